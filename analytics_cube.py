@@ -0,0 +1,474 @@
+# Cubo analítico em memória por usuário (NumPy) - FynanPro
+"""
+Os relatórios (tendências, categorias, fluxo de caixa) faziam cada um suas
+agregações no SQLite, e sazonalidade varre todo o histórico a cada visita.
+Aqui o razão do usuário é carregado uma vez em colunas NumPy compactas:
+
+    day      int32   dias desde 1970-01-01
+    cents    int64   valor em centavos (como gravado)
+    kind     int8    0 receita, 1 despesa, 2 transferência, 3 outro
+    confirmed bool
+    recurring bool   faz parte de uma série (recurrence_type / parent_transaction_id)
+    account  int32   código da conta   (índice em account_ids)
+    chart    int32   código do plano de contas (índice em chart_ids; 0 = sem)
+
+e group-by (mês, categoria, conta, tipo), top-N e sazonalidade viram
+máscaras booleanas + np.bincount. ~23 bytes por transação.
+
+O cubo fica em cache (LRU, ANALYTICS_CUBE_CACHE_SIZE usuários) junto com a
+versão dos dados do usuário - o último seq do change_log (migração 009).
+Trocar filtros de relatório custa só a leitura dessa versão; qualquer
+escrita, de qualquer processo, muda o seq e o cubo é recarregado.
+
+Com vários workers do gunicorn, o cubo também é gravado em disco
+(ANALYTICS_SNAPSHOT_DIR) como um arquivo por (usuário, versão):
+
+    <banco>-u<usuário>-v<seq>.cube
+    FYNCUBE\x02 | tamanho do cabeçalho (uint32) | cabeçalho JSON | colunas
+
+Cada coluna começa alinhada em 64 bytes, com dtype little-endian fixo, e
+é aberta com numpy.memmap: os workers compartilham as mesmas páginas pelo
+page cache do SO em vez de cada um montar sua cópia. O arquivo é escrito
+em um .tmp e renomeado (os.replace), então nenhum worker vê um snapshot
+pela metade; versões anteriores do usuário e .tmp órfãos são apagados
+depois de cada gravação (um worker que ainda mapeia o arquivo apagado
+continua lendo normalmente até soltá-lo).
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import struct
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+import numpy as np
+
+from change_log import latest_seq
+from money import Money, cents_sql
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_SIZE = 64
+
+KINDS = ('receita', 'despesa', 'transferencia')
+OTHER_KIND = len(KINDS)
+
+MONTH_NAMES = ('Janeiro', 'Fevereiro', 'Março', 'Abril', 'Maio', 'Junho', 'Julho',
+               'Agosto', 'Setembro', 'Outubro', 'Novembro', 'Dezembro')
+
+_EPOCH = np.datetime64('1970-01-01', 'D')
+
+# O último byte é a versão do formato: snapshot de formato antigo é recriado
+SNAPSHOT_MAGIC = b'FYNCUBE\x02'
+SNAPSHOT_SUFFIX = '.cube'
+_SNAPSHOT_ALIGN = 64
+# Colunas gravadas no snapshot, com dtype fixo (independente da plataforma)
+_SNAPSHOT_COLUMNS = (('day', '<i4'), ('cents', '<i8'), ('kind', '|i1'), ('confirmed', '|b1'),
+                     ('recurring', '|b1'), ('account', '<i4'), ('chart', '<i4'), ('month', '<i4'),
+                     ('account_ids', '<i8'), ('chart_ids', '<i8'))
+# .tmp mais antigo que isso é de um processo que morreu no meio da gravação
+_ORPHAN_TMP_SECONDS = 600
+
+
+def day_number(value):
+    """date ou 'YYYY-MM-DD' -> dias desde 1970-01-01 (mesma escala da coluna day)"""
+    return int((np.datetime64(str(value)[:10], 'D') - _EPOCH).astype(np.int64))
+
+
+def month_label(code):
+    """Código de mês (meses desde 1970-01) -> 'YYYY-MM'"""
+    return f'{1970 + code // 12}-{code % 12 + 1:02d}'
+
+
+def _to_float(cents):
+    return Money(int(cents)).to_float()
+
+
+class LedgerCube:
+    """Transações de um usuário em colunas NumPy (uma posição por transação)"""
+
+    def __init__(self, day, cents, kind, confirmed, recurring, account, chart, account_ids, chart_ids, charts,
+                 month=None):
+        self.day = day
+        self.cents = cents
+        self.kind = kind
+        self.confirmed = confirmed
+        self.recurring = recurring
+        self.account = account
+        self.chart = chart
+        self.account_ids = account_ids
+        self.chart_ids = chart_ids
+        # {chart_id: {'name', 'code', 'account_type', 'is_active', 'is_summary'}}
+        self.charts = charts
+        # Mês (desde 1970-01) derivado uma vez: agrupamento mensal sem strftime
+        if month is None:
+            month = day.astype('datetime64[D]').astype('datetime64[M]').astype(np.int32)
+        self.month = month
+
+    @classmethod
+    def load(cls, conn, user_id, type_column, columns):
+        """Duas consultas: o razão do usuário e os nomes do plano de contas usado"""
+        amount = cents_sql('amount', 't', columns)
+        chart = 'COALESCE(t.chart_account_id, 0)' if 'chart_account_id' in columns else '0'
+        recurring = ' OR '.join(condition for column, condition in (
+            ('parent_transaction_id', 't.parent_transaction_id IS NOT NULL'),
+            ('recurrence_type', "COALESCE(t.recurrence_type, 'unica') NOT IN ('unica', '')"))
+            if column in columns) or '0'
+        rows = conn.execute(f'''
+            SELECT CAST(julianday(DATE(t.date)) - 2440587.5 AS INTEGER), {amount},
+                   CASE t.{type_column} WHEN 'receita' THEN 0 WHEN 'despesa' THEN 1
+                                        WHEN 'transferencia' THEN 2 ELSE {OTHER_KIND} END,
+                   COALESCE(t.is_confirmed, 0), CASE WHEN {recurring} THEN 1 ELSE 0 END,
+                   t.account_id, {chart}
+            FROM transactions t
+            JOIN accounts a ON t.account_id = a.id
+            WHERE a.user_id = ? AND DATE(t.date) IS NOT NULL
+        ''', (user_id,)).fetchall()
+
+        if rows:
+            day, cents, kind, confirmed, recurring, account, chart_raw = zip(*rows)
+        else:
+            day = cents = kind = confirmed = recurring = account = chart_raw = ()
+        account_ids, account_codes = np.unique(np.array(account, dtype=np.int64), return_inverse=True)
+        # Código 0 reservado para "sem plano de contas"
+        chart_ids, chart_codes = np.unique(np.concatenate(([0], np.array(chart_raw, dtype=np.int64))),
+                                           return_inverse=True)
+
+        charts = {}
+        referenced = [int(chart_id) for chart_id in chart_ids if chart_id]
+        if referenced:
+            for row in conn.execute(f'''
+                SELECT id, name, code, account_type, is_active, is_summary FROM chart_of_accounts
+                WHERE id IN ({', '.join('?' * len(referenced))})
+            ''', referenced):
+                charts[row[0]] = {'name': row[1], 'code': row[2], 'account_type': row[3],
+                                  'is_active': row[4], 'is_summary': row[5]}
+
+        return cls(day=np.array(day, dtype=np.int32),
+                   cents=np.array(cents, dtype=np.int64),
+                   kind=np.array(kind, dtype=np.int8),
+                   confirmed=np.array(confirmed, dtype=bool),
+                   recurring=np.array(recurring, dtype=bool),
+                   account=account_codes.astype(np.int32),
+                   chart=chart_codes[1:].astype(np.int32),
+                   account_ids=account_ids,
+                   chart_ids=chart_ids,
+                   charts=charts)
+
+    def save(self, path, **meta):
+        """Gravar o snapshot em path (escreve em .tmp e renomeia); meta vai no cabeçalho"""
+        header = {'rows': len(self), 'charts': self.charts, 'columns': {}, **meta}
+        offset = 0
+        for name, dtype in _SNAPSHOT_COLUMNS:
+            array = getattr(self, name)
+            header['columns'][name] = [dtype, offset, len(array)]
+            offset += _aligned(len(array) * np.dtype(dtype).itemsize)
+
+        encoded = json.dumps(header, separators=(',', ':')).encode('utf-8')
+        data_start = _aligned(len(SNAPSHOT_MAGIC) + 4 + len(encoded))
+        tmp_path = f'{path}.{os.getpid()}.{uuid.uuid4().hex[:8]}.tmp'
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(SNAPSHOT_MAGIC + struct.pack('<I', len(encoded)) + encoded)
+                for name, dtype in _SNAPSHOT_COLUMNS:
+                    f.seek(data_start + header['columns'][name][1])
+                    f.write(np.ascontiguousarray(getattr(self, name), dtype=dtype).tobytes())
+                f.truncate(data_start + offset)
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+
+    @classmethod
+    def open(cls, path):
+        """
+        (cubo, cabeçalho) com as colunas mapeadas do arquivo (somente leitura),
+        ou None se o arquivo não existe ou não é um snapshot válido.
+        """
+        try:
+            mapped = np.memmap(path, dtype=np.uint8, mode='r')
+        except (OSError, ValueError):
+            return None
+        try:
+            prefix = len(SNAPSHOT_MAGIC) + 4
+            if len(mapped) < prefix or bytes(mapped[:len(SNAPSHOT_MAGIC)]) != SNAPSHOT_MAGIC:
+                return None
+            (header_size,) = struct.unpack('<I', bytes(mapped[len(SNAPSHOT_MAGIC):prefix]))
+            header = json.loads(bytes(mapped[prefix:prefix + header_size]).decode('utf-8'))
+            data_start = _aligned(prefix + header_size)
+            arrays = {}
+            for name, (dtype, offset, length) in header['columns'].items():
+                start = data_start + offset
+                end = start + length * np.dtype(dtype).itemsize
+                if end > len(mapped):
+                    return None
+                arrays[name] = mapped[start:end].view(dtype)
+        except (ValueError, KeyError, TypeError, struct.error):
+            return None
+        charts = {int(chart_id): chart for chart_id, chart in header['charts'].items()}
+        return cls(charts=charts, **arrays), header
+
+    def __len__(self):
+        return len(self.day)
+
+    @property
+    def nbytes(self):
+        return sum(array.nbytes for array in (self.day, self.cents, self.kind, self.confirmed,
+                                              self.recurring, self.account, self.chart, self.month))
+
+    def account_position(self, account_id):
+        """Código da conta no cubo (posição em account_ids), ou None se ela não tem transações"""
+        position = int(np.searchsorted(self.account_ids, int(account_id)))
+        if position == len(self.account_ids) or self.account_ids[position] != int(account_id):
+            return None
+        return position
+
+    def chart_position(self, chart_id):
+        """Código do plano de contas no cubo; 0 (sem plano) se None ou não usado pelo usuário"""
+        if chart_id is None:
+            return 0
+        position = int(np.searchsorted(self.chart_ids, int(chart_id)))
+        if position == len(self.chart_ids) or self.chart_ids[position] != int(chart_id):
+            return 0
+        return position
+
+    def signed_cents(self):
+        """Efeito de cada linha no saldo da conta (regra de update_account_balance)"""
+        sign = np.array([1, -1, 1, 0], dtype=np.int64)
+        return self.cents * sign[self.kind]
+
+    # ----- filtros -----
+    def mask(self, start=None, end=None, kind=None, confirmed=None, account_id=None, categorized=False):
+        """Máscara booleana das transações; start/end inclusivos (date ou 'YYYY-MM-DD')"""
+        selected = np.ones(len(self), dtype=bool)
+        if start is not None:
+            selected &= self.day >= day_number(start)
+        if end is not None:
+            selected &= self.day <= day_number(end)
+        if kind is not None:
+            selected &= self.kind == (KINDS.index(kind) if kind in KINDS else OTHER_KIND)
+        if confirmed is not None:
+            selected &= self.confirmed == confirmed
+        if account_id is not None:
+            position = self.account_position(account_id)
+            if position is None:
+                return np.zeros(len(self), dtype=bool)
+            selected &= self.account == position
+        if categorized:
+            selected &= self.chart != 0
+        return selected
+
+    # ----- agregações -----
+    def _codes(self, by):
+        if by == 'month':
+            return self.month
+        if by == 'calendar_month':
+            return self.month % 12
+        if by == 'category':
+            return self.chart
+        if by == 'account':
+            return self.account
+        if by == 'type':
+            return self.kind
+        raise ValueError(f'agrupamento desconhecido: {by}')
+
+    def group_by(self, by, mask, weights_mask=None):
+        """
+        (chaves, soma em centavos, contagem) por valor de `by` entre as linhas de mask
+        que aparecem; weights_mask restringe o que entra na soma/contagem sem tirar a chave.
+        """
+        codes = self._codes(by)[mask]
+        keys, inverse = np.unique(codes, return_inverse=True)
+        counted = np.ones(len(codes), dtype=bool) if weights_mask is None else weights_mask[mask]
+        # Soma exata em int64 (bincount usa float64)
+        sums = np.zeros(len(keys), dtype=np.int64)
+        np.add.at(sums, inverse[counted], self.cents[mask][counted])
+        counts = np.bincount(inverse[counted], minlength=len(keys))
+        return keys, sums, counts
+
+    def monthly_flow(self, mask):
+        """Receitas/despesas confirmadas por mês ('mes', 'receitas', 'despesas', 'qtd_receitas', 'qtd_despesas')"""
+        result = {}
+        for kind in ('receita', 'despesa'):
+            is_kind = self.kind == KINDS.index(kind)
+            keys, sums, _ = self.group_by('month', mask, is_kind & self.confirmed)
+            _, _, counts = self.group_by('month', mask, is_kind)
+            for key, total, count in zip(keys, sums, counts):
+                row = result.setdefault(int(key), {'mes': month_label(int(key))})
+                row[f'{kind}s'] = _to_float(total)
+                row[f'qtd_{kind}s'] = int(count)
+        return [result[key] for key in sorted(result)]
+
+    def top_categories(self, mask, limit, chart_filter=None):
+        """Plano de contas por total desc ('categoria', 'codigo', 'total', 'qtd_transacoes', 'valor_medio')"""
+        keys, sums, counts = self.group_by('category', mask)
+        rows = []
+        for key, total, count in zip(keys, sums, counts):
+            chart = self.charts.get(int(self.chart_ids[key]))
+            if chart is None or total <= 0 or (chart_filter and not chart_filter(chart)):
+                continue
+            rows.append({'categoria': chart['name'], 'codigo': chart['code'], 'total': _to_float(total),
+                         'qtd_transacoes': int(count), 'valor_medio': round(int(total) / int(count) / 100, 2)})
+        rows.sort(key=lambda row: row['total'], reverse=True)
+        return rows[:limit]
+
+    def seasonality(self, mask):
+        """Média por transação de receitas e despesas em cada mês do ano"""
+        keys, _, _ = self.group_by('calendar_month', mask)
+        averages = {}
+        for kind in ('receita', 'despesa'):
+            kind_keys, sums, counts = self.group_by('calendar_month', mask, self.kind == KINDS.index(kind))
+            averages[kind] = {int(key): total / count / 100
+                              for key, total, count in zip(kind_keys, sums, counts) if count}
+        return [{'mes_numero': int(key) + 1, 'mes_nome': MONTH_NAMES[key],
+                 'receita_media': averages['receita'].get(int(key), 0),
+                 'despesa_media': averages['despesa'].get(int(key), 0)} for key in keys]
+
+
+def _aligned(size):
+    return -(-size // _SNAPSHOT_ALIGN) * _SNAPSHOT_ALIGN
+
+
+class SnapshotStore:
+    """Snapshots versionados dos cubos de um banco, num diretório compartilhado pelos workers"""
+
+    def __init__(self, directory, db_key):
+        self.directory = directory
+        # Vários bancos podem dividir o diretório (bench.db, testes): prefixo pelo nome do arquivo
+        self.prefix = os.path.splitext(os.path.basename(str(db_key)))[0] or 'db'
+
+    def path(self, user_id, version):
+        return os.path.join(self.directory, f'{self.prefix}-u{user_id}-v{version}{SNAPSHOT_SUFFIX}')
+
+    def open(self, user_id, version):
+        """Cubo mapeado da versão, ou None (ainda não gravado, ou inválido)"""
+        opened = LedgerCube.open(self.path(user_id, version))
+        if opened is None:
+            return None
+        cube, header = opened
+        if header.get('user_id') != user_id or header.get('version') != version:
+            return None
+        return cube
+
+    def save(self, user_id, version, cube):
+        """Publicar a versão e apagar as anteriores do usuário"""
+        os.makedirs(self.directory, exist_ok=True)
+        cube.save(self.path(user_id, version), user_id=user_id, version=version)
+        self.collect_garbage(user_id, version)
+
+    def collect_garbage(self, user_id, version):
+        """
+        Remove snapshots do usuário com versão menor que version e .tmp órfãos.
+        O seq só cresce: um worker atrasado nunca apaga a versão mais nova.
+        """
+        user_prefix = f'{self.prefix}-u{user_id}-v'
+        now = time.time()
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                if name.startswith(user_prefix) and name.endswith(SNAPSHOT_SUFFIX):
+                    if int(name[len(user_prefix):-len(SNAPSHOT_SUFFIX)]) < version:
+                        os.remove(path)
+                elif name.endswith('.tmp') and now - os.path.getmtime(path) > _ORPHAN_TMP_SECONDS:
+                    os.remove(path)
+            except (ValueError, OSError):
+                # Nome fora do padrão, ou arquivo já removido/ainda aberto por outro processo (Windows)
+                continue
+
+
+class CubeCache:
+    """LRU de cubos por chave, válido enquanto a versão dos dados não muda"""
+
+    def __init__(self, maxsize=DEFAULT_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = 0
+
+    def get(self, key, version, loader, cacheable=None):
+        """Valor em cache para a versão, ou loader(); cacheable(valor) falso = devolve sem guardar"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == version and version is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        cube = loader()  # fora do lock: outro usuário não espera esta carga
+        if version is not None and (cacheable is None or cacheable(cube)):
+            with self._lock:
+                self._entries[key] = (version, cube)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+        return cube
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+_cache = CubeCache()
+_settings = {'snapshot_dir': ''}
+
+
+def init_analytics(app):
+    """
+    Tamanho do LRU (ANALYTICS_CUBE_CACHE_SIZE usuários) e diretório dos snapshots
+    (ANALYTICS_SNAPSHOT_DIR; vazio = analytics_snapshots/ ao lado do banco, off = desligado)
+    """
+    app.config.setdefault('ANALYTICS_CUBE_CACHE_SIZE',
+                          int(os.getenv('ANALYTICS_CUBE_CACHE_SIZE', DEFAULT_CACHE_SIZE)))
+    app.config.setdefault('ANALYTICS_SNAPSHOT_DIR', os.getenv('ANALYTICS_SNAPSHOT_DIR', ''))
+    _cache.maxsize = app.config['ANALYTICS_CUBE_CACHE_SIZE']
+    _settings['snapshot_dir'] = app.config['ANALYTICS_SNAPSHOT_DIR']
+    return _cache
+
+
+def snapshot_store(db_key):
+    """SnapshotStore do banco, ou None com snapshots desligados"""
+    directory = _settings['snapshot_dir']
+    if directory == 'off':
+        return None
+    if not directory:
+        directory = os.path.join(os.path.dirname(os.path.abspath(str(db_key))), 'analytics_snapshots')
+    return SnapshotStore(directory, db_key)
+
+
+def user_cube(conn, db_key, user_id, type_column, columns):
+    """
+    Cubo do usuário; recarrega só quando o seq do change_log mudou.
+    Num miss do LRU, o snapshot da versão em disco (de qualquer worker) é
+    mapeado; só sem ele o razão é lido do SQLite e o snapshot publicado.
+    """
+    try:
+        version = latest_seq(conn, user_id)
+    except sqlite3.OperationalError:
+        # Banco sem change_log: sem versão confiável, não guardar
+        version = None
+
+    def load():
+        store = snapshot_store(db_key) if version is not None else None
+        cube = store.open(user_id, version) if store else None
+        if cube is None:
+            cube = LedgerCube.load(conn, user_id, type_column, columns)
+            if store:
+                try:
+                    store.save(user_id, version, cube)
+                except OSError as e:
+                    # Disco cheio/sem permissão: segue só com o cubo em memória
+                    logger.warning("⚠️ Snapshot analítico não gravado (%s): %s", store.directory, e)
+        return cube
+
+    return _cache.get((db_key, user_id), version, load)
@@ -1,14 +1,41 @@
 import os
+import json
 import sqlite3
 import logging
 import sys
 import secrets
 from datetime import datetime, date, timedelta
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, session
+from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, session, g
 from werkzeug.security import generate_password_hash, check_password_hash
+from markupsafe import escape
+from urllib.parse import quote
 import uuid
+import numpy as np
 from decimal import Decimal
 from functools import wraps
+from request_profiler import init_request_profiler, list_profiles
+from logging_config import configure_logging
+from query_budget import init_query_budget, query_budget, sql_trace_hooks, trace_sql
+from idempotency import idempotent, init_idempotency
+from money import Money, cents_sql, to_cents
+from dedup import find_duplicate, find_duplicates, fingerprint, DEFAULT_WINDOW_DAYS
+from statement_import import StatementImporter, StatementImportError, detect_format
+from transaction_batch import MAX_BATCH_ITEMS, BatchError, TransactionBatch, parse_batch_body
+from change_log import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, fetch_changes
+from events import events_response, init_events
+from dashboard_widgets import widget_etag, widget_response
+from balance_checkpoints import MAX_SERIES_DAYS, balance_as_of, daily_balance_series, running_balances
+from analytics_cube import init_analytics, user_cube
+from chart_tree import chart_rollup, drill_down
+from tags import normalize_tags, tag_filter_sql, tag_totals
+from categorization import RuleError, categorize, create_rule, delete_rule, list_rules, parse_rule, rule_set
+from category_model import init_category_model, user_model
+from merchants import intern_merchants, merchant_key, merchant_totals
+from forecast import DEFAULT_FORECAST_MONTHS, MAX_FORECAST_MONTHS, project, recurring_series, user_forecast_basis
+from scenarios import (ScenarioError, create_scenario, data_version_key, delete_scenario, evaluate,
+                       get_scenario, list_scenarios, parse_scenario, store_result)
+from goal_simulator import data_version, goal_simulation, init_goal_simulator, load_goals
+from flask.json.provider import DefaultJSONProvider
 
 # Importar sistema de migrações
 try:
@@ -32,6 +59,16 @@ def _has_column(conn, table, column):
 
 app = Flask(__name__)
 
+class FynanJSONProvider(DefaultJSONProvider):
+    """JSON das APIs: Money vira número em reais (2 casas)"""
+    @staticmethod
+    def default(o):
+        if isinstance(o, Money):
+            return o.to_float()
+        return DefaultJSONProvider.default(o)
+
+app.json = FynanJSONProvider(app)
+
 # CONFIGURAÇÃO ROBUSTA DE SECRET_KEY
 SECRET_KEY = os.getenv("SECRET_KEY")
 if not SECRET_KEY:
@@ -41,19 +78,12 @@ if not SECRET_KEY:
     
 app.config['SECRET_KEY'] = SECRET_KEY
 app.config['DATABASE'] = 'finance_planner_saas.db'
+app.config['API_BATCH_MAX_ITEMS'] = int(os.getenv('API_BATCH_MAX_ITEMS', MAX_BATCH_ITEMS))
+
+# Logging estruturado (LOG_FORMAT=json), níveis por logger e access log por requisição
+configure_logging(app)
 
-# Configurar logging profissional para produção
 if os.environ.get('PORT'):  # Detectar se está no Render
-    logging.basicConfig(
-        level=logging.INFO,
-        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-        handlers=[
-            logging.StreamHandler(sys.stdout),
-            logging.StreamHandler(sys.stderr)
-        ]
-    )
-    
-    app.logger.setLevel(logging.INFO)
     app.logger.info("🚀 FYNANPRO ETAPA 4 - Logging configurado para produção")
     
     # INICIALIZAÇÃO AUTOMÁTICA NO RENDER COM MIGRAÇÕES
@@ -255,6 +285,7 @@ def init_db():
     
     conn.commit()
     conn.close()
+    clear_schema_caches()
     app.logger.info("✅ Banco de dados inicializado com sucesso!")
 
 def ensure_db_initialized():
@@ -285,6 +316,7 @@ def ensure_db_initialized():
             apply_database_migrations(conn)
             
         conn.close()
+        clear_schema_caches()
         return True
             
     except Exception as e:
@@ -420,6 +452,9 @@ def apply_database_migrations(conn):
 def get_db():
     conn = sqlite3.connect(app.config['DATABASE'])
     conn.row_factory = sqlite3.Row
+    # Contagem de queries (query_budget.py / benchmark_endpoints.py) - vazio em produção
+    if sql_trace_hooks:
+        conn.set_trace_callback(trace_sql)
     return conn
 
 def create_default_data():
@@ -541,7 +576,7 @@ else:
 def currency_filter(value):
     if value is None:
         return "R$ 0,00"
-    return f"R$ {float(value):,.2f}".replace(',', 'X').replace('.', ',').replace('X', '.')
+    return Money.from_value(value).format()
 
 @app.template_filter('date_format')
 def date_format_filter(value, format='%d/%m/%Y'):
@@ -559,12 +594,24 @@ def date_format_filter(value, format='%d/%m/%Y'):
     return value.strftime(format) if hasattr(value, 'strftime') else str(value)
 
 # Funções auxiliares
+
+# Colunas por (banco, tabela): o schema só muda em init_db/migrações, não a cada requisição
+_table_columns_cache = {}
+
+def get_table_columns(conn, table):
+    """Colunas da tabela via PRAGMA, em cache por processo"""
+    key = (app.config['DATABASE'], table)
+    if key not in _table_columns_cache:
+        columns = [row[1] for row in conn.execute(f"PRAGMA table_info({table})").fetchall()]
+        if not columns:
+            return columns  # tabela ainda não existe: não guardar
+        _table_columns_cache[key] = columns
+    return _table_columns_cache[key]
+
 def get_transaction_type_column(conn):
     """Detectar automaticamente se usa 'type' ou 'transaction_type'"""
     try:
-        cursor = conn.cursor()
-        cursor.execute("PRAGMA table_info(transactions)")
-        columns = [row[1] for row in cursor.fetchall()]
+        columns = get_table_columns(conn, 'transactions')
         
         if 'type' in columns:
             return 'type'
@@ -576,22 +623,110 @@ def get_transaction_type_column(conn):
         return 'type'  # padrão
 
 def get_current_user():
+    """Usuário da sessão, carregado uma vez por requisição"""
     if 'user_id' not in session:
         return None
     
+    cached = g.get('_current_user')
+    if cached is not None and cached[0] == session['user_id']:
+        return cached[1]
+    
     conn = get_db()
     user = conn.execute('SELECT * FROM users WHERE id = ?', (session['user_id'],)).fetchone()
     conn.close()
-    return dict(user) if user else None
+    user = dict(user) if user else None
+    g._current_user = (session['user_id'], user)
+    return user
+
+def get_user_accounts(user_id):
+    """Contas ativas do usuário, compartilhadas entre a rota e o context processor"""
+    cache = g.setdefault('_user_accounts', {})
+    if user_id not in cache:
+        conn = get_db()
+        cache[user_id] = [dict(row) for row in conn.execute('''
+            SELECT * FROM accounts 
+            WHERE user_id = ? AND is_active = 1 
+            ORDER BY name
+        ''', (user_id,)).fetchall()]
+        conn.close()
+    return cache[user_id]
+
+# Categorias globais só mudam no seed inicial (create_default_data / migrações)
+_categories_cache = {}
+
+def get_active_categories(conn):
+    """Categorias ativas (formulário de nova transação), em cache por processo"""
+    key = app.config['DATABASE']
+    if key in _categories_cache:
+        return _categories_cache[key]
+    categories = [dict(row) for row in conn.execute('''
+        SELECT id, name, category_type, color, icon FROM categories 
+        WHERE is_active = 1
+        ORDER BY category_type, name
+    ''').fetchall()]
+    if categories:
+        _categories_cache[key] = categories
+    return categories
+
+def category_suggester(conn, user_id):
+    """
+    (descrição, tipo) -> 3 categorias mais prováveis pelo modelo do usuário
+    (category_model.py); None enquanto o primeiro treino não terminou
+    """
+    model = user_model(conn, app.config['DATABASE'], user_id)
+    if model is None:
+        return None
+    categories = {category['id']: category for category in get_active_categories(conn)}
+    types = {category_id: category.get('category_type') for category_id, category in categories.items()}
+    
+    def suggest(description, transaction_type=None):
+        return [dict(suggestion, name=categories[suggestion['category_id']]['name'])
+                for suggestion in model.suggest(description, types, transaction_type)]
+    return suggest
+
+def get_analytics_cube(conn, user_id):
+    """Razão do usuário em colunas NumPy (analytics_cube.py), recarregado só após escritas"""
+    return user_cube(conn, app.config['DATABASE'], user_id,
+                     get_transaction_type_column(conn), get_table_columns(conn, 'transactions'))
+
+def get_forecast_basis(conn, user_id):
+    """Insumos da projeção de saldo (forecast.py) das contas ativas, em cache pela versão dos dados"""
+    account_ids = [acc['id'] for acc in get_user_accounts(user_id)]
+    return user_forecast_basis(
+        conn, app.config['DATABASE'], user_id, account_ids,
+        lambda: get_analytics_cube(conn, user_id),
+        lambda: recurring_series(conn, user_id, get_transaction_type_column(conn),
+                                 get_table_columns(conn, 'transactions')),
+        date.today())
+
+def evaluate_scenario(conn, user_id, months, adjustments):
+    """Projeção base x cenário (scenarios.py) sobre os insumos da projeção em cache"""
+    today = date.today()
+    goals = ()
+    if any(adjustment['type'] == 'goal_contribution' for adjustment in adjustments):
+        goals = load_goals(conn, user_id, get_table_columns(conn, 'goals'),
+                           get_table_columns(conn, 'goal_contributions'), today)
+    return evaluate(get_forecast_basis(conn, user_id), get_user_accounts(user_id), adjustments, months, goals)
+
+def get_goal_simulation(conn, user_id):
+    """Chance de cada meta ativa bater o alvo no prazo (goal_simulator.py), em cache pela versão dos dados"""
+    return goal_simulation(conn, app.config['DATABASE'], user_id, lambda: get_analytics_cube(conn, user_id),
+                           get_table_columns(conn, 'goals'), get_table_columns(conn, 'goal_contributions'),
+                           date.today())
+
+def clear_schema_caches():
+    """Descartar caches de schema/categorias (após init_db ou migrações)"""
+    _table_columns_cache.clear()
+    _categories_cache.clear()
 
 def login_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        app.logger.info(f"🔐 Verificando login para rota: {request.endpoint}")
-        app.logger.info(f"🔍 Session keys: {list(session.keys())}")
-        app.logger.info(f"👤 User ID na session: {session.get('user_id', 'NONE')}")
-        app.logger.info(f"🕒 Session permanent: {session.permanent}")
-        
+        if app.logger.isEnabledFor(logging.DEBUG):
+            app.logger.debug("🔐 Verificando login para rota %s - user_id=%s, permanent=%s, keys=%s",
+                             request.endpoint, session.get('user_id', 'NONE'),
+                             session.permanent, list(session.keys()))
+
         # Verificação primária
         if 'user_id' not in session:
             app.logger.warning("⚠️ Sem user_id na sessão - redirecionando para login")
@@ -600,25 +735,24 @@ def login_required(f):
         
         # Tornar sessão permanente se não for
         if not session.permanent:
-            app.logger.info("🔄 Tornando sessão permanente")
+            app.logger.debug("🔄 Tornando sessão permanente")
             session.permanent = True
         
-        # Verificação adicional - usuário existe no banco?
+        # Verificação adicional - usuário existe no banco? (mesma consulta reaproveitada pela rota)
         try:
-            conn = get_db()
-            user_exists = conn.execute('SELECT id, email FROM users WHERE id = ?', (session['user_id'],)).fetchone()
-            conn.close()
+            user_exists = get_current_user()
             
             if not user_exists:
-                app.logger.warning(f"⚠️ Usuário ID {session['user_id']} não encontrado no banco")
+                app.logger.warning("⚠️ Usuário ID %s não encontrado no banco", session['user_id'])
                 session.clear()
                 flash('Sessão inválida. Faça login novamente.', 'warning')
                 return redirect(url_for('login'))
             else:
-                app.logger.info(f"✅ Usuário {user_exists[1]} ({session['user_id']}) autenticado para {request.endpoint}")
-                
+                app.logger.debug("✅ Usuário %s (%s) autenticado para %s",
+                                 user_exists['email'], session['user_id'], request.endpoint)
+
         except Exception as e:
-            app.logger.error(f"🚨 Erro ao verificar usuário: {e}")
+            app.logger.error("🚨 Erro ao verificar usuário: %s", e)
             session.clear()
             flash('Erro na verificação. Faça login novamente.', 'error')
             return redirect(url_for('login'))
@@ -627,6 +761,47 @@ def login_required(f):
     return decorated_function
     return decorated_function
 
+# Administradores: emails definidos em ADMIN_EMAILS (separados por vírgula)
+ADMIN_EMAILS = {e.strip().lower() for e in os.getenv('ADMIN_EMAILS', 'admin@fynanpro.com').split(',') if e.strip()}
+
+def is_admin_user():
+    """Verificar se o usuário da sessão é administrador"""
+    if 'user_id' not in session:
+        return False
+    user = get_current_user()
+    return bool(user) and (user.get('email') or '').lower() in ADMIN_EMAILS
+
+def admin_required(f):
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if not is_admin_user():
+            app.logger.warning(f"⚠️ Acesso admin negado para rota: {request.endpoint}")
+            flash('Acesso restrito a administradores.', 'danger')
+            return redirect(url_for('dashboard'))
+        return f(*args, **kwargs)
+    return login_required(decorated_function)
+
+# Profiling opcional por requisição (header X-Profile de admin ou PROFILE_SAMPLE_RATE)
+init_request_profiler(app, is_admin_user)
+
+# Contagem de queries por requisição e orçamentos @query_budget (QUERY_BUDGET_MODE)
+init_query_budget(app)
+
+# Header Idempotency-Key nos POSTs que gravam (@idempotent)
+init_idempotency(app, get_db)
+
+# Stream SSE por usuário derivado do change_log (/api/v1/events)
+init_events(app, get_db)
+
+# Cubo analítico NumPy por usuário para os relatórios (LRU pela versão dos dados)
+init_analytics(app)
+
+# Simulação de Monte Carlo das metas (caminhos, orçamento de tempo, cache pela versão dos dados)
+init_goal_simulator(app)
+
+# Sugestões de categoria aprendidas por usuário (LRU em memória, retreino em segundo plano)
+init_category_model(app)
+
 # Filtros customizados para templates
 @app.template_filter('strftime')
 def strftime_filter(date_str, format='%d/%m/%Y'):
@@ -648,24 +823,16 @@ def strftime_filter(date_str, format='%d/%m/%Y'):
 def inject_user_data():
     current_user = get_current_user()
     if current_user:
-        conn = get_db()
-        accounts = conn.execute('''
-            SELECT id, name, account_type, current_balance as balance, is_active, created_at
-            FROM accounts 
-            WHERE user_id = ? AND is_active = 1 
-            ORDER BY name
-        ''', (current_user['id'],)).fetchall()
+        accounts = [dict(acc, balance=acc.get('current_balance'))
+                    for acc in get_user_accounts(current_user['id'])]
         
         # Calcular saldo total das contas (excluindo cartões de crédito)
-        total_balance = 0
-        for acc in accounts:
-            if acc['account_type'] != 'cartao':
-                total_balance += float(acc['balance'] or 0)
-        conn.close()
+        total_balance = sum((Money.from_row(acc, 'current_balance')
+                             for acc in accounts if acc['account_type'] != 'cartao'), Money()).to_float()
         
         return dict(
             current_user=current_user,
-            user_accounts=[dict(acc) for acc in accounts],
+            user_accounts=accounts,
             total_balance=total_balance
         )
     return dict(current_user=None, user_accounts=[], total_balance=0)
@@ -758,20 +925,20 @@ def favicon():
 @app.route('/login', methods=['GET', 'POST'])
 def login():
     try:
-        app.logger.info("🔐 Rota login acessada")
+        app.logger.debug("🔐 Rota login acessada")
         
         if 'user_id' in session:
-            app.logger.info("✅ Usuário já logado, redirecionando")
+            app.logger.debug("✅ Usuário já logado, redirecionando")
             return redirect(url_for('dashboard'))
         
         if request.method == 'POST':
-            app.logger.info("📝 Processando login POST")
+            app.logger.debug("📝 Processando login POST")
             
             email = request.form.get('email', '').strip()
             password = request.form.get('password', '')
             remember = 'remember_me' in request.form
             
-            app.logger.info(f"👤 Tentativa login: {email}")
+            app.logger.debug("👤 Tentativa login: %s", email)
             
             if not email or not password:
                 app.logger.warning("❌ Email ou senha vazios")
@@ -780,17 +947,17 @@ def login():
             
             try:
                 conn = get_db()
-                app.logger.info("📊 Conexão BD estabelecida")
+                app.logger.debug("📊 Conexão BD estabelecida")
                 
                 user = conn.execute('SELECT * FROM users WHERE email = ?', (email,)).fetchone()
-                app.logger.info(f"🔍 Usuário encontrado: {'✅' if user else '❌'}")
+                app.logger.debug("🔍 Usuário encontrado: %s", '✅' if user else '❌')
                 
                 if user:
-                    app.logger.info(f"👤 User ID: {user['id']}, Email: {user['email']}")
+                    app.logger.debug("👤 User ID: %s, Email: %s", user['id'], user['email'])
                     
                     # Verificar senha
                     if check_password_hash(user['password_hash'], password):
-                        app.logger.info("🔑 Senha correta")
+                        app.logger.debug("🔑 Senha correta")
                         
                         # CRIAR SESSÃO SIMPLES
                         session['user_id'] = user['id']
@@ -801,12 +968,12 @@ def login():
                                     (datetime.now(), user['id']))
                         conn.commit()
                         app.logger.info("✅ Login realizado com sucesso")
-                        app.logger.info(f"🔐 Session user_id: {session['user_id']}")
+                        app.logger.debug("🔐 Session user_id: %s", session['user_id'])
                         
                         flash('Login realizado com sucesso!', 'success')
                         next_page = request.args.get('next')
                         redirect_url = next_page if next_page else url_for('dashboard')
-                        app.logger.info(f"🔄 Redirecionando para: {redirect_url}")
+                        app.logger.debug("🔄 Redirecionando para: %s", redirect_url)
                         return redirect(redirect_url)
                     else:
                         app.logger.warning("❌ Senha incorreta")
@@ -816,7 +983,7 @@ def login():
                     flash('Email ou senha incorretos.', 'danger')
                     
                 conn.close()
-                app.logger.info("📊 Conexão BD fechada")
+                app.logger.debug("📊 Conexão BD fechada")
                 
             except Exception as db_error:
                 app.logger.error(f"🚨 Erro no banco de dados: {str(db_error)}")
@@ -824,7 +991,7 @@ def login():
                 app.logger.error(f"📊 Traceback BD: {traceback.format_exc()}")
                 flash('Erro interno. Tente novamente.', 'danger')
         
-        app.logger.info("📄 Renderizando template login")
+        app.logger.debug("📄 Renderizando template login")
         return render_template('auth/login_simple.html')
         
     except Exception as e:
@@ -886,31 +1053,37 @@ def logout():
 def update_account_balance(conn, account_id):
     """Atualizar saldo da conta baseado nas transações - FUNÇÃO CRÍTICA"""
     try:
-        app.logger.info(f"💰 Atualizando saldo da conta {account_id}")
+        app.logger.debug("💰 Atualizando saldo da conta %s", account_id)
         
         # Detectar coluna de tipo automaticamente
         type_column = get_transaction_type_column(conn)
         
-        # Calcular saldo total das transações
+        # Calcular saldo total das transações (soma exata em centavos)
+        amount = cents_sql('amount', columns=get_table_columns(conn, 'transactions'))
         balance_result = conn.execute(f'''
             SELECT COALESCE(SUM(
                 CASE 
-                    WHEN {type_column} = 'receita' THEN amount
-                    WHEN {type_column} = 'despesa' THEN -amount
-                    WHEN {type_column} = 'transferencia' THEN amount
+                    WHEN {type_column} = 'receita' THEN {amount}
+                    WHEN {type_column} = 'despesa' THEN -{amount}
+                    WHEN {type_column} = 'transferencia' THEN {amount}
                     ELSE 0
                 END
             ), 0) FROM transactions WHERE account_id = ?
         ''', (account_id,)).fetchone()
         
-        new_balance = float(balance_result[0]) if balance_result and balance_result[0] is not None else 0.0
+        new_balance = Money(balance_result[0] if balance_result and balance_result[0] is not None else 0)
         
-        # Atualizar saldo na conta
-        conn.execute('''
-            UPDATE accounts SET current_balance = ? WHERE id = ?
-        ''', (new_balance, account_id))
+        # Atualizar saldo na conta (REAL + centavos durante a transição)
+        if 'current_balance_cents' in get_table_columns(conn, 'accounts'):
+            conn.execute('''
+                UPDATE accounts SET current_balance = ?, current_balance_cents = ? WHERE id = ?
+            ''', (new_balance.to_float(), new_balance.cents, account_id))
+        else:
+            conn.execute('''
+                UPDATE accounts SET current_balance = ? WHERE id = ?
+            ''', (new_balance.to_float(), account_id))
         
-        app.logger.info(f"✅ Saldo atualizado: Conta {account_id} = R$ {new_balance:.2f}")
+        app.logger.debug("✅ Saldo atualizado: Conta %s = %s", account_id, new_balance)
         
     except Exception as e:
         app.logger.error(f"🚨 Erro ao atualizar saldo da conta {account_id}: {e}")
@@ -965,10 +1138,11 @@ def create_recurring_transactions(transaction_id, recurrence_type, end_date):
         app.logger.error(f"🚨 Erro ao criar recorrências: {e}")
 
 # Função auxiliares para cálculos da tabela financeira do dashboard
-def calculate_financial_table_data(user_id, period='today'):
+def calculate_financial_table_data(user_id, period='today', extra_ranges=None):
     """
     🧮 Calcula dados para tabela financeira do dashboard
     Períodos: today, week, month, year
+    extra_ranges: {nome: (início, fim)} somados na mesma consulta -> financial_table['ranges']
     TRATAMENTO ROBUSTO - NUNCA FALHA
     """
     from datetime import datetime, date, timedelta
@@ -978,7 +1152,8 @@ def calculate_financial_table_data(user_id, period='today'):
         'period_label': 'Este Mês',
         'a_receber': {'period': 0, 'overdue': 0, 'total': 0},
         'a_pagar': {'period': 0, 'overdue': 0, 'total': 0},
-        'total': {'period': 0, 'overdue': 0, 'total': 0}
+        'total': {'period': 0, 'overdue': 0, 'total': 0},
+        'ranges': {name: {'receita': 0, 'despesa': 0} for name in (extra_ranges or {})}
     }
     
     try:
@@ -1025,40 +1200,38 @@ def calculate_financial_table_data(user_id, period='today'):
             period_label = 'Este Mês'
     
         try:
-            # A RECEBER (Receitas) no período - CONSULTA ROBUSTA
-            period_income_result = conn.execute(f'''
-                SELECT COALESCE(SUM(amount), 0) FROM transactions t
-                JOIN accounts a ON t.account_id = a.id
-                WHERE a.user_id = ? AND t.{type_column} = 'receita'
-                AND t.date >= ? AND t.date <= ?
-            ''', (user_id, start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d'))).fetchone()
-            period_income = float(period_income_result[0]) if period_income_result and period_income_result[0] is not None else 0.0
-            
-            # A PAGAR (Despesas) no período - CONSULTA ROBUSTA
-            period_expenses_result = conn.execute(f'''
-                SELECT COALESCE(SUM(amount), 0) FROM transactions t
-                JOIN accounts a ON t.account_id = a.id
-                WHERE a.user_id = ? AND t.{type_column} = 'despesa'
-                AND t.date >= ? AND t.date <= ?
-            ''', (user_id, start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d'))).fetchone()
-            period_expenses = float(period_expenses_result[0]) if period_expenses_result and period_expenses_result[0] is not None else 0.0
-            
-            # ATRASADOS (Transações com data anterior a hoje) - CONSULTA ROBUSTA
-            overdue_income_result = conn.execute(f'''
-                SELECT COALESCE(SUM(amount), 0) FROM transactions t
-                JOIN accounts a ON t.account_id = a.id
-                WHERE a.user_id = ? AND t.{type_column} = 'receita'
-                AND t.date < ?
-            ''', (user_id, today.strftime('%Y-%m-%d'))).fetchone()
-            overdue_income = float(overdue_income_result[0]) if overdue_income_result and overdue_income_result[0] is not None else 0.0
+            # A RECEBER / A PAGAR no período, ATRASADOS (data anterior a hoje) e faixas extras
+            # em uma única varredura com somas condicionais
+            ranges = {
+                'period': ('t.date >= ? AND t.date <= ?', [start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d')]),
+                'overdue': ('t.date < ?', [today.strftime('%Y-%m-%d')]),
+            }
+            for name, (range_start, range_end) in (extra_ranges or {}).items():
+                ranges[name] = ('t.date >= ? AND t.date <= ?', [range_start.strftime('%Y-%m-%d'), range_end.strftime('%Y-%m-%d')])
             
-            overdue_expenses_result = conn.execute(f'''
-                SELECT COALESCE(SUM(amount), 0) FROM transactions t
+            amount = cents_sql('amount', 't', get_table_columns(conn, 'transactions'))
+            sums_sql = []
+            params = []
+            for condition, range_params in ranges.values():
+                for tx_type in ('receita', 'despesa'):
+                    sums_sql.append(f"COALESCE(SUM(CASE WHEN t.{type_column} = '{tx_type}' AND {condition} THEN {amount} END), 0)")
+                    params.extend(range_params)
+            params.append(user_id)
+            
+            row = conn.execute(f'''
+                SELECT {', '.join(sums_sql)} FROM transactions t
                 JOIN accounts a ON t.account_id = a.id
-                WHERE a.user_id = ? AND t.{type_column} = 'despesa'
-                AND t.date < ?
-            ''', (user_id, today.strftime('%Y-%m-%d'))).fetchone()
-            overdue_expenses = float(overdue_expenses_result[0]) if overdue_expenses_result and overdue_expenses_result[0] is not None else 0.0
+                WHERE a.user_id = ?
+            ''', params).fetchone()
+            sums = {}
+            for i, name in enumerate(ranges):
+                sums[name] = {'receita': Money(row[2 * i] or 0).to_float(),
+                              'despesa': Money(row[2 * i + 1] or 0).to_float()}
+            
+            period_income = sums['period']['receita']
+            period_expenses = sums['period']['despesa']
+            overdue_income = sums['overdue']['receita']
+            overdue_expenses = sums['overdue']['despesa']
             
             # TOTAL (com atrasados) - CÁLCULOS SEGUROS
             total_income = period_income + overdue_income
@@ -1081,11 +1254,12 @@ def calculate_financial_table_data(user_id, period='today'):
                     'period': period_income - period_expenses,
                     'overdue': overdue_income - overdue_expenses,
                     'total': total_income - total_expenses
-                }
+                },
+                'ranges': {name: sums[name] for name in (extra_ranges or {})}
             }
             
             conn.close()
-            app.logger.info(f"✅ Tabela financeira calculada: {period_label}")
+            app.logger.debug("✅ Tabela financeira calculada: %s", period_label)
             return financial_table
             
         except sqlite3.Error as sql_error:
@@ -1178,6 +1352,7 @@ def health_check():
 @app.route('/')
 @app.route('/dashboard')
 @login_required
+@query_budget(3)
 def dashboard():
     current_user = get_current_user()
     
@@ -1187,196 +1362,53 @@ def dashboard():
         flash('Sessão expirada. Por favor, faça login novamente.', 'warning')
         return redirect(url_for('login'))
     
-    app.logger.info(f"🎯 Dashboard acessado por: {current_user['email']}")
+    app.logger.debug("🎯 Dashboard acessado por: %s", current_user['email'])
     
     # Obter período selecionado (padrão: month)
     period = request.args.get('period', 'month')
-    app.logger.info(f"📊 Período selecionado: {period}")
-    
-    # Calcular dados da tabela financeira - AGORA SEGURO
-    financial_table = calculate_financial_table_data(current_user['id'], period)
-    app.logger.info(f"💰 Tabela financeira: {financial_table['period_label']}")
+    app.logger.debug("📊 Período selecionado: %s", period)
     
+    # Casca da página: tabela financeira, cards do mês e transações recentes chegam
+    # pelos widgets /api/v1/dashboard/* (dashboard_widgets.py), buscados em paralelo
     conn = get_db()
     
+    # Contas do usuário (reaproveitadas pelo context processor)
     try:
-        # Detectar coluna de tipo de transação
-        type_column = get_transaction_type_column(conn)
-        app.logger.info(f"🔍 Usando coluna: {type_column}")
-        
-        # Estatísticas do mês atual
-        from datetime import datetime, date
-        today = date.today()
-        start_of_month = today.replace(day=1)
-        app.logger.info(f"📅 Período consultado: {start_of_month} até {today}")
-        
-        # Receitas e despesas do mês (com tratamento de erro ROBUSTO)
-        try:
-            monthly_income_result = conn.execute(f'''
-                SELECT COALESCE(SUM(amount), 0) FROM transactions t
-                JOIN accounts a ON t.account_id = a.id
-                WHERE a.user_id = ? AND t.{type_column} = 'receita'
-                AND t.date >= ? AND t.date <= ?
-            ''', (current_user['id'], start_of_month.strftime('%Y-%m-%d'), today.strftime('%Y-%m-%d'))).fetchone()
-            monthly_income = float(monthly_income_result[0]) if monthly_income_result and monthly_income_result[0] is not None else 0.0
-            
-            monthly_expenses_result = conn.execute(f'''
-                SELECT COALESCE(SUM(amount), 0) FROM transactions t
-                JOIN accounts a ON t.account_id = a.id
-                WHERE a.user_id = ? AND t.{type_column} = 'despesa'
-                AND t.date >= ? AND t.date <= ?
-            ''', (current_user['id'], start_of_month.strftime('%Y-%m-%d'), today.strftime('%Y-%m-%d'))).fetchone()
-            monthly_expenses = float(monthly_expenses_result[0]) if monthly_expenses_result and monthly_expenses_result[0] is not None else 0.0
-            
-            app.logger.info(f"💰 Receitas: R$ {monthly_income}, Despesas: R$ {monthly_expenses}")
-            
-        except sqlite3.OperationalError as e:
-            app.logger.warning(f"⚠️ Erro em consulta transactions: {e}")
-            monthly_income = 0
-            monthly_expenses = 0
-        
-        # Transações recentes (com tratamento de erro)
-        try:
-            # Verificar estrutura da tabela transactions dinamicamente
-            cursor = conn.cursor()
-            cursor.execute("PRAGMA table_info(transactions)")
-            columns = [row[1] for row in cursor.fetchall()]
-            
-            # Construir query baseado nas colunas disponíveis
-            if 'category' in columns:
-                recent_transactions_result = conn.execute('''
-                    SELECT t.*, a.name as account_name, t.category as category_name
-                    FROM transactions t
-                    JOIN accounts a ON t.account_id = a.id
-                    WHERE a.user_id = ?
-                    ORDER BY t.date DESC
-                    LIMIT 10
-                ''', (current_user['id'],)).fetchall()
-            else:
-                recent_transactions_result = conn.execute('''
-                    SELECT t.*, a.name as account_name, 'Outros' as category_name
-                    FROM transactions t
-                    JOIN accounts a ON t.account_id = a.id
-                    WHERE a.user_id = ?
-                    ORDER BY t.date DESC
-                    LIMIT 10
-                ''', (current_user['id'],)).fetchall()
-                
-            recent_transactions = recent_transactions_result if recent_transactions_result else []
-            app.logger.info(f"📋 Transações recentes: {len(recent_transactions)}")
-            
-        except sqlite3.OperationalError as e:
-            app.logger.warning(f"⚠️ Erro em consulta recent_transactions: {e}")
-            recent_transactions = []
-        
-        # Contas do usuário (com tratamento de erro)
-        try:
-            user_accounts_result = conn.execute('''
-                SELECT * FROM accounts 
-                WHERE user_id = ? AND is_active = 1 
-                ORDER BY name
-            ''', (current_user['id'],)).fetchall()
-            user_accounts = user_accounts_result if user_accounts_result else []
-            app.logger.info(f"🏦 Contas do usuário: {len(user_accounts)}")
-            
-        except sqlite3.OperationalError as e:
-            app.logger.warning(f"⚠️ Erro em consulta accounts: {e}")
-            user_accounts = []
-        
-        # Categorias disponíveis (para o formulário da aba lateral)
-        try:
-            # Verificar se a tabela categories existe
-            tables_result = conn.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='categories'").fetchone()
-            
-            if tables_result:
-                categories_result = conn.execute('''
-                    SELECT id, name, category_type, color, icon FROM categories 
-                    WHERE is_active = 1
-                    ORDER BY category_type, name
-                ''').fetchall()
-                categories = categories_result if categories_result else []
-                app.logger.info(f"🏷️ Categorias disponíveis: {len(categories)}")
-            else:
-                # Tabela categories não existe - criar categorias padrão
-                app.logger.warning("⚠️ Tabela categories não encontrada - usando categorias padrão")
-                categories = [
-                    {'id': 1, 'name': 'Alimentação', 'category_type': 'despesa', 'color': '#ff6b6b', 'icon': '🍽️'},
-                    {'id': 2, 'name': 'Transporte', 'category_type': 'despesa', 'color': '#4ecdc4', 'icon': '🚗'},
-                    {'id': 3, 'name': 'Moradia', 'category_type': 'despesa', 'color': '#45b7d1', 'icon': '🏠'},
-                    {'id': 4, 'name': 'Entretenimento', 'category_type': 'despesa', 'color': '#feca57', 'icon': '🎮'},
-                    {'id': 5, 'name': 'Salário', 'category_type': 'receita', 'color': '#26de81', 'icon': '💰'},
-                    {'id': 6, 'name': 'Freelance', 'category_type': 'receita', 'color': '#a55eea', 'icon': '💼'},
-                    {'id': 7, 'name': 'Investimentos', 'category_type': 'receita', 'color': '#fd79a8', 'icon': '📈'},
-                    {'id': 8, 'name': 'Outros', 'category_type': 'geral', 'color': '#636e72', 'icon': '📱'},
-                ]
-            
-        except sqlite3.OperationalError as e:
-            app.logger.warning(f"⚠️ Erro em consulta categories: {e}")
-            # Fallback para categorias básicas
-            categories = [
-                {'id': 1, 'name': 'Alimentação', 'category_type': 'despesa', 'color': '#ff6b6b', 'icon': '🍽️'},
-                {'id': 2, 'name': 'Salário', 'category_type': 'receita', 'color': '#26de81', 'icon': '💰'},
-                {'id': 3, 'name': 'Outros', 'category_type': 'geral', 'color': '#636e72', 'icon': '📱'},
-            ]
+        user_accounts = get_user_accounts(current_user['id'])
+        app.logger.debug("🏦 Contas do usuário: %s", len(user_accounts))
         
-        conn.close()
-        app.logger.info("✅ Dashboard carregado com sucesso")
-        
-        return render_template('dashboard/index_debug.html',
-                             monthly_income=monthly_income,
-                             monthly_expenses=monthly_expenses,
-                             recent_transactions=[dict(tx) for tx in recent_transactions],
-                             balance=monthly_income - monthly_expenses,
-                             user_accounts=[dict(acc) for acc in user_accounts],
-                             categories=[dict(cat) for cat in categories],
-                             current_user=current_user,
-                             financial_table=financial_table,
-                             selected_period=period
-                             )
+    except sqlite3.OperationalError as e:
+        app.logger.warning(f"⚠️ Erro em consulta accounts: {e}")
+        user_accounts = []
     
-    except Exception as e:
-        app.logger.error(f"🚨 ERRO CRÍTICO no dashboard: {str(e)}")
-        import traceback
-        app.logger.error(f"📊 Traceback: {traceback.format_exc()}")
-        conn.close()
+    # Categorias disponíveis (para o formulário da aba lateral)
+    try:
+        categories = get_active_categories(conn)
+        app.logger.debug("🏷️ Categorias disponíveis: %s", len(categories))
         
-        # Retornar dashboard básico em caso de erro
-        return render_template('dashboard/index_debug.html',
-                             monthly_income=0,
-                             monthly_expenses=0,
-                             recent_transactions=[],
-                             balance=0,
-                             user_accounts=[],
-                             current_user=current_user,
-                             error_message="Sistema iniciando... Algumas funcionalidades podem estar limitadas.",
-                             financial_table=financial_table,
-                             selected_period=period
-                             )
-    
-    # Transações recentes
-    recent_transactions = conn.execute('''
-        SELECT t.*, a.name as account_name, t.category as category_name
-        FROM transactions t
-        JOIN accounts a ON t.account_id = a.id
-        WHERE a.user_id = ?
-        ORDER BY t.date DESC
-        LIMIT 10
-    ''', (current_user['id'],)).fetchall()
-    
-    # Contas do usuário
-    user_accounts = conn.execute('''
-        SELECT * FROM accounts 
-        WHERE user_id = ? AND is_active = 1 
-        ORDER BY name
-    ''', (current_user['id'],)).fetchall()
+    except sqlite3.OperationalError as e:
+        # Tabela categories não existe (ou schema antigo) - usar categorias padrão
+        app.logger.warning(f"⚠️ Erro em consulta categories: {e}")
+        categories = [
+            {'id': 1, 'name': 'Alimentação', 'category_type': 'despesa', 'color': '#ff6b6b', 'icon': '🍽️'},
+            {'id': 2, 'name': 'Transporte', 'category_type': 'despesa', 'color': '#4ecdc4', 'icon': '🚗'},
+            {'id': 3, 'name': 'Moradia', 'category_type': 'despesa', 'color': '#45b7d1', 'icon': '🏠'},
+            {'id': 4, 'name': 'Entretenimento', 'category_type': 'despesa', 'color': '#feca57', 'icon': '🎮'},
+            {'id': 5, 'name': 'Salário', 'category_type': 'receita', 'color': '#26de81', 'icon': '💰'},
+            {'id': 6, 'name': 'Freelance', 'category_type': 'receita', 'color': '#a55eea', 'icon': '💼'},
+            {'id': 7, 'name': 'Investimentos', 'category_type': 'receita', 'color': '#fd79a8', 'icon': '📈'},
+            {'id': 8, 'name': 'Outros', 'category_type': 'geral', 'color': '#636e72', 'icon': '📱'},
+        ]
     
     conn.close()
+    app.logger.debug("✅ Dashboard carregado com sucesso")
     
-    return render_template('dashboard/index_simple.html',
-                         monthly_income=monthly_income,
-                         monthly_expenses=monthly_expenses,
-                         recent_transactions=[dict(t) for t in recent_transactions],
-                         user_accounts=[dict(acc) for acc in user_accounts])
+    return render_template('dashboard/index_debug.html',
+                         user_accounts=[dict(acc) for acc in user_accounts],
+                         categories=[dict(cat) for cat in categories],
+                         current_user=current_user,
+                         selected_period=period
+                         )
 
 # Rotas de Transações - EXTRATO COMPLETO E ROBUSTO
 
@@ -1495,17 +1527,18 @@ def transactions_debug():
 
 @app.route('/transactions')
 @login_required
+@query_budget(4)
 def transactions():
     """Extrato completo de transações - Versão melhorada e robusta"""
     try:
-        app.logger.info("🏦 ACESSANDO EXTRATO DE TRANSAÇÕES")
+        app.logger.debug("🏦 ACESSANDO EXTRATO DE TRANSAÇÕES")
         current_user = get_current_user()
         
         if not current_user:
             app.logger.error("❌ Usuário não encontrado na sessão")
             return redirect(url_for('login'))
         
-        app.logger.info(f"👤 Usuário logado: {current_user.get('email', 'N/A')} (ID: {current_user.get('id')})")
+        app.logger.debug("👤 Usuário logado: %s (ID: %s)", current_user.get('email', 'N/A'), current_user.get('id'))
         
         # Parâmetros de paginação e filtros
         page = int(request.args.get('page', 1))
@@ -1515,24 +1548,22 @@ def transactions():
         type_filter = request.args.get('type', '')
         date_from = request.args.get('date_from', '')
         date_to = request.args.get('date_to', '')
+        tag_filter = request.args.get('tag', '').strip()
+        merchant_filter = request.args.get('merchant_id', '')
         
-        app.logger.info(f"🔍 Filtros aplicados: page={page}, search='{search}', account={account_filter}, type='{type_filter}'")
+        app.logger.debug("🔍 Filtros aplicados: page=%s, search='%s', account=%s, type='%s'", page, search, account_filter, type_filter)
         
         conn = get_db()
         
         # VERIFICAÇÃO DINÂMICA DA ESTRUTURA DA TABELA - COMPATIBILIDADE TOTAL
         try:
-            cursor = conn.cursor()
-            
-            # Verificar estrutura da tabela transactions
-            cursor.execute("PRAGMA table_info(transactions)")
-            table_columns = [row[1] for row in cursor.fetchall()]
-            app.logger.info(f"🔍 Colunas disponíveis na tabela transactions: {table_columns}")
+            # Verificar estrutura da tabela transactions (em cache por processo)
+            table_columns = get_table_columns(conn, 'transactions')
+            app.logger.debug("🔍 Colunas disponíveis na tabela transactions: %s", table_columns)
             
             # Verificar estrutura da tabela accounts
-            cursor.execute("PRAGMA table_info(accounts)")
-            accounts_columns = [row[1] for row in cursor.fetchall()]
-            app.logger.info(f"🔍 Colunas disponíveis na tabela accounts: {accounts_columns}")
+            accounts_columns = get_table_columns(conn, 'accounts')
+            app.logger.debug("🔍 Colunas disponíveis na tabela accounts: %s", accounts_columns)
             
             # Mapear colunas disponíveis para nomes seguros - TRANSACTIONS
             type_column = 'type' if 'type' in table_columns else ('transaction_type' if 'transaction_type' in table_columns else 'category')
@@ -1544,8 +1575,8 @@ def transactions():
             balance_column = 'balance' if 'balance' in accounts_columns else ('current_balance' if 'current_balance' in accounts_columns else 'initial_balance')
             account_type_column = 'account_type' if 'account_type' in accounts_columns else ('type' if 'type' in accounts_columns else "'Conta Corrente'")
             
-            app.logger.info(f"📋 Mapeamento TRANSACTIONS: type='{type_column}', notes='{notes_column}', category='{category_column}'")
-            app.logger.info(f"📋 Mapeamento ACCOUNTS: bank='{bank_column}', balance='{balance_column}', account_type='{account_type_column}'")
+            app.logger.debug("📋 Mapeamento TRANSACTIONS: type='%s', notes='%s', category='%s'", type_column, notes_column, category_column)
+            app.logger.debug("📋 Mapeamento ACCOUNTS: bank='%s', balance='%s', account_type='%s'", bank_column, balance_column, account_type_column)
             
         except Exception as e:
             app.logger.error(f"❌ Erro ao verificar estrutura da tabela: {e}")
@@ -1572,6 +1603,7 @@ def transactions():
             {f"t.transfer_from_account_id" if 'transfer_from_account_id' in table_columns else 'NULL'} as transfer_from_account_id,
             {f"t.is_transfer" if 'is_transfer' in table_columns else '0'} as is_transfer,
             {f"t.recurrence_type" if 'recurrence_type' in table_columns else "''" } as recurrence_type,
+            {"t.tags" if 'tags' in table_columns else 'NULL'} as tags,
             a.name as account_name,
             {f"a.{bank_column}" if bank_column in accounts_columns else "''" } as bank_name,
             ta.name as transfer_account_name,
@@ -1587,7 +1619,7 @@ def transactions():
         FROM transactions t
         LEFT JOIN accounts a ON t.account_id = a.id
         LEFT JOIN accounts ta ON ({f"t.transfer_to_account_id = ta.id OR t.transfer_from_account_id = ta.id" if 'transfer_to_account_id' in table_columns else "t.account_id = ta.id"})
-        WHERE (a.user_id = ? OR {f"t.user_id = ?" if 'user_id' in table_columns else "1=1"})
+        WHERE {"(a.user_id = ? OR t.user_id = ?)" if 'user_id' in table_columns else "a.user_id = ?"}
         '''
         
         if 'user_id' in table_columns:
@@ -1597,9 +1629,15 @@ def transactions():
         
         # Aplicar filtros dinâmicos
         if search:
-            base_query += f' AND (t.description LIKE ? OR t.{notes_column} LIKE ? OR t.{category_column} LIKE ?)'
             search_param = f'%{search}%'
-            params.extend([search_param, search_param, search_param])
+            if 'merchant_id' in table_columns:
+                # Também pelo estabelecimento normalizado: 'pao de acucar' acha 'Pão de Açúcar'
+                base_query += (f' AND (t.description LIKE ? OR t.{notes_column} LIKE ? OR t.{category_column} LIKE ?'
+                               f' OR t.merchant_id IN (SELECT id FROM merchants WHERE key LIKE ?))')
+                params.extend([search_param, search_param, search_param, f'%{merchant_key(search)}%'])
+            else:
+                base_query += f' AND (t.description LIKE ? OR t.{notes_column} LIKE ? OR t.{category_column} LIKE ?)'
+                params.extend([search_param, search_param, search_param])
             
         if account_filter and account_filter.isdigit():
             base_query += ' AND t.account_id = ?'
@@ -1617,80 +1655,101 @@ def transactions():
             base_query += ' AND DATE(t.date) <= ?'
             params.append(date_to)
         
-        # Contar total para paginação
-        count_query = f"SELECT COUNT(*) FROM ({base_query}) as count_subquery"
-        total_transactions = conn.execute(count_query, params).fetchone()[0]
+        if merchant_filter.isdigit() and 'merchant_id' in table_columns:
+            base_query += ' AND t.merchant_id = ?'
+            params.append(int(merchant_filter))
+        
+        # Tag exata pelo índice normalizado (migração 014), sem LIKE no texto
+        if tag_filter:
+            base_query += f' AND {tag_filter_sql()}'
+            params.extend([current_user['id'], tag_filter])
         
-        # Adicionar ordenação e paginação
-        final_query = base_query + '''
+        # Página + total para paginação na mesma consulta (COUNT(*) OVER)
+        final_query = f'''
+        SELECT *, COUNT(*) OVER () as total_rows
+        FROM ({base_query}) as filtered
         ORDER BY 
-            DATE(t.date) DESC, 
-            t.id DESC 
+            DATE(date) DESC, 
+            id DESC 
         LIMIT ? OFFSET ?
         '''
-        params.extend([per_page, (page - 1) * per_page])
+        page_params = params + [per_page, (page - 1) * per_page]
         
         # Executar query principal
-        transactions_data = conn.execute(final_query, params).fetchall()
-        app.logger.info(f"📊 Encontradas {len(transactions_data)} transações na página {page}")
+        transactions_data = [dict(t) for t in conn.execute(final_query, page_params).fetchall()]
+        app.logger.debug("📊 Encontradas %s transações na página %s", len(transactions_data), page)
         
-        # Buscar estatísticas gerais
-        stats_query = f'''
-        SELECT 
-            COUNT(*) as total_count,
-            SUM(CASE WHEN t.{type_column} = 'receita' THEN t.amount ELSE 0 END) as total_receitas,
-            SUM(CASE WHEN t.{type_column} = 'despesa' THEN t.amount ELSE 0 END) as total_despesas,
-            SUM(CASE WHEN t.{type_column} = 'receita' THEN t.amount ELSE -t.amount END) as saldo_total
-        FROM transactions t
-        LEFT JOIN accounts a ON t.account_id = a.id
-        WHERE (a.user_id = ? OR {f"t.user_id = ?" if 'user_id' in table_columns else "1=1"})
-        '''
-        if 'user_id' in table_columns:
-            stats = conn.execute(stats_query, [current_user['id'], current_user['id']]).fetchone()
+        # Saldo corrido da conta após cada linha, a partir dos checkpoints mensais (migração 010)
+        try:
+            balances = running_balances(conn, transactions_data, type_column, table_columns)
+        except sqlite3.OperationalError as e:
+            app.logger.warning(f"⚠️ Saldo corrido indisponível: {e}")
+            balances = {}
+        for t in transactions_data:
+            balance = balances.get(t['id'])
+            t['running_balance'] = balance.to_float() if balance is not None else None
+        
+        if transactions_data:
+            total_transactions = transactions_data[0]['total_rows']
+        elif page > 1:
+            # Página além do fim: contar à parte
+            count_query = f"SELECT COUNT(*) FROM ({base_query}) as count_subquery"
+            total_transactions = conn.execute(count_query, params).fetchone()[0]
         else:
-            stats = conn.execute(stats_query, [current_user['id']]).fetchone()
-        
-        # Buscar contas do usuário para filtros - USANDO FALLBACK CTE
-        if _has_column(conn, "accounts", "balance"):
-            accounts_data = conn.execute("""
-                SELECT id, name, bank_name, account_type, balance
-                FROM accounts
-                WHERE user_id = ?
-                ORDER BY name;
-            """, (current_user['id'],)).fetchall()
+            total_transactions = 0
+        
+        # Contas do usuário para filtros + estatísticas gerais agregadas por conta (uma consulta)
+        # Somas em centavos inteiros (exatas); conversão para reais só no fim
+        amount = cents_sql('amount', 't', table_columns)
+        if 'balance' in accounts_columns:
+            balance_expr = cents_sql('balance', 'a', accounts_columns)
         else:
-            accounts_data = conn.execute("""
-                WITH balances AS (
-                  SELECT account_id,
-                         COALESCE(SUM(CASE
-                           WHEN transaction_type='income'  THEN amount
-                           WHEN transaction_type='expense' THEN -amount
-                           ELSE 0 END),0) AS balance
-                  FROM transactions
-                  GROUP BY account_id
-                )
-                SELECT a.id, a.name, a.bank_name, a.account_type,
-                       COALESCE(b.balance, 0) AS balance
-                FROM accounts a
-                LEFT JOIN balances b ON b.account_id = a.id
-                WHERE a.user_id = ?
-                ORDER BY a.name;
-            """, (current_user['id'],)).fetchall()
+            balance_expr = f"""COALESCE(SUM(CASE
+                           WHEN t.{type_column}='income'  THEN {amount}
+                           WHEN t.{type_column}='expense' THEN -{amount}
+                           ELSE 0 END),0)"""
+        money_keys = ('balance', 'total_receitas', 'total_despesas', 'saldo_total')
+        accounts_data = [dict(acc) for acc in conn.execute(f"""
+            SELECT a.id, a.name, a.bank_name, a.account_type,
+                   {balance_expr} AS balance,
+                   COUNT(t.id) AS total_count,
+                   COALESCE(SUM(CASE WHEN t.{type_column} = 'receita' THEN {amount} ELSE 0 END), 0) AS total_receitas,
+                   COALESCE(SUM(CASE WHEN t.{type_column} = 'despesa' THEN {amount} ELSE 0 END), 0) AS total_despesas,
+                   COALESCE(SUM(CASE WHEN t.{type_column} = 'receita' THEN {amount} ELSE -{amount} END), 0) AS saldo_total
+            FROM accounts a
+            LEFT JOIN transactions t ON t.account_id = a.id
+            WHERE a.user_id = ?
+            GROUP BY a.id
+            ORDER BY a.name;
+        """, (current_user['id'],)).fetchall()]
         
-        # Buscar categorias únicas para filtros
-        categories_query = f'''
-        SELECT DISTINCT {category_column} as category
-        FROM transactions t
-        LEFT JOIN accounts a ON t.account_id = a.id
-        WHERE (a.user_id = ? {f"OR t.user_id = ?" if 'user_id' in table_columns else ""}) 
-        AND {category_column} IS NOT NULL 
-        AND {category_column} != ''
-        ORDER BY {category_column}
-        '''
+        stats_keys = ('total_count', 'total_receitas', 'total_despesas', 'saldo_total')
         if 'user_id' in table_columns:
-            categories_data = conn.execute(categories_query, [current_user['id'], current_user['id']]).fetchall()
+            # Schema legado: transações sem conta também pertencem ao usuário via t.user_id
+            stats = conn.execute(f'''
+            SELECT 
+                COUNT(*) as total_count,
+                SUM(CASE WHEN t.{type_column} = 'receita' THEN {amount} ELSE 0 END) as total_receitas,
+                SUM(CASE WHEN t.{type_column} = 'despesa' THEN {amount} ELSE 0 END) as total_despesas,
+                SUM(CASE WHEN t.{type_column} = 'receita' THEN {amount} ELSE -{amount} END) as saldo_total
+            FROM transactions t
+            LEFT JOIN accounts a ON t.account_id = a.id
+            WHERE (a.user_id = ? OR t.user_id = ?)
+            ''', [current_user['id'], current_user['id']]).fetchone()
+            stats_data = {key: stats[i] or 0 for i, key in enumerate(stats_keys)}
         else:
-            categories_data = conn.execute(categories_query, [current_user['id']]).fetchall()
+            stats_data = {key: sum(acc[key] for acc in accounts_data) for key in stats_keys}
+        for key in stats_keys[1:]:
+            stats_data[key] = Money(stats_data[key]).to_float()
+        for acc in accounts_data:
+            for key in money_keys:
+                acc[key] = Money(acc[key] or 0).to_float()
+        
+        # Categorias para filtros (lista global em cache)
+        try:
+            categories_data = get_active_categories(conn)
+        except sqlite3.OperationalError:
+            categories_data = []
         
         conn.close()
         
@@ -1714,24 +1773,19 @@ def transactions():
             'account_id': account_filter,
             'type': type_filter,
             'date_from': date_from,
-            'date_to': date_to
+            'date_to': date_to,
+            'tag': tag_filter,
+            'merchant_id': merchant_filter
         }
         
-        stats_data = {
-            'total_count': stats[0] if stats else 0,
-            'total_receitas': stats[1] if stats else 0,
-            'total_despesas': stats[2] if stats else 0,
-            'saldo_total': stats[3] if stats else 0
-        }
-        
-        app.logger.info(f"✅ Extrato carregado: {len(transactions_data)} transações, {len(accounts_data)} contas")
+        app.logger.debug("✅ Extrato carregado: %s transações, %s contas", len(transactions_data), len(accounts_data))
         
         # Verificar se existe template, senão criar um simples
         try:
             return render_template('transactions/extrato_completo.html',
-                                 transactions=[dict(t) for t in transactions_data],
-                                 accounts=[dict(acc) for acc in accounts_data], 
-                                 categories=[dict(cat) for cat in categories_data],
+                                 transactions=transactions_data,
+                                 accounts=accounts_data, 
+                                 categories=categories_data,
                                  pagination=pagination_data,
                                  filters=filter_data,
                                  stats=stats_data,
@@ -1820,11 +1874,16 @@ def render_transactions_inline(transactions, accounts, pagination, filters, stat
             <div class="filter-card p-4">
                 <h5><i class="fas fa-filter me-2"></i>Filtros</h5>
                 <form method="GET" class="row g-3">
-                    <div class="col-md-3">
+                    <div class="col-md-2">
                         <label class="form-label">Buscar</label>
                         <input type="text" name="search" class="form-control" value="{filters.get('search', '')}" 
                                placeholder="Descrição, notas...">
                     </div>
+                    <div class="col-md-1">
+                        <label class="form-label">Tag</label>
+                        <input type="text" name="tag" class="form-control" value="{escape(filters.get('tag', ''))}">
+                        <input type="hidden" name="merchant_id" value="{escape(filters.get('merchant_id', ''))}">
+                    </div>
                     <div class="col-md-2">
                         <label class="form-label">Conta</label>
                         <select name="account_id" class="form-select">
@@ -1877,6 +1936,12 @@ def render_transactions_inline(transactions, accounts, pagination, filters, stat
                         <a href="/transactions/new" class="btn btn-success btn-sm">
                             <i class="fas fa-plus me-1"></i>Nova Transação
                         </a>
+                        <a href="/transactions/import" class="btn btn-outline-primary btn-sm">
+                            <i class="fas fa-file-import me-1"></i>Importar Extrato
+                        </a>
+                        <a href="/transactions/duplicates" class="btn btn-outline-secondary btn-sm">
+                            <i class="fas fa-clone me-1"></i>Duplicatas
+                        </a>
                         <a href="/test-transaction-bypass" class="btn btn-warning btn-sm">
                             <i class="fas fa-flask me-1"></i>Teste Rápido
                         </a>
@@ -1897,6 +1962,7 @@ def render_transactions_inline(transactions, accounts, pagination, filters, stat
                         <th>Conta</th>
                         <th>Tipo</th>
                         <th class="text-end">Valor</th>
+                        <th class="text-end">Saldo</th>
                         <th>Ações</th>
                     </tr>
                 </thead>
@@ -1911,10 +1977,14 @@ def render_transactions_inline(transactions, accounts, pagination, filters, stat
             account_name = str(t.get('account_name', 'N/A'))[:20]
             amount = float(t.get('amount', 0))
             transaction_type = str(t.get('type', 'N/A'))
+            running_balance = t.get('running_balance')
+            balance_str = f'R$ {running_balance:,.2f}' if running_balance is not None else '—'
             
             # Classes CSS condicionais
             amount_class = 'text-success' if transaction_type == 'receita' else 'text-danger'
             type_icon = '📈' if transaction_type == 'receita' else '📉'
+            tag_badges = ''.join(f' <a href="?tag={quote(tag)}" class="badge bg-light text-primary">#{escape(tag)}</a>'
+                                 for tag in (normalize_tags(t.get('tags')) or '').split(',') if tag)
             
             html += f'''
             <tr class="transaction-card">
@@ -1922,6 +1992,7 @@ def render_transactions_inline(transactions, accounts, pagination, filters, stat
                 <td>
                     <strong>{description}</strong>
                     {f'<br><small class="text-muted">{t.get("notes", "")[:30]}</small>' if t.get("notes") else ""}
+                    {tag_badges}
                 </td>
                 <td><span class="badge bg-secondary">{category}</span></td>
                 <td><small>{account_name}</small></td>
@@ -1929,6 +2000,7 @@ def render_transactions_inline(transactions, accounts, pagination, filters, stat
                 <td class="text-end">
                     <strong class="{amount_class}">R$ {amount:,.2f}</strong>
                 </td>
+                <td class="text-end"><small class="text-muted">{balance_str}</small></td>
                 <td>
                     <div class="btn-group btn-group-sm">
                         <button class="btn btn-outline-primary btn-sm" title="Editar">
@@ -1995,17 +2067,18 @@ def render_transactions_inline(transactions, accounts, pagination, filters, stat
 
 @app.route('/transactions/new', methods=['GET', 'POST'])
 @login_required
+@idempotent
 def new_transaction():
     current_user = get_current_user()
     
     if request.method == 'POST':
         try:
-            app.logger.info("🔍 Debug: Iniciando nova transação")
+            app.logger.debug("🔍 Debug: Iniciando nova transação")
             
             # Verificar se é JSON (da aba lateral) ou form normal
             if request.is_json:
                 data = request.get_json()
-                app.logger.info(f"🔍 Debug: Dados recebidos (JSON): {data}")
+                app.logger.debug("🔍 Debug: Dados recebidos (JSON): %s", data)
                 description = data['description']
                 amount = float(data['amount'])
                 date_str = data['date']
@@ -2013,8 +2086,11 @@ def new_transaction():
                 account_id = int(data['account_id'])
                 chart_account_id = data.get('category_id', '')
                 notes = data.get('notes', '')
+                tags = normalize_tags(data.get('tags'))
+                allow_duplicate = bool(data.get('allow_duplicate'))
+                transfer_account_id = int(data['transfer_account_id']) if data.get('transfer_account_id') else None
             else:
-                app.logger.info("🔍 Debug: Dados recebidos (Form)")
+                app.logger.debug("🔍 Debug: Dados recebidos (Form)")
                 # Form normal
                 description = request.form['description']
                 amount = float(request.form['amount'])
@@ -2023,16 +2099,24 @@ def new_transaction():
                 account_id = int(request.form['account_id'])
                 chart_account_id = request.form.get('category', '')
                 notes = request.form.get('notes', '')
-            
-            app.logger.info(f"🔍 Debug: Processando - Type: {transaction_type}, Account: {account_id}, Category: {chart_account_id}")
-            
-            # Campos adicionais para form normal
-            transfer_account_id = None
-            if not request.is_json:
+                tags = normalize_tags(request.form.get('tags'))
+                allow_duplicate = 'allow_duplicate' in request.form
                 transfer_account_id = int(request.form['transfer_account_id']) if request.form.get('transfer_account_id') and request.form['transfer_account_id'] != '0' else None
             
+            app.logger.debug("🔍 Debug: Processando - Type: %s, Account: %s, Category: %s", transaction_type, account_id, chart_account_id)
+            if transaction_type != 'transferencia':
+                transfer_account_id = None
+            
             conn = get_db()
             
+            # Sem categoria: tentar as regras do usuário (categorization.py) antes de recusar
+            if not chart_account_id and transaction_type != 'transferencia':
+                rule = rule_set(conn, current_user['id']).match(description, to_cents(amount), account_id,
+                                                                transaction_type)
+                if rule:
+                    chart_account_id = rule.category_id
+                    app.logger.info("🏷️ Categoria %s pela regra %s", rule.category_id, rule.id)
+            
             # Validações
             if not chart_account_id and transaction_type != 'transferencia':
                 error_msg = 'Categoria é obrigatória para receitas e despesas.'
@@ -2055,56 +2139,101 @@ def new_transaction():
                     flash(error_msg, 'danger')
                     return redirect(url_for('new_transaction'))
             
+            if transfer_account_id and (transfer_account_id == account_id or not conn.execute(
+                    'SELECT id FROM accounts WHERE id = ? AND user_id = ?',
+                    (transfer_account_id, current_user['id'])).fetchone()):
+                error_msg = 'Conta de destino da transferência deve ser outra conta sua.'
+                app.logger.warning(f"⚠️ Validação: {error_msg}")
+                if request.is_json:
+                    return jsonify({'success': False, 'message': error_msg})
+                else:
+                    flash(error_msg, 'danger')
+                    return redirect(url_for('new_transaction'))
+            
+            # Transferência sai da origem com valor negativo e entra positiva no destino,
+            # como na API em lote (transaction_batch.py) e no gerador de dataset
+            signed_amount = -amount if transaction_type == 'transferencia' else amount
+            
+            # Duplicata exata (ex.: cliente repetindo o POST) não é criada de novo - dedup.py
+            cents = to_cents(signed_amount)
+            duplicate = find_duplicate(conn, account_id, date_str, transaction_type, cents, description)
+            if duplicate and duplicate['match'] == 'exact' and not allow_duplicate:
+                conn.close()
+                app.logger.info("♻️ Transação duplicada ignorada: igual à ID %s", duplicate['id'])
+                message = 'Transação idêntica já registrada; nada foi criado.'
+                if request.is_json:
+                    return jsonify({'success': True, 'duplicate': True, 'message': message,
+                                    'transaction_id': duplicate['id']})
+                flash(message, 'warning')
+                return redirect(url_for('transactions'))
+            
             # Inserir transação principal - ROBUSTA
             try:
                 # Detectar estrutura da tabela dinamicamente
                 cursor = conn.cursor()
                 cursor.execute("PRAGMA table_info(transactions)")
                 columns = [row[1] for row in cursor.fetchall()]
-                app.logger.info(f"🔍 Debug: Colunas da tabela: {columns}")
+                app.logger.debug("🔍 Debug: Colunas da tabela: %s", columns)
                 
                 # Preparar dados baseado na estrutura real da tabela
                 if 'user_id' in columns:
-                    app.logger.info("🔍 Debug: Usando estrutura com user_id")
+                    app.logger.debug("🔍 Debug: Usando estrutura com user_id")
                     transaction_id = conn.execute('''
                         INSERT INTO transactions (user_id, description, amount, date, transaction_type, category, account_id, notes)
                         VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                    ''', (current_user['id'], description, amount, date_str, transaction_type, 
+                    ''', (current_user['id'], description, signed_amount, date_str, transaction_type, 
                           chart_account_id or None, account_id, notes)).lastrowid
                 else:
-                    app.logger.info("🔍 Debug: Usando estrutura sem user_id")
+                    app.logger.debug("🔍 Debug: Usando estrutura sem user_id")
                     # Fallback para estrutura sem user_id
                     transaction_id = conn.execute('''
                         INSERT INTO transactions (description, amount, date, transaction_type, category, account_id, notes)
                         VALUES (?, ?, ?, ?, ?, ?, ?)
-                    ''', (description, amount, date_str, transaction_type, 
+                    ''', (description, signed_amount, date_str, transaction_type, 
                           chart_account_id or None, account_id, notes)).lastrowid
                 
-                app.logger.info(f"✅ Transação criada: ID {transaction_id}")
+                app.logger.info("✅ Transação criada: ID %s", transaction_id)
+                
+                if 'fingerprint' in columns:
+                    conn.execute('UPDATE transactions SET fingerprint = ? WHERE id = ?',
+                                 (fingerprint(account_id, date_str, transaction_type, cents, description),
+                                  transaction_id))
+                
+                # Estabelecimento normalizado (merchants.py)
+                merchant_id = None
+                if 'merchant_id' in columns:
+                    merchant_id = intern_merchants(conn, [description])[description]
+                    conn.execute('UPDATE transactions SET merchant_id = ? WHERE id = ?', (merchant_id, transaction_id))
+                
+                # Tags: os triggers da migração 014 atualizam o índice (tags.py)
+                if 'tags' in columns and tags:
+                    conn.execute('UPDATE transactions SET tags = ? WHERE id = ?', (tags, transaction_id))
                 
-                # Para transferências, criar transação contrária
+                # Para transferências, criar a entrada na conta de destino; as duas pernas
+                # apontam uma para a outra em transfer_account_id
                 if transaction_type == 'transferencia' and transfer_account_id:
-                    if 'user_id' in columns:
-                        conn.execute('''
-                            INSERT INTO transactions (user_id, description, amount, date, transaction_type, account_id, notes, transfer_to_account_id)
-                            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                        ''', (current_user['id'], f'Transferência: {description}', -amount, date_str, 'transferencia',
-                              transfer_account_id, notes, account_id))
-                    else:
-                        conn.execute('''
-                            INSERT INTO transactions (description, amount, date, transaction_type, account_id, notes, transfer_to_account_id)
-                            VALUES (?, ?, ?, ?, ?, ?, ?)
-                        ''', (f'Transferência: {description}', -amount, date_str, 'transferencia',
-                              transfer_account_id, notes, account_id))
+                    if 'transfer_account_id' in columns:
+                        conn.execute('UPDATE transactions SET transfer_account_id = ? WHERE id = ?',
+                                     (transfer_account_id, transaction_id))
+                    counterpart = {
+                        'user_id': current_user['id'], 'description': description, 'amount': amount,
+                        'date': date_str, 'transaction_type': 'transferencia', 'account_id': transfer_account_id,
+                        'notes': notes, 'transfer_account_id': account_id, 'merchant_id': merchant_id,
+                        'fingerprint': fingerprint(transfer_account_id, date_str, transaction_type,
+                                                   to_cents(amount), description),
+                    }
+                    names = [name for name in counterpart if name in columns]
+                    conn.execute(f"INSERT INTO transactions ({', '.join(names)}) VALUES ({', '.join('?' * len(names))})",
+                                 [counterpart[name] for name in names])
                     
-                    app.logger.info(f"✅ Transferência contrária criada")
+                    app.logger.debug("✅ Transferência contrária criada")
                 
                 # Atualizar saldos das contas - CRÍTICO
                 try:
                     update_account_balance(conn, account_id)
                     if transfer_account_id:
                         update_account_balance(conn, transfer_account_id)
-                    app.logger.info(f"✅ Saldos atualizados")
+                    app.logger.debug("✅ Saldos atualizados")
                 except Exception as balance_error:
                     app.logger.warning(f"⚠️ Erro ao atualizar saldos: {balance_error}")
                 
@@ -2112,9 +2241,13 @@ def new_transaction():
                 
                 success_msg = 'Transação criada com sucesso!'
                 if request.is_json:
-                    return jsonify({'success': True, 'message': success_msg, 'transaction_id': transaction_id})
+                    return jsonify({'success': True, 'message': success_msg, 'transaction_id': transaction_id,
+                                    'possible_duplicate': duplicate})
                 else:
                     flash(success_msg, 'success')
+                    if duplicate:
+                        flash(f"Possível duplicata de \"{duplicate['description']}\" em "
+                              f"{duplicate['date']} com o mesmo valor.", 'info')
                     return redirect(url_for('transactions'))
                 
             except Exception as insert_error:
@@ -2157,7 +2290,10 @@ def new_transaction():
             ORDER BY category_type, name
         ''').fetchall()
         
-        app.logger.info(f"📝 Formulário carregado: {len(user_accounts)} contas, {len(categories)} categorias")
+        app.logger.debug("📝 Formulário carregado: %s contas, %s categorias", len(user_accounts), len(categories))
+        
+        # Agenda o retreino do modelo de sugestões já ao abrir o formulário, se os dados mudaram
+        user_model(conn, app.config['DATABASE'], current_user['id'])
         
     except Exception as e:
         app.logger.error(f"🚨 Erro ao carregar formulário: {e}")
@@ -2203,14 +2339,24 @@ def edit_transaction(id):
         is_confirmed = 'is_confirmed' in request.form
         
         # Atualizar transação
-        conn.execute('''
+        columns = get_table_columns(conn, 'transactions')
+        conn.execute(f'''
             UPDATE transactions SET
-                description = ?, amount = ?, date = ?, type = ?,
+                description = ?, amount = ?, date = ?, {get_transaction_type_column(conn)} = ?,
                 category = ?, account_id = ?, notes = ?
             WHERE id = ?
         ''', (description, amount, date_str, transaction_type, chart_account_id,
               account_id, notes, id))
-        
+
+        # Os triggers das migrações 007 e 017 só zeram impressão digital e estabelecimento:
+        # recalcular já na edição
+        if 'fingerprint' in columns:
+            conn.execute('UPDATE transactions SET fingerprint = ? WHERE id = ?',
+                         (fingerprint(account_id, date_str, transaction_type, to_cents(amount), description), id))
+        if 'merchant_id' in columns and description != transaction['description']:
+            conn.execute('UPDATE transactions SET merchant_id = ? WHERE id = ?',
+                         (intern_merchants(conn, [description])[description], id))
+
         # Atualizar saldos das contas
         update_account_balance(conn, transaction['account_id'])  # Conta antiga
         update_account_balance(conn, account_id)  # Conta nova
@@ -2277,6 +2423,118 @@ def delete_transaction(id):
     flash('Transação excluída com sucesso!', 'success')
     return redirect(url_for('transactions'))
 
+@app.route('/transactions/import', methods=['GET', 'POST'])
+@login_required
+def import_transactions():
+    """Importar extrato CSV/OFX (statement_import.py) - leitura em streaming e inserção em lotes"""
+    current_user = get_current_user()
+    wants_json = request.accept_mimetypes.best == 'application/json'
+    
+    if request.method == 'POST':
+        upload = request.files.get('csv_file')
+        account_id = request.form.get('account_id', type=int)
+        error_msg = None
+        if not upload or not upload.filename:
+            error_msg = 'Selecione um arquivo CSV ou OFX.'
+        elif not any(acc['id'] == account_id for acc in get_user_accounts(current_user['id'])):
+            error_msg = 'Conta selecionada não encontrada.'
+        if error_msg:
+            app.logger.warning(f"⚠️ Importação: {error_msg}")
+            if wants_json:
+                return jsonify({'success': False, 'message': error_msg}), 400
+            flash(error_msg, 'danger')
+            return redirect(url_for('import_transactions'))
+        
+        # Tamanho do upload (já em disco/memória pelo Werkzeug) para o percentual de progresso
+        stream = upload.stream
+        stream.seek(0, os.SEEK_END)
+        total_bytes = stream.tell()
+        stream.seek(0)
+        
+        conn = get_db()
+        try:
+            importer = StatementImporter(conn, current_user['id'], account_id, update_account_balance,
+                                         skip_duplicates=request.form.get('allow_duplicates') is None,
+                                         rules=rule_set(conn, current_user['id']),
+                                         suggest=category_suggester(conn, current_user['id']))
+            summary = importer.run(stream, detect_format(upload.filename), filename=upload.filename,
+                                   total_bytes=total_bytes,
+                                   date_format=request.form.get('date_format', '%d/%m/%Y'),
+                                   decimal_separator=request.form.get('decimal_separator', ','),
+                                   has_header=request.form.get('has_header') is not None)
+        except StatementImportError as e:
+            if wants_json:
+                return jsonify({'success': False, 'message': str(e)}), 400
+            flash(str(e), 'danger')
+            return redirect(url_for('import_transactions'))
+        except Exception as e:
+            app.logger.error(f"🚨 Erro na importação: {e}")
+            if wants_json:
+                return jsonify({'success': False, 'message': 'Erro ao importar o extrato.'}), 500
+            flash('Erro ao importar o extrato.', 'danger')
+            return redirect(url_for('import_transactions'))
+        finally:
+            conn.close()
+        
+        message = f"{summary['inserted']} transações importadas"
+        if summary['categorized']:
+            message += f", {summary['categorized']} categorizadas pelas regras"
+        if summary['duplicates']:
+            message += f", {summary['duplicates']} já existentes ignoradas"
+        if summary['error_count']:
+            message += f", {summary['error_count']} linhas ignoradas"
+        if wants_json:
+            return jsonify({'success': True, 'message': message, **summary})
+        flash(message + '.', 'success' if not summary['error_count'] else 'warning')
+        for error in summary['errors'][:5]:
+            flash(error, 'warning')
+        return redirect(url_for('transactions'))
+    
+    return render_template('transactions/import.html',
+                         title='Importar Extrato',
+                         user_accounts=get_user_accounts(current_user['id']))
+
+@app.route('/transactions/import/status')
+@login_required
+def import_transactions_status():
+    """Progresso da última importação do usuário (consultado durante o upload)"""
+    current_user = get_current_user()
+    conn = get_db()
+    batch = conn.execute('''
+        SELECT id, filename, file_format, status, total_bytes, bytes_read, lines_read,
+               inserted_count, duplicate_count, error_count, errors, started_at, finished_at
+        FROM import_batches WHERE user_id = ? ORDER BY id DESC LIMIT 1
+    ''', (current_user['id'],)).fetchone()
+    conn.close()
+    if not batch:
+        return jsonify({'status': 'none'})
+    batch = dict(batch)
+    batch['errors'] = json.loads(batch['errors'] or '[]')
+    batch['percent'] = (round(100 * batch['bytes_read'] / batch['total_bytes'], 1)
+                        if batch['total_bytes'] else None)
+    return jsonify(batch)
+
+@app.route('/transactions/duplicates')
+@login_required
+@query_budget(4)
+def transaction_duplicates():
+    """Relatório de duplicatas (exatas e possíveis) - uma passada indexada em dedup.find_duplicates"""
+    current_user = get_current_user()
+    window_days = min(max(request.args.get('days', DEFAULT_WINDOW_DAYS, type=int), 0), 31)
+    conn = get_db()
+    try:
+        groups = find_duplicates(conn, current_user['id'], window_days,
+                                 columns=get_table_columns(conn, 'transactions'))
+    finally:
+        conn.close()
+    
+    if request.accept_mimetypes.best == 'application/json':
+        return jsonify({'window_days': window_days, 'groups': groups})
+    return render_template('transactions/duplicates.html',
+                         title='Transações Duplicadas',
+                         groups=groups,
+                         window_days=window_days)
+
 def create_recurring_transactions(parent_id, recurrence_type, end_date_str):
     """Cria transações recorrentes"""
     conn = get_db()
@@ -2343,6 +2601,7 @@ def create_child_transaction(conn, parent, date, parent_id):
 # Rotas de Relatórios - ETAPA 3
 @app.route('/reports')
 @login_required
+@query_budget(2)
 def reports():
     """Dashboard principal de relatórios"""
     current_user = get_current_user()
@@ -2385,6 +2644,7 @@ def reports():
 
 @app.route('/reports/cash_flow')
 @login_required
+@query_budget(5)
 def cash_flow_report():
     """Relatório de Fluxo de Caixa"""
     current_user = get_current_user()
@@ -2401,34 +2661,20 @@ def cash_flow_report():
         end_date = today.strftime('%Y-%m-%d')
         start_date = (today - timedelta(days=180)).strftime('%Y-%m-%d')
     
+    # Fluxo mensal a partir do cubo analítico (sem agregação no SQLite ao trocar filtros)
     conn = get_db()
-    
-    # Query base para fluxo de caixa mensal
-    query = '''
-        SELECT 
-            strftime('%Y-%m', t.date) as mes,
-            COALESCE(SUM(CASE WHEN t.transaction_type = 'receita' AND t.is_confirmed = 1 THEN t.amount ELSE 0 END), 0) as receitas,
-            COALESCE(SUM(CASE WHEN t.transaction_type = 'despesa' AND t.is_confirmed = 1 THEN t.amount ELSE 0 END), 0) as despesas
-        FROM transactions t
-        JOIN accounts a ON t.account_id = a.id
-        WHERE a.user_id = ? AND t.date >= ? AND t.date <= ?
-    '''
-    params = [current_user['id'], start_date, end_date]
-    
-    if account_id:
-        query += ' AND t.account_id = ?'
-        params.append(account_id)
-    
-    query += ' GROUP BY strftime("%Y-%m", t.date) ORDER BY mes'
-    
-    cash_flow_data = conn.execute(query, params).fetchall()
+    cube = get_analytics_cube(conn, current_user['id'])
+    conn.close()
+    try:
+        selected = cube.mask(start=start_date, end=end_date,
+                             account_id=int(account_id) if account_id else None)
+    except ValueError:
+        flash('Filtro inválido.', 'error')
+        selected = cube.mask(start=start_date, end=end_date)
+    cash_flow_data = cube.monthly_flow(selected)
     
     # Contas para filtro
-    user_accounts = conn.execute('''
-        SELECT * FROM accounts 
-        WHERE user_id = ? AND is_active = 1 
-        ORDER BY name
-    ''', (current_user['id'],)).fetchall()
+    user_accounts = get_user_accounts(current_user['id'])
     
     # Dados para gráfico
     labels = []
@@ -2447,8 +2693,6 @@ def cash_flow_report():
         saldo_acumulado += saldo_mensal
         saldo_values.append(saldo_acumulado)
     
-    conn.close()
-    
     chart_data = {
         'labels': labels,
         'receitas': receitas_values,
@@ -2458,7 +2702,7 @@ def cash_flow_report():
     
     return render_template('reports/cash_flow_simple.html',
                          chart_data=chart_data,
-                         cash_flow_data=[dict(row) for row in cash_flow_data],
+                         cash_flow_data=cash_flow_data,
                          user_accounts=[dict(acc) for acc in user_accounts],
                          start_date=start_date,
                          end_date=end_date,
@@ -2466,6 +2710,7 @@ def cash_flow_report():
 
 @app.route('/reports/categories')
 @login_required
+@query_budget(4)
 def categories_report():
     """Relatório por Categorias"""
     current_user = get_current_user()
@@ -2482,36 +2727,19 @@ def categories_report():
         end_date = today.strftime('%Y-%m-%d')
         start_date = today.replace(day=1).strftime('%Y-%m-%d')
     
+    # Plano de contas do tipo escolhido, a partir do cubo analítico
     conn = get_db()
-    
-    # Query para categorias
-    categories_data = conn.execute('''
-        SELECT 
-            c.name as categoria,
-            c.code as codigo,
-            COALESCE(SUM(t.amount), 0) as total,
-            COUNT(t.id) as qtd_transacoes,
-            ROUND(AVG(t.amount), 2) as valor_medio
-        FROM chart_of_accounts c
-        LEFT JOIN transactions t ON c.id = t.chart_account_id 
-            AND t.transaction_type = ? 
-            AND t.is_confirmed = 1
-            AND t.date >= ? AND t.date <= ?
-        JOIN accounts a ON t.account_id = a.id
-        WHERE c.account_type = ? AND c.is_active = 1 AND c.is_summary = 0
-            AND a.user_id = ?
-        GROUP BY c.id, c.name, c.code
-        HAVING total > 0
-        ORDER BY total DESC
-        LIMIT 20
-    ''', (transaction_type, start_date, end_date, transaction_type, current_user['id'])).fetchall()
+    cube = get_analytics_cube(conn, current_user['id'])
+    conn.close()
+    categories_data = cube.top_categories(
+        cube.mask(start=start_date, end=end_date, kind=transaction_type, confirmed=True), 20,
+        chart_filter=lambda chart: (chart['account_type'] == transaction_type and chart['is_active']
+                                    and not chart['is_summary']))
     
     # Dados para gráfico
     labels = [row['categoria'] for row in categories_data]
     values = [float(row['total']) for row in categories_data]
     
-    conn.close()
-    
     chart_data = {
         'labels': labels,
         'values': values
@@ -2519,13 +2747,108 @@ def categories_report():
     
     return render_template('reports/categories_simple.html',
                          chart_data=chart_data,
-                         categories_data=[dict(row) for row in categories_data],
+                         categories_data=categories_data,
                          start_date=start_date,
                          end_date=end_date,
                          transaction_type=transaction_type)
 
+def _report_period():
+    """(start_date, end_date) de ?start_date=&end_date=, padrão mês atual (ValueError se inválido)"""
+    today = date.today()
+    start_date = request.args.get('start_date') or today.replace(day=1).isoformat()
+    end_date = request.args.get('end_date') or today.isoformat()
+    try:
+        date.fromisoformat(start_date), date.fromisoformat(end_date)
+    except ValueError:
+        raise ValueError('start_date e end_date devem estar no formato YYYY-MM-DD.')
+    return start_date, end_date
+
+def _chart_tree_request(user_id):
+    """Drill-down do plano de contas de ?start_date=&end_date=&transaction_type=&node_id=&tag= (ValueError se inválido)"""
+    start_date, end_date = _report_period()
+    tag = request.args.get('tag', '').strip() or None
+    transaction_type = request.args.get('transaction_type', 'despesa')
+    if transaction_type not in ('despesa', 'receita'):
+        raise ValueError('transaction_type deve ser despesa ou receita.')
+    try:
+        node_id = int(request.args['node_id']) if request.args.get('node_id') else None
+    except ValueError:
+        raise ValueError('node_id deve ser um inteiro.')
+
+    conn = get_db()
+    try:
+        nodes = chart_rollup(conn, user_id, get_transaction_type_column(conn),
+                             get_table_columns(conn, 'transactions'), start_date, end_date, transaction_type, tag)
+    finally:
+        conn.close()
+    tree = drill_down(nodes, node_id)
+    if tree is not None:
+        tree.update(start_date=start_date, end_date=end_date, transaction_type=transaction_type, tag=tag)
+    return tree
+
+@app.route('/reports/chart-tree')
+@login_required
+@query_budget(3)
+def chart_tree_report():
+    """Relatório hierárquico do plano de contas com subtotais (drill-down por ?node_id=)"""
+    current_user = get_current_user()
+    try:
+        tree = _chart_tree_request(current_user['id'])
+    except ValueError as e:
+        flash(str(e), 'error')
+        return redirect(url_for('chart_tree_report'))
+    if tree is None:
+        flash('Conta do plano de contas não encontrada.', 'error')
+        return redirect(url_for('chart_tree_report'))
+    return render_template('reports/chart_tree_simple.html', tree=tree,
+                           start_date=tree['start_date'], end_date=tree['end_date'],
+                           transaction_type=tree['transaction_type'])
+
+@app.route('/reports/tags')
+@login_required
+@query_budget(3)
+def tags_report():
+    """Relatório por tag: receitas, despesas e saldo do período por tag"""
+    current_user = get_current_user()
+    try:
+        start_date, end_date = _report_period()
+    except ValueError as e:
+        flash(str(e), 'error')
+        return redirect(url_for('tags_report'))
+    conn = get_db()
+    try:
+        totals = tag_totals(conn, current_user['id'], get_transaction_type_column(conn),
+                            get_table_columns(conn, 'transactions'), start_date, end_date)
+    finally:
+        conn.close()
+    return render_template('reports/tags_simple.html', tags=totals, start_date=start_date, end_date=end_date)
+
+def _merchant_totals(user_id, start_date, end_date, limit):
+    conn = get_db()
+    try:
+        return merchant_totals(conn, user_id, get_transaction_type_column(conn),
+                               get_table_columns(conn, 'transactions'), start_date, end_date, limit)
+    finally:
+        conn.close()
+
+@app.route('/reports/merchants')
+@login_required
+@query_budget(4)
+def merchants_report():
+    """Relatório por estabelecimento: receitas, despesas e saldo do período (50 maiores despesas)"""
+    current_user = get_current_user()
+    try:
+        start_date, end_date = _report_period()
+    except ValueError as e:
+        flash(str(e), 'error')
+        return redirect(url_for('merchants_report'))
+    totals = _merchant_totals(current_user['id'], start_date, end_date, 50)
+    return render_template('reports/merchants_simple.html', merchants=totals,
+                           start_date=start_date, end_date=end_date)
+
 @app.route('/reports/accounts')
 @login_required
+@query_budget(4)
 def accounts_report():
     """Relatório por Contas"""
     current_user = get_current_user()
@@ -2574,65 +2897,27 @@ def accounts_report():
 
 @app.route('/reports/trends')
 @login_required  
+@query_budget(4)
 def trends_report():
     """Relatório de Tendências"""
     current_user = get_current_user()
     
+    # Tendências, top categorias e sazonalidade do cubo analítico (uma carga por versão dos dados)
     conn = get_db()
+    cube = get_analytics_cube(conn, current_user['id'])
+    conn.close()
     
     # Tendências mensais dos últimos 12 meses
     from datetime import date, timedelta
     today = date.today()
-    start_date = (today - timedelta(days=365)).strftime('%Y-%m-%d')
-    
-    trends_data = conn.execute('''
-        SELECT 
-            strftime('%Y-%m', t.date) as mes,
-            COALESCE(SUM(CASE WHEN t.transaction_type = 'receita' AND t.is_confirmed = 1 THEN t.amount ELSE 0 END), 0) as receitas,
-            COALESCE(SUM(CASE WHEN t.transaction_type = 'despesa' AND t.is_confirmed = 1 THEN t.amount ELSE 0 END), 0) as despesas,
-            COUNT(CASE WHEN t.transaction_type = 'receita' THEN 1 END) as qtd_receitas,
-            COUNT(CASE WHEN t.transaction_type = 'despesa' THEN 1 END) as qtd_despesas
-        FROM transactions t
-        JOIN accounts a ON t.account_id = a.id
-        WHERE a.user_id = ? AND t.date >= ?
-        GROUP BY strftime('%Y-%m', t.date)
-        ORDER BY mes
-    ''', (current_user['id'], start_date)).fetchall()
+    start_date = today - timedelta(days=365)
+    trends_data = cube.monthly_flow(cube.mask(start=start_date))
     
     # Top 5 categorias por período
-    top_categories = conn.execute('''
-        SELECT 
-            c.name as categoria,
-            COALESCE(SUM(t.amount), 0) as total
-        FROM chart_of_accounts c
-        JOIN transactions t ON c.id = t.chart_account_id
-        JOIN accounts a ON t.account_id = a.id
-        WHERE a.user_id = ? AND t.date >= ? AND t.is_confirmed = 1
-        GROUP BY c.id, c.name
-        ORDER BY total DESC
-        LIMIT 5
-    ''', (current_user['id'], start_date)).fetchall()
+    top_categories = cube.top_categories(cube.mask(start=start_date, confirmed=True, categorized=True), 5)
     
-    # Análise de sazonalidade (por mês do ano)
-    seasonality_data = conn.execute('''
-        SELECT 
-            CAST(strftime('%m', t.date) as INTEGER) as mes_numero,
-            CASE strftime('%m', t.date)
-                WHEN '01' THEN 'Janeiro' WHEN '02' THEN 'Fevereiro' WHEN '03' THEN 'Março'
-                WHEN '04' THEN 'Abril' WHEN '05' THEN 'Maio' WHEN '06' THEN 'Junho'
-                WHEN '07' THEN 'Julho' WHEN '08' THEN 'Agosto' WHEN '09' THEN 'Setembro'
-                WHEN '10' THEN 'Outubro' WHEN '11' THEN 'Novembro' WHEN '12' THEN 'Dezembro'
-            END as mes_nome,
-            COALESCE(AVG(CASE WHEN t.transaction_type = 'receita' THEN t.amount END), 0) as receita_media,
-            COALESCE(AVG(CASE WHEN t.transaction_type = 'despesa' THEN t.amount END), 0) as despesa_media
-        FROM transactions t
-        JOIN accounts a ON t.account_id = a.id
-        WHERE a.user_id = ? AND t.is_confirmed = 1
-        GROUP BY strftime('%m', t.date)
-        ORDER BY mes_numero
-    ''', (current_user['id'],)).fetchall()
-    
-    conn.close()
+    # Análise de sazonalidade (por mês do ano, todo o histórico)
+    seasonality_data = cube.seasonality(cube.mask(confirmed=True))
     
     # Preparar dados para gráficos
     trends_chart = {
@@ -2656,13 +2941,14 @@ def trends_report():
                          trends_chart=trends_chart,
                          categories_chart=categories_chart,
                          seasonality_chart=seasonality_chart,
-                         trends_data=[dict(row) for row in trends_data],
-                         top_categories=[dict(row) for row in top_categories])
+                         trends_data=trends_data,
+                         top_categories=top_categories)
 
 @app.route('/reports/export/<report_type>')
 @login_required
+@query_budget(3)
 def export_report(report_type):
-    """Exportar relatórios para CSV"""
+    """Exportar relatórios para CSV (transactions aceita ?account_id=&date_from=&date_to=)"""
     current_user = get_current_user()
     
     from io import StringIO
@@ -2673,9 +2959,22 @@ def export_report(report_type):
     output = StringIO()
     
     if report_type == 'transactions':
-        # Exportar todas as transações
-        data = conn.execute('''
+        # Exportar transações (todas ou o recorte pedido) com o saldo corrido da conta
+        filters, params = ['a.user_id = ?'], [current_user['id']]
+        account_filter = request.args.get('account_id', '')
+        if account_filter.isdigit():
+            filters.append('t.account_id = ?')
+            params.append(int(account_filter))
+        if request.args.get('date_from'):
+            filters.append('DATE(t.date) >= ?')
+            params.append(request.args['date_from'])
+        if request.args.get('date_to'):
+            filters.append('DATE(t.date) <= ?')
+            params.append(request.args['date_to'])
+        
+        data = [dict(row) for row in conn.execute(f'''
             SELECT 
+                t.id, t.account_id,
                 t.date as Data,
                 t.description as Descrição,
                 a.name as Conta,
@@ -2688,15 +2987,21 @@ def export_report(report_type):
             FROM transactions t
             JOIN accounts a ON t.account_id = a.id
             LEFT JOIN chart_of_accounts c ON t.chart_account_id = c.id
-            WHERE a.user_id = ?
-            ORDER BY t.date DESC
-        ''', (current_user['id'],)).fetchall()
+            WHERE {' AND '.join(filters)}
+            ORDER BY DATE(t.date) DESC, t.id DESC
+        ''', params).fetchall()]
         
         if data:
-            writer = csv.DictWriter(output, fieldnames=data[0].keys())
+            columns = get_table_columns(conn, 'transactions')
+            balances = running_balances(conn, [{'id': row['id'], 'account_id': row['account_id'], 'date': row['Data']}
+                                               for row in data], get_transaction_type_column(conn), columns)
+            writer = csv.DictWriter(output, fieldnames=[key for key in data[0] if key not in ('id', 'account_id')] + ['Saldo'])
             writer.writeheader()
             for row in data:
-                writer.writerow(dict(row))
+                balance = balances.get(row.pop('id'))
+                row.pop('account_id')
+                row['Saldo'] = balance.to_float() if balance is not None else ''
+                writer.writerow(row)
     
     elif report_type == 'accounts':
         # Exportar resumo de contas
@@ -2750,6 +3055,7 @@ def accounts():
 # Orçamentos - Página Principal
 @app.route('/budgets')
 @login_required
+@query_budget(3)
 def budgets():
     current_user = get_current_user()
     user_id = current_user['id']
@@ -2804,6 +3110,7 @@ def budgets():
 # Criar Orçamento
 @app.route('/budgets/create', methods=['POST'])
 @login_required
+@idempotent
 def create_budget():
     current_user = get_current_user()
     user_id = current_user['id']
@@ -2925,14 +3232,21 @@ def goals():
     total_target = sum(g['target_amount'] for g in active_goals)
     total_saved = sum(g['saved_amount'] for g in active_goals)
     
+    # Chance de bater cada meta no prazo (Monte Carlo, em cache até a próxima escrita)
+    simulation = get_goal_simulation(conn, user_id)
+    
     conn.close()
     
+    today = date.today()
     return render_template('goals/index_simple.html',
                          active_goals=active_goals,
                          total_goals=total_goals,
                          completed_goals=completed_goals,
                          total_target=total_target,
-                         total_saved=total_saved)
+                         total_saved=total_saved,
+                         goal_simulation={g['id']: g for g in simulation['goals']},
+                         today=today.isoformat(),
+                         deadline_soon=(today + timedelta(days=30)).isoformat())
 
 # Criar Meta
 @app.route('/goals/create', methods=['POST'])
@@ -3105,6 +3419,7 @@ def delete_account(id):
 
 @app.route('/accounts/create', methods=['POST'])
 @login_required
+@idempotent
 def create_account_ajax():
     """Criar conta via AJAX para o formulário de Nova Transação"""
     current_user = get_current_user()
@@ -3315,9 +3630,528 @@ def api_user_profile():
         'timestamp': datetime.now().isoformat()
     })
 
+@app.route('/api/v1/transactions/batch', methods=['POST'])
+@login_required
+@idempotent
+def api_transactions_batch():
+    """API: criar várias transações de uma vez (transaction_batch.py)"""
+    current_user = get_current_user()
+    try:
+        items, atomic, skip_duplicates = parse_batch_body(request.get_json(silent=True),
+                                                          app.config['API_BATCH_MAX_ITEMS'])
+    except BatchError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+
+    accounts = get_user_accounts(current_user['id'])
+    conn = get_db()
+    try:
+        batch = TransactionBatch(conn, current_user['id'], accounts, get_active_categories(conn),
+                                 update_account_balance, skip_duplicates=skip_duplicates,
+                                 rules=rule_set(conn, current_user['id']))
+        summary = batch.run(items, atomic=atomic)
+    finally:
+        conn.close()
+
+    if summary['invalid'] and not summary['created'] and not summary['duplicates']:
+        # Lote atômico recusado ou nenhum item válido: nada foi gravado
+        return jsonify(summary), 422
+    return jsonify(summary), 201 if summary['created'] else 200
+
+@app.route('/api/v1/sync', methods=['GET'])
+@login_required
+@query_budget(7)
+def api_sync():
+    """API: alterações desde um seq do change_log (sincronização incremental, change_log.py)"""
+    current_user = get_current_user()
+    try:
+        since = int(request.args.get('since', 0))
+        limit = int(request.args.get('limit', DEFAULT_PAGE_SIZE))
+        if since < 0 or limit < 1:
+            raise ValueError
+    except ValueError:
+        return jsonify({'success': False, 'message': 'since e limit devem ser inteiros (since ≥ 0 e limit ≥ 1).'}), 400
+    limit = min(limit, MAX_PAGE_SIZE)  # acima do máximo: página cheia, limit aplicado volta na resposta
+
+    conn = get_db()
+    try:
+        page = fetch_changes(conn, current_user['id'], since, limit, get_columns=get_table_columns)
+    finally:
+        conn.close()
+    page['limit'] = limit
+    return jsonify(page)
+
+@app.route('/api/v1/events')
+@login_required
+def api_events():
+    """API: stream SSE de alterações do usuário (events.py)"""
+    current_user = get_current_user()
+    return events_response(current_user['id'])
+
+@app.route('/api/v1/dashboard/summary')
+@login_required
+@query_budget(3)
+def api_dashboard_summary():
+    """API (widget): receitas, despesas e saldo do mês corrente"""
+    current_user = get_current_user()
+    conn = get_db()
+    etag = widget_etag(conn, current_user['id'], 'summary')
+    conn.close()
+
+    def build():
+        today = date.today()
+        ranges = calculate_financial_table_data(current_user['id'], 'month',
+                                                extra_ranges={'month': (today.replace(day=1), today)})['ranges']
+        month = ranges['month']
+        return {'month': {'income': month['receita'], 'expenses': month['despesa'],
+                          'balance': month['receita'] - month['despesa']}}
+    return widget_response(etag, build)
+
+@app.route('/api/v1/dashboard/financial-table')
+@login_required
+@query_budget(3)
+def api_dashboard_financial_table():
+    """API (widget): tabela A Receber / A Pagar / Atrasados do período (?period=today|week|month|year)"""
+    current_user = get_current_user()
+    period = request.args.get('period', 'month')
+    conn = get_db()
+    etag = widget_etag(conn, current_user['id'], 'financial-table', period)
+    conn.close()
+
+    def build():
+        financial_table = calculate_financial_table_data(current_user['id'], period)
+        financial_table.pop('ranges')
+        return {'period': period, 'financial_table': financial_table}
+    return widget_response(etag, build)
+
+@app.route('/api/v1/dashboard/recent')
+@login_required
+@query_budget(3)
+def api_dashboard_recent():
+    """API (widget): últimas transações do usuário (?limit=, padrão 5, máximo 50)"""
+    current_user = get_current_user()
+    try:
+        limit = max(1, min(int(request.args.get('limit', 5)), 50))
+    except ValueError:
+        return jsonify({'success': False, 'message': 'limit deve ser um inteiro'}), 400
+    conn = get_db()
+    etag = widget_etag(conn, current_user['id'], 'recent', limit)
+
+    def build():
+        columns = get_table_columns(conn, 'transactions')
+        type_column = get_transaction_type_column(conn)
+        rows = conn.execute(f'''
+            SELECT t.id, t.date, t.description, t.{type_column} AS transaction_type,
+                   {cents_sql('amount', 't', columns)} AS amount_cents, a.name AS account_name
+            FROM transactions t
+            JOIN accounts a ON t.account_id = a.id
+            WHERE a.user_id = ?
+            ORDER BY t.date DESC, t.id DESC
+            LIMIT ?
+        ''', (current_user['id'], limit)).fetchall()
+        return {'transactions': [{'id': row['id'], 'date': row['date'], 'description': row['description'],
+                                  'transaction_type': row['transaction_type'],
+                                  'amount': Money(row['amount_cents']).to_float(),
+                                  'account_name': row['account_name']} for row in rows]}
+    try:
+        return widget_response(etag, build)
+    finally:
+        conn.close()
+
+@app.route('/api/v1/dashboard/accounts')
+@login_required
+@query_budget(3)
+def api_dashboard_accounts():
+    """API (widget): contas ativas com saldo atual"""
+    current_user = get_current_user()
+    conn = get_db()
+    etag = widget_etag(conn, current_user['id'], 'accounts')
+    conn.close()
+
+    def build():
+        return {'accounts': [{'id': acc['id'], 'name': acc['name'], 'account_type': acc['account_type'],
+                              'current_balance': Money.from_row(acc, 'current_balance').to_float()}
+                             for acc in get_user_accounts(current_user['id'])]}
+    return widget_response(etag, build)
+
+def _balance_request_accounts(user_id):
+    """Contas de ?account_id= (ou todas as ativas do usuário); None se a conta não é do usuário"""
+    accounts = get_user_accounts(user_id)
+    account_id = request.args.get('account_id', '')
+    if not account_id:
+        return accounts
+    accounts = [acc for acc in accounts if str(acc['id']) == account_id]
+    return accounts or None
+
+def _balance_total(accounts, balances):
+    """Patrimônio: soma das contas marcadas para entrar no total"""
+    return sum((balances[acc['id']] for acc in accounts if acc.get('include_in_total') != 0), Money())
+
+@app.route('/api/v1/balances/as-of')
+@login_required
+@query_budget(3)
+def api_balance_as_of():
+    """API: saldo ao fim de uma data por conta e patrimônio (?date=YYYY-MM-DD, padrão hoje; ?account_id=)"""
+    current_user = get_current_user()
+    try:
+        day = date.fromisoformat(request.args['date']) if request.args.get('date') else date.today()
+    except ValueError:
+        return jsonify({'success': False, 'message': 'date deve estar no formato YYYY-MM-DD.'}), 400
+    accounts = _balance_request_accounts(current_user['id'])
+    if accounts is None:
+        return jsonify({'success': False, 'message': 'Conta não encontrada.'}), 404
+
+    conn = get_db()
+    try:
+        balances = balance_as_of(conn, [acc['id'] for acc in accounts], day)
+    finally:
+        conn.close()
+    return jsonify({
+        'date': day.isoformat(),
+        'accounts': [{'id': acc['id'], 'name': acc['name'], 'balance': balances[acc['id']].to_float()}
+                     for acc in accounts],
+        'total': _balance_total(accounts, balances).to_float(),
+    })
+
+@app.route('/api/v1/balances/daily')
+@login_required
+@query_budget(4)
+def api_balance_daily():
+    """API: série diária de saldos por conta e total (?start=&end=, padrão últimos 30 dias; ?account_id=)"""
+    current_user = get_current_user()
+    try:
+        end = date.fromisoformat(request.args['end']) if request.args.get('end') else date.today()
+        start = date.fromisoformat(request.args['start']) if request.args.get('start') else end - timedelta(days=29)
+    except ValueError:
+        return jsonify({'success': False, 'message': 'start e end devem estar no formato YYYY-MM-DD.'}), 400
+    if start > end or (end - start).days >= MAX_SERIES_DAYS:
+        return jsonify({'success': False,
+                        'message': f'Intervalo inválido (start <= end, no máximo {MAX_SERIES_DAYS} dias).'}), 400
+    accounts = _balance_request_accounts(current_user['id'])
+    if accounts is None:
+        return jsonify({'success': False, 'message': 'Conta não encontrada.'}), 404
+
+    conn = get_db()
+    try:
+        series = daily_balance_series(conn, [acc['id'] for acc in accounts], start, end)
+    finally:
+        conn.close()
+    by_account = series['accounts']
+    return jsonify({
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'dates': series['dates'],
+        'accounts': [{'id': acc['id'], 'name': acc['name'],
+                      'balances': [balance.to_float() for balance in by_account[acc['id']]]}
+                     for acc in accounts],
+        'total': [_balance_total(accounts, {acc['id']: by_account[acc['id']][i] for acc in accounts}).to_float()
+                  for i in range(len(series['dates']))],
+    })
+
+@app.route('/api/v1/planning/forecast')
+@login_required
+@query_budget(3)
+def api_planning_forecast():
+    """API: saldo diário projetado por conta e total (?months=1..24, padrão 6; ?account_id=)"""
+    current_user = get_current_user()
+    try:
+        months = int(request.args.get('months', DEFAULT_FORECAST_MONTHS))
+    except ValueError:
+        months = 0
+    if not 1 <= months <= MAX_FORECAST_MONTHS:
+        return jsonify({'success': False,
+                        'message': f'months deve ser um inteiro entre 1 e {MAX_FORECAST_MONTHS}.'}), 400
+    accounts = _balance_request_accounts(current_user['id'])
+    if accounts is None:
+        return jsonify({'success': False, 'message': 'Conta não encontrada.'}), 404
+
+    conn = get_db()
+    try:
+        basis = get_forecast_basis(conn, current_user['id'])
+    finally:
+        conn.close()
+    result = project(basis, months, [basis['account_ids'].index(acc['id']) for acc in accounts])
+
+    dates = np.datetime_as_string(result['days'].astype('datetime64[D]')).tolist()
+    balances = result['balances']
+    in_total = np.array([acc.get('include_in_total') != 0 for acc in accounts], dtype=bool)
+    total = balances[in_total].sum(axis=0)
+
+    def lowest(values):
+        i = int(np.argmin(values))
+        return {'balance': Money(int(values[i])).to_float(), 'date': dates[i]}
+
+    return jsonify({
+        'start': dates[0],
+        'end': dates[-1],
+        'months': months,
+        'dates': dates,
+        'accounts': [{
+            'id': acc['id'],
+            'name': acc['name'],
+            'opening_balance': Money(int(result['opening'][i])).to_float(),
+            'balances': (balances[i] / 100).tolist(),
+            'lowest': lowest(balances[i]),
+            'components': {name: Money(int(values[i])).to_float()
+                           for name, values in result['components'].items()},
+        } for i, acc in enumerate(accounts)],
+        'total': (total / 100).tolist(),
+        'total_lowest': lowest(total),
+    })
+
+@app.route('/api/v1/reports/chart-tree')
+@login_required
+@query_budget(2)
+def api_chart_tree():
+    """API: subtotais de um nível do plano de contas (?node_id=, padrão raízes; ?start_date=&end_date=&transaction_type=&tag=)"""
+    current_user = get_current_user()
+    try:
+        tree = _chart_tree_request(current_user['id'])
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    if tree is None:
+        return jsonify({'success': False, 'message': 'Conta do plano de contas não encontrada.'}), 404
+    return jsonify(tree)
+
+@app.route('/api/v1/reports/tags')
+@login_required
+@query_budget(2)
+def api_tags_report():
+    """API: totais por tag no período (?start_date=&end_date=, padrão mês atual)"""
+    current_user = get_current_user()
+    try:
+        start_date, end_date = _report_period()
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    conn = get_db()
+    try:
+        totals = tag_totals(conn, current_user['id'], get_transaction_type_column(conn),
+                            get_table_columns(conn, 'transactions'), start_date, end_date)
+    finally:
+        conn.close()
+    return jsonify({'start_date': start_date, 'end_date': end_date, 'tags': totals})
+
+@app.route('/api/v1/reports/merchants')
+@login_required
+@query_budget(3)
+def api_merchants_report():
+    """API: totais por estabelecimento no período (?start_date=&end_date=, padrão mês atual; ?limit=)"""
+    current_user = get_current_user()
+    try:
+        start_date, end_date = _report_period()
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    limit = request.args.get('limit', type=int)
+    totals = _merchant_totals(current_user['id'], start_date, end_date,
+                              max(limit, 1) if limit is not None else None)
+    return jsonify({'start_date': start_date, 'end_date': end_date, 'merchants': totals})
+
+@app.route('/api/v1/goals/simulation')
+@login_required
+@query_budget(4)
+def api_goal_simulation():
+    """API: probabilidade de cada meta ativa chegar ao alvo até target_date e bandas p10/p50/p90 por mês"""
+    current_user = get_current_user()
+    conn = get_db()
+    try:
+        simulation = get_goal_simulation(conn, current_user['id'])
+    finally:
+        conn.close()
+    return jsonify(simulation)
+
+@app.route('/api/v1/planning/scenarios/preview', methods=['POST'])
+@login_required
+@query_budget(4)
+def api_planning_scenario_preview():
+    """API: projeção base x cenário "e se" sem gravar (corpo: months, adjustments - scenarios.py)"""
+    current_user = get_current_user()
+    conn = get_db()
+    try:
+        _, months, adjustments = parse_scenario(request.get_json(silent=True))
+        result = evaluate_scenario(conn, current_user['id'], months, adjustments)
+    except ScenarioError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    finally:
+        conn.close()
+    return jsonify(result)
+
+@app.route('/api/v1/planning/scenarios', methods=['GET'])
+@login_required
+@query_budget(2)
+def api_planning_scenarios():
+    """API: cenários salvos do usuário (sem o resultado)"""
+    current_user = get_current_user()
+    conn = get_db()
+    try:
+        scenarios = list_scenarios(conn, current_user['id'])
+    finally:
+        conn.close()
+    return jsonify({'scenarios': scenarios})
+
+@app.route('/api/v1/planning/scenarios', methods=['POST'])
+@login_required
+@idempotent
+def api_create_planning_scenario():
+    """API: gravar um cenário (corpo: name, months, adjustments) com o resultado já calculado"""
+    current_user = get_current_user()
+    user_id = current_user['id']
+    conn = get_db()
+    try:
+        name, months, adjustments = parse_scenario(request.get_json(silent=True))
+        result = evaluate_scenario(conn, user_id, months, adjustments)
+        version = data_version_key(data_version(conn, user_id), date.today())
+        scenario_id = create_scenario(conn, user_id, name, months, adjustments, version, result)
+        conn.commit()
+        scenario = get_scenario(conn, user_id, scenario_id)
+    except ScenarioError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    finally:
+        conn.close()
+    return jsonify(scenario), 201
+
+@app.route('/api/v1/planning/scenarios/<int:scenario_id>', methods=['GET'])
+@login_required
+@query_budget(3)
+def api_planning_scenario(scenario_id):
+    """API: cenário salvo; o resultado é recalculado só se os dados (ou o dia) mudaram desde o último cálculo"""
+    current_user = get_current_user()
+    user_id = current_user['id']
+    conn = get_db()
+    try:
+        scenario = get_scenario(conn, user_id, scenario_id)
+        if scenario is None:
+            return jsonify({'success': False, 'message': 'Cenário não encontrado.'}), 404
+        version = data_version_key(data_version(conn, user_id), date.today())
+        if version is None or version != scenario['result_version']:
+            try:
+                scenario['result'] = evaluate_scenario(conn, user_id, scenario['months'], scenario['adjustments'])
+            except ScenarioError as e:
+                # Conta ou meta do ajuste deixou de existir
+                return jsonify({'success': False, 'message': str(e)}), 409
+            store_result(conn, scenario_id, version, scenario['result'])
+            conn.commit()
+            scenario['result_version'] = version
+    finally:
+        conn.close()
+    return jsonify(scenario)
+
+@app.route('/api/v1/planning/scenarios/<int:scenario_id>', methods=['DELETE'])
+@login_required
+def api_delete_planning_scenario(scenario_id):
+    """API: excluir um cenário salvo"""
+    current_user = get_current_user()
+    conn = get_db()
+    try:
+        deleted = delete_scenario(conn, current_user['id'], scenario_id)
+        conn.commit()
+    finally:
+        conn.close()
+    if not deleted:
+        return jsonify({'success': False, 'message': 'Cenário não encontrado.'}), 404
+    return jsonify({'success': True})
+
+@app.route('/api/v1/categorization/rules', methods=['GET'])
+@login_required
+@query_budget(2)
+def api_categorization_rules():
+    """API: regras de categorização automática do usuário, em ordem de prioridade"""
+    current_user = get_current_user()
+    conn = get_db()
+    try:
+        rules = list_rules(conn, current_user['id'])
+    finally:
+        conn.close()
+    return jsonify({'rules': rules})
+
+@app.route('/api/v1/categorization/rules', methods=['POST'])
+@login_required
+@idempotent
+def api_create_categorization_rule():
+    """API: nova regra (pattern, match_type, category_id, min/max_amount, account_id, priority)"""
+    current_user = get_current_user()
+    account_ids = {acc['id'] for acc in get_user_accounts(current_user['id'])}
+    conn = get_db()
+    try:
+        categories = {category['id']: category.get('category_type') for category in get_active_categories(conn)}
+        rule = parse_rule(request.get_json(silent=True), account_ids, categories)
+        created = create_rule(conn, current_user['id'], rule)
+        conn.commit()
+    except RuleError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    finally:
+        conn.close()
+    return jsonify(created), 201
+
+@app.route('/api/v1/categorization/rules/<int:rule_id>', methods=['DELETE'])
+@login_required
+def api_delete_categorization_rule(rule_id):
+    """API: excluir uma regra de categorização"""
+    current_user = get_current_user()
+    conn = get_db()
+    try:
+        deleted = delete_rule(conn, current_user['id'], rule_id)
+        conn.commit()
+    finally:
+        conn.close()
+    if not deleted:
+        return jsonify({'success': False, 'message': 'Regra não encontrada.'}), 404
+    return jsonify({'success': True})
+
+@app.route('/api/v1/categorization/suggest')
+@login_required
+@query_budget(4)
+def api_categorization_suggest():
+    """API: 3 categorias mais prováveis para uma descrição (?description=&transaction_type=receita|despesa)"""
+    current_user = get_current_user()
+    description = request.args.get('description', '').strip()
+    if not description:
+        return jsonify({'success': False, 'message': 'description é obrigatória.'}), 400
+    transaction_type = request.args.get('transaction_type')
+    if transaction_type not in ('receita', 'despesa'):
+        transaction_type = None
+    conn = get_db()
+    try:
+        suggest = category_suggester(conn, current_user['id'])
+    finally:
+        conn.close()
+    return jsonify({'ready': suggest is not None,
+                    'suggestions': suggest(description, transaction_type) if suggest else []})
+
+def _run_categorization(user_id, apply):
+    body = request.get_json(silent=True) or {}
+    conn = get_db()
+    try:
+        summary = categorize(conn, user_id, rule_set(conn, user_id), get_transaction_type_column(conn),
+                             get_table_columns(conn, 'transactions'), apply=apply,
+                             recategorize=bool(body.get('recategorize')))
+        if apply:
+            conn.commit()
+    finally:
+        conn.close()
+    return summary
+
+@app.route('/api/v1/categorization/preview', methods=['POST'])
+@login_required
+@query_budget(3)
+def api_categorization_preview():
+    """API: o que as regras fariam com os lançamentos sem categoria, sem gravar (recategorize: todos)"""
+    current_user = get_current_user()
+    return jsonify(_run_categorization(current_user['id'], apply=False))
+
+@app.route('/api/v1/categorization/apply', methods=['POST'])
+@login_required
+@idempotent
+def api_categorization_apply():
+    """API: aplicar as regras em lote sobre o histórico (mesmo corpo da prévia)"""
+    current_user = get_current_user()
+    summary = _run_categorization(current_user['id'], apply=True)
+    app.logger.info("🏷️ Categorização em lote: %s de %s lançamentos em %.2fs",
+                    summary['updated'], summary['scanned'], summary['seconds'])
+    return jsonify(summary)
+
 # Contribuir para Meta
 @app.route('/goals/contribute/<int:goal_id>', methods=['POST'])
 @login_required
+@idempotent
 def contribute_goal(goal_id):
     current_user = get_current_user()
     user_id = current_user['id']
@@ -3424,22 +4258,12 @@ def planning():
         LIMIT 5
     ''', (user_id,)).fetchall()
     
-    # Análise de gastos por categoria (últimos 3 meses)
-    spending_analysis = conn.execute('''
-        SELECT 
-            c.name as category,
-            c.icon,
-            SUM(ABS(t.amount)) as spent,
-            COUNT(*) as transaction_count,
-            AVG(ABS(t.amount)) as avg_transaction
-        FROM transactions t
-        JOIN categories c ON t.category_id = c.id
-        WHERE t.user_id = ? AND t.amount < 0 
-        AND t.date >= date('now', '-3 months')
-        GROUP BY t.category_id, c.name, c.icon
-        ORDER BY spent DESC
-        LIMIT 10
-    ''', (user_id,)).fetchall()
+    # Análise de gastos por plano de contas (últimos 3 meses), do cubo analítico
+    cube = get_analytics_cube(conn, user_id)
+    spending_mask = cube.mask(start=add_months(date.today(), -3), kind='despesa')
+    spending_analysis = [{'category': row['categoria'], 'icon': None, 'spent': row['total'],
+                          'transaction_count': row['qtd_transacoes'], 'avg_transaction': row['valor_medio']}
+                         for row in cube.top_categories(spending_mask, 10)]
     
     conn.close()
     
@@ -3515,6 +4339,29 @@ def ensure_admin_user():
     
     conn.close()
 
+# ===== ADMIN - PROFILES DE REQUISIÇÕES =====
+@app.route('/admin/profiles')
+@admin_required
+def admin_profiles():
+    """Listar profiles recentes capturados pelo middleware"""
+    profiles = list_profiles(app.config['PROFILE_DIR'])
+    return render_template('admin/profiles.html',
+                         profiles=profiles,
+                         sample_rate=app.config['PROFILE_SAMPLE_RATE'])
+
+@app.route('/admin/profiles/<profile_id>/<kind>')
+@admin_required
+def admin_profile_download(profile_id, kind):
+    """Baixar o dump pstats ou as pilhas colapsadas de um profile"""
+    from flask import send_from_directory, abort
+    import re
+
+    if kind not in ('pstats', 'collapsed') or not re.fullmatch(r'[0-9a-f_]+', profile_id):
+        abort(404)
+
+    return send_from_directory(os.path.abspath(app.config['PROFILE_DIR']),
+                               f'{profile_id}.{kind}', as_attachment=True)
+
 # ROTA DE TESTE TEMPORÁRIA - BYPASS AUTENTICAÇÃO
 @app.route('/test-transaction-bypass', methods=['POST', 'GET'])
 def test_transaction_bypass():
@@ -0,0 +1,214 @@
+# Saldo corrido do extrato a partir de checkpoints mensais - FynanPro
+"""
+Extrato bancário mostra, em cada linha, o saldo da conta logo após ela.
+Calcular isso com SUM() OVER sobre todo o histórico da conta a cada página
+custa O(histórico). A migração 010 mantém, pelos triggers de escrita em
+transactions, o saldo de cada conta ao fim de cada mês:
+
+    account_balance_checkpoints(account_id, month='2024-06', balance_cents)
+
+Para uma página, cada (conta, mês) presente parte do checkpoint do mês
+anterior e soma só as linhas daquele mês (índice account_id, date):
+
+    saldo(linha) = checkpoint(mês anterior) + Σ linhas do mês até (data, id) da linha
+
+A regra do saldo é a de update_account_balance: receita soma, despesa
+subtrai, transferência entra com o sinal gravado. Dentro do dia a ordem é
+o id, a mesma do extrato (DATE(date) DESC, id DESC).
+
+Escritas em massa (importação de extratos, lote da API, gerador de dataset)
+não passam pelos triggers: com DeferredSnapshots cada conta tocada é refeita
+uma vez, a partir da data mais antiga gravada, em vez de cada linha
+retroativa atualizar todos os meses e dias seguintes.
+
+Saldo em uma data (patrimônio em X, séries para gráfico) usa os snapshots
+diários da migração 011, mantidos pelos mesmos triggers:
+
+    account_daily_balances(account_id, day='2024-06-11', balance_cents)
+
+Só existem linhas nos dias com movimento; o saldo ao fim de qualquer dia é
+o snapshot mais recente até ele - uma descida na chave primária por conta,
+O(log n), sem somar o histórico.
+"""
+
+from datetime import timedelta
+
+from money import Money, cents_sql
+
+# Pares (conta, mês) por consulta: 2 parâmetros cada, abaixo do limite de 999 do SQLite antigo
+_MONTHS_CHUNK = 400
+
+# Série diária máxima por chamada (~10 anos)
+MAX_SERIES_DAYS = 3660
+
+
+def signed_cents_sql(alias, type_column, columns):
+    """Efeito da transação no saldo da conta, em centavos"""
+    amount = cents_sql('amount', alias, columns)
+    return f'''(CASE {alias}.{type_column}
+                WHEN 'receita' THEN {amount}
+                WHEN 'despesa' THEN -{amount}
+                WHEN 'transferencia' THEN {amount}
+                ELSE 0 END)'''
+
+
+def running_balances(conn, rows, type_column, columns):
+    """
+    {id: Money} com o saldo da conta logo após cada linha.
+    rows: dicts com id, account_id e date (a página do extrato/exportação);
+    columns: colunas de transactions (get_table_columns).
+    """
+    months = sorted({(row['account_id'], str(row['date'])[:7]) for row in rows
+                     if row.get('account_id') is not None and row.get('date')})
+    wanted = {row['id'] for row in rows}
+    signed = signed_cents_sql('t', type_column, columns)
+
+    balances = {}
+    for start in range(0, len(months), _MONTHS_CHUNK):
+        chunk = months[start:start + _MONTHS_CHUNK]
+        params = [value for pair in chunk for value in pair]
+        for row_id, balance_cents in conn.execute(f'''
+            WITH page_months(account_id, month) AS (VALUES {', '.join(['(?, ?)'] * len(chunk))}),
+            openings AS (
+                SELECT p.account_id, p.month, COALESCE((
+                    SELECT c.balance_cents FROM account_balance_checkpoints c
+                    WHERE c.account_id = p.account_id AND c.month < p.month
+                    ORDER BY c.month DESC LIMIT 1), 0) AS opening_cents
+                FROM page_months p
+            )
+            SELECT t.id, o.opening_cents + SUM({signed}) OVER (
+                PARTITION BY o.account_id, o.month ORDER BY DATE(t.date), t.id)
+            FROM openings o
+            JOIN transactions t ON t.account_id = o.account_id
+                               AND t.date >= o.month AND t.date < o.month || '~'
+        ''', params):
+            if row_id in wanted:
+                balances[row_id] = Money(balance_cents)
+    return balances
+
+
+def _in_list(values):
+    return ', '.join('?' * len(values))
+
+
+def balance_as_of(conn, account_ids, day):
+    """{account_id: Money} com o saldo de cada conta ao fim de day (date ou 'YYYY-MM-DD')"""
+    account_ids = list(account_ids)
+    if not account_ids:
+        return {}
+    rows = conn.execute(f'''
+        WITH wanted(account_id) AS (VALUES {', '.join(['(?)'] * len(account_ids))})
+        SELECT w.account_id, COALESCE((
+            SELECT d.balance_cents FROM account_daily_balances d
+            WHERE d.account_id = w.account_id AND d.day <= ?
+            ORDER BY d.day DESC LIMIT 1), 0)
+        FROM wanted w
+    ''', account_ids + [str(day)]).fetchall()
+    return {account_id: Money(cents) for account_id, cents in rows}
+
+
+def daily_balance_series(conn, account_ids, start, end):
+    """
+    Saldo ao fim de cada dia de start a end (datas, inclusive), para gráfico:
+    {'dates': ['2024-06-01', ...], 'accounts': {account_id: [Money, ...]}}.
+    Duas consultas: saldo na véspera de start e os snapshots do intervalo.
+    """
+    account_ids = list(account_ids)
+    dates = [(start + timedelta(days=i)).isoformat() for i in range((end - start).days + 1)]
+    current = balance_as_of(conn, account_ids, start - timedelta(days=1))
+    changes = {}
+    if account_ids and dates:
+        for account_id, day, cents in conn.execute(f'''
+            SELECT account_id, day, balance_cents FROM account_daily_balances
+            WHERE account_id IN ({_in_list(account_ids)}) AND day >= ? AND day <= ?
+        ''', account_ids + [dates[0], dates[-1]]):
+            changes.setdefault(day, {})[account_id] = Money(cents)
+
+    series = {account_id: [] for account_id in account_ids}
+    for day in dates:
+        current.update(changes.get(day, {}))
+        for account_id in account_ids:
+            series[account_id].append(current[account_id])
+    return {'dates': dates, 'accounts': series}
+
+
+
+def rebuild_balance_snapshots(conn, starts, type_column, columns):
+    """
+    Refaz os checkpoints mensais e os snapshots diários de cada conta a partir
+    de uma data, com uma soma em janela partindo do valor anterior a ela.
+    starts: {account_id: 'YYYY-MM-DD'} (data vazia = todo o histórico da conta).
+    """
+    signed = signed_cents_sql('t', type_column, columns)
+    for account_id, start in sorted(starts.items()):
+        day, month = str(start or ''), str(start or '')[:7]
+        conn.execute('DELETE FROM account_daily_balances WHERE account_id = ? AND day >= ?', (account_id, day))
+        conn.execute(f'''
+            INSERT INTO account_daily_balances (account_id, day, balance_cents)
+            SELECT ?, day, COALESCE((
+                SELECT balance_cents FROM account_daily_balances
+                WHERE account_id = ? AND day < ? ORDER BY day DESC LIMIT 1), 0)
+                + SUM(net) OVER (ORDER BY day)
+            FROM (
+                SELECT DATE(t.date) AS day, SUM({signed}) AS net
+                FROM transactions t
+                WHERE t.account_id = ? AND t.date >= ? AND DATE(t.date) IS NOT NULL
+                GROUP BY day
+            )
+        ''', (account_id, account_id, day, account_id, day))
+
+        conn.execute('DELETE FROM account_balance_checkpoints WHERE account_id = ? AND month >= ?',
+                     (account_id, month))
+        conn.execute(f'''
+            INSERT INTO account_balance_checkpoints (account_id, month, balance_cents)
+            SELECT ?, month, COALESCE((
+                SELECT balance_cents FROM account_balance_checkpoints
+                WHERE account_id = ? AND month < ? ORDER BY month DESC LIMIT 1), 0)
+                + SUM(net) OVER (ORDER BY month)
+            FROM (
+                SELECT substr(t.date, 1, 7) AS month, SUM({signed}) AS net
+                FROM transactions t
+                WHERE t.account_id = ? AND t.date >= ?
+                GROUP BY month
+            )
+        ''', (account_id, account_id, month, account_id, month))
+
+
+class DeferredSnapshots:
+    """
+    Escrita em massa sem a manutenção linha a linha dos checkpoints e
+    snapshots diários: os triggers das migrações 010 e 011 ficam desligados entre suspend() e resume()
+    (mesma transação) e rebuild() refaz cada conta tocada uma vez, a partir
+    da data mais antiga gravada ou apagada nela.
+    """
+
+    def __init__(self, conn, type_column, columns):
+        self.conn = conn
+        self.type_column = type_column
+        self.columns = columns
+        self.enabled = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' "
+                                    "AND name = 'balance_snapshot_bypass'").fetchone() is not None
+        self.starts = {}
+
+    def touch(self, account_id, day):
+        """Conta com linhas gravadas/apagadas a partir de day ('YYYY-MM-DD', None = histórico todo)"""
+        if account_id is None:
+            return
+        day = str(day)[:10] if day else ''
+        current = self.starts.get(account_id)
+        if current is None or day < current:
+            self.starts[account_id] = day
+
+    def suspend(self):
+        if self.enabled:
+            self.conn.execute('INSERT OR IGNORE INTO balance_snapshot_bypass (active) VALUES (1)')
+
+    def resume(self):
+        """Religa os triggers - a linha de controle nunca pode chegar ao commit"""
+        if self.enabled:
+            self.conn.execute('DELETE FROM balance_snapshot_bypass')
+
+    def rebuild(self):
+        if self.enabled and self.starts:
+            rebuild_balance_snapshots(self.conn, self.starts, self.type_column, self.columns)
+        self.starts = {}
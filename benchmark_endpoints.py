@@ -0,0 +1,358 @@
+#!/usr/bin/env python3
+"""
+Benchmark de endpoints - FynanPro
+
+Executa as rotas principais via test client do Flask (sem rede) contra um
+dataset gerado por generate_dataset.py e mede latência (p50/p95/p99) e
+número de queries SQL por requisição. Os cenários de escrita (nova
+transação, lote da API e importação de extrato, também com datas
+retroativas) registram a vazão em transações/s e têm suas transações
+removidas ao final. O resultado é gravado em JSON e comparado com
+benchmarks/baseline.json; regressões acima da tolerância fazem o script
+sair com código 1.
+
+--update-baseline só acrescenta os cenários que ainda não estão na
+baseline (ou regrava os passados em --only): as linhas já gravadas ficam
+como estão, para que a baseline continue sendo uma referência fixa e não
+o ruído da última execução.
+
+Exemplos:
+    python benchmark_endpoints.py                      # gera benchmarks/bench.db se preciso
+    python benchmark_endpoints.py --iterations 50 --tolerance 0.3
+    python benchmark_endpoints.py --update-baseline    # gravar os cenários novos na baseline
+    python benchmark_endpoints.py --update-baseline --only reports_index   # regravar um cenário
+"""
+
+import argparse
+import io
+import json
+import logging
+import os
+import platform
+import sqlite3
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+from query_budget import QueryCounter, sql_trace_hooks
+
+BENCH_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmarks')
+DEFAULT_DB = os.path.join(BENCH_DIR, 'bench.db')
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, 'baseline.json')
+DEFAULT_OUTPUT = os.path.join(BENCH_DIR, 'results.json')
+
+# Parâmetros do dataset padrão (mesma semente => mesma baseline)
+DATASET = {'users': 20, 'accounts_per_user': 3, 'years': 2, 'tx_per_month': 30, 'seed': 42}
+
+# Folga absoluta para latências muito pequenas (ruído de agendamento)
+LATENCY_SLACK_MS = 2.0
+
+# Transações criadas pelos cenários de escrita (removidas ao final)
+BENCH_PREFIX = 'BENCH'
+BENCH_IMPORT_FILE = 'bench_import.csv'
+BATCH_SIZE = 50
+IMPORT_LINES = 1000
+# Datas retroativas espalhadas pelos últimos ~2 anos (cada linha mexe em checkpoints antigos)
+BACKDATED_DAYS = 700
+
+def percentile(values, pct):
+    """Percentil por nearest-rank (valores já ordenados)"""
+    if not values:
+        return 0.0
+    rank = max(1, int(round(pct / 100.0 * len(values) + 0.4999)))
+    return values[min(rank, len(values)) - 1]
+
+
+def build_scenarios(db_path, user_id):
+    """Lista (nome, url) das rotas medidas, com parâmetros derivados do dataset"""
+    with sqlite3.connect(db_path) as conn:
+        tx_count = conn.execute('''
+            SELECT COUNT(*) FROM transactions t JOIN accounts a ON t.account_id = a.id
+            WHERE a.user_id = ?
+        ''', (user_id,)).fetchone()[0]
+        first_account = conn.execute('SELECT MIN(id) FROM accounts WHERE user_id = ?', (user_id,)).fetchone()[0]
+        last_seq = conn.execute('SELECT MAX(seq) FROM change_log WHERE user_id = ?', (user_id,)).fetchone()[0] or 0
+
+    deep_page = max(1, (tx_count + 49) // 50)
+    date_from = (date.today() - timedelta(days=90)).isoformat()
+    date_to = date.today().isoformat()
+
+    # O dashboard é uma casca (o período só muda o widget da tabela financeira)
+    scenarios = [('dashboard_month', '/dashboard?period=month')]
+    scenarios += [(f'api_dashboard_financial_table_{period}', f'/api/v1/dashboard/financial-table?period={period}')
+                  for period in ('today', 'week', 'month', 'year')]
+    scenarios += [
+        ('api_dashboard_summary', '/api/v1/dashboard/summary'),
+        ('api_dashboard_recent', '/api/v1/dashboard/recent'),
+        ('api_dashboard_accounts', '/api/v1/dashboard/accounts'),
+        ('transactions_first_page', '/transactions'),
+        ('transactions_deep_page', f'/transactions?page={deep_page}'),
+        ('transactions_search', '/transactions?search=IFOOD'),
+        ('transactions_tag', '/transactions?tag=viagem'),
+        ('transactions_duplicates', '/transactions/duplicates'),
+        ('transactions_filters', f'/transactions?type=despesa&account_id={first_account}'
+                                 f'&date_from={date_from}&date_to={date_to}'),
+        ('api_sync_full_page', '/api/v1/sync?since=0'),
+        ('api_sync_delta', f'/api/v1/sync?since={max(0, last_seq - 100)}'),
+        ('api_balances_as_of', f'/api/v1/balances/as-of?date={date_from}'),
+        ('api_balances_daily_year', f'/api/v1/balances/daily?start={date.today() - timedelta(days=364)}'),
+        ('reports_index', '/reports'),
+        ('reports_cash_flow', '/reports/cash_flow'),
+        ('reports_categories', '/reports/categories'),
+        ('reports_chart_tree', f'/reports/chart-tree?start_date={date.today() - timedelta(days=364)}'),
+        ('api_reports_chart_tree', f'/api/v1/reports/chart-tree?start_date={date.today() - timedelta(days=364)}'),
+        ('api_reports_tags', f'/api/v1/reports/tags?start_date={date.today() - timedelta(days=364)}'),
+        ('reports_accounts', '/reports/accounts'),
+        ('reports_trends', '/reports/trends'),
+        ('reports_export_transactions', '/reports/export/transactions'),
+        ('reports_export_accounts', '/reports/export/accounts'),
+        ('budgets', '/budgets'),
+        ('goals', '/goals'),
+        ('api_goals_simulation', '/api/v1/goals/simulation'),
+        ('planning', '/planning'),
+        ('api_planning_forecast_12m', '/api/v1/planning/forecast?months=12'),
+    ]
+    return scenarios
+
+
+def build_write_scenarios(db_path, user_id):
+    """
+    Lista (nome, url, itens, request_kwargs(i)) das rotas de escrita; cada
+    iteração grava descrições novas para não cair na detecção de duplicatas.
+    """
+    with sqlite3.connect(db_path) as conn:
+        account_id = conn.execute('SELECT MIN(id) FROM accounts WHERE user_id = ?', (user_id,)).fetchone()[0]
+        category_id = conn.execute("SELECT MIN(id) FROM categories WHERE category_type = 'despesa'").fetchone()[0]
+
+    def backdated(n):
+        return date.today() - timedelta(days=n * 37 % BACKDATED_DAYS)
+
+    def item(i, n, tx_date=None):
+        return {'description': f'{BENCH_PREFIX} {i}-{n}', 'amount': f'{n % 90 + 10}.25',
+                'date': (tx_date or date.today()).isoformat(), 'transaction_type': 'despesa',
+                'account_id': account_id, 'category_id': category_id}
+
+    def statement(i):
+        lines = ['data;descricao;valor'] + [
+            f"{backdated(n).strftime('%d/%m/%Y')};{BENCH_PREFIX} {i}-{n};-{n % 90 + 10},25"
+            for n in range(IMPORT_LINES)]
+        data = ('\n'.join(lines) + '\n').encode('utf-8')
+        return {'headers': {'Accept': 'application/json'},
+                'data': {'csv_file': (io.BytesIO(data), BENCH_IMPORT_FILE),
+                         'account_id': str(account_id), 'has_header': '1'}}
+
+    return [
+        ('transactions_new_single', '/transactions/new', 1, lambda i: {'json': item(i, 0)}),
+        (f'api_transactions_batch_{BATCH_SIZE}', '/api/v1/transactions/batch', BATCH_SIZE,
+         lambda i: {'json': [item(i, n) for n in range(BATCH_SIZE)]}),
+        (f'api_transactions_batch_{BATCH_SIZE}_backdated', '/api/v1/transactions/batch', BATCH_SIZE,
+         lambda i: {'json': [item(i, n, backdated(n)) for n in range(BATCH_SIZE)]}),
+        (f'transactions_import_{IMPORT_LINES}_backdated', '/transactions/import', IMPORT_LINES, statement),
+    ]
+
+
+def cleanup_writes(app, db_path, user_id):
+    """Remover as transações dos cenários de escrita e recalcular os saldos do usuário"""
+    from app_simple_advanced import update_account_balance
+    from balance_checkpoints import DeferredSnapshots
+
+    with app.app_context(), sqlite3.connect(db_path) as conn:
+        # Remoção em massa: checkpoints/snapshots refeitos uma vez por conta, não por linha apagada
+        columns = {row[1] for row in conn.execute('PRAGMA table_info(transactions)')}
+        snapshots = DeferredSnapshots(conn, 'type' if 'type' in columns else 'transaction_type', columns)
+        pattern = (f'{BENCH_PREFIX} %',)
+        for account_id, first_day in conn.execute(
+                'SELECT account_id, MIN(date) FROM transactions WHERE description LIKE ? GROUP BY account_id',
+                pattern).fetchall():
+            snapshots.touch(account_id, first_day)
+        snapshots.suspend()
+        conn.execute('DELETE FROM transactions WHERE description LIKE ?', pattern)
+        snapshots.resume()
+        snapshots.rebuild()
+        conn.execute('DELETE FROM import_batches WHERE filename = ?', (BENCH_IMPORT_FILE,))
+        for (account_id,) in conn.execute('SELECT id FROM accounts WHERE user_id = ?', (user_id,)).fetchall():
+            update_account_balance(conn, account_id)
+
+
+def _measure(client, counter, request, iterations, warmup):
+    """Executa request(i) warmup + iterations vezes; devolve (status, timings ordenados, queries)"""
+    timings = []
+    queries = []
+    status = None
+    for i in range(warmup + iterations):
+        counter.reset()
+        started = time.perf_counter()
+        response = request(i)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        response.close()
+        status = response.status_code
+        if i >= warmup:
+            timings.append(elapsed_ms)
+            queries.append(counter.count)
+    timings.sort()
+    return status, timings, max(queries)
+
+
+def _summarize(url, status, timings, queries):
+    return {
+        'url': url,
+        'status': status,
+        'p50_ms': round(percentile(timings, 50), 3),
+        'p95_ms': round(percentile(timings, 95), 3),
+        'p99_ms': round(percentile(timings, 99), 3),
+        'mean_ms': round(sum(timings) / len(timings), 3),
+        'queries': queries,
+    }
+
+
+def _print_result(name, result):
+    line = (f"  {name:<30} {result['status']}  p50={result['p50_ms']:8.2f}ms  "
+            f"p95={result['p95_ms']:8.2f}ms  p99={result['p99_ms']:8.2f}ms  queries={result['queries']}")
+    if 'items_per_s' in result:
+        line += f"  {result['items_per_s']:.0f} itens/s"
+    print(line)
+
+
+def ensure_dataset(db_path):
+    if os.path.exists(db_path):
+        return
+    from generate_dataset import DatasetGenerator
+    print(f"🔧 Gerando dataset de benchmark em {db_path}")
+    os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+    DatasetGenerator(db_path, DATASET['users'], DATASET['accounts_per_user'], DATASET['years'],
+                     DATASET['tx_per_month'], seed=DATASET['seed']).run()
+
+
+def run_benchmark(db_path, user_id=1, iterations=20, warmup=2, only=None):
+    from app_simple_advanced import app
+
+    # Sem logs no console (configure_logging roda no import): o status de cada rota já vai para o resultado
+    logging.getLogger().setLevel(logging.CRITICAL)
+
+    saved_config = {key: app.config.get(key) for key in ('DATABASE', 'TESTING', 'PROPAGATE_EXCEPTIONS')}
+    app.config.update(DATABASE=db_path, TESTING=False, PROPAGATE_EXCEPTIONS=False)
+
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess['user_id'] = user_id
+
+    counter = QueryCounter()
+    sql_trace_hooks.append(counter)
+    results = {}
+    try:
+        for name, url in build_scenarios(db_path, user_id):
+            if only and name not in only:
+                continue
+            status, timings, queries = _measure(client, counter, lambda i: client.get(url), iterations, warmup)
+            results[name] = _summarize(url, status, timings, queries)
+            _print_result(name, results[name])
+
+        # Escritas: latência por requisição e vazão em transações/s (pela média)
+        for name, url, items, request_kwargs in build_write_scenarios(db_path, user_id):
+            if only and name not in only:
+                continue
+            status, timings, queries = _measure(
+                client, counter, lambda i: client.post(url, **request_kwargs(i)), iterations, warmup)
+            results[name] = _summarize(url, status, timings, queries)
+            results[name]['items'] = items
+            results[name]['items_per_s'] = round(items * 1000 / results[name]['mean_ms'], 1)
+            _print_result(name, results[name])
+    finally:
+        sql_trace_hooks.remove(counter)
+        try:
+            cleanup_writes(app, db_path, user_id)
+        finally:
+            app.config.update(saved_config)
+
+    return {
+        'meta': {
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'iterations': iterations,
+            'dataset': DATASET,
+        },
+        'results': results,
+    }
+
+
+def compare_with_baseline(current, baseline, tolerance):
+    """Lista de regressões (strings) em relação à baseline"""
+    regressions = []
+    for name, base in baseline.get('results', {}).items():
+        result = current['results'].get(name)
+        if result is None:
+            continue
+        if base['status'] < 400 <= result['status']:
+            regressions.append(f"{name}: status {base['status']} -> {result['status']}")
+        if result['queries'] > base['queries']:
+            regressions.append(f"{name}: queries {base['queries']} -> {result['queries']}")
+        for metric in ('p50_ms', 'p95_ms'):
+            limit = base[metric] * (1 + tolerance) + LATENCY_SLACK_MS
+            if result[metric] > limit:
+                regressions.append(f"{name}: {metric} {base[metric]:.2f} -> {result[metric]:.2f} "
+                                   f"(limite {limit:.2f})")
+    return regressions
+
+
+def merge_baseline(baseline, current, only=None):
+    """
+    Baseline com os cenários de current que ainda não estavam nela (e os de
+    only, regravados); as demais linhas continuam com os números gravados.
+    """
+    if not baseline:
+        return current
+    merged = {'meta': baseline.get('meta') or current.get('meta'), 'results': dict(baseline.get('results', {}))}
+    for name, result in current['results'].items():
+        if name not in merged['results'] or (only and name in only):
+            merged['results'][name] = result
+    return merged
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark de endpoints FynanPro')
+    parser.add_argument('--db', default=DEFAULT_DB, help='banco gerado (criado se não existir)')
+    parser.add_argument('--user-id', type=int, default=1)
+    parser.add_argument('--iterations', type=int, default=20)
+    parser.add_argument('--warmup', type=int, default=2)
+    parser.add_argument('--only', nargs='*', help='executar apenas estes cenários')
+    parser.add_argument('--output', default=DEFAULT_OUTPUT)
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='aumento relativo de latência aceito (0.25 = +25%%)')
+    parser.add_argument('--update-baseline', action='store_true',
+                        help='acrescentar os cenários novos à baseline (com --only: regravar esses)')
+    args = parser.parse_args(argv)
+
+    ensure_dataset(args.db)
+    print(f"🚀 Benchmark: {args.iterations} iterações por rota ({args.db})")
+    current = run_benchmark(args.db, args.user_id, args.iterations, args.warmup, args.only)
+
+    baseline = None
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+
+    target = args.baseline if args.update_baseline else args.output
+    written = merge_baseline(baseline, current, args.only) if args.update_baseline else current
+    os.makedirs(os.path.dirname(target) or '.', exist_ok=True)
+    with open(target, 'w', encoding='utf-8') as f:
+        json.dump(written, f, indent=2, ensure_ascii=False)
+        f.write('\n')
+    print(f"💾 Resultado gravado em {target}")
+
+    if args.update_baseline or baseline is None:
+        return 0
+
+    regressions = compare_with_baseline(current, baseline, args.tolerance)
+    if regressions:
+        print(f"❌ {len(regressions)} regressões em relação à baseline:")
+        for line in regressions:
+            print(f"   - {line}")
+        return 1
+    print("✅ Sem regressões em relação à baseline")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
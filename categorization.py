@@ -0,0 +1,386 @@
+# Categorização automática por regras (/api/v1/categorization) - FynanPro
+"""
+Lançamentos importados ou digitados às pressas chegam sem categoria. O
+usuário cadastra regras (migração 015) e elas preenchem a categoria:
+
+    {"pattern": "uber", "category_id": 7}
+        descrição contém "uber" (sem diferença de maiúsculas/acentos)
+    {"match_type": "regex", "pattern": "^posto (ipiranga|shell)", "category_id": 7,
+     "min_amount": 50, "max_amount": 400, "account_id": 2}
+        expressão regular + faixa de valor (absoluto) + conta
+
+Várias regras casando, vence a de menor priority (empate: a mais antiga).
+
+As regras de um usuário viram um RuleSet compilado uma vez (lru_cache
+pelas linhas da tabela): todos os trechos 'contains' entram em um único
+autômato de Aho-Corasick, que acha em uma passada pela descrição todas as
+regras cujo trecho aparece; as regex (restritas a um subconjunto sem
+backtracking exponencial, ver compile_regex) são testadas à parte. Extratos
+repetem muito as mesmas descrições, então os candidatos de cada descrição
+ficam memorizados e só os filtros de valor/conta/tipo rodam por linha.
+
+Aplicado na criação (new_transaction sem categoria, importação de
+extratos) e em lote sobre o histórico (categorize), com prévia sem gravar.
+"""
+
+import logging
+import re
+import time
+import unicodedata
+from collections import Counter, namedtuple
+from functools import lru_cache
+
+try:
+    from re import _parser as sre_parse  # Python 3.11+
+except ImportError:  # pragma: no cover
+    import sre_parse
+
+from money import Money, cents_sql, to_cents
+
+MATCH_TYPES = ('contains', 'regex')
+RULE_TRANSACTION_TYPES = ('receita', 'despesa')
+MAX_RULES_PER_USER = 200
+MAX_PATTERN_LENGTH = 200
+PREVIEW_SAMPLE_SIZE = 50
+APPLY_CHUNK_SIZE = 5000
+_MEMO_LIMIT = 50000
+
+Rule = namedtuple('Rule', 'id category_id match_type pattern min_cents max_cents account_id '
+                          'transaction_type priority')
+
+_SPACES = re.compile(r'\s+')
+
+logger = logging.getLogger(__name__)
+
+# Subconjunto seguro de regex: o re do Python faz backtracking, e '(a+)+$'
+# numa descrição longa sem casamento leva tempo exponencial (ReDoS). Sem
+# quantificador ilimitado dentro de outro, sem alternância repetida e sem
+# backreference, o custo do search fica polinomial no tamanho da descrição.
+_REPEATS = {sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT}
+if hasattr(sre_parse, 'POSSESSIVE_REPEAT'):
+    _REPEATS.add(sre_parse.POSSESSIVE_REPEAT)
+_BACKREFERENCES = {sre_parse.GROUPREF, sre_parse.GROUPREF_EXISTS}
+_ATOMIC_GROUP = getattr(sre_parse, 'ATOMIC_GROUP', None)
+
+
+class RuleError(ValueError):
+    """Regra inválida (regex que não compila, categoria/conta de outro usuário, limite atingido)"""
+
+
+def normalize_text(text):
+    """Minúsculas, sem acentos e com espaços simples - 'Pão  de Açúcar' -> 'pao de acucar'"""
+    text = unicodedata.normalize('NFKD', str(text or '').lower())
+    return _SPACES.sub(' ', ''.join(ch for ch in text if not unicodedata.combining(ch))).strip()
+
+
+def _strip_accents(pattern):
+    pattern = unicodedata.normalize('NFKD', pattern)
+    return ''.join(ch for ch in pattern if not unicodedata.combining(ch))
+
+
+def _unsafe_construct(items, repeated=False):
+    """Descrição do primeiro trecho fora do subconjunto seguro, ou None"""
+    for op, av in items:
+        if op in _BACKREFERENCES:
+            return 'backreference'
+        if op in _REPEATS:
+            low, high, body = av
+            unbounded = high is sre_parse.MAXREPEAT or high > 1
+            if unbounded and repeated:
+                return 'quantificador aninhado'
+            problem = _unsafe_construct(body, repeated or unbounded)
+        elif op is sre_parse.BRANCH:
+            if repeated:
+                return 'alternância dentro de repetição'
+            problem = next(filter(None, (_unsafe_construct(branch, repeated) for branch in av[1])), None)
+        elif op is sre_parse.SUBPATTERN:
+            problem = _unsafe_construct(av[-1], repeated)
+        elif op is _ATOMIC_GROUP:
+            problem = _unsafe_construct(av, repeated)
+        elif op in (sre_parse.ASSERT, sre_parse.ASSERT_NOT):
+            problem = _unsafe_construct(av[1], repeated)
+        else:
+            continue
+        if problem:
+            return problem
+    return None
+
+
+def compile_regex(pattern):
+    """Compilar o padrão de uma regra regex; RuleError se não compila ou sai do subconjunto seguro"""
+    pattern = _strip_accents(pattern)
+    try:
+        problem = _unsafe_construct(sre_parse.parse(pattern, re.IGNORECASE))
+        regex = re.compile(pattern, re.IGNORECASE)
+    except re.error as e:
+        raise RuleError(f'Expressão regular inválida: {e}.')
+    if problem:
+        raise RuleError(f'Expressão regular não permitida ({problem}): risco de tempo exponencial.')
+    return regex
+
+
+class Automaton:
+    """Aho-Corasick: todos os valores cujos trechos aparecem no texto, em uma passada"""
+
+    def __init__(self, words):
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [()]
+        for word, value in words:
+            state = 0
+            for ch in word:
+                if ch not in self.goto[state]:
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append(())
+                    self.goto[state][ch] = len(self.goto) - 1
+                state = self.goto[state][ch]
+            self.output[state] += (value,)
+
+        # Falhas em largura: cada estado herda as saídas do seu sufixo mais longo
+        queue = list(self.goto[0].values())  # profundidade 1: falha na raiz
+        for state in queue:
+            for ch, child in self.goto[state].items():
+                queue.append(child)
+                fallback = self.fail[state]
+                while fallback and ch not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[child] = self.goto[fallback].get(ch, 0)
+                self.output[child] += self.output[self.fail[child]]
+
+    def search(self, text):
+        goto, fail, output = self.goto, self.fail, self.output
+        found = set()
+        state = 0
+        for ch in text:
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if output[state]:
+                found.update(output[state])
+        return found
+
+
+class RuleSet:
+    """Regras ativas de um usuário compiladas para casar muitas descrições"""
+
+    def __init__(self, rules):
+        self.rules = sorted(rules, key=lambda rule: (rule.priority, rule.id))
+        self._automaton = Automaton((normalize_text(rule.pattern), index)
+                                    for index, rule in enumerate(self.rules) if rule.match_type == 'contains')
+        self._regexes = []
+        for index, rule in enumerate(self.rules):
+            if rule.match_type != 'regex':
+                continue
+            try:
+                self._regexes.append((index, compile_regex(rule.pattern)))
+            except RuleError as e:  # regra gravada antes da validação atual: ignorada, não trava o lote
+                logger.warning("⚠️ Regra de categorização %s ignorada: %s", rule.id, e)
+        self._memo = {}
+
+    def __len__(self):
+        return len(self.rules)
+
+    def candidates(self, description):
+        """Índices (em ordem de prioridade) das regras cujo padrão casa com a descrição"""
+        found = self._memo.get(description)
+        if found is None:
+            text = normalize_text(description)
+            indices = self._automaton.search(text)
+            indices.update(index for index, regex in self._regexes if regex.search(text))
+            found = tuple(sorted(indices))
+            if len(self._memo) >= _MEMO_LIMIT:
+                self._memo.clear()
+            self._memo[description] = found
+        return found
+
+    def match(self, description, cents, account_id, transaction_type):
+        """Primeira regra (por prioridade) que casa com o lançamento, ou None"""
+        if not self.rules:
+            return None
+        cents = abs(cents or 0)
+        for index in self.candidates(description):
+            rule = self.rules[index]
+            if rule.min_cents is not None and cents < rule.min_cents:
+                continue
+            if rule.max_cents is not None and cents > rule.max_cents:
+                continue
+            if rule.account_id is not None and rule.account_id != account_id:
+                continue
+            if rule.transaction_type is not None and rule.transaction_type != transaction_type:
+                continue
+            return rule
+        return None
+
+
+_RULE_COLUMNS = ('id, category_id, match_type, pattern, min_amount_cents, max_amount_cents, account_id, '
+                 'transaction_type, priority')
+
+
+@lru_cache(maxsize=32)
+def compile_rules(rows):
+    """RuleSet das linhas (tupla de tuplas); regras iguais reaproveitam o autômato"""
+    return RuleSet([Rule(*row) for row in rows])
+
+
+def rule_set(conn, user_id):
+    """Regras ativas do usuário já compiladas (uma consulta)"""
+    rows = conn.execute(f'''
+        SELECT {_RULE_COLUMNS} FROM categorization_rules
+        WHERE user_id = ? AND is_active = 1 ORDER BY priority, id
+    ''', (user_id,)).fetchall()
+    return compile_rules(tuple(tuple(row) for row in rows))
+
+
+def _optional_cents(body, field):
+    if body.get(field) in (None, ''):
+        return None
+    try:
+        cents = abs(to_cents(body[field]))
+    except (TypeError, ValueError, ArithmeticError):
+        raise RuleError(f'{field} inválido.')
+    return cents
+
+
+def parse_rule(body, account_ids, categories):
+    """
+    Validar o corpo de uma regra; devolve o dict gravável.
+    account_ids: contas do usuário; categories: {id: category_type}.
+    """
+    if not isinstance(body, dict):
+        raise RuleError('Envie a regra como objeto JSON.')
+    match_type = body.get('match_type') or 'contains'
+    if match_type not in MATCH_TYPES:
+        raise RuleError('match_type deve ser contains ou regex.')
+    pattern = str(body.get('pattern') or '').strip()
+    if not pattern or len(pattern) > MAX_PATTERN_LENGTH:
+        raise RuleError(f'pattern é obrigatório (até {MAX_PATTERN_LENGTH} caracteres).')
+    if match_type == 'contains' and not normalize_text(pattern):
+        raise RuleError('pattern é obrigatório.')
+    if match_type == 'regex':
+        compile_regex(pattern)
+
+    try:
+        category_id = int(body.get('category_id'))
+    except (TypeError, ValueError):
+        raise RuleError('category_id é obrigatória.')
+    if category_id not in categories:
+        raise RuleError('category_id não encontrada.')
+
+    # Sem tipo explícito a regra vale para o tipo da categoria
+    transaction_type = body.get('transaction_type') or categories[category_id]
+    if transaction_type is not None and transaction_type not in RULE_TRANSACTION_TYPES:
+        raise RuleError('transaction_type deve ser receita ou despesa.')
+    if categories[category_id] not in (transaction_type, None):
+        raise RuleError(f'category_id não é uma categoria de {transaction_type}.')
+
+    account_id = body.get('account_id')
+    if account_id not in (None, ''):
+        try:
+            account_id = int(account_id)
+        except (TypeError, ValueError):
+            account_id = None
+        if account_id not in account_ids:
+            raise RuleError('account_id não encontrada entre as contas do usuário.')
+    else:
+        account_id = None
+
+    min_cents, max_cents = _optional_cents(body, 'min_amount'), _optional_cents(body, 'max_amount')
+    if min_cents is not None and max_cents is not None and min_cents > max_cents:
+        raise RuleError('min_amount maior que max_amount.')
+    try:
+        priority = int(body.get('priority', 100))
+    except (TypeError, ValueError):
+        raise RuleError('priority deve ser um inteiro.')
+
+    return {'category_id': category_id, 'match_type': match_type, 'pattern': pattern,
+            'min_amount_cents': min_cents, 'max_amount_cents': max_cents, 'account_id': account_id,
+            'transaction_type': transaction_type, 'priority': priority}
+
+
+def _public_rule(row):
+    return {'id': row[0], 'category_id': row[1], 'match_type': row[2], 'pattern': row[3],
+            'min_amount': Money(row[4]).to_float() if row[4] is not None else None,
+            'max_amount': Money(row[5]).to_float() if row[5] is not None else None,
+            'account_id': row[6], 'transaction_type': row[7], 'priority': row[8],
+            'is_active': bool(row[9]), 'created_at': row[10]}
+
+
+def list_rules(conn, user_id):
+    return [_public_rule(row) for row in conn.execute(f'''
+        SELECT {_RULE_COLUMNS}, is_active, created_at FROM categorization_rules
+        WHERE user_id = ? ORDER BY priority, id
+    ''', (user_id,))]
+
+
+def create_rule(conn, user_id, rule):
+    count = conn.execute('SELECT COUNT(*) FROM categorization_rules WHERE user_id = ?', (user_id,)).fetchone()[0]
+    if count >= MAX_RULES_PER_USER:
+        raise RuleError(f'Limite de {MAX_RULES_PER_USER} regras atingido.')
+    names = list(rule)
+    cursor = conn.execute(f'''
+        INSERT INTO categorization_rules (user_id, {', '.join(names)})
+        VALUES (?, {', '.join('?' * len(names))})
+    ''', (user_id, *rule.values()))
+    return _public_rule(conn.execute(f'''
+        SELECT {_RULE_COLUMNS}, is_active, created_at FROM categorization_rules WHERE id = ?
+    ''', (cursor.lastrowid,)).fetchone())
+
+
+def delete_rule(conn, user_id, rule_id):
+    return conn.execute('DELETE FROM categorization_rules WHERE id = ? AND user_id = ?',
+                        (rule_id, user_id)).rowcount > 0
+
+
+def categorize(conn, user_id, rules, type_column, columns, apply=False, recategorize=False,
+               sample_size=PREVIEW_SAMPLE_SIZE):
+    """
+    Passa as regras sobre as receitas/despesas do usuário. Só as sem
+    categoria, a não ser com recategorize=True (aí só conta quem muda).
+    apply=False é a prévia: nada é gravado. Com apply=True as categorias
+    entram via executemany em blocos; o commit fica com quem chamou.
+    """
+    started = time.perf_counter()
+    amount = cents_sql('amount', 't', columns)
+    pending = '' if recategorize else "AND (t.category IS NULL OR t.category = '')"
+    cursor = conn.execute(f'''
+        SELECT t.id, t.description, {amount}, t.account_id, t.{type_column}, t.category
+        FROM transactions t
+        JOIN accounts a ON a.id = t.account_id
+        WHERE a.user_id = ? AND t.{type_column} IN ('receita', 'despesa') {pending}
+        ORDER BY t.id
+    ''', (user_id,))
+
+    scanned = 0
+    updates = []
+    by_rule = Counter()
+    sample = []
+    for tx_id, description, cents, account_id, transaction_type, current in cursor:
+        scanned += 1
+        rule = rules.match(description, cents, account_id, transaction_type)
+        if rule is None or str(current) == str(rule.category_id):
+            continue
+        updates.append((rule.category_id, tx_id))
+        by_rule[rule.id] += 1
+        if len(sample) < sample_size:
+            sample.append({'transaction_id': tx_id, 'description': description,
+                           'amount': Money(cents).to_float(), 'account_id': account_id,
+                           'current_category_id': current or None,
+                           'category_id': rule.category_id, 'rule_id': rule.id})
+
+    if apply:
+        for start in range(0, len(updates), APPLY_CHUNK_SIZE):
+            conn.executemany('UPDATE transactions SET category = ? WHERE id = ?',
+                             updates[start:start + APPLY_CHUNK_SIZE])
+
+    rules_by_id = {rule.id: rule for rule in rules.rules}
+    return {
+        'applied': bool(apply),
+        'scanned': scanned,
+        'matched': len(updates),
+        'updated': len(updates) if apply else 0,
+        'by_rule': [{'rule_id': rule_id, 'category_id': rules_by_id[rule_id].category_id, 'count': count}
+                    for rule_id, count in by_rule.most_common()],
+        'sample': sample,
+        'seconds': round(time.perf_counter() - started, 3),
+    }
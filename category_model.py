@@ -0,0 +1,299 @@
+# Sugestões de categoria aprendidas com o histórico (/api/v1/categorization/suggest) - FynanPro
+"""
+Além das regras explícitas (categorization.py), cada usuário tem um
+classificador naive Bayes multinomial sobre as palavras da descrição dos
+lançamentos que ele já categorizou: "UBER *TRIP SP" -> Transporte 0.93,
+Lazer 0.04, ... As três mais prováveis aparecem no formulário de nova
+transação e no resumo da importação de extratos.
+
+O modelo são só contagens (lançamentos por categoria e palavras por
+categoria), então treinar é somar e o modelo pode ser gravado como JSON
+(migração 016) com a versão dos dados em que foi treinado - o seq do
+change_log (migração 009). Quando a versão avança:
+
+- só inserções desde então: as linhas novas entram nas contagens;
+- alteração/exclusão de lançamento antigo: o modelo é refeito do zero.
+
+O treino nunca roda na requisição. A requisição usa o modelo em memória
+(ou o gravado por outro worker) mesmo defasado e agenda o retreino em uma
+thread de fundo (um por usuário de cada vez); a próxima requisição já vê
+o modelo novo. Sugerir custa um dict lookup por palavra e categoria.
+"""
+
+import json
+import logging
+import math
+import os
+import re
+import sqlite3
+import threading
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from categorization import normalize_text
+from change_log import in_chunks, latest_seq
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TOP_K = 3
+DEFAULT_CACHE_SIZE = 256
+
+_WORDS = re.compile(r'[a-z0-9]+')
+
+
+def tokenize(description):
+    """Palavras normalizadas da descrição, sem números puros e letras soltas"""
+    return [word for word in _WORDS.findall(normalize_text(description))
+            if len(word) > 1 and not word.isdigit()]
+
+
+def _category_id(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class CategoryModel:
+    """Naive Bayes multinomial (suavização de Laplace) de descrição -> categoria"""
+
+    def __init__(self, version=0, docs=None, words=None):
+        self.version = version
+        self.docs = Counter(docs or {})  # categoria -> lançamentos
+        self.words = {category: Counter(counts) for category, counts in (words or {}).items()}
+        self._prepared = None
+
+    def __len__(self):
+        return sum(self.docs.values())
+
+    def add(self, description, category_id):
+        self.docs[category_id] += 1
+        self.words.setdefault(category_id, Counter()).update(tokenize(description))
+        self._prepared = None
+
+    def copy(self):
+        return CategoryModel(self.version, self.docs, self.words)
+
+    def _prepare(self):
+        """Vocabulário e logaritmos por categoria, calculados uma vez por versão do modelo"""
+        if self._prepared is None:
+            vocabulary = set()
+            for counts in self.words.values():
+                vocabulary.update(counts)
+            total = len(self) or 1
+            self._prepared = (vocabulary, {
+                category: (math.log(count / total),
+                           math.log(sum(self.words.get(category, {}).values()) + len(vocabulary)))
+                for category, count in self.docs.items() if count > 0
+            })
+        return self._prepared
+
+    def suggest(self, description, categories=None, transaction_type=None, k=DEFAULT_TOP_K):
+        """
+        [{'category_id', 'probability'}] das k categorias mais prováveis.
+        categories: {id: category_type} - só essas, e do tipo pedido quando
+        há transaction_type. Descrição sem nenhuma palavra conhecida: [].
+        """
+        vocabulary, logs = self._prepare()
+        words = [word for word in tokenize(description) if word in vocabulary]
+        if not words:
+            return []
+        scores = {}
+        for category, (log_prior, log_denominator) in logs.items():
+            if categories is not None:
+                if category not in categories:
+                    continue
+                if transaction_type and categories[category] not in (transaction_type, None):
+                    continue
+            counts = self.words.get(category, {})
+            scores[category] = (log_prior - len(words) * log_denominator
+                                + sum(math.log(counts.get(word, 0) + 1) for word in words))
+        if not scores:
+            return []
+        best = max(scores.values())
+        weights = {category: math.exp(score - best) for category, score in scores.items()}
+        total = sum(weights.values())
+        ranked = sorted(weights.items(), key=lambda item: (-item[1], item[0]))[:k]
+        return [{'category_id': category, 'probability': round(weight / total, 4)} for category, weight in ranked]
+
+    def to_json(self):
+        return json.dumps({'docs': self.docs, 'words': self.words}, ensure_ascii=False)
+
+    @classmethod
+    def from_json(cls, version, text):
+        data = json.loads(text)
+        return cls(version, {int(category): count for category, count in data['docs'].items()},
+                   {int(category): counts for category, counts in data['words'].items()})
+
+
+def _labelled_rows(conn, user_id, type_column, ids=None):
+    """(descrição, categoria) das receitas/despesas categorizadas do usuário"""
+    sql = f'''
+        SELECT t.description, t.category
+        FROM transactions t
+        JOIN accounts a ON a.id = t.account_id
+        WHERE a.user_id = ? AND t.{type_column} IN ('receita', 'despesa')
+          AND t.category IS NOT NULL AND t.category <> ''
+    '''
+    if ids is None:
+        yield from conn.execute(sql, (user_id,))
+        return
+    for marks, chunk in in_chunks(sorted(ids)):
+        yield from conn.execute(f'{sql} AND t.id IN ({marks})', (user_id, *chunk))
+
+
+def train(conn, user_id, type_column, model=None):
+    """
+    Modelo na versão atual dos dados: incremental a partir de `model` quando
+    desde a versão dele só houve inserções, senão do zero. `model` não é
+    alterado (pode estar servindo sugestões em outra thread).
+    """
+    # Versão e linhas lidas na mesma transação: nenhuma inserção entra duas vezes
+    conn.execute('BEGIN')
+    try:
+        version = latest_seq(conn, user_id)
+        inserted = None
+        if model is not None:
+            if model.version >= version:
+                return model
+            inserted = set()
+            for op, entity_id in conn.execute('''
+                SELECT op, entity_id FROM change_log
+                WHERE user_id = ? AND entity = 'transactions' AND seq > ? AND seq <= ?
+                ORDER BY seq
+            ''', (user_id, model.version, version)):
+                if op == 'I':
+                    inserted.add(entity_id)
+                elif entity_id not in inserted:
+                    inserted = None  # lançamento já contado mudou ou sumiu
+                    break
+
+        trained = model.copy() if inserted is not None else CategoryModel()
+        for description, category in _labelled_rows(conn, user_id, type_column, inserted):
+            category_id = _category_id(category)
+            if category_id is not None:
+                trained.add(description, category_id)
+        trained.version = version
+        return trained
+    finally:
+        conn.rollback()
+
+
+def load_model(conn, user_id):
+    """Modelo gravado do usuário, ou None"""
+    try:
+        row = conn.execute('SELECT version, model FROM category_models WHERE user_id = ?', (user_id,)).fetchone()
+    except sqlite3.OperationalError:
+        return None  # banco sem a migração 016
+    return CategoryModel.from_json(row[0], row[1]) if row else None
+
+
+def save_model(conn, user_id, model):
+    """Grava o modelo se for mais novo que o gravado (outro worker pode ter treinado antes)"""
+    conn.execute('''
+        INSERT INTO category_models (user_id, version, model) VALUES (?, ?, ?)
+        ON CONFLICT(user_id) DO UPDATE SET version = excluded.version, model = excluded.model,
+                                           trained_at = CURRENT_TIMESTAMP
+        WHERE excluded.version > category_models.version
+    ''', (user_id, model.version, model.to_json()))
+
+
+class ModelTrainer:
+    """Modelos em memória (LRU por banco e usuário) e retreino em segundo plano"""
+
+    def __init__(self, maxsize=DEFAULT_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._models = OrderedDict()
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def current(self, conn, db_path, user_id):
+        """Modelo para sugerir agora (pode estar defasado; None se nunca treinado) - nunca treina aqui"""
+        try:
+            version = latest_seq(conn, user_id)
+        except sqlite3.OperationalError:
+            return None  # sem change_log não há versão para invalidar
+        key = (db_path, user_id)
+        with self._lock:
+            model = self._models.get(key)
+            if model is not None:
+                self._models.move_to_end(key)
+        if model is None:
+            model = load_model(conn, user_id)
+            if model is not None:
+                self._remember(key, model)
+        if model is None or model.version < version:
+            self.schedule(db_path, user_id)
+        return model
+
+    def schedule(self, db_path, user_id):
+        """Agenda o retreino do usuário (no máximo um pendente por usuário)"""
+        key = (db_path, user_id)
+        with self._lock:
+            if key not in self._pending:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='category-model')
+                self._pending[key] = self._executor.submit(self._train, db_path, user_id)
+            return self._pending[key]
+
+    def wait(self, timeout=None):
+        """Espera os retreinos agendados (testes, scripts)"""
+        with self._lock:
+            futures = list(self._pending.values())
+        wait(futures, timeout)
+
+    def clear(self):
+        with self._lock:
+            self._models.clear()
+
+    def _remember(self, key, model):
+        with self._lock:
+            current = self._models.get(key)
+            if current is None or current.version <= model.version:
+                self._models[key] = model
+            self._models.move_to_end(key)
+            while len(self._models) > self.maxsize:
+                self._models.popitem(last=False)
+
+    def _train(self, db_path, user_id):
+        key = (db_path, user_id)
+        try:
+            conn = sqlite3.connect(db_path, timeout=30)
+            try:
+                with self._lock:
+                    model = self._models.get(key)
+                stored = load_model(conn, user_id)
+                if stored is not None and (model is None or stored.version > model.version):
+                    model = stored
+                columns = {row[1] for row in conn.execute('PRAGMA table_info(transactions)')}
+                trained = train(conn, user_id, 'type' if 'type' in columns else 'transaction_type', model)
+                if trained is not model:
+                    save_model(conn, user_id, trained)
+                    conn.commit()
+            finally:
+                conn.close()
+            self._remember(key, trained)
+            logger.info("🧠 Modelo de categorias do usuário %s na versão %s (%s lançamentos)",
+                        user_id, trained.version, len(trained))
+        except Exception as e:
+            logger.error("🚨 Falha ao treinar o modelo de categorias do usuário %s: %s", user_id, e)
+        finally:
+            with self._lock:
+                self._pending.pop(key, None)
+
+
+_trainer = ModelTrainer()
+
+
+def init_category_model(app):
+    """Tamanho do LRU de modelos em memória (CATEGORY_MODEL_CACHE_SIZE usuários)"""
+    app.config.setdefault('CATEGORY_MODEL_CACHE_SIZE',
+                          int(os.getenv('CATEGORY_MODEL_CACHE_SIZE', DEFAULT_CACHE_SIZE)))
+    _trainer.maxsize = app.config['CATEGORY_MODEL_CACHE_SIZE']
+    return _trainer
+
+
+def user_model(conn, db_path, user_id):
+    """Modelo do usuário para a requisição atual; retreino agendado se a versão dos dados mudou"""
+    return _trainer.current(conn, db_path, user_id)
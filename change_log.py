@@ -0,0 +1,141 @@
+# Sincronização incremental (GET /api/v1/sync) - FynanPro
+"""
+Triggers da migração 009 gravam em change_log uma linha por inserção,
+alteração ou exclusão em transações, contas, orçamentos e metas, com seq
+crescente. O cliente guarda o último seq recebido e pede só o que mudou
+depois dele: O(alterações) em vez de baixar as listas inteiras.
+
+Cada página é compactada: várias alterações da mesma linha viram uma só
+(estado atual da linha ou tombstone), e linhas criadas e apagadas dentro da
+mesma página nem aparecem.
+
+    {'since': 120, 'next_since': 620, 'has_more': True, 'latest_seq': 4100,
+     'changes': {'transactions': {'inserted': [...], 'updated': [...], 'deleted': [ids]}, ...}}
+
+A rota acrescenta 'limit': o tamanho de página aplicado (limit acima de
+MAX_PAGE_SIZE é reduzido ao máximo).
+"""
+
+DEFAULT_PAGE_SIZE = 500
+MAX_PAGE_SIZE = 5000
+
+# Limite de parâmetros por IN (...) - SQLite antigo aceita 999
+IN_CHUNK_SIZE = 500
+
+# Campos enviados por entidade (os que não existirem no schema são ignorados)
+SYNC_FIELDS = {
+    'transactions': ('id', 'account_id', 'description', 'amount', 'amount_cents', 'date', 'transaction_type',
+                     'category', 'transfer_account_id', 'notes', 'tags', 'is_confirmed', 'is_reconciled',
+                     'recurrence_type', 'parent_transaction_id'),
+    'accounts': ('id', 'name', 'bank_name', 'account_type', 'current_balance', 'current_balance_cents',
+                 'credit_limit', 'color', 'is_active', 'include_in_total'),
+    'budgets': ('id', 'category_id', 'name', 'amount', 'amount_cents', 'period_type', 'start_date',
+                'end_date', 'alert_percentage', 'is_active'),
+    'goals': ('id', 'name', 'description', 'target_amount', 'target_amount_cents', 'current_amount',
+              'current_amount_cents', 'target_date', 'category', 'is_active'),
+}
+
+# Filtro de dono ao ler o estado atual: uma linha que mudou de dono vira tombstone
+_OWNER_FILTER = {
+    'transactions': 'account_id IN (SELECT id FROM accounts WHERE user_id = ?)',
+    'accounts': 'user_id = ?',
+    'budgets': 'user_id = ?',
+    'goals': 'user_id = ?',
+}
+
+
+def latest_seq(conn, user_id):
+    """Último seq do usuário (0 se nada mudou ainda)"""
+    row = conn.execute('SELECT MAX(seq) FROM change_log WHERE user_id = ?', (user_id,)).fetchone()
+    return row[0] or 0
+
+
+def in_chunks(values, size=IN_CHUNK_SIZE):
+    """
+    Fatias de values para consultas com IN (...), cada uma com seus placeholders:
+
+        for marks, chunk in in_chunks(ids):
+            conn.execute(f'SELECT ... WHERE id IN ({marks})', chunk)
+    """
+    values = list(values)
+    for start in range(0, len(values), size):
+        chunk = values[start:start + size]
+        yield ', '.join('?' * len(chunk)), chunk
+
+
+def _pragma_columns(conn, table):
+    return [row[1] for row in conn.execute(f'PRAGMA table_info({table})').fetchall()]
+
+
+def _select_list(columns, entity):
+    fields = []
+    for field in SYNC_FIELDS[entity]:
+        if field in columns:
+            fields.append(field)
+        elif field == 'transaction_type' and 'type' in columns:
+            fields.append('type AS transaction_type')
+    return ', '.join(fields)
+
+
+def _current_rows(conn, entity, user_id, ids, get_columns):
+    """{id: dict} do estado atual das linhas do usuário"""
+    select = _select_list(set(get_columns(conn, entity)), entity)
+    rows = {}
+    for marks, chunk in in_chunks(ids):
+        for row in conn.execute(f'''
+            SELECT {select} FROM {entity}
+            WHERE id IN ({marks}) AND {_OWNER_FILTER[entity]}
+        ''', chunk + [user_id]).fetchall():
+            rows[row['id']] = dict(row)
+    return rows
+
+
+def fetch_changes(conn, user_id, since=0, limit=DEFAULT_PAGE_SIZE, get_columns=_pragma_columns):
+    """
+    Página de alterações do usuário com seq > since (conn com row_factory=sqlite3.Row).
+    get_columns(conn, tabela): colunas da tabela; o app passa get_table_columns (em cache).
+    """
+    limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+    log = conn.execute('''
+        SELECT seq, entity, entity_id, op FROM change_log
+        WHERE user_id = ? AND seq > ?
+        ORDER BY seq LIMIT ?
+    ''', (user_id, since, limit + 1)).fetchall()
+    has_more = len(log) > limit
+    log = log[:limit]
+
+    # (entidade, id) -> [primeira op, última op] na página
+    touched = {}
+    for seq, entity, entity_id, op in log:
+        if entity not in SYNC_FIELDS:
+            continue
+        ops = touched.setdefault((entity, entity_id), [op, op])
+        ops[1] = op
+
+    changes = {}
+    for entity in SYNC_FIELDS:
+        ids = [entity_id for (name, entity_id), ops in touched.items() if name == entity and ops[1] != 'D']
+        current = _current_rows(conn, entity, user_id, ids, get_columns) if ids else {}
+        inserted, updated, deleted = [], [], []
+        for (name, entity_id), (first, _) in touched.items():
+            if name != entity:
+                continue
+            row = current.get(entity_id)
+            if row is None:
+                if first != 'I':  # criada e apagada na mesma página: o cliente nunca a viu
+                    deleted.append(entity_id)
+            elif first == 'I':
+                inserted.append(row)
+            else:
+                updated.append(row)
+        if inserted or updated or deleted:
+            changes[entity] = {'inserted': inserted, 'updated': updated, 'deleted': deleted}
+
+    next_since = log[-1]['seq'] if log else since
+    return {
+        'since': since,
+        'next_since': next_since,
+        'has_more': has_more,
+        'latest_seq': next_since if not has_more else latest_seq(conn, user_id),
+        'changes': changes,
+    }
@@ -0,0 +1,106 @@
+# Totais hierárquicos do plano de contas (/reports/chart-tree) - FynanPro
+"""
+Subtotais de todos os nós do plano de contas em uma única consulta.
+
+A tabela de fechamento chart_account_closure (migração 013, mantida por
+triggers em chart_of_accounts) guarda um par (ancestral, descendente,
+distância) por caminho da árvore. Juntar cada lançamento a todos os
+ancestrais do seu plano de contas e agrupar por ancestral dá, de uma vez,
+o subtotal de cada nó (ele e todos os descendentes) - em vez de um SUM
+por nó como ChartOfAccounts.get_balance.
+
+O drill-down parte desses nós: caminho até a raiz, o nó e os filhos
+diretos com subtotal e participação no total do pai.
+"""
+
+from money import Money, cents_sql
+from tags import tag_filter_sql
+
+
+def chart_rollup(conn, user_id, type_column, columns, start_date, end_date, transaction_type, tag=None):
+    """
+    Nós ativos do plano de contas do tipo, em ordem de código, com subtotal
+    da subárvore, total lançado no próprio nó e quantidade (centavos).
+    tag: só lançamentos com a tag (índice da migração 014).
+    """
+    amount = cents_sql('amount', 't', columns)
+    tag_condition, tag_params = (f'AND {tag_filter_sql()}', (user_id, tag)) if tag else ('', ())
+    rows = conn.execute(f'''
+        WITH totals AS (
+            SELECT cl.ancestor_id AS chart_id,
+                   SUM({amount}) AS subtotal,
+                   SUM(CASE WHEN cl.depth = 0 THEN {amount} ELSE 0 END) AS own,
+                   COUNT(*) AS quantity
+            FROM transactions t
+            JOIN accounts a ON a.id = t.account_id
+            JOIN chart_account_closure cl ON cl.descendant_id = t.chart_account_id
+            WHERE a.user_id = ? AND t.is_confirmed = 1 AND t.{type_column} = ?
+              AND DATE(t.date) BETWEEN ? AND ? {tag_condition}
+            GROUP BY cl.ancestor_id
+        )
+        SELECT c.id, c.code, c.name, c.parent_id, c.level, c.is_summary,
+               COALESCE(s.subtotal, 0), COALESCE(s.own, 0), COALESCE(s.quantity, 0)
+        FROM chart_of_accounts c
+        LEFT JOIN totals s ON s.chart_id = c.id
+        WHERE c.is_active = 1 AND c.account_type = ?
+        ORDER BY c.code
+    ''', (user_id, transaction_type, start_date, end_date, *tag_params, transaction_type)).fetchall()
+    return [{'id': row[0], 'code': row[1], 'name': row[2], 'parent_id': row[3], 'level': row[4],
+             'is_summary': bool(row[5]), 'subtotal_cents': row[6], 'own_cents': row[7], 'quantity': row[8]}
+            for row in rows]
+
+
+def _public(node, parent_cents):
+    return {
+        'id': node['id'],
+        'code': node['code'],
+        'name': node['name'],
+        'level': node['level'],
+        'is_summary': node['is_summary'],
+        'total': Money(node['subtotal_cents']).to_float(),
+        'own_total': Money(node['own_cents']).to_float(),
+        'quantity': node['quantity'],
+        'share': round(node['subtotal_cents'] * 100 / parent_cents, 2) if parent_cents else 0.0,
+        'has_children': bool(node.get('children')),
+    }
+
+
+def drill_down(nodes, node_id=None):
+    """
+    {'total', 'path', 'node', 'children'} de um nó (None = raízes): caminho
+    da raiz até o nó e filhos diretos com subtotal, por valor decrescente.
+    None se node_id não está entre os nós.
+    """
+    by_id = {node['id']: dict(node, children=[]) for node in nodes}
+    roots = []
+    for node in by_id.values():
+        parent = by_id.get(node['parent_id'])
+        (parent['children'] if parent else roots).append(node)
+    grand_total = sum(node['subtotal_cents'] for node in roots)
+
+    if node_id is None:
+        current, children, parent_cents = None, roots, grand_total
+    else:
+        current = by_id.get(node_id)
+        if current is None:
+            return None
+        children, parent_cents = current['children'], current['subtotal_cents']
+
+    path = []
+    ancestor = current
+    while ancestor is not None and len(path) <= len(by_id):
+        path.insert(0, {'id': ancestor['id'], 'code': ancestor['code'], 'name': ancestor['name']})
+        ancestor = by_id.get(ancestor['parent_id'])
+
+    if current is None:
+        node = None
+    else:
+        parent = by_id.get(current['parent_id'])
+        node = _public(current, parent['subtotal_cents'] if parent else grand_total)
+    return {
+        'total': Money(grand_total).to_float(),
+        'path': path,
+        'node': node,
+        'children': [_public(child, parent_cents)
+                     for child in sorted(children, key=lambda child: (-child['subtotal_cents'], child['code']))],
+    }
@@ -0,0 +1,64 @@
+# Fixtures compartilhados dos testes (pytest) - FynanPro
+"""
+Cada teste roda com o app apontando para um banco próprio em tmp_path;
+app.config volta ao que era no fim do teste.
+
+- app: app Flask com TESTING e DATABASE num banco temporário (ainda vazio)
+- dataset_db: o mesmo banco preenchido por generate_dataset. Tamanho e
+  semente vêm do marcador dataset, no módulo ou no teste:
+
+      pytestmark = pytest.mark.dataset(years=0.25, tx_per_month=5, seed=31)
+
+      @pytest.mark.dataset(users=1, seed=5)
+      def test_algo(dataset_db, client_for): ...
+
+- client_for(user_id): test client com a sessão do usuário
+- connect(): conexão sqlite3 (row_factory=Row) com o banco do teste
+"""
+
+import sqlite3
+
+import pytest
+
+from app_simple_advanced import app as flask_app
+from generate_dataset import DatasetGenerator
+
+DATASET_DEFAULTS = {'users': 2, 'accounts_per_user': 2, 'years': 0.25, 'tx_per_month': 5, 'seed': 42}
+
+
+def pytest_configure(config):
+    config.addinivalue_line('markers', 'dataset(**kwargs): parâmetros do DatasetGenerator para dataset_db')
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    monkeypatch.setitem(flask_app.config, 'DATABASE', str(tmp_path / 'test.db'))
+    monkeypatch.setitem(flask_app.config, 'TESTING', True)
+    return flask_app
+
+
+@pytest.fixture
+def dataset_db(request, app):
+    marker = request.node.get_closest_marker('dataset')
+    options = dict(DATASET_DEFAULTS, **(marker.kwargs if marker else {}))
+    DatasetGenerator(app.config['DATABASE'], **options).run()
+    return app.config['DATABASE']
+
+
+@pytest.fixture
+def client_for(app):
+    def make_client(user_id):
+        client = app.test_client()
+        with client.session_transaction() as sess:
+            sess['user_id'] = user_id
+        return client
+    return make_client
+
+
+@pytest.fixture
+def connect(app):
+    def open_connection():
+        conn = sqlite3.connect(app.config['DATABASE'])
+        conn.row_factory = sqlite3.Row
+        return conn
+    return open_connection
@@ -0,0 +1,57 @@
+# Widgets do dashboard com ETag (/api/v1/dashboard/*) - FynanPro
+"""
+O dashboard é servido como uma casca leve e cada bloco (cards do mês,
+tabela financeira, transações recentes, contas) vem de um endpoint JSON
+próprio, buscado em paralelo pelo navegador: o primeiro pixel não espera
+o agregado mais lento.
+
+A versão dos dados de cada usuário já existe: o último seq do change_log
+(migração 009), lido pelo índice (user_id, seq). O ETag de um widget é
+
+    hash(widget, usuário, seq, dia, parâmetros)
+
+- o dia entra porque "atrasados" e "este mês" mudam à meia-noite sem
+  nenhuma escrita. Com If-None-Match igual a resposta é 304 antes de
+  calcular o widget: revalidar custa uma consulta ao índice.
+
+Cache-Control "private, no-cache": o navegador guarda, mas revalida a cada
+uso, e proxies compartilhados não guardam dados de um usuário.
+"""
+
+import hashlib
+import sqlite3
+from datetime import date
+
+from flask import current_app, jsonify, request
+
+from change_log import latest_seq
+
+CACHE_CONTROL = 'private, no-cache'
+
+
+def widget_etag(conn, user_id, widget, *params):
+    """ETag do widget para o estado atual dos dados do usuário (None sem change_log)"""
+    try:
+        seq = latest_seq(conn, user_id)
+    except sqlite3.OperationalError:
+        # Banco sem a migração 009: sem versão confiável, sempre calcular
+        return None
+    parts = [widget, str(user_id), str(seq), date.today().isoformat()] + [str(p) for p in params]
+    return hashlib.sha1('|'.join(parts).encode('utf-8')).hexdigest()[:20]
+
+
+def widget_response(etag, build):
+    """
+    304 se o navegador já tem esta versão; senão jsonify(build()) com o ETag.
+    build só é chamado quando o corpo precisa ser gerado.
+    """
+    if etag is not None and request.if_none_match.contains_weak(etag):
+        response = current_app.response_class(status=304)
+    else:
+        response = jsonify(build())
+    if etag is not None:
+        response.set_etag(etag, weak=True)
+    response.headers['Cache-Control'] = CACHE_CONTROL
+    # Mesma URL, usuário diferente após novo login no mesmo navegador
+    response.vary.add('Cookie')
+    return response
@@ -0,0 +1,239 @@
+# Detecção de transações duplicadas - FynanPro
+"""
+Cada transação tem uma impressão digital (transactions.fingerprint, migração
+007): hash de conta + data + tipo + valor em centavos + descrição normalizada.
+
+- Duplicata exata: mesma impressão digital (reimportar um extrato que se
+  sobrepõe ao anterior, ou um cliente repetindo o POST de /transactions/new).
+- Possível duplicata: mesma conta, tipo e valor com data a até ±N dias.
+
+Quem grava pelo código novo (importação, lote, new_transaction,
+edit_transaction, gerador) já preenche a coluna, e a migração 007 preenche
+as linhas anteriores a ela. Escritas legadas (SQL direto) deixam NULL; o
+trigger da migração 007 zera a impressão digital quando
+descrição/valor/data/conta mudam. As leituras não gravam: o relatório
+calcula em memória a impressão digital que faltar, e backfill_fingerprints()
+roda nos caminhos de escrita ou pela linha de comando:
+
+    python dedup.py --db finance_planner_saas.db [--user-id 1]
+"""
+
+import argparse
+import hashlib
+import sqlite3
+import sys
+import re
+import unicodedata
+from datetime import date, timedelta
+from functools import lru_cache
+
+from change_log import in_chunks
+from money import cents_sql
+
+DEFAULT_WINDOW_DAYS = 3
+
+_NON_WORD = re.compile(r'[^a-z0-9]+')
+
+
+@lru_cache(maxsize=8192)
+def normalize_description(text):
+    """'  PIX  Padaria Pão-Quente ' -> 'pix padaria pao quente'"""
+    text = unicodedata.normalize('NFKD', (text or '').lower())
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch))
+    return _NON_WORD.sub(' ', text).strip()
+
+
+def fingerprint(account_id, date_str, transaction_type, cents, description):
+    """Impressão digital de uma transação (hex de 20 caracteres)"""
+    key = f"{account_id}|{str(date_str)[:10]}|{transaction_type}|{cents}|{normalize_description(description)}"
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()[:20]
+
+
+def _columns(conn):
+    return {row[1] for row in conn.execute('PRAGMA table_info(transactions)').fetchall()}
+
+
+def _type_column(columns):
+    return 'type' if 'type' in columns else 'transaction_type'
+
+
+def _cents_column(columns, alias=None):
+    """amount_cents (sempre preenchida após a migração 005, usa o índice) ou a expressão legada"""
+    if 'amount_cents' in columns:
+        return f"{alias}.amount_cents" if alias else 'amount_cents'
+    return cents_sql('amount', alias, columns)
+
+
+def backfill_fingerprints(conn, account_ids=None, columns=None, user_id=None):
+    """Calcular impressões digitais nulas (escritas legadas); devolve quantas foram preenchidas"""
+    columns = columns or _columns(conn)
+    if 'fingerprint' not in columns:
+        return 0
+    where, params = 'fingerprint IS NULL', []
+    if account_ids is not None:
+        account_ids = list(account_ids)
+        where += f" AND account_id IN ({', '.join('?' * len(account_ids))})"
+        params = account_ids
+    elif user_id is not None:
+        where += " AND account_id IN (SELECT id FROM accounts WHERE user_id = ?)"
+        params = [user_id]
+    rows = conn.execute(f'''
+        SELECT id, account_id, date, {_type_column(columns)}, {_cents_column(columns)}, description
+        FROM transactions WHERE {where}
+    ''', params).fetchall()
+    conn.executemany('UPDATE transactions SET fingerprint = ? WHERE id = ?',
+                     [(fingerprint(*row[1:]), row[0]) for row in rows])
+    return len(rows)
+
+
+def existing_fingerprint_counts(conn, fingerprints, exclude_import_batch=None):
+    """{fingerprint: quantidade já gravada} para as impressões digitais informadas (busca indexada)"""
+    exclude, extra = '', []
+    if exclude_import_batch is not None:
+        exclude, extra = ' AND import_batch_id IS NOT ?', [exclude_import_batch]
+    counts = {}
+    for marks, chunk in in_chunks(fingerprints):
+        rows = conn.execute(f'''
+            SELECT fingerprint, COUNT(*) FROM transactions
+            WHERE fingerprint IN ({marks}){exclude}
+            GROUP BY fingerprint
+        ''', chunk + extra).fetchall()
+        counts.update((row[0], row[1]) for row in rows)
+    return counts
+
+
+class DuplicateCounter:
+    """
+    Descarte de duplicatas exatas em lotes (importação, API em lote).
+    Linhas idênticas legítimas (dois cafés no mesmo dia) são mantidas: só a
+    n-ésima ocorrência é duplicata se já existirem n gravadas antes do lote.
+    """
+
+    def __init__(self, conn, exclude_import_batch=None):
+        self.conn = conn
+        self.exclude_import_batch = exclude_import_batch
+        self._existing = {}  # fingerprint -> ocorrências já gravadas
+        self._seen = {}      # fingerprint -> ocorrências vistas neste lote
+
+    def prefetch(self, fingerprints):
+        """Uma busca indexada para as impressões digitais ainda não consultadas"""
+        unknown = {fp for fp in fingerprints if fp not in self._existing}
+        if unknown:
+            found = existing_fingerprint_counts(self.conn, unknown, self.exclude_import_batch)
+            self._existing.update((fp, found.get(fp, 0)) for fp in unknown)
+
+    def is_duplicate(self, fp):
+        """Registrar mais uma ocorrência (após prefetch) e dizer se ela já existe gravada"""
+        self._seen[fp] = self._seen.get(fp, 0) + 1
+        return self._seen[fp] <= self._existing.get(fp, 0)
+
+
+def find_duplicate(conn, account_id, date_str, transaction_type, cents, description,
+                   window_days=DEFAULT_WINDOW_DAYS):
+    """
+    Transação já gravada que duplica a informada, ou None.
+    Devolve {'id', 'date', 'description', 'amount', 'match': 'exact'|'fuzzy'}; exata tem precedência.
+    """
+    columns = _columns(conn)
+    target = fingerprint(account_id, date_str, transaction_type, cents, description)
+    day = date.fromisoformat(str(date_str)[:10])
+    amount = _cents_column(columns)
+    # Uma busca pelo índice idx_transactions_dedup cobre os dois casos,
+    # inclusive linhas legadas ainda sem impressão digital
+    candidates = conn.execute(f'''
+        SELECT id, date, description, amount, {amount} AS cents
+        FROM transactions
+        WHERE account_id = ? AND {_type_column(columns)} = ? AND {amount} = ?
+          AND date BETWEEN ? AND ?
+        ORDER BY ABS(julianday(date) - julianday(?)), id
+    ''', (account_id, transaction_type, cents,
+          (day - timedelta(days=window_days)).isoformat(),
+          (day + timedelta(days=window_days)).isoformat() + '~', day.isoformat())).fetchall()
+
+    best = None
+    for row in candidates:
+        match = 'exact' if fingerprint(account_id, row['date'], transaction_type, cents,
+                                       row['description']) == target else 'fuzzy'
+        if best is None or (match == 'exact' and best['match'] == 'fuzzy'):
+            best = {'id': row['id'], 'date': str(row['date'])[:10], 'description': row['description'],
+                    'amount': row['cents'] / 100, 'match': match}
+    return best
+
+
+def find_duplicates(conn, user_id, window_days=DEFAULT_WINDOW_DAYS, columns=None):
+    """
+    Relatório de duplicatas do usuário em uma passada: as transações vêm
+    ordenadas por (conta, tipo, valor, data) e uma janela deslizante agrupa
+    as que ficam a até `window_days` dias umas das outras - O(n log n) em vez
+    de comparar todos os pares.
+
+    Devolve grupos [{'account_id', 'transaction_type', 'amount', 'match', 'transactions': [...]}].
+    """
+    columns = columns or _columns(conn)
+    type_column = _type_column(columns)
+    amount = _cents_column(columns, 't')
+    rows = conn.execute(f'''
+        SELECT t.id, t.account_id, a.name AS account_name, t.date, t.description,
+               t.{type_column} AS transaction_type, {amount} AS cents, t.fingerprint
+        FROM transactions t JOIN accounts a ON a.id = t.account_id
+        WHERE a.user_id = ?
+        ORDER BY t.account_id, t.{type_column}, {amount}, t.date
+    ''', (user_id,)).fetchall()
+
+    groups = []
+    current = []
+
+    def close_group():
+        if len(current) > 1:
+            # Linha legada sem impressão digital: calculada aqui, sem gravar na leitura
+            fingerprints = {row['fingerprint'] or fingerprint(row['account_id'], row['date'],
+                                                              row['transaction_type'], row['cents'],
+                                                              row['description'])
+                            for row in current}
+            groups.append({
+                'account_id': current[0]['account_id'],
+                'account_name': current[0]['account_name'],
+                'transaction_type': current[0]['transaction_type'],
+                'amount': current[0]['cents'] / 100,
+                'match': 'exact' if len(fingerprints) == 1 else 'fuzzy',
+                'transactions': [{'id': row['id'], 'date': str(row['date'])[:10],
+                                  'description': row['description']} for row in current],
+            })
+
+    previous_day = None
+    for row in rows:
+        day = date.fromisoformat(str(row['date'])[:10])
+        same_key = current and (row['account_id'], row['transaction_type'], row['cents']) == \
+            (current[0]['account_id'], current[0]['transaction_type'], current[0]['cents'])
+        if not (same_key and (day - previous_day).days <= window_days):
+            close_group()
+            current = []
+        current.append(row)
+        previous_day = day
+    close_group()
+
+    # Duplicatas exatas primeiro, depois as mais recentes
+    groups.sort(key=lambda group: group['transactions'][-1]['date'], reverse=True)
+    groups.sort(key=lambda group: group['match'] != 'exact')
+    return groups
+
+
+def main(argv=None):
+    """Preencher as impressões digitais nulas de um banco (escritas fora da aplicação)"""
+    parser = argparse.ArgumentParser(description='Preenche transactions.fingerprint onde estiver NULL')
+    parser.add_argument('--db', default='finance_planner_saas.db', help='banco SQLite')
+    parser.add_argument('--user-id', type=int, help='só as contas deste usuário')
+    args = parser.parse_args(argv)
+
+    conn = sqlite3.connect(args.db)
+    try:
+        filled = backfill_fingerprints(conn, user_id=args.user_id)
+        conn.commit()
+    finally:
+        conn.close()
+    print(f"🔏 {filled} impressões digitais preenchidas")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,146 @@
+# Eventos ao vivo por usuário (SSE em /api/v1/events) - FynanPro
+"""
+O dashboard aberto em uma aba não sabe quando outra aba, o celular ou a API
+em lote gravou transações. Este módulo expõe um stream Server-Sent Events
+por usuário com eventos leves derivados do change_log (migração 009):
+
+    event: balance      data: {"seq": 812, "accounts": [1, 2]}
+    event: aggregates   data: {"seq": 812, "entities": ["transactions"], "changes": 3}
+
+O id de cada evento é o seq do change_log: ao reconectar, o EventSource
+manda Last-Event-ID e o stream continua de onde parou, agrupando o que
+aconteceu no intervalo.
+
+Cada conexão consulta o change_log (índice user_id, seq) a cada
+EVENTS_POLL_SECONDS, sem estado em memória compartilhada: funciona com
+vários processos do gunicorn. A conexão é encerrada após
+EVENTS_MAX_SECONDS e o navegador reconecta sozinho, o que limita quanto
+tempo um worker fica preso. Use o worker gthread ou gevent
+(gunicorn.conf.py); com o worker sync cada stream ocupa um processo.
+"""
+
+import json
+import os
+import time
+
+from flask import Response, current_app, request, stream_with_context
+
+from change_log import latest_seq
+
+DEFAULT_POLL_SECONDS = 1.0
+DEFAULT_HEARTBEAT_SECONDS = 15.0
+DEFAULT_MAX_SECONDS = 60.0
+RETRY_MS = 3000
+
+# Alterações lidas por consulta; o restante sai na próxima volta
+_BATCH_LIMIT = 1000
+
+# Entidades que mudam os agregados do dashboard (receitas/despesas, orçamentos, metas)
+AGGREGATE_ENTITIES = ('transactions', 'budgets', 'goals')
+
+_connect = None
+
+
+def init_events(app, connect):
+    """connect: função que abre a conexão do app (get_db)"""
+    global _connect
+    _connect = connect
+    app.config.setdefault('EVENTS_POLL_SECONDS', float(os.getenv('EVENTS_POLL_SECONDS', DEFAULT_POLL_SECONDS)))
+    app.config.setdefault('EVENTS_HEARTBEAT_SECONDS',
+                          float(os.getenv('EVENTS_HEARTBEAT_SECONDS', DEFAULT_HEARTBEAT_SECONDS)))
+    app.config.setdefault('EVENTS_MAX_SECONDS', float(os.getenv('EVENTS_MAX_SECONDS', DEFAULT_MAX_SECONDS)))
+
+
+def format_event(event, data, event_id=None):
+    """Bloco SSE (id/event/data) terminado por linha em branco"""
+    lines = []
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    lines.append(f'event: {event}')
+    lines.append(f'data: {json.dumps(data, separators=(",", ":"))}')
+    return '\n'.join(lines) + '\n\n'
+
+
+def pending_events(conn, user_id, since):
+    """
+    Eventos (nome, seq, dados) para as alterações do usuário com seq > since,
+    agrupados: no máximo um 'balance' e um 'aggregates' por chamada.
+    """
+    rows = conn.execute('''
+        SELECT seq, entity, entity_id FROM change_log
+        WHERE user_id = ? AND seq > ?
+        ORDER BY seq LIMIT ?
+    ''', (user_id, since, _BATCH_LIMIT)).fetchall()
+    if not rows:
+        return []
+
+    last_seq = rows[-1][0]
+    accounts = sorted({entity_id for _, entity, entity_id in rows if entity == 'accounts'})
+    aggregates = [entity for _, entity, _ in rows if entity in AGGREGATE_ENTITIES]
+
+    events = []
+    if accounts:
+        events.append(('balance', last_seq, {'seq': last_seq, 'accounts': accounts}))
+    if aggregates:
+        events.append(('aggregates', last_seq, {'seq': last_seq, 'entities': sorted(set(aggregates)),
+                                                'changes': len(aggregates)}))
+    if not events:
+        # Alterações que não afetam o dashboard: só avançar o cursor do cliente
+        events.append(('sync', last_seq, {'seq': last_seq}))
+    return events
+
+
+def event_stream(user_id, since, poll_seconds, heartbeat_seconds, max_seconds):
+    """Gerador do corpo SSE; abre uma conexão curta por consulta (nada preso entre esperas)"""
+    yield f'retry: {RETRY_MS}\n\n'
+    yield format_event('ready', {'seq': since}, since)
+
+    started = last_sent = time.monotonic()
+    while True:
+        conn = _connect()
+        try:
+            events = pending_events(conn, user_id, since)
+        finally:
+            conn.close()
+
+        for event, seq, data in events:
+            since = seq
+            yield format_event(event, data, seq)
+        now = time.monotonic()
+        if events:
+            last_sent = now
+        elif now - last_sent >= heartbeat_seconds:
+            # Comentário SSE: mantém proxies/balanceadores com a conexão aberta
+            last_sent = now
+            yield ': keep-alive\n\n'
+
+        if now - started >= max_seconds:
+            return
+        time.sleep(poll_seconds)
+
+
+def _resume_seq(user_id):
+    """Last-Event-ID (reconexão) ou ?since=; sem nenhum, começa do seq atual"""
+    value = request.headers.get('Last-Event-ID') or request.args.get('since')
+    if value is not None:
+        try:
+            return max(0, int(value))
+        except ValueError:
+            pass
+    conn = _connect()
+    try:
+        return latest_seq(conn, user_id)
+    finally:
+        conn.close()
+
+
+def events_response(user_id):
+    """Resposta text/event-stream para o usuário da sessão"""
+    config = current_app.config
+    since = _resume_seq(user_id)
+    stream = event_stream(user_id, since, config['EVENTS_POLL_SECONDS'],
+                          config['EVENTS_HEARTBEAT_SECONDS'], config['EVENTS_MAX_SECONDS'])
+    return Response(stream_with_context(stream), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',  # nginx: não acumular o stream em buffer
+    })
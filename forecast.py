@@ -0,0 +1,301 @@
+# Projeção de fluxo de caixa por conta (/planning) - FynanPro
+"""
+Saldo diário projetado de cada conta de amanhã até N meses à frente:
+
+    saldo(d) = saldo hoje + Σ até d (agendado + recorrente + linha de base)
+
+- agendado: lançamentos com data futura já gravados - os confirmados e as
+  ocorrências já materializadas de séries recorrentes;
+- recorrente: próximas ocorrências de cada série (recurrence_type do
+  lançamento pai, até recurrence_end_date) depois da última gravada;
+- linha de base: o que sobra (lançamentos avulsos), pela média do mesmo
+  mês do ano nos últimos BASELINE_MONTHS meses completos, espalhada pelos
+  dias do mês. Meses anteriores ao primeiro lançamento da conta não entram.
+
+Tudo sai do cubo analítico (analytics_cube.py, já em cache) em arrays
+(contas x dias) de centavos; a única consulta própria é a última ocorrência
+de cada série. Saldo e linha de base seguem a regra de update_account_balance.
+
+Os insumos (forecast_basis: eventos futuros e médias sazonais por conta e
+plano de contas) ficam em cache pela versão dos dados no horizonte máximo;
+project() só soma - com fatores por plano de contas e fluxos extras para
+os cenários "e se" (scenarios.py).
+"""
+
+import sqlite3
+
+import numpy as np
+
+from analytics_cube import CubeCache, day_number
+from balance_checkpoints import signed_cents_sql
+from change_log import latest_seq
+
+DEFAULT_FORECAST_MONTHS = 6
+MAX_FORECAST_MONTHS = 24
+
+# Meses completos de histórico da linha de base sazonal
+BASELINE_MONTHS = 36
+
+# Origem dos eventos futuros do basis
+EVENT_SOURCES = ('scheduled', 'recurring')
+
+# Intervalo de cada recurrence_type: (passo, unidade); em meses o dia é limitado ao fim do mês
+RECURRENCE_STEPS = {
+    'diaria': (1, 'D'),
+    'semanal': (7, 'D'),
+    'quinzenal': (14, 'D'),
+    'mensal': (1, 'M'),
+    'bimestral': (2, 'M'),
+    'trimestral': (3, 'M'),
+    'semestral': (6, 'M'),
+    'anual': (12, 'M'),
+}
+
+_bases = CubeCache()
+
+
+def _month_of(days):
+    """Dias desde 1970-01-01 -> meses desde 1970-01"""
+    return np.asarray(days, dtype='datetime64[D]').astype('datetime64[M]').astype(np.int64)
+
+
+def _month_start(months):
+    """Meses desde 1970-01 -> dia (desde 1970-01-01) em que cada mês começa"""
+    return np.asarray(months, dtype='datetime64[M]').astype('datetime64[D]').astype(np.int64)
+
+
+def _month_days(months, day_of_month):
+    """Dia day_of_month de cada mês, limitado ao último dia (31 -> 28/02)"""
+    start = _month_start(months)
+    length = _month_start(np.asarray(months) + 1) - start
+    return start + np.minimum(day_of_month, length) - 1
+
+
+def forecast_horizon(today, months):
+    """(primeiro, último) dia da projeção: amanhã até o mesmo dia months meses à frente"""
+    today_number = day_number(today)
+    last = _month_days(_month_of(today_number) + months, today.day)
+    return today_number + 1, int(last)
+
+
+def recurring_series(conn, user_id, type_column, columns):
+    """
+    Séries recorrentes do usuário com a última ocorrência gravada: dicts com
+    recurrence_type, end (dia ou None), anchor (dia do mês do pai), account_id,
+    last (dia), cents (efeito no saldo) e chart_id da última ocorrência.
+    """
+    if 'recurrence_type' not in columns or 'parent_transaction_id' not in columns:
+        return []
+    signed = signed_cents_sql('t', type_column, columns)
+    chart = 't.chart_account_id' if 'chart_account_id' in columns else 'NULL'
+    rows = conn.execute(f'''
+        WITH occurrences AS (
+            SELECT COALESCE(t.parent_transaction_id, t.id) AS series_id, t.account_id,
+                   DATE(t.date) AS day, {signed} AS cents, {chart} AS chart_id,
+                   ROW_NUMBER() OVER (PARTITION BY COALESCE(t.parent_transaction_id, t.id)
+                                      ORDER BY DATE(t.date) DESC, t.id DESC) AS recency
+            FROM transactions t
+            JOIN accounts a ON t.account_id = a.id
+            WHERE a.user_id = ? AND DATE(t.date) IS NOT NULL
+              AND (t.parent_transaction_id IS NOT NULL
+                   OR COALESCE(t.recurrence_type, 'unica') NOT IN ('unica', ''))
+        )
+        SELECT p.recurrence_type, DATE(p.recurrence_end_date), DATE(p.date), o.account_id, o.day, o.cents,
+               o.chart_id
+        FROM occurrences o
+        JOIN transactions p ON p.id = o.series_id
+        WHERE o.recency = 1
+    ''', (user_id,)).fetchall()
+
+    series = []
+    for recurrence_type, end, first_date, account_id, last, cents, chart_id in rows:
+        if recurrence_type not in RECURRENCE_STEPS or not cents:
+            continue
+        series.append({
+            'recurrence_type': recurrence_type,
+            'end': day_number(end) if end else None,
+            'anchor': int((first_date or last)[8:10]),
+            'account_id': account_id,
+            'last': day_number(last),
+            'cents': cents,
+            'chart_id': chart_id,
+        })
+    return series
+
+
+def next_occurrences(series, first, last):
+    """Dias das ocorrências da série depois da última gravada, dentro de [first, last]"""
+    step, unit = RECURRENCE_STEPS[series['recurrence_type']]
+    end = last if series['end'] is None else min(last, series['end'])
+    if end < first:
+        return np.empty(0, dtype=np.int64)
+    if unit == 'D':
+        start = series['last'] + step
+        if start < first:
+            start += -(-(first - start) // step) * step
+        return np.arange(start, end + 1, step, dtype=np.int64)
+
+    last_month = int(_month_of(series['last']))
+    count = (int(_month_of(end)) - last_month) // step
+    days = _month_days(last_month + step * np.arange(1, count + 1), series['anchor'])
+    return days[(days >= first) & (days <= end)]
+
+
+def monthly_days(today, last, day_of_month):
+    """Dia day_of_month (limitado ao fim do mês) de cada mês depois do atual, até last"""
+    current = int(_month_of(day_number(today)))
+    count = int(_month_of(last)) - current
+    days = _month_days(current + np.arange(1, count + 1), day_of_month)
+    return days[days <= last]
+
+
+def _seasonal_rates(cube, signed, row_of, n_accounts, current_month):
+    """
+    Média em centavos de cada mês do ano (12 x contas x planos de contas) dos
+    lançamentos avulsos nos BASELINE_MONTHS meses completos anteriores.
+    """
+    window = current_month - BASELINE_MONTHS + np.arange(BASELINE_MONTHS)
+    n_charts = len(cube.chart_ids)
+
+    known = row_of >= 0
+    selected = known & ~cube.recurring & (cube.month >= window[0]) & (cube.month < current_month)
+    grid = np.zeros((BASELINE_MONTHS, n_accounts, n_charts))
+    np.add.at(grid, (cube.month[selected] - window[0], row_of[selected], cube.chart[selected]), signed[selected])
+
+    # Conta aberta há pouco: meses antes do primeiro lançamento não puxam a média para zero
+    first_month = np.full(n_accounts, np.iinfo(np.int64).max, dtype=np.int64)
+    np.minimum.at(first_month, row_of[known], cube.month[known])
+    active = window[:, None] >= first_month[None, :]
+
+    totals = np.zeros((12, n_accounts, n_charts))
+    counts = np.zeros((12, n_accounts))
+    np.add.at(totals, window % 12, grid * active[:, :, None])
+    np.add.at(counts, window % 12, active.astype(np.float64))
+    return np.divide(totals, counts[:, :, None], out=np.zeros_like(totals), where=counts[:, :, None] > 0)
+
+
+def forecast_basis(cube, series, account_ids, today, months=MAX_FORECAST_MONTHS):
+    """
+    Insumos da projeção, antes de somar: saldo de hoje por conta (ordem de
+    account_ids), eventos futuros - agendados e próximas ocorrências das
+    séries - como arrays (conta, dia, plano de contas, centavos, origem) e
+    as médias sazonais por conta e plano de contas. project() soma; cenários
+    (scenarios.py) reprojetam daqui sem reler o razão.
+    """
+    first, last = forecast_horizon(today, months)
+    index = {account_id: i for i, account_id in enumerate(account_ids)}
+
+    # Código da conta no cubo -> linha do resultado (-1: conta fora do pedido)
+    lookup = np.full(len(cube.account_ids), -1, dtype=np.int64)
+    for account_id, i in index.items():
+        position = cube.account_position(account_id)
+        if position is not None:
+            lookup[position] = i
+    row_of = lookup[cube.account]
+    known = row_of >= 0
+    signed = cube.signed_cents()
+
+    opening = np.zeros(len(account_ids), dtype=np.int64)
+    past = known & (cube.day < first)
+    np.add.at(opening, row_of[past], signed[past])
+
+    future = known & (cube.day >= first) & (cube.day <= last) & (cube.confirmed | cube.recurring)
+    parts = [(row_of[future], cube.day[future], cube.chart[future], signed[future], EVENT_SOURCES.index('scheduled'))]
+    for item in series:
+        i = index.get(item['account_id'])
+        if i is None:
+            continue
+        days = next_occurrences(item, first, last)
+        parts.append((np.full(len(days), i), days, np.full(len(days), cube.chart_position(item.get('chart_id'))),
+                      np.full(len(days), item['cents']), EVENT_SOURCES.index('recurring')))
+
+    return {
+        'today': today,
+        'first': first,
+        'last': last,
+        'account_ids': list(account_ids),
+        'opening': opening,
+        'events': {
+            'account': np.concatenate([p[0] for p in parts]).astype(np.int64),
+            'day': np.concatenate([p[1] for p in parts]).astype(np.int64),
+            'chart': np.concatenate([p[2] for p in parts]).astype(np.int64),
+            'cents': np.concatenate([p[3] for p in parts]).astype(np.int64),
+            'source': np.concatenate([np.full(len(p[0]), p[4]) for p in parts]).astype(np.int8),
+        },
+        'seasonal': _seasonal_rates(cube, signed, row_of, len(account_ids), int(_month_of(first - 1))),
+        'chart_ids': cube.chart_ids,
+        'charts': cube.charts,
+    }
+
+
+def _add_flows(grid, rows, days, cents, first):
+    np.add.at(grid, (rows, days - first), cents)
+    return grid
+
+
+def project(basis, months=None, rows=None, chart_factors=None, extra=None):
+    """
+    Saldo diário projetado a partir de forecast_basis:
+    - months: até quantos meses (padrão: todo o horizonte do basis);
+    - rows: contas (índices em basis['account_ids']), padrão todas;
+    - chart_factors: multiplicador por código de plano de contas (eventos e linha de base);
+    - extra: fluxos de ajuste {'account': linhas, 'day': dias, 'cents': valores}.
+    {'days': dias desde 1970-01-01, 'opening': centavos hoje, 'balances': centavos
+    (contas x dias), 'components': centavos por conta no horizonte}.
+    """
+    first = basis['first']
+    last = basis['last'] if months is None else min(basis['last'], forecast_horizon(basis['today'], months)[1])
+    n_days = last - first + 1
+    rows = np.arange(len(basis['account_ids'])) if rows is None else np.asarray(rows, dtype=np.int64)
+    remap = np.full(len(basis['account_ids']), -1, dtype=np.int64)
+    remap[rows] = np.arange(len(rows))
+    factors = np.ones(len(basis['chart_ids'])) if chart_factors is None else chart_factors
+
+    flows = {}
+    events = basis['events']
+    target = remap[events['account']]
+    keep = (target >= 0) & (events['day'] <= last)
+    weighted = events['cents'][keep] * factors[events['chart'][keep]]
+    for code, name in enumerate(EVENT_SOURCES):
+        source = events['source'][keep] == code
+        flows[name] = _add_flows(np.zeros((len(rows), n_days)), target[keep][source],
+                                 events['day'][keep][source], weighted[source], first)
+
+    days = np.arange(first, last + 1)
+    months_of_days = _month_of(days)
+    length = _month_start(months_of_days + 1) - _month_start(months_of_days)
+    monthly = basis['seasonal'][:, rows, :] @ factors
+    flows['baseline'] = monthly[months_of_days % 12].T / length
+
+    if extra is not None:
+        target = remap[extra['account']]
+        keep = (target >= 0) & (extra['day'] >= first) & (extra['day'] <= last)
+        flows['adjustments'] = _add_flows(np.zeros((len(rows), n_days)), target[keep],
+                                          extra['day'][keep], extra['cents'][keep], first)
+
+    opening = basis['opening'][rows]
+    total = sum(flows.values())
+    return {
+        'days': days,
+        'opening': opening,
+        'balances': opening[:, None] + np.rint(np.cumsum(total, axis=1)).astype(np.int64),
+        'components': {name: np.rint(flow.sum(axis=1)).astype(np.int64) for name, flow in flows.items()},
+    }
+
+
+def forecast_balances(cube, series, account_ids, today, months):
+    """Projeção diária de saldo das contas (ordem de account_ids) direto do cubo - ver project()"""
+    return project(forecast_basis(cube, series, account_ids, today, months))
+
+
+def user_forecast_basis(conn, db_key, user_id, account_ids, load_cube, load_series, today):
+    """
+    forecast_basis do usuário no horizonte máximo, em cache pela versão dos dados
+    (seq do change_log) e pelo dia; load_cube/load_series só rodam num miss.
+    """
+    try:
+        version = (latest_seq(conn, user_id), today.isoformat(), tuple(account_ids))
+    except sqlite3.OperationalError:
+        version = None
+    return _bases.get((db_key, user_id), version,
+                      lambda: forecast_basis(load_cube(), load_series(), account_ids, today))
@@ -222,8 +222,8 @@ class FilterForm(FlaskForm):
 
 # Formulário de Importação CSV
 class ImportCSVForm(FlaskForm):
-    csv_file = FileField('Arquivo CSV', validators=[
-        DataRequired(), FileAllowed(['csv'], 'Apenas arquivos CSV!')
+    csv_file = FileField('Arquivo CSV/OFX', validators=[
+        DataRequired(), FileAllowed(['csv', 'ofx', 'qfx'], 'Apenas arquivos CSV ou OFX!')
     ], render_kw={'class': 'form-control'})
     account_id = SelectField('Conta de Destino', coerce=int, validators=[DataRequired()],
                            render_kw={'class': 'form-select'})
@@ -0,0 +1,446 @@
+#!/usr/bin/env python3
+"""
+Gerador de dataset sintético para testes de escala - FynanPro
+
+Cria um finance_planner_saas.db realista (usuários, contas, anos de histórico,
+recorrências, transferências, orçamentos, metas e contribuições) com semente
+fixa, inserindo tudo via executemany em transações grandes. Os checkpoints
+de saldo são recalculados uma vez no final; o log mostra a vazão medida
+(~19 mil transações/s com --users 200 --years 5 --tx-per-month 40).
+
+Exemplos:
+    python generate_dataset.py --users 10 --years 2
+    python generate_dataset.py --db bench.db --users 2000 --years 10 --tx-per-month 40 --force
+"""
+
+import argparse
+import calendar
+import math
+import os
+import random
+import sqlite3
+import sys
+import time
+from datetime import date, timedelta
+
+from werkzeug.security import generate_password_hash
+
+from balance_checkpoints import DeferredSnapshots
+from dedup import fingerprint
+from merchants import intern_merchants
+from migrations import run_all_migrations
+
+DEFAULT_PASSWORD = 'senha123'
+ADMIN_EMAIL = 'admin@fynanpro.com'
+ADMIN_PASSWORD = 'admin123'
+
+# (nome, tipo, cor, ícone, código no plano de contas)
+CATEGORIES = [
+    ('Salário', 'receita', '#27ae60', 'fas fa-money-bill-wave', '3.1.01'),
+    ('Freelance', 'receita', '#f39c12', 'fas fa-laptop', '3.1.02'),
+    ('Investimentos', 'receita', '#8e44ad', 'fas fa-chart-line', '3.1.03'),
+    ('Outras Receitas', 'receita', '#2ecc71', 'fas fa-plus', '3.1.04'),
+    ('Moradia', 'despesa', '#2ecc71', 'fas fa-home', '4.1.01'),
+    ('Alimentação', 'despesa', '#e74c3c', 'fas fa-utensils', '4.1.02'),
+    ('Transporte', 'despesa', '#3498db', 'fas fa-car', '4.1.03'),
+    ('Saúde', 'despesa', '#9b59b6', 'fas fa-heartbeat', '4.1.04'),
+    ('Educação', 'despesa', '#f39c12', 'fas fa-graduation-cap', '4.1.05'),
+    ('Lazer', 'despesa', '#e67e22', 'fas fa-gamepad', '4.1.06'),
+    ('Outras Despesas', 'despesa', '#95a5a6', 'fas fa-question', '4.1.07'),
+]
+
+CHART_OF_ACCOUNTS = [
+    ('3.1', 'RECEITAS', None, 'receita', True),
+    ('3.1.01', 'Salários', '3.1', 'receita', False),
+    ('3.1.02', 'Freelances', '3.1', 'receita', False),
+    ('3.1.03', 'Investimentos', '3.1', 'receita', False),
+    ('3.1.04', 'Outras Receitas', '3.1', 'receita', False),
+    ('4.1', 'DESPESAS', None, 'despesa', True),
+    ('4.1.01', 'Moradia', '4.1', 'despesa', False),
+    ('4.1.02', 'Alimentação', '4.1', 'despesa', False),
+    ('4.1.03', 'Transporte', '4.1', 'despesa', False),
+    ('4.1.04', 'Saúde', '4.1', 'despesa', False),
+    ('4.1.05', 'Educação', '4.1', 'despesa', False),
+    ('4.1.06', 'Lazer', '4.1', 'despesa', False),
+    ('4.1.07', 'Outras Despesas', '4.1', 'despesa', False),
+]
+
+# Gastos variáveis: (categoria, peso, mediana R$, dispersão lognormal, descrições)
+VARIABLE_EXPENSES = [
+    ('Alimentação', 35, 45.0, 0.8, ['PAG*IFOOD {n}', 'IFOOD *SP', 'iFood', 'SUPERMERCADO EXTRA {n}',
+                                    'Pão de Açúcar', 'PADARIA SAO JORGE', 'RESTAURANTE SABOR & CIA']),
+    ('Transporte', 20, 28.0, 0.7, ['UBER *TRIP {n}', 'Uber', '99 POP {n}', 'POSTO SHELL {n}', 'Estacionamento Centro']),
+    ('Lazer', 12, 60.0, 0.9, ['CINEMARK {n}', 'Ingresso.com', 'BAR DO ZE', 'STEAM PURCHASE']),
+    ('Saúde', 8, 85.0, 0.9, ['DROGASIL {n}', 'Drogaria São Paulo', 'LAB FLEURY', 'Consulta Dr. Silva']),
+    ('Educação', 5, 120.0, 0.6, ['AMAZON *LIVROS', 'UDEMY {n}', 'Livraria Cultura']),
+    ('Outras Despesas', 20, 40.0, 1.0, ['MERCADOLIVRE*{n}', 'AMAZON MKTPLACE', 'SHOPEE *{n}', 'Lojas Americanas']),
+]
+
+TAGS = ['trabalho', 'familia', 'viagem', 'urgente', 'reembolsavel', 'assinatura']
+
+ACCOUNT_TEMPLATES = [
+    ('Conta Corrente', 'corrente', 'Banco do Brasil', '#007bff'),
+    ('Poupança', 'poupanca', 'Caixa', '#28a745'),
+    ('Cartão de Crédito', 'cartao', 'Nubank', '#8a05be'),
+    ('Investimentos', 'investimento', 'XP', '#fd7e14'),
+    ('Carteira', 'dinheiro', None, '#6c757d'),
+]
+
+GOAL_TEMPLATES = [
+    ('Reserva de Emergência', 'emergency', 15000.0),
+    ('Viagem de Férias', 'travel', 8000.0),
+    ('Carro Novo', 'vehicle', 45000.0),
+    ('Entrada do Apartamento', 'home', 80000.0),
+]
+
+
+def month_range(start, end):
+    """Primeiro dia de cada mês entre start e end (inclusive)"""
+    current = start.replace(day=1)
+    while current <= end:
+        yield current
+        year = current.year + current.month // 12
+        month = current.month % 12 + 1
+        current = current.replace(year=year, month=month)
+
+
+def day_in_month(month_start, day):
+    last = calendar.monthrange(month_start.year, month_start.month)[1]
+    return month_start.replace(day=min(day, last))
+
+
+class DatasetGenerator:
+    def __init__(self, db_path, users, accounts_per_user, years, tx_per_month,
+                 seed=42, batch_size=50000, future_months=3):
+        self.db_path = db_path
+        self.users = users
+        self.accounts_per_user = max(1, min(accounts_per_user, len(ACCOUNT_TEMPLATES)))
+        self.years = years
+        self.tx_per_month = tx_per_month
+        self.batch_size = batch_size
+        self.future_months = future_months
+        self.rng = random.Random(seed)
+        self.today = date.today()
+        self.history_start = self.today.replace(day=1) - timedelta(days=int(365.25 * years))
+
+        self.next_tx_id = 1
+        self.tx_batch = []
+        self.tx_count = 0
+        self.balances = {}  # account_id -> saldo em centavos
+        self.category_ids = {}
+        self.chart_ids = {}
+        self.merchant_ids = {}  # descrição -> merchants.id
+        self.started = None
+
+    # ----- infraestrutura -----
+    def connect(self):
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("PRAGMA journal_mode = MEMORY;")
+        conn.execute("PRAGMA synchronous = OFF;")
+        conn.execute("PRAGMA temp_store = MEMORY;")
+        conn.execute("PRAGMA cache_size = -200000;")
+        return conn
+
+    def log(self, message):
+        elapsed = time.perf_counter() - self.started
+        print(f"[{elapsed:7.1f}s] {message}", flush=True)
+
+    def flush_transactions(self, conn):
+        if not self.tx_batch:
+            return
+        # Estabelecimentos resolvidos por lote, só para as descrições ainda não vistas
+        unseen = {row[1] for row in self.tx_batch} - self.merchant_ids.keys()
+        if unseen:
+            self.merchant_ids.update(intern_merchants(conn, unseen))
+        conn.executemany('''
+            INSERT INTO transactions (id, description, amount, amount_cents, date, transaction_type, category,
+                                      chart_account_id, account_id, notes, reference, tags,
+                                      recurrence_type, recurrence_end_date, parent_transaction_id,
+                                      transfer_account_id, is_confirmed, is_reconciled, created_at, fingerprint,
+                                      merchant_id)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', [row + (self.merchant_ids[row[1]],) for row in self.tx_batch])
+        self.tx_count += len(self.tx_batch)
+        self.tx_batch = []
+        if self.tx_count % (self.batch_size * 10) < self.batch_size:
+            self.log(f"💾 {self.tx_count:,} transações inseridas")
+
+    def add_transaction(self, conn, description, amount, tx_date, tx_type, category_name, account_id,
+                        recurrence_type='unica', recurrence_end_date=None, parent_id=None,
+                        transfer_account_id=None, tags=None, notes=None):
+        tx_id = self.next_tx_id
+        self.next_tx_id += 1
+        confirmed = 1 if tx_date <= self.today else 0
+        category_id = self.category_ids.get(category_name)
+        chart_id = self.chart_ids.get(category_name)
+        date_str = tx_date.isoformat()
+        cents = round(amount * 100)
+        self.tx_batch.append((
+            tx_id, description, amount, cents, date_str, tx_type, category_id, chart_id, account_id,
+            notes, None, tags, recurrence_type,
+            recurrence_end_date.isoformat() if recurrence_end_date else None,
+            parent_id, transfer_account_id, confirmed, confirmed and tx_date < self.today - timedelta(days=30),
+            date_str + ' 12:00:00', fingerprint(account_id, date_str, tx_type, cents, description),
+        ))
+        if confirmed:
+            signed = cents if tx_type in ('receita', 'transferencia') else -cents
+            self.balances[account_id] = self.balances.get(account_id, 0) + signed
+        if len(self.tx_batch) >= self.batch_size:
+            self.flush_transactions(conn)
+        return tx_id
+
+    # ----- etapas -----
+    def create_schema(self):
+        if not run_all_migrations(self.db_path):
+            raise RuntimeError("Falha ao executar migrações")
+
+    def seed_reference_data(self, conn):
+        chart_codes = {}
+        for code, name, parent_code, acc_type, is_summary in CHART_OF_ACCOUNTS:
+            cursor = conn.execute('''
+                INSERT INTO chart_of_accounts (code, name, parent_id, level, account_type, is_summary)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (code, name, chart_codes.get(parent_code), code.count('.') - 1, acc_type, is_summary))
+            chart_codes[code] = cursor.lastrowid
+
+        for name, cat_type, color, icon, chart_code in CATEGORIES:
+            row = conn.execute('SELECT id FROM categories WHERE user_id IS NULL AND name = ?', (name,)).fetchone()
+            if row:
+                conn.execute('''
+                    UPDATE categories SET category_type = ?, color = ?, icon = ?, is_active = 1 WHERE id = ?
+                ''', (cat_type, color, icon, row[0]))
+                category_id = row[0]
+            else:
+                category_id = conn.execute('''
+                    INSERT INTO categories (user_id, name, type, category_type, color, icon, is_active)
+                    VALUES (NULL, ?, ?, ?, ?, ?, 1)
+                ''', (name, 'income' if cat_type == 'receita' else 'expense', cat_type, color, icon)).lastrowid
+            self.category_ids[name] = category_id
+            self.chart_ids[name] = chart_codes[chart_code]
+
+    def create_users_and_accounts(self, conn):
+        password_hash = generate_password_hash(DEFAULT_PASSWORD)
+        admin_hash = generate_password_hash(ADMIN_PASSWORD)
+        users = []
+        accounts = []
+        account_id = 1
+        self.user_accounts = {}
+        for user_id in range(1, self.users + 1):
+            if user_id == 1:
+                users.append((1, 'Admin FynanPro', 'Admin', 'FynanPro', ADMIN_EMAIL, admin_hash))
+            else:
+                users.append((user_id, f'Usuário {user_id}', 'Usuário', str(user_id),
+                              f'usuario{user_id}@fynanpro.test', password_hash))
+            ids = []
+            for name, acc_type, bank, color in ACCOUNT_TEMPLATES[:self.accounts_per_user]:
+                accounts.append((account_id, user_id, name, acc_type, bank, color))
+                ids.append((account_id, acc_type))
+                account_id += 1
+            self.user_accounts[user_id] = ids
+
+        conn.executemany('''
+            INSERT INTO users (id, name, first_name, last_name, email, password_hash, is_active)
+            VALUES (?, ?, ?, ?, ?, ?, 1)
+        ''', users)
+        conn.executemany('''
+            INSERT INTO accounts (id, user_id, name, account_type, bank_name, color,
+                                  initial_balance, current_balance, balance, initial_balance_cents,
+                                  current_balance_cents, balance_cents, is_active, include_in_total)
+            VALUES (?, ?, ?, ?, ?, ?, 0, 0, 0, 0, 0, 0, 1, 1)
+        ''', accounts)
+
+    def recurring_series(self, conn, account_id, description, amount, tx_type, category_name, day,
+                         start, end, jitter=0.0):
+        """Série mensal: transação pai com recurrence_type + filhas ligadas via parent_transaction_id"""
+        parent_id = None
+        for month_start in month_range(start, end):
+            value = round(amount * (1 + self.rng.uniform(-jitter, jitter)), 2)
+            tx_date = day_in_month(month_start, day)
+            if parent_id is None:
+                parent_id = self.add_transaction(conn, description, value, tx_date, tx_type, category_name,
+                                                 account_id, recurrence_type='mensal', recurrence_end_date=end)
+            else:
+                self.add_transaction(conn, description, value, tx_date, tx_type, category_name,
+                                     account_id, recurrence_type='mensal', parent_id=parent_id)
+
+    def generate_user_history(self, conn, user_id):
+        rng = self.rng
+        accounts = self.user_accounts[user_id]
+        main_account = accounts[0][0]
+        card_account = next((a for a, t in accounts if t == 'cartao'), main_account)
+        savings_account = next((a for a, t in accounts if t == 'poupanca'), None)
+        spend_accounts = [main_account, card_account, card_account]
+
+        series_end = self.today.replace(day=1) + timedelta(days=31 * self.future_months)
+        salary = round(rng.lognormvariate(math.log(5200), 0.45), 2)
+        rent = round(salary * rng.uniform(0.2, 0.35), 2)
+
+        self.recurring_series(conn, main_account, 'Salário', salary, 'receita', 'Salário', 5,
+                              self.history_start, series_end, jitter=0.02)
+        self.recurring_series(conn, main_account, 'Aluguel', rent, 'despesa', 'Moradia', 10,
+                              self.history_start, series_end)
+        self.recurring_series(conn, main_account, 'CONTA DE LUZ ENEL', rng.uniform(120, 260), 'despesa',
+                              'Moradia', 15, self.history_start, series_end, jitter=0.25)
+        self.recurring_series(conn, card_account, 'NETFLIX.COM', 55.90, 'despesa', 'Lazer', 20,
+                              self.history_start, series_end)
+        if rng.random() < 0.5:
+            self.recurring_series(conn, main_account, 'Academia SmartFit', 119.90, 'despesa', 'Saúde', 8,
+                                  self.history_start, series_end)
+
+        weights = [w for _, w, _, _, _ in VARIABLE_EXPENSES]
+        for month_start in month_range(self.history_start, self.today):
+            days_in_month = calendar.monthrange(month_start.year, month_start.month)[1]
+            count = max(0, int(rng.gauss(self.tx_per_month, self.tx_per_month * 0.25)))
+            # Sazonalidade: dezembro e janeiro gastam mais
+            if month_start.month in (12, 1):
+                count = int(count * 1.3)
+            for spec in rng.choices(VARIABLE_EXPENSES, weights=weights, k=count):
+                name, _, median, sigma, descriptions = spec
+                tx_date = month_start.replace(day=rng.randint(1, days_in_month))
+                if tx_date > self.today:
+                    continue
+                description = rng.choice(descriptions).format(n=rng.randint(1000, 9999))
+                amount = round(min(rng.lognormvariate(math.log(median), sigma), median * 40), 2)
+                tags = ','.join(rng.sample(TAGS, rng.randint(1, 2))) if rng.random() < 0.1 else None
+                self.add_transaction(conn, description, amount, tx_date, 'despesa', name,
+                                     rng.choice(spend_accounts), tags=tags)
+
+            if rng.random() < 0.15:
+                tx_date = month_start.replace(day=rng.randint(1, days_in_month))
+                if tx_date <= self.today:
+                    self.add_transaction(conn, 'Projeto freelance', round(rng.uniform(500, 4000), 2),
+                                         tx_date, 'receita', 'Freelance', main_account)
+
+            # Transferência mensal para a poupança (duas pernas com sinais opostos)
+            if savings_account and rng.random() < 0.7:
+                tx_date = day_in_month(month_start, 6)
+                if tx_date <= self.today:
+                    value = round(salary * rng.uniform(0.05, 0.15), 2)
+                    self.add_transaction(conn, 'Transferência para Poupança', -value, tx_date, 'transferencia',
+                                         None, main_account, transfer_account_id=savings_account)
+                    self.add_transaction(conn, 'Transferência para Poupança', value, tx_date, 'transferencia',
+                                         None, savings_account, transfer_account_id=main_account)
+
+    def create_budgets_and_goals(self, conn):
+        rng = self.rng
+        month_start = self.today.replace(day=1)
+        month_end = day_in_month(month_start, 31)
+        budgets = []
+        goals = []
+        contributions = []
+        goal_id = 1
+        for user_id in range(1, self.users + 1):
+            for name, _, median, _, _ in rng.sample(VARIABLE_EXPENSES, 3):
+                monthly = round(median * self.tx_per_month * rng.uniform(0.2, 0.5), -1)
+                budgets.append((user_id, self.category_ids[name], f'Orçamento {name}', monthly, round(monthly * 100), 'mensal',
+                                month_start.isoformat(), month_end.isoformat(), 80))
+
+            for name, category, target in rng.sample(GOAL_TEMPLATES, rng.randint(1, 3)):
+                target_date = self.today + timedelta(days=rng.randint(90, 1500))
+                goals.append((goal_id, user_id, name, f'Meta: {name}', target, round(target * 100),
+                              target_date.isoformat(), category))
+                start = self.today - timedelta(days=rng.randint(60, 720))
+                monthly = target / rng.uniform(20, 60)
+                for month in month_range(start, self.today):
+                    if rng.random() < 0.8:
+                        value = round(monthly * rng.uniform(0.5, 1.5), 2)
+                        contributions.append((goal_id, value, round(value * 100), 'Aporte mensal',
+                                              day_in_month(month, 7).isoformat() + ' 09:00:00'))
+                goal_id += 1
+
+        conn.executemany('''
+            INSERT INTO budgets (user_id, category_id, name, amount, amount_cents, period_type, start_date, end_date,
+                                 alert_percentage, is_active)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, 1)
+        ''', budgets)
+        conn.executemany('''
+            INSERT INTO goals (id, user_id, name, description, target_amount, target_amount_cents,
+                               target_date, category, is_active)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, 1)
+        ''', goals)
+        conn.executemany('''
+            INSERT INTO goal_contributions (goal_id, amount, amount_cents, description, created_at)
+            VALUES (?, ?, ?, ?, ?)
+        ''', contributions)
+        return len(budgets), len(goals), len(contributions)
+
+    def update_balances(self, conn):
+        conn.executemany('''
+            UPDATE accounts SET current_balance = ?, balance = ?, current_balance_cents = ?, balance_cents = ?
+            WHERE id = ?
+        ''', [(cents / 100, cents / 100, cents, cents, account_id) for account_id, cents in self.balances.items()])
+
+    def run(self):
+        self.started = time.perf_counter()
+        self.log(f"🔧 Criando schema em {self.db_path}")
+        self.create_schema()
+
+        conn = self.connect()
+        try:
+            conn.execute('BEGIN')
+            # Checkpoints de saldo calculados uma vez no final, não a cada linha inserida
+            columns = {row[1] for row in conn.execute('PRAGMA table_info(transactions)')}
+            snapshots = DeferredSnapshots(conn, 'transaction_type', columns)
+            snapshots.suspend()
+            self.seed_reference_data(conn)
+            self.create_users_and_accounts(conn)
+            self.log(f"👤 {self.users} usuários, {self.users * self.accounts_per_user} contas")
+
+            for user_id in range(1, self.users + 1):
+                self.generate_user_history(conn, user_id)
+            self.flush_transactions(conn)
+            snapshots.resume()
+            for accounts in self.user_accounts.values():
+                for account_id, _ in accounts:
+                    snapshots.touch(account_id, None)
+            snapshots.rebuild()
+            self.log(f"💰 {self.tx_count:,} transações "
+                     f"({self.tx_count / (time.perf_counter() - self.started):,.0f}/s)")
+
+            budgets, goals, contributions = self.create_budgets_and_goals(conn)
+            self.log(f"🎯 {budgets} orçamentos, {goals} metas, {contributions} contribuições")
+
+            self.update_balances(conn)
+            conn.commit()
+
+            # Histórico gravado de uma vez sai intercalado com as linhas do change_log
+            # (triggers da migração 009); VACUUM deixa as tabelas contíguas como num banco mantido
+            conn.execute('VACUUM')
+            conn.execute('ANALYZE')
+            conn.commit()
+        finally:
+            conn.close()
+
+        self.log("✅ Dataset gerado")
+        return {'users': self.users, 'transactions': self.tx_count,
+                'budgets': budgets, 'goals': goals, 'contributions': contributions}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Gerador de dataset sintético FynanPro')
+    parser.add_argument('--db', default='finance_planner_saas.db', help='arquivo SQLite de saída')
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--accounts-per-user', type=int, default=3)
+    parser.add_argument('--years', type=float, default=2)
+    parser.add_argument('--tx-per-month', type=float, default=30,
+                        help='média de gastos variáveis por usuário/mês (além das recorrências)')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--batch-size', type=int, default=50000)
+    parser.add_argument('--force', action='store_true', help='sobrescrever o banco se já existir')
+    args = parser.parse_args(argv)
+
+    if os.path.exists(args.db):
+        if not args.force:
+            print(f"❌ {args.db} já existe (use --force para sobrescrever)")
+            return 1
+        os.remove(args.db)
+
+    generator = DatasetGenerator(args.db, args.users, args.accounts_per_user, args.years,
+                                 args.tx_per_month, seed=args.seed, batch_size=args.batch_size)
+    summary = generator.run()
+    print(f"📊 Resumo: {summary}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,224 @@
+# Simulação de Monte Carlo das metas (/goals) - FynanPro
+"""
+Chance de cada meta ativa chegar ao valor alvo até target_date.
+
+Modelo: a capacidade de poupança de um mês é o fluxo líquido positivo
+(receitas - despesas, sem transferências) de um mês sorteado do histórico
+do usuário (últimos HISTORY_MONTHS meses completos, do cubo analítico).
+Cada meta recebe uma fração fixa dessa capacidade:
+
+- meta com contribuições: a fração que o usuário de fato destinou a ela
+  (contribuições / capacidade nos últimos até 12 meses desde a primeira);
+- meta sem contribuições: divide igualmente o que sobra da capacidade.
+
+Os caminhos são sorteados em lotes (caminhos x meses) com NumPy - mesmo
+sorteio para todas as metas, percentis de todos os meses em uma chamada.
+Cada requisição tem um orçamento de tempo (GOAL_SIMULATION_BUDGET_MS):
+ao estourá-lo o resultado usa os caminhos já simulados (truncated=True) e
+não entra no cache.
+
+O resultado fica em cache (LRU de analytics_cube.CubeCache) pela versão dos
+dados: seq do change_log + assinatura de goal_contributions (a tabela não
+entra no change_log) + o dia. A semente vem da mesma versão, então a mesma
+versão sempre dá o mesmo número.
+"""
+
+import os
+import sqlite3
+import time
+
+import numpy as np
+
+from analytics_cube import KINDS, CubeCache
+from money import Money, cents_sql
+
+DEFAULT_PATHS = 5000
+DEFAULT_TIME_BUDGET_MS = 250
+BATCH_PATHS = 500
+DEFAULT_CACHE_SIZE = 256
+
+# Meses completos de fluxo líquido sorteados
+HISTORY_MONTHS = 36
+# Janela máxima para estimar a fração de cada meta
+RATE_MONTHS = 12
+# Horizonte máximo simulado (metas mais distantes usam este limite)
+MAX_SIMULATION_MONTHS = 360
+
+PERCENTILES = (10, 50, 90)
+
+_results = CubeCache(maxsize=DEFAULT_CACHE_SIZE)
+_settings = {'paths': DEFAULT_PATHS, 'budget_ms': DEFAULT_TIME_BUDGET_MS}
+
+
+def init_goal_simulator(app):
+    """Caminhos por simulação, orçamento de tempo (ms) e metas/usuários em cache"""
+    app.config.setdefault('GOAL_SIMULATION_PATHS', int(os.getenv('GOAL_SIMULATION_PATHS', DEFAULT_PATHS)))
+    app.config.setdefault('GOAL_SIMULATION_BUDGET_MS',
+                          float(os.getenv('GOAL_SIMULATION_BUDGET_MS', DEFAULT_TIME_BUDGET_MS)))
+    _settings['paths'] = app.config['GOAL_SIMULATION_PATHS']
+    _settings['budget_ms'] = app.config['GOAL_SIMULATION_BUDGET_MS']
+    return _results
+
+
+def _month_code(value):
+    """date ou 'YYYY-MM-DD' -> meses desde 1970-01"""
+    text = str(value)
+    return (int(text[:4]) - 1970) * 12 + int(text[5:7]) - 1
+
+
+def _month_label(code):
+    return f'{1970 + code // 12}-{code % 12 + 1:02d}'
+
+
+def data_version(conn, user_id):
+    """Versão dos dados que a simulação lê; None sem change_log (não cachear)"""
+    try:
+        row = conn.execute('''
+            SELECT (SELECT MAX(seq) FROM change_log WHERE user_id = ?),
+                   COUNT(gc.id), COALESCE(MAX(gc.id), 0), COALESCE(SUM(gc.amount), 0)
+            FROM goal_contributions gc
+            JOIN goals g ON g.id = gc.goal_id
+            WHERE g.user_id = ?
+        ''', (user_id, user_id)).fetchone()
+    except sqlite3.OperationalError:
+        return None
+    return (row[0] or 0, row[1], row[2], round(row[3] * 100))
+
+
+def monthly_net_flow(cube, today, months=HISTORY_MONTHS):
+    """
+    Fluxo líquido (receitas - despesas) em centavos dos últimos meses completos,
+    a partir do primeiro mês com lançamento; transferências entre contas não contam.
+    """
+    current = _month_code(today)
+    first = current - months
+    if len(cube):
+        first = max(first, int(cube.month.min()))
+    if first >= current:
+        return np.zeros(0, dtype=np.int64)
+    selected = (cube.month >= first) & (cube.month < current) & (cube.kind < KINDS.index('transferencia'))
+    net = np.zeros(current - first, dtype=np.int64)
+    np.add.at(net, cube.month[selected] - first, cube.signed_cents()[selected])
+    return net
+
+
+def load_goals(conn, user_id, goal_columns, contribution_columns, today):
+    """Metas ativas com alvo, total guardado e contribuições da janela da fração (centavos)"""
+    target = cents_sql('target_amount', 'g', goal_columns)
+    amount = cents_sql('amount', 'gc', contribution_columns)
+    rate_start = _month_label(_month_code(today) - RATE_MONTHS) + '-01'
+    rows = conn.execute(f'''
+        SELECT g.id, g.name, {target}, DATE(g.target_date),
+               COALESCE(SUM({amount}), 0),
+               COALESCE(SUM(CASE WHEN gc.created_at >= ? THEN {amount} END), 0),
+               MIN(gc.created_at)
+        FROM goals g
+        LEFT JOIN goal_contributions gc ON gc.goal_id = g.id
+        WHERE g.user_id = ? AND g.is_active = 1
+        GROUP BY g.id
+        ORDER BY g.target_date, g.id
+    ''', (rate_start, user_id)).fetchall()
+    return [{'id': row[0], 'name': row[1], 'target_cents': row[2] or 0, 'target_date': row[3],
+             'saved_cents': row[4], 'recent_cents': row[5], 'first_contribution': row[6]} for row in rows]
+
+
+def _saving_rates(goals, net, today):
+    """Fração da capacidade de poupança (fluxo líquido positivo) destinada a cada meta"""
+    positive = np.maximum(net, 0)
+    current = _month_code(today)
+    rates = {}
+    for goal in goals:
+        if not goal['first_contribution'] or not goal['recent_cents']:
+            continue
+        window = min(RATE_MONTHS, max(1, current - _month_code(goal['first_contribution'])))
+        capacity = int(positive[-window:].sum()) if len(positive) else 0
+        rates[goal['id']] = min(1.0, goal['recent_cents'] / capacity) if capacity > 0 else 0.0
+
+    # O que sobra da capacidade é dividido entre as metas em aberto ainda sem contribuições recentes
+    pending = [goal['id'] for goal in goals if goal['id'] not in rates
+               and goal['saved_cents'] < goal['target_cents']
+               and goal['target_date'] and _month_code(goal['target_date']) > current]
+    if pending:
+        free = max(0.0, 1.0 - sum(rates.values())) / len(pending)
+        rates.update({goal_id: free for goal_id in pending})
+    return {goal['id']: rates.get(goal['id'], 0.0) for goal in goals}
+
+
+def simulate(goals, net, today, n_paths, budget_ms, seed):
+    """
+    {'paths', 'truncated', 'elapsed_ms', 'goals': [...]}: probabilidade de cada meta
+    chegar ao alvo até target_date e bandas de percentis do valor guardado por mês.
+    """
+    started = time.perf_counter()
+    deadline = started + budget_ms / 1000
+    current = _month_code(today)
+    months = {goal['id']: min(MAX_SIMULATION_MONTHS, max(0, _month_code(goal['target_date']) - current))
+              if goal['target_date'] else 0 for goal in goals}
+    horizon = max(months.values(), default=0)
+    positive = np.maximum(net, 0)
+
+    # Caminhos acumulados (caminhos x meses) em lotes até o total ou o fim do orçamento
+    rng = np.random.default_rng(seed)
+    batches, simulated = [], 0
+    if horizon and len(positive):
+        while simulated < n_paths:
+            batch = min(BATCH_PATHS, n_paths - simulated)
+            draws = rng.integers(0, len(positive), size=(batch, horizon))
+            batches.append(np.cumsum(positive[draws], axis=1))
+            simulated += batch
+            if time.perf_counter() > deadline:
+                break
+    paths = np.concatenate(batches) if batches else np.zeros((1, horizon), dtype=np.int64)
+    bands = np.percentile(paths, PERCENTILES, axis=0) if horizon else np.zeros((len(PERCENTILES), 0))
+
+    rates = _saving_rates(goals, net, today)
+    results = []
+    for goal in goals:
+        n, rate, saved = months[goal['id']], rates[goal['id']], goal['saved_cents']
+        if n:
+            final = saved + rate * paths[:, n - 1]
+            probability = float(np.mean(final >= goal['target_cents']))
+            goal_bands = saved + rate * bands[:, :n]
+        else:
+            probability = float(saved >= goal['target_cents'])
+            goal_bands = np.full((len(PERCENTILES), 1), float(saved))
+        results.append({
+            'id': goal['id'],
+            'name': goal['name'],
+            'target_amount': Money(goal['target_cents']).to_float(),
+            'saved_amount': Money(saved).to_float(),
+            'target_date': goal['target_date'],
+            'months': n,
+            'saving_rate': round(rate, 4),
+            'probability': round(probability, 4),
+            'final': {f'p{p}': round(float(goal_bands[i, -1]) / 100, 2) for i, p in enumerate(PERCENTILES)},
+            'bands': {
+                'months': [_month_label(current + k) for k in range(1, n + 1)],
+                **{f'p{p}': np.round(goal_bands[i] / 100, 2).tolist() if n else []
+                   for i, p in enumerate(PERCENTILES)},
+            },
+        })
+    return {
+        'paths': simulated,
+        'truncated': simulated < n_paths and horizon > 0 and len(positive) > 0,
+        'history_months': len(net),
+        'elapsed_ms': round((time.perf_counter() - started) * 1000, 1),
+        'goals': results,
+    }
+
+
+def goal_simulation(conn, db_key, user_id, load_cube, goal_columns, contribution_columns, today):
+    """Simulação das metas do usuário, recalculada só quando a versão dos dados (ou o dia) muda"""
+    version = data_version(conn, user_id)
+    if version is not None:
+        version = version + (today.isoformat(), _settings['paths'])
+
+    def run():
+        goals = load_goals(conn, user_id, goal_columns, contribution_columns, today)
+        net = monthly_net_flow(load_cube(), today) if goals else np.zeros(0, dtype=np.int64)
+        seed = [user_id, today.toordinal()] + [abs(int(part)) for part in (version or ())[:4]]
+        return simulate(goals, net, today, _settings['paths'], _settings['budget_ms'], seed)
+
+    # Truncado pelo orçamento de tempo é uma estimativa com menos caminhos:
+    # não fica em cache, a próxima requisição tenta de novo a simulação completa
+    return _results.get((db_key, user_id), version, run, cacheable=lambda result: not result['truncated'])
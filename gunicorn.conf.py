@@ -0,0 +1,18 @@
+# Configuração do Gunicorn - FynanPro
+"""
+Carregado automaticamente pelo gunicorn a partir do diretório do projeto;
+opções passadas na linha de comando (render.yaml, start.sh) têm precedência.
+
+O stream SSE (/api/v1/events) mantém a requisição aberta por até
+EVENTS_MAX_SECONDS. Com o worker sync cada aba com o dashboard aberto
+ocuparia um processo inteiro, então o padrão é o worker gthread:
+
+    GUNICORN_WORKER_CLASS=gthread   GUNICORN_THREADS=8     (padrão, sem dependências)
+    GUNICORN_WORKER_CLASS=gevent    GUNICORN_WORKER_CONNECTIONS=1000  (pip install gevent)
+"""
+
+import os
+
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gthread')
+threads = int(os.getenv('GUNICORN_THREADS', 8))
+worker_connections = int(os.getenv('GUNICORN_WORKER_CONNECTIONS', 1000))
@@ -0,0 +1,196 @@
+# Chaves de idempotência para POSTs que gravam - FynanPro
+"""
+Clientes com conexão instável (painel lateral do dashboard no celular)
+repetem o POST quando a resposta se perde. Com o header Idempotency-Key a
+primeira execução grava a resposta em idempotency_keys (migração 008) e as
+repetições recebem a mesma resposta sem executar as escritas de novo.
+
+Uso nas rotas:
+
+    @app.route('/transactions/new', methods=['GET', 'POST'])
+    @login_required
+    @idempotent
+    def new_transaction(): ...
+
+Regras:
+  - a chave vale por usuário e expira após IDEMPOTENCY_TTL_SECONDS (24h)
+  - mesma chave com outro corpo/rota -> 422
+  - mesma chave enquanto a primeira ainda executa -> 409; uma reserva sem
+    resposta há mais de IDEMPOTENCY_PROCESSING_TIMEOUT_SECONDS (worker morto
+    pelo timeout do gunicorn, processo derrubado) é abandonada e a chave
+    volta a ser reservada pela nova tentativa
+  - respostas 5xx (ou exceção) liberam a chave para uma nova tentativa, e
+    também as falhas que as rotas devolvem sem 5xx: JSON com
+    "success": false e redirects com flash 'danger'/'error'
+  - o replay de um redirect repete as mensagens flash da primeira execução
+  - sem o header a rota funciona como antes
+"""
+
+import hashlib
+import json
+import logging
+import os
+import time
+from functools import wraps
+
+from flask import current_app, flash, jsonify, make_response, request, session
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+DEFAULT_TTL_SECONDS = 24 * 3600
+# Algumas vezes o --timeout do gunicorn (120s em render.yaml/start.sh)
+DEFAULT_PROCESSING_TIMEOUT_SECONDS = 600
+MAX_KEY_LENGTH = 255
+# Categorias de flash com que as rotas de formulário informam falha
+_ERROR_FLASHES = ('danger', 'error')
+
+# Limpeza das chaves expiradas no máximo a cada PURGE_INTERVAL segundos por processo
+PURGE_INTERVAL = 300
+_last_purge = 0.0
+
+_connect = None
+
+
+def init_idempotency(app, connect):
+    """connect: função que abre a conexão do app (get_db)"""
+    global _connect
+    _connect = connect
+    app.config.setdefault('IDEMPOTENCY_TTL_SECONDS',
+                          int(os.getenv('IDEMPOTENCY_TTL_SECONDS', DEFAULT_TTL_SECONDS)))
+    app.config.setdefault('IDEMPOTENCY_PROCESSING_TIMEOUT_SECONDS',
+                          int(os.getenv('IDEMPOTENCY_PROCESSING_TIMEOUT_SECONDS',
+                                        DEFAULT_PROCESSING_TIMEOUT_SECONDS)))
+
+
+def _request_hash():
+    digest = hashlib.sha256(f"{request.method} {request.path}\n".encode())
+    digest.update(request.get_data(cache=True))
+    return digest.hexdigest()
+
+
+def _error(status, message):
+    response = jsonify({'success': False, 'message': message})
+    response.status_code = status
+    return response
+
+
+def _replay(row):
+    response = make_response(row['body'], row['status_code'])
+    response.headers['Content-Type'] = row['content_type']
+    if row['location']:
+        response.headers['Location'] = row['location']
+    for category, message in json.loads(row['flashes'] or '[]'):
+        flash(message, category)
+    response.headers[REPLAYED_HEADER] = 'true'
+    return response
+
+
+def _purge_expired(conn, now):
+    global _last_purge
+    if now - _last_purge >= PURGE_INTERVAL:
+        _last_purge = now
+        conn.execute('DELETE FROM idempotency_keys WHERE expires_at <= ?', (int(now),))
+
+
+def _abandoned(row, now):
+    """Reserva sem resposta há mais que o timeout de processamento (o _finish nunca rodou)"""
+    if row['status_code'] is not None:
+        return False
+    timeout = current_app.config['IDEMPOTENCY_PROCESSING_TIMEOUT_SECONDS']
+    return (row['reserved_at'] or 0) + timeout <= now
+
+
+def _reserve(user_id, key, request_hash):
+    """Reservar a chave; devolve uma resposta pronta (replay/erro) ou None para executar a rota"""
+    now = time.time()
+    conn = _connect()
+    try:
+        _purge_expired(conn, now)
+        row = conn.execute('''
+            SELECT request_hash, status_code, body, content_type, location, flashes, expires_at, reserved_at
+            FROM idempotency_keys WHERE user_id = ? AND idempotency_key = ?
+        ''', (user_id, key)).fetchone()
+        if row and (row['expires_at'] <= now or _abandoned(row, now)):
+            if row['status_code'] is None:
+                logger.warning("⚠️ Reserva de %s abandonada (usuário %s); executando de novo", IDEMPOTENCY_HEADER, user_id)
+            conn.execute('DELETE FROM idempotency_keys WHERE user_id = ? AND idempotency_key = ?', (user_id, key))
+            row = None
+        if row:
+            if row['request_hash'] != request_hash:
+                return _error(422, f'{IDEMPOTENCY_HEADER} já usada em outra requisição.')
+            if row['status_code'] is None:
+                return _error(409, f'Requisição com esta {IDEMPOTENCY_HEADER} ainda em processamento.')
+            logger.info("♻️ Replay idempotente: %s %s (usuário %s)", request.method, request.path, user_id)
+            return _replay(row)
+
+        inserted = conn.execute('''
+            INSERT OR IGNORE INTO idempotency_keys (user_id, idempotency_key, request_hash, expires_at, reserved_at)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (user_id, key, request_hash, int(now) + current_app.config['IDEMPOTENCY_TTL_SECONDS'],
+              int(now))).rowcount
+        conn.commit()
+        if not inserted:
+            # Outra requisição com a mesma chave reservou entre o SELECT e o INSERT
+            return _error(409, f'Requisição com esta {IDEMPOTENCY_HEADER} ainda em processamento.')
+        return None
+    finally:
+        conn.close()
+
+
+def _failed(response, flashes):
+    """5xx ou falha devolvida como 200/302 ({'success': false}, flash de erro): não gravar"""
+    if response.status_code >= 500:
+        return True
+    if any(category in _ERROR_FLASHES for category, _ in flashes):
+        return True
+    if response.is_json:
+        body = response.get_json(silent=True)
+        return isinstance(body, dict) and body.get('success') is False
+    return False
+
+
+def _finish(user_id, key, response, flashes=()):
+    """Gravar a resposta ou liberar a chave (falha) para nova tentativa; flashes: os desta execução"""
+    flashes = [list(item) for item in flashes]
+    conn = _connect()
+    try:
+        if _failed(response, flashes):
+            conn.execute('DELETE FROM idempotency_keys WHERE user_id = ? AND idempotency_key = ?', (user_id, key))
+        else:
+            conn.execute('''
+                UPDATE idempotency_keys SET status_code = ?, body = ?, content_type = ?, location = ?, flashes = ?
+                WHERE user_id = ? AND idempotency_key = ?
+            ''', (response.status_code, response.get_data(), response.content_type,
+                  response.headers.get('Location'), json.dumps(flashes) if flashes else None, user_id, key))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def idempotent(f):
+    """Suporte ao header Idempotency-Key em uma rota POST (depois de @login_required)"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        key = request.headers.get(IDEMPOTENCY_HEADER, '').strip()
+        if request.method != 'POST' or not key:
+            return f(*args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return _error(400, f'{IDEMPOTENCY_HEADER} maior que {MAX_KEY_LENGTH} caracteres.')
+
+        user_id = session.get('user_id')
+        early = _reserve(user_id, key, _request_hash())
+        if early is not None:
+            return early
+
+        # Lidas direto da sessão (get_flashed_messages as consumiria antes do redirect)
+        flashed_before = len(session.get('_flashes', []))
+        try:
+            response = make_response(f(*args, **kwargs))
+        except Exception:
+            _finish(user_id, key, make_response('', 500))
+            raise
+        _finish(user_id, key, response, session.get('_flashes', [])[flashed_before:])
+        return response
+    return decorated_function
@@ -0,0 +1,130 @@
+# Configuração de logging estruturado - FynanPro
+"""
+Logging de baixo overhead para produção.
+
+Variáveis de ambiente:
+  LOG_FORMAT             'text' (padrão) ou 'json' (uma linha JSON por evento)
+  LOG_LEVEL              nível raiz (padrão INFO)
+  LOG_LEVELS             níveis por logger: 'migrations=WARNING,fynanpro.access=INFO'
+  LOG_DEBUG_SAMPLE_RATE  fração dos eventos DEBUG emitidos (padrão 1.0 = todos)
+  LOG_ACCESS             '0' desliga a linha de access log por requisição
+
+As mensagens devem usar formatação preguiçosa (``logger.debug("x=%s", x)``):
+o texto só é montado se o evento passar pelo nível e pela amostragem.
+"""
+
+import json
+import logging
+import os
+import random
+import sys
+import time
+from datetime import datetime, timezone
+
+from flask import g, request, session
+
+ACCESS_LOGGER_NAME = 'fynanpro.access'
+
+# Atributos padrão de LogRecord; o resto veio de ``extra=`` e vira campo do JSON
+_RESERVED_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+class JsonFormatter(logging.Formatter):
+    """Uma linha JSON por evento, com os campos passados em ``extra=``"""
+
+    def format(self, record):
+        payload = {
+            'ts': datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED_ATTRS and not key.startswith('_'):
+                payload[key] = value
+        if record.exc_info:
+            payload['exc'] = self.formatException(record.exc_info)
+        return json.dumps(payload, ensure_ascii=False, default=str)
+
+
+class DebugSamplingFilter(logging.Filter):
+    """Deixa passar apenas uma fração dos eventos DEBUG (caminhos quentes)"""
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        if record.levelno > logging.DEBUG or self.rate >= 1.0:
+            return True
+        return random.random() < self.rate
+
+
+def _parse_levels(spec):
+    levels = {}
+    for item in (spec or '').split(','):
+        if '=' in item:
+            name, level = item.split('=', 1)
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def configure_logging(app):
+    """Configurar handlers, formato e níveis; registrar o access log do app"""
+    log_format = os.getenv('LOG_FORMAT', 'text').lower()
+    root_level = os.getenv('LOG_LEVEL', 'INFO').upper()
+    sample_rate = float(os.getenv('LOG_DEBUG_SAMPLE_RATE', '1.0') or 1.0)
+
+    handler = logging.StreamHandler(sys.stdout)
+    if log_format == 'json':
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+    handler.addFilter(DebugSamplingFilter(sample_rate))
+
+    root = logging.getLogger()
+    for old_handler in list(root.handlers):
+        root.removeHandler(old_handler)
+    root.addHandler(handler)
+    root.setLevel(root_level)
+
+    # O Flask instala um handler próprio; deixar tudo subir para o root
+    from flask.logging import default_handler
+    app.logger.removeHandler(default_handler)
+    app.logger.setLevel(logging.NOTSET)
+
+    for name, level in _parse_levels(os.getenv('LOG_LEVELS')).items():
+        logging.getLogger(name).setLevel(level)
+
+    if os.getenv('LOG_ACCESS', '1') != '0':
+        init_access_log(app)
+
+
+def init_access_log(app):
+    """Uma linha por requisição com os campos de tempo"""
+    access_logger = logging.getLogger(ACCESS_LOGGER_NAME)
+
+    @app.before_request
+    def _access_log_start():
+        g._access_started = time.perf_counter()
+
+    @app.after_request
+    def _access_log_emit(response):
+        started = g.pop('_access_started', None)
+        if started is None or not access_logger.isEnabledFor(logging.INFO):
+            return response
+        duration_ms = round((time.perf_counter() - started) * 1000, 2)
+        access_logger.info(
+            '%s %s %s %.2fms', request.method, request.path, response.status_code, duration_ms,
+            extra={
+                'method': request.method,
+                'path': request.path,
+                'endpoint': request.endpoint,
+                'status': response.status_code,
+                'duration_ms': duration_ms,
+                # Em respostas em stream (SSE) calcular o tamanho consumiria o gerador inteiro
+                'bytes': None if response.is_streamed else response.calculate_content_length(),
+                'user_id': session.get('user_id'),
+                'remote_addr': request.remote_addr,
+            })
+        return response
@@ -0,0 +1,154 @@
+# Estabelecimentos normalizados (/reports/merchants) - FynanPro
+"""
+"PAG*IFOOD 1234", "IFOOD *SP" e "iFood" são o mesmo estabelecimento, mas
+como texto livre cada um vira uma linha nos agrupamentos e na busca.
+
+merchant_name() limpa a descrição do extrato:
+
+    PAG*IFOOD 1234        -> IFOOD      (prefixo do processador de pagamento)
+    IFOOD *SP             -> IFOOD      (complemento depois do '*')
+    COMPRA CARTAO DROGASIL 0423 -> DROGASIL (palavras do cartão e números)
+
+e merchant_key() dá a chave sem maiúsculas/acentos ('ifood'). A tabela
+merchants (migração 017) guarda uma linha por chave, compartilhada entre
+os usuários, e transactions.merchant_id aponta para ela: agrupar por
+estabelecimento é agrupar por um inteiro indexado.
+
+A descrição original continua na transação (impressão digital do dedup,
+exibição, busca por trecho). Importação, lote, gerador, new_transaction e
+edit_transaction já gravam merchant_id, e a migração 017 preenche as
+linhas anteriores a ela. Linhas de SQL direto ou cuja descrição mudou fora
+da aplicação (o trigger zera merchant_id) ficam fora do relatório até
+backfill_merchants rodar - nunca numa leitura:
+
+    python merchants.py --db finance_planner_saas.db [--user-id 1]
+"""
+
+import argparse
+import re
+import sqlite3
+import sys
+
+from categorization import normalize_text
+from change_log import in_chunks
+from money import Money, cents_sql
+
+# Processadores que prefixam o nome do estabelecimento: "PAG*", "MP *", "PAYPAL *"...
+_PROCESSOR = re.compile(r'^\s*(?:pag|pg|mp|mercadopago|pagseguro|ps|ec|sumup|iz|paypal|pp|picpay)\s*\*\s*',
+                        re.IGNORECASE)
+_WORD = re.compile(r'[^\W_]+')
+# Palavras do meio de pagamento no começo da descrição
+_CARD_WORDS = {'compra', 'compras', 'cartao', 'debito', 'credito', 'deb', 'cred', 'visa', 'master',
+               'mastercard', 'elo'}
+_UNKNOWN_KEY = 'sem descricao'
+
+
+def merchant_name(description):
+    """Nome do estabelecimento na grafia original, sem prefixos de pagamento, complementos e números"""
+    text = str(description or '')
+    processor = _PROCESSOR.match(text)
+    if processor:
+        text = text[processor.end():]
+    head = text.split('*', 1)[0]
+    words = _WORD.findall(head) or _WORD.findall(text)
+    # Número é ruído (terminal, parcela, data), exceto curto no começo ("99 POP")
+    words = [word for index, word in enumerate(words)
+             if not any(ch.isdigit() for ch in word) or (index == 0 and len(word) < 3)]
+    while len(words) > 1 and normalize_text(words[0]) in _CARD_WORDS:
+        words.pop(0)
+    return ' '.join(words) or ' '.join(str(description or '').split())
+
+
+def merchant_key(description):
+    """Chave de agrupamento: nome limpo em minúsculas e sem acentos"""
+    return normalize_text(merchant_name(description)) or _UNKNOWN_KEY
+
+
+def intern_merchants(conn, descriptions):
+    """{descrição: merchant_id}, criando os estabelecimentos que ainda não existem"""
+    names = {}
+    keys = {}
+    for description in set(descriptions):
+        name = merchant_name(description)
+        key = normalize_text(name) or _UNKNOWN_KEY
+        keys[description] = key
+        names.setdefault(key, name or key)
+
+    def lookup(wanted):
+        found = {}
+        for marks, chunk in in_chunks(wanted):
+            found.update(conn.execute(f'SELECT key, id FROM merchants WHERE key IN ({marks})', chunk).fetchall())
+        return found
+
+    ids = lookup(names)
+    missing = [(key, name) for key, name in names.items() if key not in ids]
+    if missing:
+        conn.executemany('INSERT OR IGNORE INTO merchants (key, name) VALUES (?, ?)', missing)
+        ids.update(lookup(key for key, _ in missing))
+    return {description: ids[key] for description, key in keys.items()}
+
+
+def backfill_merchants(conn, account_ids=None, user_id=None):
+    """Preencher merchant_id nulo (escritas legadas, descrição alterada); devolve quantas linhas"""
+    where, params = 'merchant_id IS NULL', []
+    if account_ids is not None:
+        account_ids = list(account_ids)
+        where += f" AND account_id IN ({', '.join('?' * len(account_ids))})"
+        params = account_ids
+    elif user_id is not None:
+        where += " AND account_id IN (SELECT id FROM accounts WHERE user_id = ?)"
+        params = [user_id]
+    rows = conn.execute(f'SELECT id, description FROM transactions WHERE {where}', params).fetchall()
+    if not rows:
+        return 0
+    ids = intern_merchants(conn, (row[1] for row in rows))
+    conn.executemany('UPDATE transactions SET merchant_id = ? WHERE id = ?', [(ids[row[1]], row[0]) for row in rows])
+    return len(rows)
+
+
+def merchant_totals(conn, user_id, type_column, columns, start_date, end_date, limit=None):
+    """
+    Receitas, despesas, saldo e quantidade de lançamentos confirmados por
+    estabelecimento no período, por despesa decrescente (limit: só os N primeiros).
+    """
+    amount = cents_sql('amount', 't', columns)
+    rows = conn.execute(f'''
+        SELECT m.id, m.name, s.quantity, s.income, s.expenses
+        FROM (
+            SELECT t.merchant_id, COUNT(*) AS quantity,
+                   COALESCE(SUM(CASE WHEN t.{type_column} = 'receita' THEN {amount} END), 0) AS income,
+                   COALESCE(SUM(CASE WHEN t.{type_column} = 'despesa' THEN {amount} END), 0) AS expenses
+            FROM transactions t
+            JOIN accounts a ON a.id = t.account_id
+            WHERE a.user_id = ? AND t.is_confirmed = 1 AND t.merchant_id IS NOT NULL
+              AND DATE(t.date) BETWEEN ? AND ?
+            GROUP BY t.merchant_id
+        ) s
+        JOIN merchants m ON m.id = s.merchant_id
+        ORDER BY s.expenses DESC, m.name
+        LIMIT ?
+    ''', (user_id, start_date, end_date, -1 if limit is None else limit)).fetchall()
+    return [{'id': row[0], 'name': row[1], 'quantity': row[2],
+             'income': Money(row[3]).to_float(), 'expenses': Money(row[4]).to_float(),
+             'net': Money(row[3] - row[4]).to_float()} for row in rows]
+
+
+def main(argv=None):
+    """Preencher merchant_id nulo de um banco (escritas fora da aplicação)"""
+    parser = argparse.ArgumentParser(description='Preenche transactions.merchant_id onde estiver NULL')
+    parser.add_argument('--db', default='finance_planner_saas.db', help='banco SQLite')
+    parser.add_argument('--user-id', type=int, help='só as contas deste usuário')
+    args = parser.parse_args(argv)
+
+    conn = sqlite3.connect(args.db)
+    try:
+        filled = backfill_merchants(conn, user_id=args.user_id)
+        conn.commit()
+    finally:
+        conn.close()
+    print(f"🏪 {filled} lançamentos associados a estabelecimentos")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
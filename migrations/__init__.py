@@ -36,12 +36,40 @@ from .migration_000_create_base_schema import migration_000
 from .migration_001_add_accounts_balance import migration_001
 from .migration_002_fix_transactions_type_column import migration_002
 from .migration_003_seed_categories import migration_003
+from .migration_004_align_app_schema import migration_004
+from .migration_005_money_cents import migration_005
+from .migration_006_import_batches import migration_006
+from .migration_007_transaction_fingerprints import migration_007
+from .migration_008_idempotency_keys import migration_008
+from .migration_009_change_log import migration_009
+from .migration_010_balance_checkpoints import migration_010
+from .migration_011_daily_balances import migration_011
+from .migration_012_planning_scenarios import migration_012
+from .migration_013_chart_closure import migration_013
+from .migration_014_transaction_tags import migration_014
+from .migration_015_categorization_rules import migration_015
+from .migration_016_category_models import migration_016
+from .migration_017_merchants import migration_017
 
 MIGRATIONS = [
     ("000_create_base_schema", migration_000),
     ("001_add_accounts_balance", migration_001),
     ("002_fix_transactions_type_column", migration_002),
     ("003_seed_categories", migration_003),
+    ("004_align_app_schema", migration_004),
+    ("005_money_cents", migration_005),
+    ("006_import_batches", migration_006),
+    ("007_transaction_fingerprints", migration_007),
+    ("008_idempotency_keys", migration_008),
+    ("009_change_log", migration_009),
+    ("010_balance_checkpoints", migration_010),
+    ("011_daily_balances", migration_011),
+    ("012_planning_scenarios", migration_012),
+    ("013_chart_closure", migration_013),
+    ("014_transaction_tags", migration_014),
+    ("015_categorization_rules", migration_015),
+    ("016_category_models", migration_016),
+    ("017_merchants", migration_017),
 ]
 
 def run_all_migrations(db_path=None):
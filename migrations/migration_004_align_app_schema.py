@@ -0,0 +1,115 @@
+def _add_columns(conn, column_exists, table, columns):
+    for name, ddl in columns:
+        if not column_exists(conn, table, name):
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} {ddl};")
+
+
+def migration_004(conn, table_exists, column_exists):
+    """Alinha o schema das migrações com as colunas lidas pelo app_simple_advanced"""
+    for table in ("users", "accounts", "transactions", "categories"):
+        if not table_exists(conn, table):
+            raise RuntimeError(f"Tabela '{table}' não existe; execute 000_create_base_schema antes.")
+
+    _add_columns(conn, column_exists, "users", [
+        ("first_name", "TEXT"),
+        ("last_name", "TEXT"),
+        ("phone", "TEXT"),
+        ("preferred_currency", "TEXT DEFAULT 'BRL'"),
+        ("is_active", "BOOLEAN DEFAULT 1"),
+        ("last_login", "TIMESTAMP"),
+    ])
+
+    _add_columns(conn, column_exists, "accounts", [
+        ("initial_balance", "REAL DEFAULT 0"),
+        ("current_balance", "REAL DEFAULT 0"),
+        ("credit_limit", "REAL DEFAULT 0"),
+        ("color", "TEXT DEFAULT '#007bff'"),
+        ("is_active", "BOOLEAN DEFAULT 1"),
+        ("include_in_total", "BOOLEAN DEFAULT 1"),
+    ])
+
+    # 'category' guarda o id de categories (formulário da aba lateral / new_transaction)
+    _add_columns(conn, column_exists, "transactions", [
+        ("category", "INTEGER"),
+    ])
+
+    _add_columns(conn, column_exists, "categories", [
+        ("description", "TEXT"),
+        ("color", "TEXT DEFAULT '#007bff'"),
+        ("icon", "TEXT DEFAULT 'fas fa-folder'"),
+        ("category_type", "TEXT"),
+        ("is_active", "BOOLEAN DEFAULT 1"),
+    ])
+    if column_exists(conn, "categories", "type"):
+        conn.execute("""
+        UPDATE categories
+        SET category_type = CASE type WHEN 'income' THEN 'receita' ELSE 'despesa' END
+        WHERE category_type IS NULL;""")
+
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS chart_of_accounts(
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        code TEXT UNIQUE NOT NULL,
+        name TEXT NOT NULL,
+        description TEXT,
+        parent_id INTEGER,
+        level INTEGER DEFAULT 0,
+        account_type TEXT NOT NULL,
+        is_summary BOOLEAN DEFAULT 0,
+        is_active BOOLEAN DEFAULT 1,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY(parent_id) REFERENCES chart_of_accounts(id)
+    );""")
+
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS budgets(
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        category_id INTEGER,
+        name TEXT,
+        amount REAL NOT NULL,
+        period_type TEXT DEFAULT 'mensal',
+        start_date DATE,
+        end_date DATE,
+        alert_percentage INTEGER DEFAULT 80,
+        is_active BOOLEAN DEFAULT 1,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        updated_at DATETIME,
+        FOREIGN KEY(user_id) REFERENCES users(id) ON DELETE CASCADE,
+        FOREIGN KEY(category_id) REFERENCES categories(id)
+    );""")
+    _add_columns(conn, column_exists, "budgets", [
+        ("alert_percentage", "INTEGER DEFAULT 80"),
+        ("updated_at", "DATETIME"),
+    ])
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_budgets_user ON budgets(user_id);")
+
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS goals(
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        name TEXT NOT NULL,
+        description TEXT,
+        target_amount REAL NOT NULL,
+        current_amount REAL DEFAULT 0,
+        target_date DATE,
+        category TEXT DEFAULT 'other',
+        is_active BOOLEAN DEFAULT 1,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY(user_id) REFERENCES users(id) ON DELETE CASCADE
+    );""")
+    _add_columns(conn, column_exists, "goals", [
+        ("category", "TEXT DEFAULT 'other'"),
+    ])
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_goals_user ON goals(user_id);")
+
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS goal_contributions(
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        goal_id INTEGER NOT NULL,
+        amount REAL NOT NULL,
+        description TEXT,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY(goal_id) REFERENCES goals(id) ON DELETE CASCADE
+    );""")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_goal_contributions_goal ON goal_contributions(goal_id);")
@@ -0,0 +1,44 @@
+# (tabela, coluna REAL) que ganham a coluna espelho <coluna>_cents INTEGER
+MONEY_COLUMNS = [
+    ("transactions", "amount"),
+    ("accounts", "initial_balance"),
+    ("accounts", "current_balance"),
+    ("accounts", "balance"),
+    ("budgets", "amount"),
+    ("goals", "target_amount"),
+    ("goals", "current_amount"),
+    ("goal_contributions", "amount"),
+]
+
+
+def migration_005(conn, table_exists, column_exists):
+    """Colunas em centavos inteiros com backfill e triggers de escrita dupla"""
+    for table, column in MONEY_COLUMNS:
+        if not table_exists(conn, table) or not column_exists(conn, table, column):
+            continue
+
+        cents = f"{column}_cents"
+        if not column_exists(conn, table, cents):
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {cents} INTEGER;")
+
+        conn.execute(f"""
+        UPDATE {table}
+        SET {cents} = CAST(ROUND({column} * 100) AS INTEGER)
+        WHERE {cents} IS NULL AND {column} IS NOT NULL;""")
+
+        # Código legado ainda grava só a coluna REAL: os triggers mantêm os centavos em dia.
+        # Quem já grava <coluna>_cents (código novo) não paga o UPDATE extra.
+        conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_{table}_{cents}_insert
+        AFTER INSERT ON {table}
+        WHEN NEW.{cents} IS NULL AND NEW.{column} IS NOT NULL
+        BEGIN
+            UPDATE {table} SET {cents} = CAST(ROUND(NEW.{column} * 100) AS INTEGER) WHERE id = NEW.id;
+        END;""")
+        conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_{table}_{cents}_update
+        AFTER UPDATE OF {column} ON {table}
+        WHEN NEW.{cents} IS OLD.{cents}
+        BEGIN
+            UPDATE {table} SET {cents} = CAST(ROUND(NEW.{column} * 100) AS INTEGER) WHERE id = NEW.id;
+        END;""")
@@ -0,0 +1,29 @@
+def migration_006(conn, table_exists, column_exists):
+    """Lotes de importação de extratos (CSV/OFX) e vínculo nas transações importadas"""
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS import_batches(
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        account_id INTEGER NOT NULL,
+        filename TEXT,
+        file_format TEXT NOT NULL,
+        status TEXT NOT NULL DEFAULT 'processing',
+        total_bytes INTEGER,
+        bytes_read INTEGER DEFAULT 0,
+        lines_read INTEGER DEFAULT 0,
+        inserted_count INTEGER DEFAULT 0,
+        error_count INTEGER DEFAULT 0,
+        errors TEXT,
+        started_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        finished_at DATETIME,
+        FOREIGN KEY(user_id) REFERENCES users(id) ON DELETE CASCADE,
+        FOREIGN KEY(account_id) REFERENCES accounts(id) ON DELETE CASCADE
+    );""")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_import_batches_user ON import_batches(user_id, id);")
+
+    if table_exists(conn, "transactions"):
+        if not column_exists(conn, "transactions", "created_by_import"):
+            conn.execute("ALTER TABLE transactions ADD COLUMN created_by_import BOOLEAN DEFAULT 0;")
+        if not column_exists(conn, "transactions", "import_batch_id"):
+            conn.execute("ALTER TABLE transactions ADD COLUMN import_batch_id INTEGER;")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_transactions_import_batch ON transactions(import_batch_id);")
@@ -0,0 +1,32 @@
+def migration_007(conn, table_exists, column_exists):
+    """Impressão digital de transações (dedup.py) e índices para busca de duplicatas"""
+    if not table_exists(conn, "transactions"):
+        raise RuntimeError("Tabela 'transactions' não existe; execute 000_create_base_schema antes.")
+
+    if not column_exists(conn, "transactions", "fingerprint"):
+        conn.execute("ALTER TABLE transactions ADD COLUMN fingerprint TEXT;")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_transactions_fingerprint ON transactions(fingerprint);")
+
+    # Janela ±N dias com mesmo valor e o relatório ordenado por (conta, tipo, valor, data)
+    type_column = "type" if column_exists(conn, "transactions", "type") else "transaction_type"
+    amount_column = "amount_cents" if column_exists(conn, "transactions", "amount_cents") else "amount"
+    conn.execute(f"""
+    CREATE INDEX IF NOT EXISTS idx_transactions_dedup
+    ON transactions(account_id, {type_column}, {amount_column}, date);""")
+
+    # A impressão digital é calculada em Python (dedup.backfill_fingerprints):
+    # escritas legadas que mudam os campos da chave só a invalidam
+    conn.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS trg_transactions_fingerprint_update
+    AFTER UPDATE OF account_id, date, {type_column}, amount, description ON transactions
+    WHEN NEW.fingerprint IS OLD.fingerprint AND NEW.fingerprint IS NOT NULL
+    BEGIN
+        UPDATE transactions SET fingerprint = NULL WHERE id = NEW.id;
+    END;""")
+
+    if table_exists(conn, "import_batches") and not column_exists(conn, "import_batches", "duplicate_count"):
+        conn.execute("ALTER TABLE import_batches ADD COLUMN duplicate_count INTEGER DEFAULT 0;")
+
+    # Lançamentos anteriores à migração: preenchidos aqui, não na primeira leitura
+    from dedup import backfill_fingerprints
+    backfill_fingerprints(conn)
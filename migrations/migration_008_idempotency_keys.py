@@ -0,0 +1,26 @@
+def migration_008(conn, table_exists, column_exists):
+    """Chaves de idempotência (idempotency.py) com a resposta gravada e expiração"""
+    # WITHOUT ROWID: a chave primária já é o acesso; expires_at em segundos epoch
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS idempotency_keys(
+        user_id INTEGER NOT NULL,
+        idempotency_key TEXT NOT NULL,
+        request_hash TEXT NOT NULL,
+        status_code INTEGER,
+        content_type TEXT,
+        location TEXT,
+        body BLOB,
+        flashes TEXT,
+        reserved_at INTEGER,
+        expires_at INTEGER NOT NULL,
+        PRIMARY KEY (user_id, idempotency_key)
+    ) WITHOUT ROWID;""")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_idempotency_keys_expires ON idempotency_keys(expires_at);")
+
+    # Mensagens flash de rotas com formulário, repetidas junto com o redirect
+    if not column_exists(conn, "idempotency_keys", "flashes"):
+        conn.execute("ALTER TABLE idempotency_keys ADD COLUMN flashes TEXT;")
+
+    # Início da execução: reservas sem resposta antigas demais são abandonadas (idempotency.py)
+    if not column_exists(conn, "idempotency_keys", "reserved_at"):
+        conn.execute("ALTER TABLE idempotency_keys ADD COLUMN reserved_at INTEGER;")
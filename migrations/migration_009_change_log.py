@@ -0,0 +1,61 @@
+def _tracked_columns(conn, table):
+    """Colunas cuja mudança interessa aos clientes (espelhos em centavos e campos técnicos ficam de fora)"""
+    skip = {"id", "fingerprint", "created_at", "updated_at"}
+    return [r[1] for r in conn.execute(f"PRAGMA table_info({table});")
+            if r[1] not in skip and not r[1].endswith("_cents")]
+
+
+def migration_009(conn, table_exists, column_exists):
+    """Log de alterações (change_log.py) para sincronização incremental via /api/v1/sync"""
+    # AUTOINCREMENT: seq nunca é reutilizado, mesmo após limpeza do log
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS change_log(
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER,
+        entity TEXT NOT NULL,
+        entity_id INTEGER NOT NULL,
+        op TEXT NOT NULL CHECK (op IN ('I', 'U', 'D')),
+        changed_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    );""")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_change_log_user_seq ON change_log(user_id, seq);")
+
+    # Dono de cada linha: transações pertencem ao usuário da conta
+    owners = {
+        "accounts": "{row}.user_id",
+        "budgets": "{row}.user_id",
+        "goals": "{row}.user_id",
+        "transactions": "(SELECT user_id FROM accounts WHERE id = {row}.account_id)",
+    }
+    for table, owner in owners.items():
+        if not table_exists(conn, table):
+            continue
+        if table == "transactions" and column_exists(conn, table, "user_id"):
+            owner = "COALESCE({row}.user_id, " + owner + ")"
+
+        conn.execute(f"""
+        INSERT INTO change_log (user_id, entity, entity_id, op)
+        SELECT {owner.format(row=table)}, '{table}', id, 'I' FROM {table} ORDER BY id;""")
+
+        conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_{table}_change_log_insert AFTER INSERT ON {table}
+        BEGIN
+            INSERT INTO change_log (user_id, entity, entity_id, op)
+            VALUES ({owner.format(row='NEW')}, '{table}', NEW.id, 'I');
+        END;""")
+
+        # Só registra quando algum campo visível muda (recalcular um saldo igual não gera alteração)
+        changed = " AND ".join(f"OLD.{c} IS NEW.{c}" for c in _tracked_columns(conn, table))
+        conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_{table}_change_log_update AFTER UPDATE ON {table}
+        WHEN NOT ({changed})
+        BEGIN
+            INSERT INTO change_log (user_id, entity, entity_id, op)
+            VALUES ({owner.format(row='NEW')}, '{table}', NEW.id, 'U');
+        END;""")
+
+        conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_{table}_change_log_delete AFTER DELETE ON {table}
+        BEGIN
+            INSERT INTO change_log (user_id, entity, entity_id, op)
+            VALUES ({owner.format(row='OLD')}, '{table}', OLD.id, 'D');
+        END;""")
@@ -0,0 +1,87 @@
+def _signed_cents(conn, column_exists, row):
+    """Efeito da transação no saldo, em centavos (mesma regra de update_account_balance)"""
+    type_column = "type" if column_exists(conn, "transactions", "type") else "transaction_type"
+    amount = f"CAST(ROUND({row}.amount * 100) AS INTEGER)"
+    if column_exists(conn, "transactions", "amount_cents"):
+        amount = f"COALESCE({row}.amount_cents, {amount})"
+    return f"""(CASE {row}.{type_column}
+                WHEN 'receita' THEN {amount}
+                WHEN 'despesa' THEN -{amount}
+                WHEN 'transferencia' THEN {amount}
+                ELSE 0 END)"""
+
+
+def migration_010(conn, table_exists, column_exists):
+    """Checkpoints mensais de saldo por conta (balance_checkpoints.py) para o saldo corrido do extrato"""
+    # balance_cents: saldo da conta ao fim do mês (YYYY-MM), somando todo o histórico até ele
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS account_balance_checkpoints(
+        account_id INTEGER NOT NULL,
+        month TEXT NOT NULL,
+        balance_cents INTEGER NOT NULL,
+        PRIMARY KEY (account_id, month)
+    ) WITHOUT ROWID;""")
+
+    # Escritas em massa (importação, lote, gerador) gravam uma linha aqui dentro da própria
+    # transação: os triggers abaixo não disparam e os checkpoints das contas tocadas são
+    # refeitos uma vez no final (balance_checkpoints.rebuild_balance_snapshots). A linha é
+    # apagada antes do commit, então nenhuma outra conexão chega a vê-la.
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS balance_snapshot_bypass(
+        active INTEGER PRIMARY KEY
+    );""")
+
+    if not table_exists(conn, "transactions"):
+        return
+    # Linhas de um mês da conta, em ordem de data, sem varrer o resto do histórico
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_transactions_account_date ON transactions(account_id, date);")
+
+    new, old = _signed_cents(conn, column_exists, "NEW"), _signed_cents(conn, column_exists, "OLD")
+    conn.execute(f"""
+    INSERT OR REPLACE INTO account_balance_checkpoints (account_id, month, balance_cents)
+    SELECT account_id, month, SUM(net) OVER (PARTITION BY account_id ORDER BY month)
+    FROM (
+        SELECT account_id, substr(date, 1, 7) AS month, SUM({_signed_cents(conn, column_exists, 'transactions')}) AS net
+        FROM transactions
+        WHERE account_id IS NOT NULL AND date IS NOT NULL
+        GROUP BY account_id, month
+    );""")
+
+    bulk = "NOT EXISTS (SELECT 1 FROM balance_snapshot_bypass)"
+
+    # Entrar com valor num mês: cria o checkpoint do mês (a partir do anterior) e soma o
+    # efeito nele e nos meses seguintes. Lançamento no mês corrente toca uma linha.
+    def add(row, effect):
+        return f"""
+            INSERT OR IGNORE INTO account_balance_checkpoints (account_id, month, balance_cents)
+            VALUES ({row}.account_id, substr({row}.date, 1, 7), COALESCE((
+                SELECT balance_cents FROM account_balance_checkpoints
+                WHERE account_id = {row}.account_id AND month < substr({row}.date, 1, 7)
+                ORDER BY month DESC LIMIT 1), 0));
+            UPDATE account_balance_checkpoints SET balance_cents = balance_cents + {effect}
+            WHERE account_id = {row}.account_id AND month >= substr({row}.date, 1, 7);"""
+
+    def remove(row, effect):
+        return f"""
+            UPDATE account_balance_checkpoints SET balance_cents = balance_cents - {effect}
+            WHERE account_id = {row}.account_id AND month >= substr({row}.date, 1, 7);"""
+
+    conn.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS trg_transactions_checkpoint_insert AFTER INSERT ON transactions
+    WHEN {bulk} AND NEW.account_id IS NOT NULL AND {new} <> 0
+    BEGIN{add('NEW', new)}
+    END;""")
+
+    # O UPDATE de amount_cents feito pelos triggers da migração 005 não muda o efeito: não dispara
+    conn.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS trg_transactions_checkpoint_update AFTER UPDATE ON transactions
+    WHEN {bulk} AND NOT (OLD.account_id IS NEW.account_id AND substr(OLD.date, 1, 7) IS substr(NEW.date, 1, 7)
+              AND {old} = {new})
+    BEGIN{remove('OLD', old)}{add('NEW', new)}
+    END;""")
+
+    conn.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS trg_transactions_checkpoint_delete AFTER DELETE ON transactions
+    WHEN {bulk} AND OLD.account_id IS NOT NULL AND {old} <> 0
+    BEGIN{remove('OLD', old)}
+    END;""")
@@ -0,0 +1,65 @@
+from .migration_010_balance_checkpoints import _signed_cents
+
+
+def migration_011(conn, table_exists, column_exists):
+    """Snapshots diários acumulados de saldo por conta (saldo em uma data, balance_checkpoints.py)"""
+    # balance_cents: saldo da conta ao fim do dia, só nos dias com movimento;
+    # o saldo em qualquer data é o snapshot mais recente até ela (busca na chave primária)
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS account_daily_balances(
+        account_id INTEGER NOT NULL,
+        day TEXT NOT NULL,
+        balance_cents INTEGER NOT NULL,
+        PRIMARY KEY (account_id, day)
+    ) WITHOUT ROWID;""")
+
+    if not table_exists(conn, "transactions"):
+        return
+
+    new, old = _signed_cents(conn, column_exists, "NEW"), _signed_cents(conn, column_exists, "OLD")
+    conn.execute(f"""
+    INSERT OR REPLACE INTO account_daily_balances (account_id, day, balance_cents)
+    SELECT account_id, day, SUM(net) OVER (PARTITION BY account_id ORDER BY day)
+    FROM (
+        SELECT account_id, DATE(date) AS day, SUM({_signed_cents(conn, column_exists, 'transactions')}) AS net
+        FROM transactions
+        WHERE account_id IS NOT NULL AND DATE(date) IS NOT NULL
+        GROUP BY account_id, day
+    );""")
+
+    # Mesma manutenção dos checkpoints mensais (migração 010), com granularidade de dia:
+    # lançamento retroativo soma o efeito no dia e em todos os dias seguintes da conta.
+    # Escritas em massa desligam os triggers pela mesma tabela balance_snapshot_bypass
+    bulk = "NOT EXISTS (SELECT 1 FROM balance_snapshot_bypass)"
+    def add(row, effect):
+        return f"""
+            INSERT OR IGNORE INTO account_daily_balances (account_id, day, balance_cents)
+            VALUES ({row}.account_id, DATE({row}.date), COALESCE((
+                SELECT balance_cents FROM account_daily_balances
+                WHERE account_id = {row}.account_id AND day < DATE({row}.date)
+                ORDER BY day DESC LIMIT 1), 0));
+            UPDATE account_daily_balances SET balance_cents = balance_cents + {effect}
+            WHERE account_id = {row}.account_id AND day >= DATE({row}.date);"""
+
+    def remove(row, effect):
+        return f"""
+            UPDATE account_daily_balances SET balance_cents = balance_cents - {effect}
+            WHERE account_id = {row}.account_id AND day >= DATE({row}.date);"""
+
+    conn.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS trg_transactions_daily_balance_insert AFTER INSERT ON transactions
+    WHEN {bulk} AND NEW.account_id IS NOT NULL AND {new} <> 0
+    BEGIN{add('NEW', new)}
+    END;""")
+
+    conn.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS trg_transactions_daily_balance_update AFTER UPDATE ON transactions
+    WHEN {bulk} AND NOT (OLD.account_id IS NEW.account_id AND DATE(OLD.date) IS DATE(NEW.date) AND {old} = {new})
+    BEGIN{remove('OLD', old)}{add('NEW', new)}
+    END;""")
+
+    conn.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS trg_transactions_daily_balance_delete AFTER DELETE ON transactions
+    WHEN {bulk} AND OLD.account_id IS NOT NULL AND {old} <> 0
+    BEGIN{remove('OLD', old)}
+    END;""")
@@ -0,0 +1,17 @@
+def migration_012(conn, table_exists, column_exists):
+    """Cenários "e se" salvos do planejamento (scenarios.py) com o último resultado calculado"""
+    # result/result_version: cálculo guardado e a versão dos dados em que foi feito;
+    # versão diferente na leitura = recalcular (a tabela não entra no change_log)
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS planning_scenarios(
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        name TEXT NOT NULL,
+        months INTEGER NOT NULL,
+        adjustments TEXT NOT NULL,
+        result TEXT,
+        result_version TEXT,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    );""")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_planning_scenarios_user ON planning_scenarios(user_id, id);")
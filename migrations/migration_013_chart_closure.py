@@ -0,0 +1,60 @@
+def migration_013(conn, table_exists, column_exists):
+    """Tabela de fechamento do plano de contas (chart_tree.py): totais de todos os nós em uma consulta"""
+    # Um par (ancestral, descendente, distância) por caminho da árvore, incluindo o próprio nó (depth 0)
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS chart_account_closure(
+        ancestor_id INTEGER NOT NULL,
+        descendant_id INTEGER NOT NULL,
+        depth INTEGER NOT NULL,
+        PRIMARY KEY (ancestor_id, descendant_id)
+    ) WITHOUT ROWID;""")
+    conn.execute("""
+    CREATE INDEX IF NOT EXISTS idx_chart_account_closure_descendant
+    ON chart_account_closure(descendant_id, ancestor_id, depth);""")
+
+    if not table_exists(conn, "chart_of_accounts"):
+        return
+
+    # depth < 64: parent_id em ciclo não trava a migração
+    conn.execute("""
+    INSERT OR IGNORE INTO chart_account_closure (ancestor_id, descendant_id, depth)
+    WITH RECURSIVE paths(ancestor_id, descendant_id, depth) AS (
+        SELECT id, id, 0 FROM chart_of_accounts
+        UNION ALL
+        SELECT p.ancestor_id, c.id, p.depth + 1
+        FROM paths p JOIN chart_of_accounts c ON c.parent_id = p.descendant_id
+        WHERE p.depth < 64
+    )
+    SELECT ancestor_id, descendant_id, MIN(depth) FROM paths GROUP BY ancestor_id, descendant_id;""")
+
+    conn.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_chart_of_accounts_closure_insert AFTER INSERT ON chart_of_accounts
+    BEGIN
+        INSERT OR IGNORE INTO chart_account_closure (ancestor_id, descendant_id, depth)
+        SELECT NEW.id, NEW.id, 0
+        UNION ALL
+        SELECT ancestor_id, NEW.id, depth + 1 FROM chart_account_closure WHERE descendant_id = NEW.parent_id;
+    END;""")
+
+    # Mudança de pai move a subárvore inteira: desligar dos ancestrais antigos e ligar aos novos
+    conn.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_chart_of_accounts_closure_move AFTER UPDATE OF parent_id ON chart_of_accounts
+    WHEN OLD.parent_id IS NOT NEW.parent_id
+    BEGIN
+        DELETE FROM chart_account_closure
+        WHERE descendant_id IN (SELECT descendant_id FROM chart_account_closure WHERE ancestor_id = NEW.id)
+          AND ancestor_id IN (SELECT ancestor_id FROM chart_account_closure
+                              WHERE descendant_id = NEW.id AND ancestor_id <> NEW.id);
+        INSERT OR IGNORE INTO chart_account_closure (ancestor_id, descendant_id, depth)
+        SELECT above.ancestor_id, below.descendant_id, above.depth + below.depth + 1
+        FROM chart_account_closure above, chart_account_closure below
+        WHERE above.descendant_id = NEW.parent_id AND below.ancestor_id = NEW.id
+          AND NOT EXISTS (SELECT 1 FROM chart_account_closure WHERE ancestor_id = NEW.id
+                          AND descendant_id = NEW.parent_id);
+    END;""")
+
+    conn.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_chart_of_accounts_closure_delete AFTER DELETE ON chart_of_accounts
+    BEGIN
+        DELETE FROM chart_account_closure WHERE ancestor_id = OLD.id OR descendant_id = OLD.id;
+    END;""")
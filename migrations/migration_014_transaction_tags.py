@@ -0,0 +1,75 @@
+MAX_TAG_LENGTH = 50
+
+
+def _tag_array(row):
+    """transactions.tags ('a, b') como array JSON para json_each; texto que não vira JSON válido -> []"""
+    cleaned = f"replace(replace(replace({row}.tags, char(13), ','), char(10), ','), char(9), ' ')"
+    escaped = rf"""replace(replace({cleaned}, '\', '\\'), '"', '\"')"""
+    array = f"""'["' || replace({escaped}, ',', '","') || '"]'"""
+    return f"(CASE WHEN json_valid({array}) THEN {array} ELSE '[]' END)"
+
+
+def migration_014(conn, table_exists, column_exists):
+    """Índice normalizado de tags (tags.py): tags por usuário e vínculo com as transações"""
+    # Nome sem diferença de maiúsculas por usuário; transactions.tags continua sendo o que o usuário digita
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS tags(
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        name TEXT NOT NULL COLLATE NOCASE,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        UNIQUE (user_id, name)
+    );""")
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS transaction_tags(
+        tag_id INTEGER NOT NULL,
+        transaction_id INTEGER NOT NULL,
+        PRIMARY KEY (tag_id, transaction_id)
+    ) WITHOUT ROWID;""")
+    conn.execute("""
+    CREATE INDEX IF NOT EXISTS idx_transaction_tags_transaction
+    ON transaction_tags(transaction_id, tag_id);""")
+
+    if not table_exists(conn, "transactions") or not column_exists(conn, "transactions", "tags"):
+        return
+
+    # Dono da transação: usuário da conta (schema legado: t.user_id primeiro, como no change_log)
+    owner = "(SELECT user_id FROM accounts WHERE id = {row}.account_id)"
+    if column_exists(conn, "transactions", "user_id"):
+        owner = "COALESCE({row}.user_id, " + owner + ")"
+
+    def link(row, source='', where='1'):
+        """(criar as tags de {row}, ligar a transação a elas)"""
+        user = owner.format(row=row)
+        name = f"substr(trim(j.value), 1, {MAX_TAG_LENGTH})"
+        return (f"""
+            INSERT OR IGNORE INTO tags (user_id, name)
+            SELECT {user}, {name} FROM {source} json_each({_tag_array(row)}) j
+            WHERE {where} AND {user} IS NOT NULL AND trim(j.value) <> '';""", f"""
+            INSERT OR IGNORE INTO transaction_tags (tag_id, transaction_id)
+            SELECT tg.id, {row}.id FROM {source} json_each({_tag_array(row)}) j
+            JOIN tags tg ON tg.user_id = {user} AND tg.name = {name}
+            WHERE {where} AND trim(j.value) <> '';""")
+
+    # Preenchimento a partir das strings existentes (mesma expressão dos triggers)
+    for statement in link("transactions", "transactions,", "transactions.tags IS NOT NULL"):
+        conn.execute(statement)
+
+    conn.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS trg_transactions_tags_insert AFTER INSERT ON transactions
+    WHEN NEW.tags IS NOT NULL AND trim(NEW.tags) <> ''
+    BEGIN{''.join(link('NEW'))}
+    END;""")
+
+    conn.execute(f"""
+    CREATE TRIGGER IF NOT EXISTS trg_transactions_tags_update AFTER UPDATE ON transactions
+    WHEN OLD.tags IS NOT NEW.tags OR OLD.account_id IS NOT NEW.account_id
+    BEGIN
+        DELETE FROM transaction_tags WHERE transaction_id = NEW.id;{''.join(link('NEW'))}
+    END;""")
+
+    conn.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_transactions_tags_delete AFTER DELETE ON transactions
+    BEGIN
+        DELETE FROM transaction_tags WHERE transaction_id = OLD.id;
+    END;""")
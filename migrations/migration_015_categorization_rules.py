@@ -0,0 +1,20 @@
+def migration_015(conn, table_exists, column_exists):
+    """Regras de categorização automática por usuário (categorization.py)"""
+    # match_type: 'contains' (trecho da descrição, sem acento/maiúsculas) ou 'regex';
+    # filtros opcionais por valor (centavos, absoluto), conta e tipo; menor priority vence
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS categorization_rules(
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        category_id INTEGER NOT NULL,
+        match_type TEXT NOT NULL DEFAULT 'contains' CHECK (match_type IN ('contains', 'regex')),
+        pattern TEXT NOT NULL,
+        min_amount_cents INTEGER,
+        max_amount_cents INTEGER,
+        account_id INTEGER,
+        transaction_type TEXT,
+        priority INTEGER NOT NULL DEFAULT 100,
+        is_active BOOLEAN NOT NULL DEFAULT 1,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    );""")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_categorization_rules_user ON categorization_rules(user_id, priority, id);")
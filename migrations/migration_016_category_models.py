@@ -0,0 +1,11 @@
+def migration_016(conn, table_exists, column_exists):
+    """Modelo de sugestão de categoria treinado por usuário (category_model.py)"""
+    # version: seq do change_log até onde o modelo foi treinado; model: contagens em JSON.
+    # Um worker que reinicia continua do modelo gravado em vez de retreinar do zero.
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS category_models(
+        user_id INTEGER PRIMARY KEY,
+        version INTEGER NOT NULL,
+        model TEXT NOT NULL,
+        trained_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    );""")
@@ -0,0 +1,31 @@
+def migration_017(conn, table_exists, column_exists):
+    """Estabelecimentos normalizados (merchants.py): tabela, transactions.merchant_id e preenchimento"""
+    if not table_exists(conn, "transactions"):
+        raise RuntimeError("Tabela 'transactions' não existe; execute 000_create_base_schema antes.")
+
+    # Uma linha por chave normalizada ('ifood'), compartilhada entre os usuários
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS merchants(
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        key TEXT NOT NULL UNIQUE,
+        name TEXT NOT NULL,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    );""")
+
+    if not column_exists(conn, "transactions", "merchant_id"):
+        conn.execute("ALTER TABLE transactions ADD COLUMN merchant_id INTEGER;")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_transactions_merchant ON transactions(merchant_id);")
+
+    # A chave é calculada em Python (merchants.backfill_merchants), como a impressão
+    # digital da migração 007: escritas que mudam a descrição só zeram merchant_id
+    conn.execute("""
+    CREATE TRIGGER IF NOT EXISTS trg_transactions_merchant_update
+    AFTER UPDATE OF description ON transactions
+    WHEN NEW.merchant_id IS OLD.merchant_id AND NEW.merchant_id IS NOT NULL
+         AND NEW.description IS NOT OLD.description
+    BEGIN
+        UPDATE transactions SET merchant_id = NULL WHERE id = NEW.id;
+    END;""")
+
+    from merchants import backfill_merchants
+    backfill_merchants(conn)
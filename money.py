@@ -0,0 +1,148 @@
+# Valores monetários em centavos inteiros - FynanPro
+"""
+Money guarda o valor em centavos (int): somas e comparações são exatas e
+a conversão para float/texto só acontece na borda (templates e JSON).
+
+Durante a transição as tabelas têm a coluna REAL antiga (amount) e a nova
+em centavos (amount_cents, migração 005). Leituras usam cents_sql(), que
+prefere a coluna em centavos e cai para ROUND(amount * 100) quando ela
+ainda não existe ou está nula.
+"""
+
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+from functools import total_ordering
+
+CURRENCY_SYMBOL = 'R$'
+
+_CENT = Decimal('0.01')
+
+
+def to_cents(value):
+    """Converter reais (int, float, Decimal ou texto) para centavos inteiros"""
+    if value is None or value == '':
+        return 0
+    if isinstance(value, Money):
+        return value.cents
+    if isinstance(value, str):
+        value = _normalize_text(value)
+    elif isinstance(value, float):
+        value = repr(value)
+    try:
+        return int((Decimal(value).quantize(_CENT, rounding=ROUND_HALF_UP) * 100).to_integral_value())
+    except InvalidOperation:
+        raise ValueError(f"Valor monetário inválido: {value!r}")
+
+
+def _normalize_text(text):
+    """'R$ 1.234,56' / '1234.56' / '-12,3' -> '1234.56'"""
+    text = text.strip().replace(CURRENCY_SYMBOL, '').replace(' ', '').replace('\xa0', '')
+    if ',' in text:
+        # Formato brasileiro: ponto é separador de milhar
+        text = text.replace('.', '').replace(',', '.')
+    return text
+
+
+def cents_sql(column, alias=None, columns=()):
+    """
+    Expressão SQL em centavos para a coluna REAL `column` (dual-read).
+    columns: colunas existentes na tabela (get_table_columns).
+    """
+    ref = f"{alias}.{column}" if alias else column
+    legacy = f"CAST(ROUND({ref} * 100) AS INTEGER)"
+    if f"{column}_cents" in columns:
+        return f"COALESCE({ref}_cents, {legacy})"
+    return legacy
+
+
+@total_ordering
+class Money:
+    """Valor monetário imutável em centavos"""
+
+    __slots__ = ('cents',)
+
+    def __init__(self, cents=0):
+        object.__setattr__(self, 'cents', int(cents))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Money é imutável")
+
+    @classmethod
+    def from_value(cls, value):
+        """Reais (int, float, Decimal, texto ou Money) -> Money"""
+        if isinstance(value, Money):
+            return value
+        return cls(to_cents(value))
+
+    @classmethod
+    def from_row(cls, row, column):
+        """Dual-read de uma linha (dict/sqlite3.Row): <coluna>_cents se houver, senão a coluna REAL"""
+        keys = row.keys()
+        cents_column = f"{column}_cents"
+        if cents_column in keys and row[cents_column] is not None:
+            return cls(row[cents_column])
+        return cls.from_value(row[column] if column in keys else None)
+
+    def to_decimal(self):
+        return Decimal(self.cents) / 100
+
+    def to_float(self):
+        return self.cents / 100
+
+    def __float__(self):
+        return self.to_float()
+
+    def __add__(self, other):
+        if isinstance(other, Money):
+            return Money(self.cents + other.cents)
+        if other == 0:
+            return self
+        return NotImplemented
+
+    __radd__ = __add__
+
+    def __sub__(self, other):
+        if isinstance(other, Money):
+            return Money(self.cents - other.cents)
+        return NotImplemented
+
+    def __neg__(self):
+        return Money(-self.cents)
+
+    def __abs__(self):
+        return Money(abs(self.cents))
+
+    def __mul__(self, factor):
+        if isinstance(factor, int):
+            return Money(self.cents * factor)
+        return NotImplemented
+
+    __rmul__ = __mul__
+
+    def __bool__(self):
+        return self.cents != 0
+
+    def __eq__(self, other):
+        if isinstance(other, Money):
+            return self.cents == other.cents
+        return NotImplemented
+
+    def __lt__(self, other):
+        if isinstance(other, Money):
+            return self.cents < other.cents
+        return NotImplemented
+
+    def __hash__(self):
+        return hash(self.cents)
+
+    def format(self, symbol=CURRENCY_SYMBOL):
+        """Formato brasileiro: 'R$ 1.234,56' (negativos: 'R$ -1.234,56')"""
+        sign = '-' if self.cents < 0 else ''
+        units, cents = divmod(abs(self.cents), 100)
+        grouped = f"{units:,}".replace(',', '.')
+        return f"{symbol} {sign}{grouped},{cents:02d}"
+
+    def __str__(self):
+        return self.format()
+
+    def __repr__(self):
+        return f"Money({self.cents})"
@@ -0,0 +1,178 @@
+# Orçamento de queries SQL por rota - FynanPro
+"""
+Contagem de statements SQL por requisição e limites declarados por rota.
+
+Uso nas rotas:
+
+    @app.route('/dashboard')
+    @login_required
+    @query_budget(4)
+    def dashboard(): ...
+
+Modos (config QUERY_BUDGET_MODE ou variável de ambiente de mesmo nome):
+  off     padrão; nenhum rastreio de SQL (sem overhead)
+  header  adiciona X-Query-Count / X-Query-Budget às respostas
+  warn    header + log WARNING com os statements quando o orçamento estoura
+  raise   header + QueryBudgetExceeded (para testes com o test client)
+
+Nos testes com test client:
+
+    with assert_max_queries(3):
+        client.get('/transactions')
+
+Nos scripts contra servidor rodando (QUERY_BUDGET_MODE=header):
+
+    check_query_headers(response)
+"""
+
+import logging
+import os
+from contextlib import contextmanager
+
+from flask import g, has_request_context, request
+
+logger = logging.getLogger(__name__)
+
+QUERY_COUNT_HEADER = 'X-Query-Count'
+QUERY_BUDGET_HEADER = 'X-Query-Budget'
+
+TRANSACTION_CONTROL = ('BEGIN', 'COMMIT', 'ROLLBACK')
+
+# Callbacks que recebem cada statement executado nas conexões de get_db()
+sql_trace_hooks = []
+
+
+def trace_sql(statement):
+    for hook in sql_trace_hooks:
+        hook(statement)
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Rota executou mais statements SQL do que o orçamento declarado"""
+
+    def __init__(self, label, budget, statements):
+        self.label = label
+        self.budget = budget
+        self.statements = list(statements)
+        listing = '\n'.join(f'  {i}. {" ".join(s.split())}' for i, s in enumerate(self.statements, 1))
+        super().__init__(f"{label}: {len(self.statements)} queries (orçamento {budget})\n{listing}")
+
+
+class QueryCounter:
+    """Coleta statements SQL, ignorando controle de transação (BEGIN/COMMIT/ROLLBACK)"""
+
+    def __init__(self):
+        self.statements = []
+
+    def __call__(self, statement):
+        if not statement.lstrip().upper().startswith(TRANSACTION_CONTROL):
+            self.statements.append(statement)
+
+    def reset(self):
+        self.statements = []
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+
+def query_budget(max_queries):
+    """Declarar o número máximo de statements SQL que a rota pode executar"""
+    def decorator(f):
+        # Só anota a view: login_required (functools.wraps) copia o atributo para o wrapper
+        f.query_budget = max_queries
+        return f
+    return decorator
+
+
+def get_route_budget(app, endpoint):
+    view = app.view_functions.get(endpoint)
+    return getattr(view, 'query_budget', None)
+
+
+def _request_hook(statement):
+    if has_request_context():
+        counter = g.get('_query_counter')
+        if counter is not None:
+            counter(statement)
+
+
+def init_query_budget(app):
+    """Registrar a contagem por requisição conforme QUERY_BUDGET_MODE"""
+    app.config.setdefault('QUERY_BUDGET_MODE', os.getenv('QUERY_BUDGET_MODE', 'off').lower())
+
+    @app.before_request
+    def _query_budget_start():
+        if app.config['QUERY_BUDGET_MODE'] == 'off':
+            return
+        if _request_hook not in sql_trace_hooks:
+            sql_trace_hooks.append(_request_hook)
+        g._query_counter = QueryCounter()
+
+    @app.after_request
+    def _query_budget_check(response):
+        counter = g.pop('_query_counter', None)
+        if counter is None:
+            return response
+        mode = app.config['QUERY_BUDGET_MODE']
+        budget = get_route_budget(app, request.endpoint)
+        response.headers[QUERY_COUNT_HEADER] = str(counter.count)
+        if budget is not None:
+            response.headers[QUERY_BUDGET_HEADER] = str(budget)
+            if counter.count > budget:
+                error = QueryBudgetExceeded(request.endpoint, budget, counter.statements)
+                if mode == 'raise':
+                    raise error
+                if mode == 'warn':
+                    logger.warning("⚠️ Orçamento de queries excedido - %s", error)
+        return response
+
+
+@contextmanager
+def count_queries():
+    """Contar os statements executados via get_db() dentro do bloco"""
+    counter = QueryCounter()
+    sql_trace_hooks.append(counter)
+    try:
+        yield counter
+    finally:
+        sql_trace_hooks.remove(counter)
+
+
+@contextmanager
+def assert_max_queries(max_queries, label='bloco'):
+    """Falhar com a lista de statements se o bloco executar mais que max_queries"""
+    with count_queries() as counter:
+        yield counter
+    if counter.count > max_queries:
+        raise QueryBudgetExceeded(label, max_queries, counter.statements)
+
+
+def check_route_budget(client, url, warmup=True, **kwargs):
+    """
+    GET via test client verificando o orçamento declarado da rota; retorna a resposta.
+    warmup: uma requisição prévia não medida, para que os caches por processo
+    (colunas do schema, categorias) não contem contra o orçamento.
+    """
+    app = client.application
+    with app.test_request_context(url):
+        endpoint = request.url_rule.endpoint if request.url_rule else None
+    budget = get_route_budget(app, endpoint)
+    if budget is None:
+        raise AssertionError(f"Rota {url} não declara @query_budget")
+    if warmup:
+        client.get(url, **kwargs)
+    with assert_max_queries(budget, label=f"{endpoint} ({url})"):
+        response = client.get(url, **kwargs)
+    return response
+
+
+def check_query_headers(response, label=None):
+    """Verificar X-Query-Count contra X-Query-Budget em respostas de servidor real"""
+    count = response.headers.get(QUERY_COUNT_HEADER)
+    budget = response.headers.get(QUERY_BUDGET_HEADER)
+    if count is None or budget is None:
+        return None
+    if int(count) > int(budget):
+        raise AssertionError(f"{label or response.url}: {count} queries (orçamento {budget})")
+    return int(count)
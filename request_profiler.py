@@ -0,0 +1,182 @@
+# Profiler de requisições sob demanda - FynanPro
+"""
+Middleware opcional de profiling por requisição.
+
+Ativação:
+  - Admin envia o header ``X-Profile: 1`` ou o parâmetro ``?_profile=1``
+    (cProfile + amostrador estatístico);
+  - ``PROFILE_SAMPLE_RATE`` > 0 sorteia requisições comuns
+    (apenas o amostrador, que tem overhead bem menor).
+
+Cada perfil gera, em ``PROFILE_DIR``:
+  - ``<id>.pstats``    dump do cProfile (abrir com ``python -m pstats``);
+  - ``<id>.collapsed`` pilhas colapsadas (formato flamegraph.pl / speedscope);
+  - ``<id>.json``      metadados (endpoint, usuário, duração, status).
+"""
+
+import cProfile
+import json
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime
+
+from flask import g, request, session
+
+PROFILE_HEADER = 'X-Profile'
+PROFILE_QUERY_ARG = '_profile'
+SKIP_ENDPOINTS = {'static', 'favicon', 'admin_profiles', 'admin_profile_download'}
+
+
+class StackSampler(threading.Thread):
+    """Amostrador estatístico: captura a pilha da thread alvo a cada intervalo"""
+
+    def __init__(self, target_thread_id, interval=0.005):
+        super().__init__(daemon=True)
+        self.target_thread_id = target_thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.target_thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                frame = frame.f_back
+            self.stacks[';'.join(reversed(stack))] += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join(timeout=1)
+
+    def collapsed(self):
+        """Formato 'frame1;frame2;frame3 contagem' por linha"""
+        return '\n'.join(f"{stack} {count}" for stack, count in self.stacks.most_common())
+
+
+def _profile_dir(app):
+    path = app.config['PROFILE_DIR']
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def _requested_explicitly():
+    flag = request.headers.get(PROFILE_HEADER) or request.args.get(PROFILE_QUERY_ARG)
+    return flag in ('1', 'true', 'on')
+
+
+def _prune_old_profiles(directory, max_profiles):
+    if max_profiles <= 0:
+        return
+    metas = sorted(f for f in os.listdir(directory) if f.endswith('.json'))
+    for meta_name in metas[:-max_profiles]:
+        profile_id = meta_name[:-len('.json')]
+        for ext in ('.json', '.pstats', '.collapsed'):
+            try:
+                os.remove(os.path.join(directory, profile_id + ext))
+            except FileNotFoundError:
+                pass
+
+
+def init_request_profiler(app, is_admin):
+    """Registrar hooks de profiling no app. ``is_admin`` decide quem pode ativar via header"""
+    app.config.setdefault('PROFILE_DIR', os.getenv('PROFILE_DIR', 'profiles'))
+    app.config.setdefault('PROFILE_SAMPLE_RATE', float(os.getenv('PROFILE_SAMPLE_RATE', '0') or 0))
+    app.config.setdefault('PROFILE_SAMPLE_INTERVAL', float(os.getenv('PROFILE_SAMPLE_INTERVAL', '0.005')))
+    app.config.setdefault('PROFILE_MAX_FILES', int(os.getenv('PROFILE_MAX_FILES', '200')))
+
+    @app.before_request
+    def _start_profiling():
+        if request.endpoint in SKIP_ENDPOINTS:
+            return
+        explicit = _requested_explicitly() and is_admin()
+        sampled = not explicit and random.random() < app.config['PROFILE_SAMPLE_RATE']
+        if not (explicit or sampled):
+            return
+
+        sampler = StackSampler(threading.get_ident(), app.config['PROFILE_SAMPLE_INTERVAL'])
+        sampler.start()
+        profiler = None
+        if explicit:
+            profiler = cProfile.Profile()
+            profiler.enable()
+        g._profile = {
+            'profiler': profiler,
+            'sampler': sampler,
+            'trigger': 'admin' if explicit else 'sample',
+            'started': time.perf_counter(),
+        }
+
+    @app.after_request
+    def _stop_profiling(response):
+        state = g.pop('_profile', None)
+        if not state:
+            return response
+
+        duration_ms = (time.perf_counter() - state['started']) * 1000
+        if state['profiler']:
+            state['profiler'].disable()
+        state['sampler'].stop()
+
+        try:
+            directory = _profile_dir(app)
+            profile_id = f"{datetime.now().strftime('%Y%m%d%H%M%S')}_{uuid.uuid4().hex[:8]}"
+            files = []
+
+            if state['profiler']:
+                state['profiler'].dump_stats(os.path.join(directory, f'{profile_id}.pstats'))
+                files.append('pstats')
+
+            with open(os.path.join(directory, f'{profile_id}.collapsed'), 'w', encoding='utf-8') as fh:
+                fh.write(state['sampler'].collapsed())
+            files.append('collapsed')
+
+            meta = {
+                'id': profile_id,
+                'endpoint': request.endpoint,
+                'method': request.method,
+                'path': request.full_path.rstrip('?'),
+                'user_id': session.get('user_id'),
+                'status': response.status_code,
+                'duration_ms': round(duration_ms, 2),
+                'samples': sum(state['sampler'].stacks.values()),
+                'trigger': state['trigger'],
+                'files': files,
+                'created_at': datetime.now().isoformat(timespec='seconds'),
+            }
+            with open(os.path.join(directory, f'{profile_id}.json'), 'w', encoding='utf-8') as fh:
+                json.dump(meta, fh)
+
+            _prune_old_profiles(directory, app.config['PROFILE_MAX_FILES'])
+            response.headers['X-Profile-Id'] = profile_id
+        except OSError as e:
+            app.logger.error(f"🚨 Erro ao salvar profile: {e}")
+
+        return response
+
+
+def list_profiles(directory, limit=100):
+    """Metadados dos perfis mais recentes primeiro"""
+    if not os.path.isdir(directory):
+        return []
+    profiles = []
+    for name in sorted(os.listdir(directory), reverse=True):
+        if not name.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(directory, name), encoding='utf-8') as fh:
+                profiles.append(json.load(fh))
+        except (OSError, ValueError):
+            continue
+        if len(profiles) >= limit:
+            break
+    return profiles
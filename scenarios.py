@@ -0,0 +1,296 @@
+# Cenários "e se" do planejamento (/api/v1/planning/scenarios) - FynanPro
+"""
+"E se eu cortar Alimentação em 20% e guardar R$ 500 por mês para a meta?"
+
+Um cenário é uma lista de ajustes aplicados juntos sobre a projeção de
+saldo (forecast.py). A projeção base e a do cenário saem do mesmo
+forecast_basis em cache - fatores por plano de contas e fluxos extras
+entram só na soma (project), sem reler o razão:
+
+    {"type": "category", "category": "Alimentação", "percent": -20}
+        (ou "chart_account_id": 12) escala agendados, recorrentes e a linha
+        de base do plano de contas e dos filhos pelo código (4.1 inclui 4.1.02)
+    {"type": "monthly", "amount": -300.00, "day": 10, "account_id": 1}
+        fluxo mensal novo a partir do próximo mês (negativo = saída)
+    {"type": "goal_contribution", "goal_id": 3, "amount": 500.00, "day": 5}
+        contribuição mensal para a meta: sai da conta e soma no guardado da meta
+    {"type": "one_time", "amount": -2000.00, "date": "2026-12-20", "account_id": 1}
+        lançamento avulso numa data
+
+Sem account_id, o fluxo sai da primeira conta do usuário. Cenários salvos
+(migração 012) guardam o último resultado com a versão dos dados usada; a
+leitura só recalcula quando a versão mudou.
+"""
+
+import json
+from datetime import date
+
+import numpy as np
+
+from analytics_cube import day_number
+from forecast import MAX_FORECAST_MONTHS, monthly_days, project
+from money import Money, to_cents
+
+ADJUSTMENT_TYPES = ('category', 'monthly', 'goal_contribution', 'one_time')
+MAX_ADJUSTMENTS = 20
+MAX_SCENARIOS_PER_USER = 50
+
+
+class ScenarioError(ValueError):
+    """Cenário inválido (ajuste desconhecido, valor fora do intervalo, conta/meta de outro usuário)"""
+
+
+def _amount_cents(adjustment, field='amount'):
+    try:
+        return to_cents(adjustment[field])
+    except (KeyError, TypeError, ValueError, ArithmeticError):
+        raise ScenarioError(f'{field} inválido no ajuste {adjustment.get("type")}.')
+
+
+def _day_of_month(adjustment):
+    try:
+        day = int(adjustment.get('day', 1))
+    except (TypeError, ValueError):
+        day = 0
+    if not 1 <= day <= 31:
+        raise ScenarioError('day deve ser um inteiro entre 1 e 31.')
+    return day
+
+
+def parse_scenario(body):
+    """(nome, meses, ajustes) validados a partir do JSON do cliente"""
+    if not isinstance(body, dict):
+        raise ScenarioError('Corpo JSON deve ser um objeto.')
+    try:
+        months = int(body.get('months', 12))
+    except (TypeError, ValueError):
+        months = 0
+    if not 1 <= months <= MAX_FORECAST_MONTHS:
+        raise ScenarioError(f'months deve ser um inteiro entre 1 e {MAX_FORECAST_MONTHS}.')
+
+    adjustments = body.get('adjustments')
+    if not isinstance(adjustments, list) or not adjustments:
+        raise ScenarioError('adjustments deve ser uma lista não vazia.')
+    if len(adjustments) > MAX_ADJUSTMENTS:
+        raise ScenarioError(f'No máximo {MAX_ADJUSTMENTS} ajustes por cenário.')
+
+    parsed = []
+    for adjustment in adjustments:
+        if not isinstance(adjustment, dict) or adjustment.get('type') not in ADJUSTMENT_TYPES:
+            raise ScenarioError(f'type deve ser um de: {", ".join(ADJUSTMENT_TYPES)}.')
+        kind = adjustment['type']
+        item = {'type': kind}
+        if adjustment.get('account_id') is not None:
+            item['account_id'] = adjustment['account_id']
+        if kind == 'category':
+            if adjustment.get('chart_account_id') is None and not adjustment.get('category'):
+                raise ScenarioError('Ajuste category precisa de category ou chart_account_id.')
+            try:
+                percent = float(adjustment['percent'])
+            except (KeyError, TypeError, ValueError):
+                raise ScenarioError('percent inválido no ajuste category.')
+            if not -100 <= percent <= 1000:
+                raise ScenarioError('percent deve estar entre -100 e 1000.')
+            item.update(percent=percent, category=adjustment.get('category'),
+                        chart_account_id=adjustment.get('chart_account_id'))
+        elif kind in ('monthly', 'goal_contribution'):
+            item.update(amount=Money(_amount_cents(adjustment)).to_float(), day=_day_of_month(adjustment))
+            if kind == 'goal_contribution':
+                if adjustment.get('goal_id') is None:
+                    raise ScenarioError('Ajuste goal_contribution precisa de goal_id.')
+                if item['amount'] <= 0:
+                    raise ScenarioError('amount da contribuição deve ser positivo.')
+                item['goal_id'] = adjustment['goal_id']
+        else:
+            try:
+                item['date'] = date.fromisoformat(str(adjustment.get('date'))).isoformat()
+            except ValueError:
+                raise ScenarioError('date deve estar no formato YYYY-MM-DD no ajuste one_time.')
+            item['amount'] = Money(_amount_cents(adjustment)).to_float()
+        parsed.append(item)
+
+    name = str(body.get('name') or '').strip()[:100]
+    return name, months, parsed
+
+
+def chart_factors(basis, adjustments):
+    """Multiplicador por código de plano de contas do basis (1 = sem ajuste)"""
+    factors = np.ones(len(basis['chart_ids']))
+    charts = basis['charts']
+    for adjustment in adjustments:
+        if adjustment['type'] != 'category':
+            continue
+        if adjustment.get('chart_account_id') is not None:
+            selected = charts.get(int(adjustment['chart_account_id']))
+        else:
+            wanted = adjustment['category'].strip().lower()
+            selected = next((chart for chart in charts.values() if chart['name'].strip().lower() == wanted), None)
+        if selected is None:
+            # Plano de contas sem lançamentos do usuário: nada a escalar
+            continue
+        prefix = f"{selected['code']}."
+        for code, chart_id in enumerate(basis['chart_ids']):
+            chart = charts.get(int(chart_id))
+            if chart and (chart['code'] == selected['code'] or str(chart['code']).startswith(prefix)):
+                factors[code] *= 1 + adjustment['percent'] / 100
+    return factors
+
+
+def extra_flows(basis, adjustments, default_row):
+    """Fluxos novos do cenário como eventos (linha da conta, dia, centavos)"""
+    rows, days, cents = [], [], []
+    for adjustment in adjustments:
+        if adjustment['type'] == 'category':
+            continue
+        row = default_row
+        if adjustment.get('account_id') is not None:
+            try:
+                row = basis['account_ids'].index(int(adjustment['account_id']))
+            except (ValueError, TypeError):
+                raise ScenarioError('Conta não encontrada.')
+        amount = to_cents(adjustment['amount'])
+        if adjustment['type'] == 'one_time':
+            when = [day_number(adjustment['date'])]
+        else:
+            when = monthly_days(basis['today'], basis['last'], adjustment['day'])
+            # Contribuição para a meta sai da conta
+            amount = -amount if adjustment['type'] == 'goal_contribution' else amount
+        rows.append(np.full(len(when), row))
+        days.append(np.asarray(when, dtype=np.int64))
+        cents.append(np.full(len(when), amount))
+    if not rows:
+        return {'account': np.zeros(0, dtype=np.int64), 'day': np.zeros(0, dtype=np.int64),
+                'cents': np.zeros(0, dtype=np.int64)}
+    return {'account': np.concatenate(rows).astype(np.int64), 'day': np.concatenate(days),
+            'cents': np.concatenate(cents).astype(np.int64)}
+
+
+def _goal_projection(adjustments, goals, today):
+    """Valor guardado de cada meta ajustada no prazo, com as contribuições do cenário"""
+    by_id = {goal['id']: goal for goal in goals}
+    results = {}
+    for adjustment in adjustments:
+        if adjustment['type'] != 'goal_contribution':
+            continue
+        goal = by_id.get(adjustment['goal_id'])
+        if goal is None:
+            raise ScenarioError('Meta não encontrada.')
+        entry = results.setdefault(goal['id'], {'goal': goal, 'monthly_cents': 0})
+        entry['monthly_cents'] += to_cents(adjustment['amount'])
+
+    projections = []
+    for entry in results.values():
+        goal = entry['goal']
+        target_date = goal['target_date']
+        months = 0
+        if target_date:
+            months = max(0, (int(target_date[:4]) - today.year) * 12 + int(target_date[5:7]) - today.month)
+        projected = goal['saved_cents'] + entry['monthly_cents'] * months
+        projections.append({
+            'id': goal['id'],
+            'name': goal['name'],
+            'target_amount': Money(goal['target_cents']).to_float(),
+            'saved_amount': Money(goal['saved_cents']).to_float(),
+            'target_date': target_date,
+            'monthly_contribution': Money(entry['monthly_cents']).to_float(),
+            'projected_amount': Money(projected).to_float(),
+            'reaches_target': projected >= goal['target_cents'],
+        })
+    return projections
+
+
+def _summary(result, in_total, dates):
+    total = result['balances'][in_total].sum(axis=0)
+    lowest = int(np.argmin(total))
+    return total, {
+        'total': (total / 100).tolist(),
+        'end_balance': Money(int(total[-1])).to_float(),
+        'lowest': {'balance': Money(int(total[lowest])).to_float(), 'date': dates[lowest]},
+        'components': {name: Money(int(values[in_total].sum())).to_float()
+                       for name, values in result['components'].items()},
+    }
+
+
+def evaluate(basis, accounts, adjustments, months, goals=()):
+    """
+    Projeção base x cenário das contas (dicts de get_user_accounts): séries
+    do total, diferença dia a dia, saldos finais por conta e metas ajustadas.
+    """
+    if not accounts:
+        raise ScenarioError('Nenhuma conta ativa para projetar.')
+    rows = [basis['account_ids'].index(acc['id']) for acc in accounts]
+    extra = extra_flows(basis, adjustments, rows[0])
+    base = project(basis, months, rows)
+    scenario = project(basis, months, rows, chart_factors(basis, adjustments), extra)
+
+    dates = np.datetime_as_string(base['days'].astype('datetime64[D]')).tolist()
+    in_total = np.array([acc.get('include_in_total') != 0 for acc in accounts], dtype=bool)
+    base_total, base_summary = _summary(base, in_total, dates)
+    scenario_total, scenario_summary = _summary(scenario, in_total, dates)
+    return {
+        'months': months,
+        'start': dates[0],
+        'end': dates[-1],
+        'dates': dates,
+        'baseline': base_summary,
+        'scenario': scenario_summary,
+        'difference': ((scenario_total - base_total) / 100).tolist(),
+        'accounts': [{'id': acc['id'], 'name': acc['name'],
+                      'baseline_end': Money(int(base['balances'][i, -1])).to_float(),
+                      'scenario_end': Money(int(scenario['balances'][i, -1])).to_float()}
+                     for i, acc in enumerate(accounts)],
+        'goals': _goal_projection(adjustments, goals, basis['today']),
+    }
+
+
+# ----- cenários salvos (planning_scenarios, migração 012) -----
+def list_scenarios(conn, user_id):
+    return [{'id': row[0], 'name': row[1], 'months': row[2], 'adjustments': json.loads(row[3]),
+             'created_at': row[4], 'updated_at': row[5]}
+            for row in conn.execute('''
+                SELECT id, name, months, adjustments, created_at, updated_at
+                FROM planning_scenarios WHERE user_id = ? ORDER BY id
+            ''', (user_id,))]
+
+
+def create_scenario(conn, user_id, name, months, adjustments, version, result):
+    count = conn.execute('SELECT COUNT(*) FROM planning_scenarios WHERE user_id = ?', (user_id,)).fetchone()[0]
+    if count >= MAX_SCENARIOS_PER_USER:
+        raise ScenarioError(f'Limite de {MAX_SCENARIOS_PER_USER} cenários salvos atingido.')
+    cursor = conn.execute('''
+        INSERT INTO planning_scenarios (user_id, name, months, adjustments, result, result_version)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', (user_id, name or 'Cenário', months, json.dumps(adjustments, ensure_ascii=False),
+          json.dumps(result), version))
+    return cursor.lastrowid
+
+
+def get_scenario(conn, user_id, scenario_id):
+    row = conn.execute('''
+        SELECT id, name, months, adjustments, result, result_version, created_at, updated_at
+        FROM planning_scenarios WHERE id = ? AND user_id = ?
+    ''', (scenario_id, user_id)).fetchone()
+    if row is None:
+        return None
+    return {'id': row[0], 'name': row[1], 'months': row[2], 'adjustments': json.loads(row[3]),
+            'result': json.loads(row[4]) if row[4] else None, 'result_version': row[5],
+            'created_at': row[6], 'updated_at': row[7]}
+
+
+def store_result(conn, scenario_id, version, result):
+    conn.execute('''
+        UPDATE planning_scenarios SET result = ?, result_version = ?, updated_at = CURRENT_TIMESTAMP
+        WHERE id = ?
+    ''', (json.dumps(result), version, scenario_id))
+
+
+def delete_scenario(conn, user_id, scenario_id):
+    return conn.execute('DELETE FROM planning_scenarios WHERE id = ? AND user_id = ?',
+                        (scenario_id, user_id)).rowcount > 0
+
+
+def data_version_key(version, today):
+    """Versão (goal_simulator.data_version) + dia como texto gravável; None sem versão"""
+    if version is None:
+        return None
+    return ':'.join(str(part) for part in version + (today.isoformat(),))
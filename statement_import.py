@@ -0,0 +1,455 @@
+#!/usr/bin/env python3
+"""
+Importação de extratos bancários (CSV/OFX) - FynanPro
+
+O arquivo é lido linha a linha (nunca inteiro em memória), cada linha é
+normalizada (data ISO, valor em centavos, receita/despesa pelo sinal) e as
+transações são gravadas via executemany em lotes, um commit por lote. O
+saldo de cada conta tocada é recalculado uma única vez, no final, assim
+como os checkpoints de saldo (balance_checkpoints.DeferredSnapshots). Linhas
+que já existem na conta (mesma impressão digital, dedup.py) são puladas.
+Com as regras do usuário (categorization.RuleSet), cada linha já entra
+com a categoria da primeira regra que casar; as que ficarem sem categoria
+trazem no resumo as sugestões do modelo aprendido (category_model.py).
+Cada descrição também é mapeada para o estabelecimento normalizado
+(merchants.py), um intern por lote.
+
+O progresso fica na tabela import_batches (migração 006), atualizada a cada
+lote, para que /transactions/import/status possa ser consultado enquanto um
+arquivo grande (100k+ linhas) ainda está sendo processado.
+
+Exemplos:
+    python statement_import.py extrato.csv --user-id 1 --account-id 2
+    python statement_import.py extrato.ofx --db bench.db --user-id 1 --account-id 2
+"""
+
+import argparse
+import csv
+import json
+import logging
+import os
+import re
+import sqlite3
+import sys
+import time
+import unicodedata
+from collections import namedtuple
+from datetime import datetime
+from functools import lru_cache
+
+from balance_checkpoints import DeferredSnapshots
+from dedup import DuplicateCounter, backfill_fingerprints, fingerprint
+from merchants import intern_merchants
+from money import to_cents
+
+DEFAULT_BATCH_SIZE = 5000
+PROGRESS_EVERY = 10000
+MAX_STORED_ERRORS = 20
+MAX_SUGGESTED_DESCRIPTIONS = 20
+
+# Uma linha do extrato já normalizada; error preenchido quando a linha foi rejeitada
+ImportRecord = namedtuple('ImportRecord', 'line date description cents transaction_type reference error')
+
+# Cabeçalhos aceitos no CSV (normalizados: minúsculas, sem acento)
+CSV_COLUMN_ALIASES = {
+    'date': ('data', 'date', 'dt', 'data lancamento', 'data do lancamento', 'data movimento'),
+    'description': ('descricao', 'description', 'historico', 'lancamento', 'memo', 'estabelecimento'),
+    'amount': ('valor', 'amount', 'value', 'valor (r$)', 'valor r$'),
+    'type': ('tipo', 'type', 'natureza'),
+}
+
+CREDIT_TYPES = {'receita', 'credito', 'credit', 'c', 'entrada'}
+DEBIT_TYPES = {'despesa', 'debito', 'debit', 'd', 'saida'}
+
+_OFX_TAG = re.compile(r'<(/?)([A-Za-z0-9.]+)>([^<]*)')
+
+logger = logging.getLogger(__name__)
+
+
+class StatementImportError(ValueError):
+    """Arquivo de extrato inválido (formato, cabeçalho ou conta)"""
+
+
+def detect_format(filename):
+    """'ofx' para .ofx/.qfx, senão 'csv'"""
+    extension = os.path.splitext(filename or '')[1].lower()
+    return 'ofx' if extension in ('.ofx', '.qfx') else 'csv'
+
+
+def parse_amount(text, decimal_separator=','):
+    """'R$ -1.234,56' / '(12,50)' / '1,234.56' -> centavos (int)"""
+    text = text.strip().replace('R$', '').replace(' ', '').replace('\xa0', '')
+    negative = text.startswith('(') and text.endswith(')')
+    if negative:
+        text = text[1:-1]
+    if decimal_separator == ',':
+        text = text.replace('.', '').replace(',', '.')
+    else:
+        text = text.replace(',', '')
+    cents = to_cents(text)
+    return -cents if negative else cents
+
+
+@lru_cache(maxsize=4096)
+def parse_date(text, date_format='%d/%m/%Y'):
+    """Data no formato informado -> 'AAAA-MM-DD' (extratos repetem poucas datas: strptime em cache)"""
+    return datetime.strptime(text.strip(), date_format).date().isoformat()
+
+
+def _normalize_header(name):
+    name = unicodedata.normalize('NFKD', name.strip().lower())
+    return ''.join(ch for ch in name if not unicodedata.combining(ch))
+
+
+def _classify(cents, type_text=None):
+    """(valor absoluto em centavos, receita|despesa); coluna de tipo tem precedência sobre o sinal"""
+    if type_text:
+        kind = _normalize_header(type_text)
+        if kind in CREDIT_TYPES:
+            return abs(cents), 'receita'
+        if kind in DEBIT_TYPES:
+            return abs(cents), 'despesa'
+    return abs(cents), ('despesa' if cents < 0 else 'receita')
+
+
+class LineSource:
+    """Itera as linhas de um arquivo binário contando os bytes lidos (progresso)"""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.bytes_read = 0
+
+    def __iter__(self):
+        first = True
+        for raw in self.stream:
+            self.bytes_read += len(raw)
+            if first:
+                raw = raw[3:] if raw.startswith(b'\xef\xbb\xbf') else raw
+                first = False
+            try:
+                yield raw.decode('utf-8')
+            except UnicodeDecodeError:
+                # Extratos de bancos brasileiros costumam vir em Windows-1252
+                yield raw.decode('cp1252', errors='replace')
+
+
+def iter_csv(lines, date_format='%d/%m/%Y', decimal_separator=',', has_header=True):
+    """Gera ImportRecord a partir de linhas CSV (separador ; , ou tab detectado na 1ª linha)"""
+    lines = iter(lines)
+    first_line = next(lines, None)
+    if first_line is None:
+        return
+    delimiter = max((';', '\t', ','), key=first_line.count)
+
+    def all_lines():
+        yield first_line
+        yield from lines
+
+    reader = csv.reader(all_lines(), delimiter=delimiter)
+    positions = {'date': 0, 'description': 1, 'amount': 2, 'type': None}
+    if has_header:
+        header = [_normalize_header(name) for name in next(reader, [])]
+        positions = {field: next((i for i, name in enumerate(header) if name in aliases), None)
+                     for field, aliases in CSV_COLUMN_ALIASES.items()}
+        missing = [field for field in ('date', 'description', 'amount') if positions[field] is None]
+        if missing:
+            raise StatementImportError(f"Cabeçalho do CSV sem coluna(s): {', '.join(missing)}")
+
+    for row in reader:
+        line = reader.line_num
+        if not any(cell.strip() for cell in row):
+            continue
+        try:
+            cents, transaction_type = _classify(
+                parse_amount(row[positions['amount']], decimal_separator),
+                row[positions['type']] if positions['type'] is not None else None)
+            description = row[positions['description']].strip()
+            if not description:
+                raise ValueError("descrição vazia")
+            yield ImportRecord(line, parse_date(row[positions['date']], date_format),
+                               description, cents, transaction_type, None, None)
+        except (ValueError, IndexError) as e:
+            yield ImportRecord(line, None, None, None, None, None, str(e) or 'coluna ausente')
+
+
+def iter_ofx(lines):
+    """Gera ImportRecord a partir de blocos <STMTTRN> de um OFX (SGML 1.x ou XML 2.x)"""
+    current = None
+    for line_number, text in enumerate(lines, 1):
+        for closing, tag, value in _OFX_TAG.findall(text):
+            tag = tag.upper()
+            if tag == 'STMTTRN':
+                if not closing:
+                    current = {'line': line_number}
+                    continue
+                if current is not None:
+                    yield _ofx_record(current)
+                current = None
+            elif current is not None and not closing:
+                current[tag] = value.strip()
+
+
+def _ofx_record(fields):
+    line = fields['line']
+    try:
+        posted = fields.get('DTPOSTED', '')
+        date = parse_date(posted[:8], '%Y%m%d')
+        amount = fields.get('TRNAMT', '')
+        # Alguns bancos exportam TRNAMT com vírgula decimal
+        separator = ',' if ',' in amount and '.' not in amount else '.'
+        cents, transaction_type = _classify(parse_amount(amount, separator))
+        description = fields.get('MEMO') or fields.get('NAME') or fields.get('PAYEE') or ''
+        if not description:
+            raise ValueError("descrição vazia")
+        return ImportRecord(line, date, description, cents, transaction_type, fields.get('FITID'), None)
+    except ValueError as e:
+        return ImportRecord(line, None, None, None, None, None, str(e))
+
+
+class StatementImporter:
+    """Importa um extrato para uma conta do usuário em lotes (executemany)"""
+
+    def __init__(self, conn, user_id, account_id, update_balance, skip_duplicates=True,
+                 batch_size=DEFAULT_BATCH_SIZE, progress_every=PROGRESS_EVERY, on_progress=None,
+                 rules=None, suggest=None):
+        self.conn = conn
+        self.user_id = user_id
+        self.account_id = account_id
+        self.update_balance = update_balance  # (conn, account_id) -> None, ex.: update_account_balance
+        self.skip_duplicates = skip_duplicates
+        self.batch_size = batch_size
+        self.progress_every = progress_every
+        self.on_progress = on_progress
+        self.batch_id = None
+        self.accounts = {account_id}
+        self.lines_read = 0
+        self.inserted = 0
+        self.errors = []
+        self.error_count = 0
+        self.duplicates = 0
+        self.categorized = 0
+        self.suggest = suggest  # (descrição, tipo) -> sugestões de categoria, ex.: modelo do usuário
+        self.suggestions = {}
+        self._duplicates = None
+
+        self.columns = columns = {row[1] for row in conn.execute('PRAGMA table_info(transactions)').fetchall()}
+        type_column = 'type' if 'type' in columns else 'transaction_type'
+        names = ['description', 'amount', 'date', type_column, 'account_id',
+                 'created_by_import', 'import_batch_id']
+        self._extras = [name for name in ('amount_cents', 'user_id', 'reference', 'fingerprint', 'merchant_id')
+                        if name in columns]
+        self._merchant_ids = {}
+        self.skip_duplicates = skip_duplicates and 'fingerprint' in columns
+        self.rules = rules if rules and 'category' in columns else None
+        if self.rules is not None:
+            self._extras.append('category')
+        names += self._extras
+        self.insert_sql = (f"INSERT INTO transactions ({', '.join(names)}) "
+                           f"VALUES ({', '.join('?' * len(names))})")
+        self.snapshots = DeferredSnapshots(conn, type_column, columns)
+
+    def _row(self, record, record_fingerprint):
+        values = [record.description, record.cents / 100, record.date, record.transaction_type,
+                  self.account_id, 1, self.batch_id]
+        extras = {'amount_cents': record.cents, 'user_id': self.user_id, 'reference': record.reference,
+                  'fingerprint': record_fingerprint, 'merchant_id': self._merchant_ids.get(record.description)}
+        rule = None
+        if self.rules is not None:
+            rule = self.rules.match(record.description, record.cents, self.account_id, record.transaction_type)
+            extras['category'] = rule.category_id if rule else None
+            self.categorized += rule is not None
+        if rule is None and self.suggest is not None:
+            self._suggest(record)
+        return values + [extras[name] for name in self._extras]
+
+    def _suggest(self, record):
+        """Sugestões para as primeiras descrições distintas que entraram sem categoria"""
+        if len(self.suggestions) >= MAX_SUGGESTED_DESCRIPTIONS or record.description in self.suggestions:
+            return
+        self.suggestions[record.description] = self.suggest(record.description, record.transaction_type)
+
+    def _new_rows(self, records):
+        """Linhas a inserir de um lote, sem as duplicatas exatas (dedup.DuplicateCounter)"""
+        fingerprints = [fingerprint(self.account_id, r.date, r.transaction_type, r.cents, r.description)
+                        for r in records]
+        if 'merchant_id' in self._extras:
+            # Extratos repetem descrições: só as ainda não vistas nesta importação vão ao banco
+            unseen = {r.description for r in records} - self._merchant_ids.keys()
+            if unseen:
+                self._merchant_ids.update(intern_merchants(self.conn, unseen))
+        if not self.skip_duplicates:
+            return [self._row(r, fp) for r, fp in zip(records, fingerprints)]
+
+        if self._duplicates is None:
+            self._duplicates = DuplicateCounter(self.conn, exclude_import_batch=self.batch_id)
+        self._duplicates.prefetch(fingerprints)
+        rows = []
+        for record, fp in zip(records, fingerprints):
+            if self._duplicates.is_duplicate(fp):
+                self.duplicates += 1
+                continue
+            rows.append(self._row(record, fp))
+        return rows
+
+    def run(self, stream, file_format='csv', filename=None, total_bytes=None,
+            date_format='%d/%m/%Y', decimal_separator=',', has_header=True):
+        """Processa o arquivo binário `stream` e devolve o resumo da importação"""
+        started = time.perf_counter()
+        source = LineSource(stream)
+        if file_format == 'ofx':
+            records = iter_ofx(source)
+        else:
+            records = iter_csv(source, date_format, decimal_separator, has_header)
+
+        owner = self.conn.execute('SELECT id FROM accounts WHERE id = ? AND user_id = ?',
+                                  (self.account_id, self.user_id)).fetchone()
+        if not owner:
+            raise StatementImportError('Conta selecionada não encontrada.')
+
+        if self.skip_duplicates:
+            # Linhas legadas da conta precisam da impressão digital para a comparação exata
+            backfill_fingerprints(self.conn, [self.account_id], self.columns)
+
+        self.batch_id = self.conn.execute('''
+            INSERT INTO import_batches (user_id, account_id, filename, file_format, total_bytes)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (self.user_id, self.account_id, filename, file_format, total_bytes)).lastrowid
+        self.conn.commit()
+        logger.info("📥 Importação %s iniciada: %s (%s)", self.batch_id, filename or '-', file_format)
+
+        batch = []
+        try:
+            for record in records:
+                self.lines_read += 1
+                if record.error:
+                    self.error_count += 1
+                    if len(self.errors) < MAX_STORED_ERRORS:
+                        self.errors.append(f"Linha {record.line}: {record.error}")
+                else:
+                    batch.append(record)
+                    if len(batch) >= self.batch_size:
+                        self._flush(batch, source)
+                        batch = []
+                if self.lines_read % self.progress_every == 0:
+                    self._report(source, total_bytes)
+            self._flush(batch, source)
+
+            # Saldo e checkpoints recalculados uma vez por conta, não por transação
+            self.snapshots.rebuild()
+            for account_id in self.accounts:
+                self.update_balance(self.conn, account_id)
+            self._set_status('completed', source)
+            self.conn.commit()
+        except Exception as e:
+            self.conn.rollback()
+            self._abort(source, e)
+            raise
+
+        summary = self.summary()
+        summary['seconds'] = round(time.perf_counter() - started, 3)
+        logger.info("✅ Importação %s concluída: %s inseridas, %s duplicadas, %s rejeitadas em %.2fs",
+                    self.batch_id, self.inserted, self.duplicates, self.error_count, summary['seconds'])
+        return summary
+
+    def _flush(self, batch, source):
+        """Grava um lote e o progresso na mesma transação"""
+        rows = self._new_rows(batch) if batch else []
+        if rows:
+            self.snapshots.suspend()
+            self.conn.executemany(self.insert_sql, rows)
+            self.snapshots.resume()
+            self.snapshots.touch(self.account_id, min(row[2] for row in rows))
+            self.inserted += len(rows)
+        self._set_status('processing', source)
+        self.conn.commit()
+
+    def _set_status(self, status, source):
+        finished = "CURRENT_TIMESTAMP" if status != 'processing' else "NULL"
+        self.conn.execute(f'''
+            UPDATE import_batches
+            SET status = ?, bytes_read = ?, lines_read = ?, inserted_count = ?, duplicate_count = ?,
+                error_count = ?, errors = ?, finished_at = {finished}
+            WHERE id = ?
+        ''', (status, source.bytes_read, self.lines_read, self.inserted, self.duplicates, self.error_count,
+              json.dumps(self.errors, ensure_ascii=False), self.batch_id))
+
+    def _abort(self, source, error):
+        """Desfaz os lotes já gravados e marca a importação como falha"""
+        logger.error("🚨 Importação %s falhou na linha %s: %s", self.batch_id, self.lines_read, error)
+        self.snapshots.suspend()
+        self.conn.execute('DELETE FROM transactions WHERE import_batch_id = ?', (self.batch_id,))
+        self.snapshots.resume()
+        self.snapshots.rebuild()
+        for account_id in self.accounts:
+            self.update_balance(self.conn, account_id)
+        self.inserted = 0
+        self.categorized = 0
+        self.errors.append(f"Falha: {error}")
+        self._set_status('failed', source)
+        self.conn.commit()
+
+    def _report(self, source, total_bytes):
+        percent = round(100 * source.bytes_read / total_bytes, 1) if total_bytes else None
+        logger.info("📥 Importação %s: %s linhas lidas, %s inseridas%s", self.batch_id,
+                    self.lines_read, self.inserted, f" ({percent}%)" if percent is not None else '')
+        if self.on_progress:
+            self.on_progress(self.summary(), percent)
+
+    def summary(self):
+        return {
+            'import_id': self.batch_id,
+            'lines_read': self.lines_read,
+            'inserted': self.inserted,
+            'duplicates': self.duplicates,
+            'categorized': self.categorized,
+            'suggestions': [{'description': description, 'suggestions': suggestions}
+                            for description, suggestions in self.suggestions.items() if suggestions],
+            'error_count': self.error_count,
+            'errors': list(self.errors),
+        }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Importar extrato CSV/OFX no FynanPro')
+    parser.add_argument('file', help='arquivo .csv, .ofx ou .qfx')
+    parser.add_argument('--db', default='finance_planner_saas.db')
+    parser.add_argument('--user-id', type=int, required=True)
+    parser.add_argument('--account-id', type=int, required=True)
+    parser.add_argument('--format', choices=['csv', 'ofx'], help='padrão: pela extensão do arquivo')
+    parser.add_argument('--date-format', default='%d/%m/%Y')
+    parser.add_argument('--decimal-separator', default=',', choices=[',', '.'])
+    parser.add_argument('--no-header', action='store_true', help='CSV sem cabeçalho (data;descrição;valor)')
+    parser.add_argument('--allow-duplicates', action='store_true',
+                        help='inserir também linhas que já existem na conta (mesma impressão digital)')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    from app_simple_advanced import app, update_account_balance
+    from categorization import rule_set
+    app.config['DATABASE'] = args.db
+
+    conn = sqlite3.connect(args.db)
+    conn.row_factory = sqlite3.Row
+    try:
+        with app.app_context(), open(args.file, 'rb') as stream:
+            importer = StatementImporter(conn, args.user_id, args.account_id, update_account_balance,
+                                         skip_duplicates=not args.allow_duplicates,
+                                         batch_size=args.batch_size, rules=rule_set(conn, args.user_id))
+            summary = importer.run(stream, args.format or detect_format(args.file),
+                                   filename=os.path.basename(args.file),
+                                   total_bytes=os.path.getsize(args.file),
+                                   date_format=args.date_format,
+                                   decimal_separator=args.decimal_separator,
+                                   has_header=not args.no_header)
+    except StatementImportError as e:
+        print(f"❌ {e}")
+        return 1
+    finally:
+        conn.close()
+    print(f"📊 Resumo: {summary}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
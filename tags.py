@@ -0,0 +1,58 @@
+# Tags das transações (filtros e /reports/tags) - FynanPro
+"""
+transactions.tags continua guardando o texto digitado ('viagem, trabalho');
+os triggers da migração 014 mantêm o índice normalizado:
+
+    tags(id, user_id, name COLLATE NOCASE)      uma linha por tag do usuário
+    transaction_tags(tag_id, transaction_id)     chave (tag, transação) + índice inverso
+
+Filtrar por tag vira busca na chave única (user_id, name) e na chave
+primária do vínculo - sem LIKE '%tag%' (que casa 'trabalho' com
+'trabalho-extra'). Os totais por tag saem de uma consulta agrupada.
+"""
+
+from money import Money, cents_sql
+
+MAX_TAG_LENGTH = 50
+TAG_SEPARATOR = ','
+
+
+def normalize_tags(text):
+    """'Viagem, trabalho,,viagem ' -> 'Viagem,trabalho' (sem vazias nem repetidas; None se nada sobrar)"""
+    seen, names = set(), []
+    for name in str(text or '').replace('\n', TAG_SEPARATOR).split(TAG_SEPARATOR):
+        name = name.strip()[:MAX_TAG_LENGTH]
+        if name and name.lower() not in seen:
+            seen.add(name.lower())
+            names.append(name)
+    return TAG_SEPARATOR.join(names) or None
+
+
+def tag_filter_sql(alias='t'):
+    """Condição 'transação tem a tag' para WHERE; parâmetros: (user_id, nome da tag)"""
+    return f'''{alias}.id IN (
+            SELECT tt.transaction_id FROM tags tg
+            JOIN transaction_tags tt ON tt.tag_id = tg.id
+            WHERE tg.user_id = ? AND tg.name = ?)'''
+
+
+def tag_totals(conn, user_id, type_column, columns, start_date, end_date):
+    """
+    Receitas, despesas, saldo e quantidade de lançamentos confirmados por tag
+    no período, por despesa decrescente (uma transação conta em cada tag sua).
+    """
+    amount = cents_sql('amount', 't', columns)
+    rows = conn.execute(f'''
+        SELECT tg.id, tg.name, COUNT(*),
+               COALESCE(SUM(CASE WHEN t.{type_column} = 'receita' THEN {amount} END), 0),
+               COALESCE(SUM(CASE WHEN t.{type_column} = 'despesa' THEN {amount} END), 0)
+        FROM tags tg
+        JOIN transaction_tags tt ON tt.tag_id = tg.id
+        JOIN transactions t ON t.id = tt.transaction_id
+        WHERE tg.user_id = ? AND t.is_confirmed = 1 AND DATE(t.date) BETWEEN ? AND ?
+        GROUP BY tg.id
+        ORDER BY 5 DESC, tg.name
+    ''', (user_id, start_date, end_date)).fetchall()
+    return [{'id': row[0], 'name': row[1], 'quantity': row[2],
+             'income': Money(row[3]).to_float(), 'expenses': Money(row[4]).to_float(),
+             'net': Money(row[3] - row[4]).to_float()} for row in rows]
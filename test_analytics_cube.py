@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Testes do cubo analítico NumPy dos relatórios (analytics_cube.py)
+"""
+
+import os
+from datetime import date, timedelta
+
+import numpy as np
+import pytest
+
+from analytics_cube import CubeCache, LedgerCube, init_analytics, snapshot_store
+from query_budget import count_queries
+
+pytestmark = pytest.mark.dataset(users=2, accounts_per_user=2, years=2, tx_per_month=10, seed=41)
+
+@pytest.fixture
+def analytics(app):
+    """Cache de cubos do app, esvaziado no fim para não vazar para o próximo teste"""
+    cache = init_analytics(app)
+    yield cache
+    cache.clear()
+
+def _cube(conn, user_id=1):
+    columns = [row[1] for row in conn.execute('PRAGMA table_info(transactions)')]
+    return LedgerCube.load(conn, user_id, 'transaction_type', columns)
+
+def _close(a, b):
+    return abs(a - b) < 0.005
+
+def test_cube_matches_sql_aggregates(dataset_db, connect):
+    """Teste: agrupamentos do cubo iguais às consultas SQL que os relatórios usavam"""
+    with connect() as conn:
+        cube = _cube(conn)
+        start = (date.today() - timedelta(days=365)).isoformat()
+
+        expected = conn.execute('''
+            SELECT strftime('%Y-%m', t.date) AS mes,
+                   COALESCE(SUM(CASE WHEN t.transaction_type = 'receita' AND t.is_confirmed = 1 THEN t.amount ELSE 0 END), 0),
+                   COALESCE(SUM(CASE WHEN t.transaction_type = 'despesa' AND t.is_confirmed = 1 THEN t.amount ELSE 0 END), 0),
+                   COUNT(CASE WHEN t.transaction_type = 'receita' THEN 1 END),
+                   COUNT(CASE WHEN t.transaction_type = 'despesa' THEN 1 END)
+            FROM transactions t JOIN accounts a ON t.account_id = a.id
+            WHERE a.user_id = 1 AND t.date >= ? GROUP BY mes ORDER BY mes''', (start,)).fetchall()
+        flow = cube.monthly_flow(cube.mask(start=start))
+        assert [row['mes'] for row in flow] == [row[0] for row in expected]
+        for row, (_, income, expenses, n_income, n_expenses) in zip(flow, expected):
+            assert _close(row['receitas'], income) and _close(row['despesas'], expenses)
+            assert (row['qtd_receitas'], row['qtd_despesas']) == (n_income, n_expenses)
+
+        expected = conn.execute('''
+            SELECT c.name, SUM(t.amount), COUNT(t.id) FROM chart_of_accounts c
+            JOIN transactions t ON c.id = t.chart_account_id JOIN accounts a ON t.account_id = a.id
+            WHERE a.user_id = 1 AND t.transaction_type = 'despesa' AND t.is_confirmed = 1 AND t.date >= ?
+              AND c.account_type = 'despesa' AND c.is_active = 1 AND c.is_summary = 0
+            GROUP BY c.id ORDER BY SUM(t.amount) DESC LIMIT 20''', (start,)).fetchall()
+        top = cube.top_categories(cube.mask(start=start, kind='despesa', confirmed=True), 20,
+                                  chart_filter=lambda c: c['account_type'] == 'despesa' and not c['is_summary'])
+        assert [row['categoria'] for row in top] == [row[0] for row in expected]
+        assert all(_close(row['total'], exp[1]) and row['qtd_transacoes'] == exp[2] for row, exp in zip(top, expected))
+
+        expected = conn.execute('''
+            SELECT CAST(strftime('%m', t.date) AS INTEGER),
+                   COALESCE(AVG(CASE WHEN t.transaction_type = 'receita' THEN t.amount END), 0),
+                   COALESCE(AVG(CASE WHEN t.transaction_type = 'despesa' THEN t.amount END), 0)
+            FROM transactions t JOIN accounts a ON t.account_id = a.id
+            WHERE a.user_id = 1 AND t.is_confirmed = 1 GROUP BY strftime('%m', t.date) ORDER BY 1''').fetchall()
+        season = cube.seasonality(cube.mask(confirmed=True))
+        assert [row['mes_numero'] for row in season] == [row[0] for row in expected]
+        assert all(_close(row['receita_media'], exp[1]) and _close(row['despesa_media'], exp[2])
+                   for row, exp in zip(season, expected))
+
+        account_only = cube.monthly_flow(cube.mask(account_id=1))
+        total = conn.execute('''SELECT SUM(amount) FROM transactions
+                                WHERE account_id = 1 AND transaction_type = 'despesa' AND is_confirmed = 1''').fetchone()[0]
+        assert _close(sum(row['despesas'] for row in account_only), total)
+        assert not cube.mask(account_id=3).any()  # conta de outro usuário não está no cubo
+
+def test_reports_reuse_cached_cube(dataset_db, analytics, client_for):
+    """Teste: trocar filtros dos relatórios não volta ao SQLite; escrita invalida; LRU limita usuários"""
+    client = client_for(1)
+    assert client.get('/reports/trends').status_code == 200
+    with count_queries() as counter:
+        for url in ('/reports/categories?transaction_type=receita&start_date=2020-01-01&end_date=2030-01-01',
+                    '/reports/trends', '/reports/cash_flow?account_id=1'):
+            assert client.get(url).status_code == 200
+    # Cada página: usuário + seq + contas ativas (filtro/menu); nenhuma agregação no SQLite
+    assert counter.count == 3 * 3
+
+    client.post('/transactions/new', json={'description': 'Nova despesa', 'amount': '10.00',
+                                           'date': date.today().isoformat(), 'transaction_type': 'despesa',
+                                           'account_id': 1, 'category_id': 3})
+    with count_queries() as counter:
+        client.get('/reports/trends')
+    assert counter.count == 5  # versão mudou: recarrega razão + plano de contas
+
+    cache = CubeCache(maxsize=2)
+    loads = []
+    for key in ('a', 'b', 'a', 'c', 'b'):
+        cache.get(key, 1, lambda: loads.append(key) or key)
+    assert loads == ['a', 'b', 'c', 'b'] and len(cache) == 2  # 'b' saiu quando 'c' entrou
+    assert cache.get('x', None, lambda: 'sem versão') == 'sem versão' and len(cache) == 2
+
+def test_snapshot_shared_between_workers(app, dataset_db, analytics, tmp_path, connect, client_for):
+    """Teste: snapshot mapeado em disco serve outro worker; escrita publica nova versão e apaga a antiga"""
+    with connect() as conn:
+        cube = _cube(conn)
+    path = str(tmp_path / 'roundtrip.cube')
+    cube.save(path, user_id=1, version=7)
+    mapped, header = LedgerCube.open(path)
+    assert header['version'] == 7 and len(mapped) == len(cube) and mapped.charts == cube.charts
+    for name in ('day', 'cents', 'kind', 'confirmed', 'recurring', 'account', 'chart', 'month', 'account_ids', 'chart_ids'):
+        assert isinstance(getattr(mapped, name), np.memmap) or len(getattr(mapped, name)) == 0
+        assert np.array_equal(getattr(mapped, name), getattr(cube, name))
+    assert mapped.monthly_flow(mapped.mask()) == cube.monthly_flow(cube.mask())
+
+    client = client_for(1)
+    html = client.get('/reports/categories').get_data(as_text=True)
+    store = snapshot_store(app.config['DATABASE'])
+    published = [name for name in os.listdir(store.directory) if name.endswith('.cube')]
+    assert len(published) == 1
+
+    analytics.clear()  # outro worker: LRU vazio, mesmo diretório
+    with count_queries() as counter:
+        assert client.get('/reports/categories').get_data(as_text=True) == html
+    assert counter.count == 3  # razão veio do snapshot, não do SQLite
+
+    client.post('/transactions/new', json={'description': 'Nova receita', 'amount': '10.00',
+                                           'date': date.today().isoformat(), 'transaction_type': 'receita',
+                                           'account_id': 1, 'category_id': 1})
+    client.get('/reports/categories')
+    current = [name for name in os.listdir(store.directory) if name.endswith('.cube')]
+    assert len(current) == 1 and current != published
+
+    with open(os.path.join(store.directory, current[0]), 'r+b') as f:
+        f.write(b'lixo')  # snapshot inválido: reconstruído a partir do SQLite
+    analytics.clear()
+    with count_queries() as counter:
+        assert client.get('/reports/categories').status_code == 200
+    assert counter.count == 5
+    assert LedgerCube.open(os.path.join(store.directory, current[0])) is not None
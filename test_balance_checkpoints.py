@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+Testes do saldo corrido e do saldo em uma data (balance_checkpoints.py, migrações 010 e 011)
+"""
+
+import csv
+import io
+import re
+import sqlite3
+from datetime import date, timedelta
+
+import pytest
+
+from app_simple_advanced import app
+
+SIGN = {'receita': 1, 'despesa': -1, 'transferencia': 1}
+
+pytestmark = pytest.mark.dataset(users=2, accounts_per_user=2, years=1, tx_per_month=8, seed=39)
+
+def _expected():
+    """Recalcula tudo do zero: (checkpoints {(conta, mês): centavos}, saldo após cada linha {id: centavos})"""
+    with sqlite3.connect(app.config['DATABASE']) as conn:
+        rows = conn.execute('''
+            SELECT id, account_id, date, transaction_type, amount_cents FROM transactions
+            ORDER BY account_id, DATE(date), id
+        ''').fetchall()
+    checkpoints, after, running = {}, {}, {}
+    for tx_id, account_id, tx_date, tx_type, cents in rows:
+        running[account_id] = running.get(account_id, 0) + SIGN.get(tx_type, 0) * cents
+        after[tx_id] = running[account_id]
+        checkpoints[(account_id, tx_date[:7])] = running[account_id]
+    return checkpoints, after
+
+def _expected_days():
+    """{(conta, dia): centavos} ao fim de cada dia com movimento, recalculado do zero"""
+    with sqlite3.connect(app.config['DATABASE']) as conn:
+        rows = conn.execute('''
+            SELECT account_id, DATE(date), transaction_type, amount_cents FROM transactions
+            ORDER BY account_id, DATE(date), id
+        ''').fetchall()
+    days, running = {}, {}
+    for account_id, day, tx_type, cents in rows:
+        running[account_id] = running.get(account_id, 0) + SIGN.get(tx_type, 0) * cents
+        days[(account_id, day)] = running[account_id]
+    return days
+
+def _checkpoints():
+    with sqlite3.connect(app.config['DATABASE']) as conn:
+        return {(account_id, month): cents for account_id, month, cents in
+                conn.execute('SELECT account_id, month, balance_cents FROM account_balance_checkpoints')}
+
+def _assert_checkpoints_match():
+    expected, _ = _expected()
+    stored = _checkpoints()
+    # Mês que ficou vazio mantém o checkpoint (com o saldo do mês anterior): só os meses com linhas são comparados
+    assert {key: stored.get(key) for key in expected} == expected
+    expected_days = _expected_days()
+    with sqlite3.connect(app.config['DATABASE']) as conn:
+        stored_days = {(account_id, day): cents for account_id, day, cents in
+                       conn.execute('SELECT account_id, day, balance_cents FROM account_daily_balances')}
+    assert {key: stored_days.get(key) for key in expected_days} == expected_days
+
+def _page_balances(client, url):
+    """Coluna Saldo do extrato, na ordem da página"""
+    html = client.get(url).get_data(as_text=True)
+    return [float(value.replace(',', '')) for value in re.findall(r'<small class="text-muted">R\$ ([-\d.,]+)</small>', html)]
+
+def test_checkpoints_follow_writes(dataset_db, client_for):
+    """Teste: backfill, triggers e escritas em massa mantêm os saldos de fim de mês e de dia iguais ao recálculo"""
+    _assert_checkpoints_match()
+    client = client_for(1)
+    # Lançamento retroativo (atualiza os meses seguintes) e transferência entre contas
+    assert client.post('/api/v1/transactions/batch', json=[
+        {'description': 'Ajuste antigo', 'amount': '321.09', 'date': '2020-01-15',
+         'transaction_type': 'despesa', 'account_id': 1, 'category_id': 3},
+        {'description': 'Reserva', 'amount': '100.00', 'date': '2024-03-05',
+         'transaction_type': 'transferencia', 'account_id': 1, 'transfer_account_id': 2},
+    ]).status_code == 201
+    _assert_checkpoints_match()
+    # Importação retroativa: triggers desligados durante o lote, contas refeitas uma vez no final
+    csv_file = 'data;descricao;valor\n03/02/2021;Estorno;15,00\n20/11/2019;Tarifa antiga;-4,50\n'.encode()
+    assert client.post('/transactions/import', headers={'Accept': 'application/json'}, data={
+        'csv_file': (io.BytesIO(csv_file), 'extrato.csv'), 'account_id': '2', 'has_header': '1'}
+    ).get_json()['inserted'] == 2
+    _assert_checkpoints_match()
+
+    with sqlite3.connect(app.config['DATABASE']) as conn:
+        tx_id, moved_id = [row[0] for row in conn.execute(
+            'SELECT id FROM transactions WHERE account_id = 1 ORDER BY id LIMIT 2')]
+        conn.execute('UPDATE transactions SET amount = amount + 10, amount_cents = amount_cents + 1000 WHERE id = ?', (tx_id,))
+        conn.execute("UPDATE transactions SET account_id = 2, date = '2021-07-01' WHERE id = ?", (moved_id,))
+        conn.execute('DELETE FROM transactions WHERE id = (SELECT MAX(id) FROM transactions WHERE account_id = 2)')
+        # Legado: só a coluna REAL (o trigger da migração 005 preenche os centavos)
+        conn.execute('''INSERT INTO transactions (account_id, description, amount, date, transaction_type)
+                        VALUES (1, 'Legado', 12.34, '2022-02-02', 'receita')''')
+        assert conn.execute('SELECT COUNT(*) FROM balance_snapshot_bypass').fetchone()[0] == 0
+    _assert_checkpoints_match()
+
+def test_extrato_and_export_running_balance(dataset_db, client_for):
+    """Teste: saldo corrido de qualquer página/exportação igual ao calculado sobre o histórico inteiro"""
+    client = client_for(1)
+    _, after = _expected()
+    with sqlite3.connect(app.config['DATABASE']) as conn:
+        ordered = [row[0] for row in conn.execute('''
+            SELECT t.id FROM transactions t JOIN accounts a ON a.id = t.account_id
+            WHERE a.user_id = 1 ORDER BY DATE(t.date) DESC, t.id DESC''')]
+        by_account = [row[0] for row in conn.execute('''
+            SELECT id FROM transactions WHERE account_id = 2 AND transaction_type = 'despesa'
+            ORDER BY DATE(date) DESC, id DESC''')]
+
+    assert len(ordered) > 150
+    assert _page_balances(client, '/transactions?page=3') == [after[i] / 100 for i in ordered[100:150]]
+    # Filtros não mudam o saldo: é o da conta após a linha
+    assert _page_balances(client, '/transactions?account_id=2&type=despesa') == [after[i] / 100 for i in by_account[:50]]
+
+    response = client.get('/reports/export/transactions?account_id=2&date_from=2000-01-01')
+    rows = list(csv.DictReader(io.StringIO(response.get_data(as_text=True))))
+    assert 'id' not in rows[0] and rows[0]['Conta']
+    with sqlite3.connect(app.config['DATABASE']) as conn:
+        account_2 = [row[0] for row in conn.execute(
+            'SELECT id FROM transactions WHERE account_id = 2 ORDER BY DATE(date) DESC, id DESC')]
+    assert [float(row['Saldo']) for row in rows] == [after[i] / 100 for i in account_2]
+
+def _balance_on(day):
+    """{conta: centavos} ao fim de day, somando o histórico inteiro"""
+    with sqlite3.connect(app.config['DATABASE']) as conn:
+        rows = conn.execute('SELECT account_id, transaction_type, amount_cents FROM transactions WHERE DATE(date) <= ?',
+                            (str(day),)).fetchall()
+    balances = {}
+    for account_id, tx_type, cents in rows:
+        balances[account_id] = balances.get(account_id, 0) + SIGN.get(tx_type, 0) * cents
+    return balances
+
+def test_balance_as_of_date(dataset_db, client_for):
+    """Teste: saldo em uma data igual à soma do histórico, inclusive após escritas retroativas"""
+    client = client_for(1)
+    with sqlite3.connect(app.config['DATABASE']) as conn:
+        first, last = conn.execute('SELECT MIN(DATE(date)), MAX(DATE(date)) FROM transactions').fetchone()
+        edited = conn.execute('SELECT id FROM transactions WHERE account_id = 2 ORDER BY date DESC LIMIT 1').fetchone()[0]
+        conn.execute("UPDATE transactions SET date = ? WHERE id = ?", (first, edited))
+        conn.execute('DELETE FROM transactions WHERE id = (SELECT MIN(id) FROM transactions WHERE account_id = 1)')
+    client.post('/api/v1/transactions/batch', json=[
+        {'description': 'Retroativa', 'amount': '77.70', 'date': first,
+         'transaction_type': 'receita', 'account_id': 1, 'category_id': 1}])
+
+    middle = date.fromisoformat(first) + (date.fromisoformat(last) - date.fromisoformat(first)) / 2
+    for day in (date.fromisoformat(first) - timedelta(days=1), first, middle, last):
+        data = client.get(f'/api/v1/balances/as-of?date={day}').get_json()
+        expected = _balance_on(day)
+        assert {acc['id']: round(acc['balance'] * 100) for acc in data['accounts']} == \
+            {1: expected.get(1, 0), 2: expected.get(2, 0)}, day
+        assert round(data['total'] * 100) == expected.get(1, 0) + expected.get(2, 0)
+
+    one = client.get(f'/api/v1/balances/as-of?date={middle}&account_id=2').get_json()
+    assert [acc['id'] for acc in one['accounts']] == [2]
+    assert client.get('/api/v1/balances/as-of?account_id=3').status_code == 404
+    assert client.get('/api/v1/balances/as-of?date=31/12/2024').status_code == 400
+
+def test_daily_balance_series(dataset_db, client_for):
+    """Teste: série diária em uma chamada, com o saldo levado adiante nos dias sem movimento"""
+    client = client_for(1)
+    end = date.today()
+    start = end - timedelta(days=120)
+    data = client.get(f'/api/v1/balances/daily?start={start}&end={end}').get_json()
+    assert len(data['dates']) == 121 and data['dates'][0] == start.isoformat()
+    for i in (0, 37, 120):
+        expected = _balance_on(data['dates'][i])
+        for account in data['accounts']:
+            assert round(account['balances'][i] * 100) == expected.get(account['id'], 0)
+        assert round(data['total'][i] * 100) == sum(expected.get(acc, 0) for acc in (1, 2))
+
+    default = client.get('/api/v1/balances/daily?account_id=1').get_json()
+    assert len(default['dates']) == 30 and default['end'] == end.isoformat()
+    assert default['accounts'][0]['balances'][-1] == data['accounts'][0]['balances'][-1]
+    assert client.get(f'/api/v1/balances/daily?start={end}&end={start}').status_code == 400
+    assert client.get('/api/v1/balances/daily?start=2000-01-01').status_code == 400
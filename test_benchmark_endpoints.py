@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Testes do benchmark de endpoints (benchmark_endpoints.py)
+"""
+
+import sqlite3
+
+from benchmark_endpoints import compare_with_baseline, merge_baseline, percentile, run_benchmark
+from generate_dataset import DatasetGenerator
+
+def _result(p50, p95, queries, status=200):
+    return {'status': status, 'p50_ms': p50, 'p95_ms': p95, 'p99_ms': p95, 'mean_ms': p50, 'queries': queries}
+
+def test_percentile_nearest_rank():
+    """Teste: percentis por nearest-rank"""
+    values = list(range(1, 101))
+    assert percentile(values, 50) == 50
+    assert percentile(values, 95) == 95
+    assert percentile(values, 99) == 99
+    assert percentile([3.0], 99) == 3.0
+    assert percentile([], 50) == 0.0
+
+def test_compare_flags_regressions():
+    """Teste: latência acima da tolerância, queries a mais e status quebrado são regressões"""
+    baseline = {'results': {
+        'fast': _result(10.0, 12.0, 3),
+        'queries': _result(10.0, 12.0, 3),
+        'broken': _result(10.0, 12.0, 3),
+        'already_broken': _result(10.0, 12.0, 3, status=500),
+    }}
+    current = {'results': {
+        'fast': _result(12.0, 16.0, 3),
+        'queries': _result(10.0, 12.0, 4),
+        'broken': _result(10.0, 12.0, 3, status=500),
+        'already_broken': _result(10.0, 12.0, 3, status=500),
+    }}
+    regressions = compare_with_baseline(current, baseline, tolerance=0.25)
+    assert not any(r.startswith('fast') for r in regressions)
+    assert any(r.startswith('queries: queries 3 -> 4') for r in regressions)
+    assert any(r.startswith('broken: status') for r in regressions)
+    assert not any(r.startswith('already_broken') for r in regressions)
+
+    current['results']['fast'] = _result(30.0, 40.0, 3)
+    regressions = compare_with_baseline(current, baseline, tolerance=0.25)
+    assert any(r.startswith('fast: p95_ms') for r in regressions)
+
+    # Atualizar a baseline só acrescenta cenários novos (ou os pedidos em only)
+    current['results']['new'] = _result(1.0, 2.0, 1)
+    merged = merge_baseline(baseline, current)
+    assert merged['results']['fast'] == baseline['results']['fast'] and merged['results']['new']['p50_ms'] == 1.0
+    assert merge_baseline(baseline, current, only=['fast'])['results']['fast']['p50_ms'] == 30.0
+    assert merge_baseline(None, current) is current
+
+def test_run_counts_queries(tmp_path):
+    """Teste: execução real conta queries e mede latência por rota"""
+    db_path = str(tmp_path / 'bench.db')
+    DatasetGenerator(db_path, users=1, accounts_per_user=2, years=0.5, tx_per_month=5, seed=1).run()
+    report = run_benchmark(db_path, iterations=2, warmup=0,
+                           only=['dashboard_month', 'reports_export_transactions'])
+    assert set(report['results']) == {'dashboard_month', 'reports_export_transactions'}
+    for result in report['results'].values():
+        assert result['status'] == 200
+        assert result['queries'] > 0
+        assert result['p50_ms'] <= result['p95_ms'] <= result['p99_ms']
+
+def test_write_scenarios_measure_throughput(tmp_path):
+    """Teste: cenários de escrita (inclusive retroativos e importação) medem vazão e não deixam rastro no banco"""
+    db_path = str(tmp_path / 'bench.db')
+    DatasetGenerator(db_path, users=1, accounts_per_user=2, years=0.5, tx_per_month=5, seed=1).run()
+    with sqlite3.connect(db_path) as conn:
+        before = conn.execute('SELECT COUNT(*) FROM transactions').fetchone()[0]
+        checkpoints = conn.execute('SELECT * FROM account_balance_checkpoints ORDER BY 1, 2').fetchall()
+        days = conn.execute('SELECT * FROM account_daily_balances ORDER BY 1, 2').fetchall()
+    report = run_benchmark(db_path, iterations=3, warmup=1,
+                           only=['transactions_new_single', 'api_transactions_batch_50',
+                                 'api_transactions_batch_50_backdated', 'transactions_import_1000_backdated'])
+    for name in ('api_transactions_batch_50', 'api_transactions_batch_50_backdated'):
+        batch = report['results'][name]
+        assert batch['status'] == 201 and batch['items'] == 50 and batch['items_per_s'] > 0
+    statement = report['results']['transactions_import_1000_backdated']
+    assert statement['status'] == 200 and statement['items'] == 1000
+    assert report['results']['transactions_new_single']['status'] == 200
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute('SELECT COUNT(*) FROM transactions').fetchone()[0] == before
+        assert conn.execute('SELECT COUNT(*) FROM import_batches').fetchone()[0] == 0
+        # Limpeza em massa refaz os saldos das contas: os mesmos de antes dos cenários
+        assert conn.execute('SELECT * FROM account_balance_checkpoints ORDER BY 1, 2').fetchall() == checkpoints
+        assert conn.execute('SELECT * FROM account_daily_balances ORDER BY 1, 2').fetchall() == days
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+Testes da categorização automática por regras (categorization.py, migração 015)
+"""
+
+import io
+import sqlite3
+import time
+
+import pytest
+
+from app_simple_advanced import app
+from categorization import Rule, RuleError, RuleSet, categorize, parse_rule
+from migrations import run_all_migrations
+from query_budget import check_route_budget
+
+def _category_ids(conn):
+    return dict(conn.execute('SELECT name, id FROM categories'))
+
+def test_rule_set_matching_and_bulk(tmp_path):
+    """Teste: prioridade, filtros e acentos; lote categoriza milhares de linhas por segundo"""
+    rules = RuleSet([
+        Rule(1, 10, 'contains', 'Uber', None, None, None, 'despesa', 100),
+        Rule(2, 11, 'contains', 'uber eats', None, None, None, 'despesa', 50),
+        Rule(3, 12, 'regex', r'^posto (ipiranga|shell)', 5000, 40000, 2, 'despesa', 100),
+        Rule(4, 13, 'contains', 'padaria são joão', None, 2000, None, None, 100),
+        Rule(5, 14, 'contains', 'salario', None, None, None, 'receita', 100),
+    ])
+    assert rules.match('PG *UBER TRIP', 2500, 1, 'despesa').id == 1
+    assert rules.match('Uber   Eats Pedido', 4500, 1, 'despesa').id == 2  # menor priority vence
+    assert rules.match('Uber trip', 2500, 1, 'receita') is None
+    assert rules.match('POSTO SHELL 123', 15000, 2, 'despesa').id == 3
+    assert rules.match('POSTO SHELL 123', 15000, 1, 'despesa') is None  # outra conta
+    assert rules.match('POSTO SHELL 123', 45000, 2, 'despesa') is None  # acima da faixa
+    assert rules.match('Padaria Sao Joao', 1999, 1, 'despesa').id == 4
+    assert rules.match('Padaria São João', 2001, 1, 'despesa') is None
+    assert rules.match('SALÁRIO EMPRESA', 500000, 1, 'receita').id == 5
+    assert RuleSet([]).match('Uber', 100, 1, 'despesa') is None
+
+    categories = {10: 'despesa', 14: 'receita'}
+    assert parse_rule({'pattern': 'uber', 'category_id': 10, 'max_amount': '80,00'}, {1}, categories) == {
+        'category_id': 10, 'match_type': 'contains', 'pattern': 'uber', 'min_amount_cents': None,
+        'max_amount_cents': 8000, 'account_id': None, 'transaction_type': 'despesa', 'priority': 100}
+    for body in ({'pattern': 'x', 'category_id': 99}, {'pattern': '(', 'match_type': 'regex', 'category_id': 10},
+                 {'pattern': 'x', 'category_id': 10, 'transaction_type': 'receita'},
+                 {'pattern': 'x', 'category_id': 10, 'account_id': 2},
+                 {'pattern': 'x', 'category_id': 10, 'min_amount': 5, 'max_amount': 1}, {'category_id': 10}):
+        try:
+            parse_rule(body, {1}, categories)
+            assert False, body
+        except RuleError:
+            pass
+
+    db_path = str(tmp_path / 'categorization.db')
+    assert run_all_migrations(db_path)
+    conn = sqlite3.connect(db_path)
+    conn.execute("INSERT INTO users (id, email, password_hash, first_name, last_name) VALUES (1, 'u@t', 'x', 'U', 'U')")
+    conn.execute("INSERT INTO accounts (id, user_id, name, account_type) VALUES (1, 1, 'Conta', 'corrente')")
+    conn.execute("INSERT INTO accounts (id, user_id, name, account_type) VALUES (2, 1, 'Cartão', 'corrente')")
+    names = ['PG *UBER TRIP', 'UBER EATS', 'POSTO SHELL 7', 'Mercado X', 'SALARIO ACME']
+    rows = [(f'{names[i % 5]} {i % 97}', 10 + i % 300, '2025-01-01',
+             'receita' if i % 5 == 4 else 'despesa', 1 + i % 2, 13 if i % 250 == 0 else None)
+            for i in range(20000)]
+    conn.executemany('''INSERT INTO transactions (description, amount, date, transaction_type, account_id, category)
+                        VALUES (?, ?, ?, ?, ?, ?)''', rows)
+    columns = [row[1] for row in conn.execute('PRAGMA table_info(transactions)')]
+
+    preview = categorize(conn, 1, rules, 'transaction_type', columns)
+    expected = {1: 0, 2: 0, 3: 0, 5: 0}
+    for description, amount, _, kind, account_id, category in rows:
+        rule = rules.match(description, round(amount * 100), account_id, kind)
+        if rule and category is None:
+            expected[rule.id] += 1
+    assert preview['applied'] is False and preview['updated'] == 0
+    assert preview['scanned'] == 20000 - 80
+    assert {item['rule_id']: item['count'] for item in preview['by_rule']} == {
+        rule_id: count for rule_id, count in expected.items() if count}
+    assert len(preview['sample']) == 50
+    assert conn.execute('SELECT COUNT(*) FROM transactions WHERE category IS NOT NULL').fetchone()[0] == 80
+
+    applied = categorize(conn, 1, rules, 'transaction_type', columns, apply=True)
+    conn.commit()
+    assert applied['updated'] == preview['matched'] == sum(expected.values())
+    assert applied['scanned'] / max(applied['seconds'], 1e-6) > 5000  # milhares de linhas por segundo
+    assert conn.execute("SELECT DISTINCT category FROM transactions WHERE description LIKE 'UBER EATS%'"
+                        ).fetchall() == [(11,)]
+    assert conn.execute("SELECT COUNT(*) FROM transactions WHERE description LIKE 'SALARIO%' AND category = 14"
+                        ).fetchone()[0] == 4000
+    # Já categorizadas ficam de fora; recategorize só conta quem muda
+    assert categorize(conn, 1, rules, 'transaction_type', columns)['matched'] == 0
+    assert categorize(conn, 1, rules, 'transaction_type', columns, recategorize=True)['matched'] == \
+        len([row for row in rows if row[5] == 13 and rules.match(row[0], round(row[1] * 100), row[4], row[3])])
+    conn.close()
+
+def test_regex_rules_reject_backtracking():
+    """Teste: regex com quantificador aninhado/backreference é recusada (ReDoS); regra antiga é ignorada"""
+    categories = {10: 'despesa'}
+    for pattern in (r'(a+)+$', r'(\w+\s?)*$', r'(uber|ub)*x', r'(posto)\s\1'):
+        try:
+            parse_rule({'pattern': pattern, 'match_type': 'regex', 'category_id': 10}, {1}, categories)
+            assert False, pattern
+        except RuleError as e:
+            assert 'não permitida' in str(e)
+    for pattern in (r'^posto (ipiranga|shell)', r'uber\s+eats?', r'(pg )?\*?ifood', r'\d{2}/\d{2}'):
+        assert parse_rule({'pattern': pattern, 'match_type': 'regex', 'category_id': 10}, {1}, categories)
+
+    # Gravada antes da validação: o RuleSet ignora a regra em vez de travar no search
+    rules = RuleSet([Rule(1, 10, 'regex', r'(a+)+$', None, None, None, None, 100),
+                     Rule(2, 11, 'contains', 'aaa', None, None, None, None, 100)])
+    started = time.perf_counter()
+    assert rules.match('a' * 40 + '!', 100, 1, 'despesa').id == 2
+    assert time.perf_counter() - started < 1
+
+@pytest.mark.dataset(users=2, accounts_per_user=2, years=1, tx_per_month=10, seed=48)
+def test_rules_api_and_insert_paths(dataset_db, client_for):
+    """Teste: CRUD de regras, prévia/aplicação e categoria preenchida em new_transaction, importação e lote"""
+    conn = sqlite3.connect(app.config['DATABASE'])
+    ids = _category_ids(conn)
+    conn.close()
+
+    client = client_for(1)
+    created = client.post('/api/v1/categorization/rules', json={
+        'pattern': 'Posto', 'category_id': ids['Transporte'], 'priority': 10})
+    assert created.status_code == 201 and created.get_json()['transaction_type'] == 'despesa'
+    assert client.post('/api/v1/categorization/rules', json={
+        'pattern': 'x', 'category_id': ids['Transporte'], 'account_id': 3}).status_code == 400
+    assert client.post('/api/v1/categorization/rules', json={
+        'pattern': '(a+)+$', 'match_type': 'regex', 'category_id': ids['Transporte']}).status_code == 400
+    other = client_for(2).post('/api/v1/categorization/rules', json={
+        'pattern': 'posto', 'category_id': ids['Lazer']}).get_json()
+    assert [rule['pattern'] for rule in client.get('/api/v1/categorization/rules').get_json()['rules']] == ['Posto']
+
+    # Quick-add sem categoria: a regra preenche; sem regra continua recusado
+    result = client.post('/transactions/new', json={
+        'description': 'POSTO IPIRANGA', 'amount': '150.00', 'date': '2025-05-02',
+        'transaction_type': 'despesa', 'account_id': 1}).get_json()
+    assert result['success']
+    assert client.post('/transactions/new', json={
+        'description': 'Loja qualquer', 'amount': '10.00', 'date': '2025-05-02',
+        'transaction_type': 'despesa', 'account_id': 1}).get_json()['success'] is False
+
+    csv_file = 'data;descricao;valor\n03/05/2025;Posto Shell;-80,00\n04/05/2025;Cinema;-30,00\n'.encode()
+    imported = client.post('/transactions/import', headers={'Accept': 'application/json'}, data={
+        'csv_file': (io.BytesIO(csv_file), 'extrato.csv'), 'account_id': '1', 'has_header': '1'}).get_json()
+    assert imported['inserted'] == 2 and imported['categorized'] == 1
+    batch = client.post('/api/v1/transactions/batch', json={'atomic': False, 'transactions': [
+        {'description': 'POSTO ALE 22', 'amount': '60.00', 'date': '2025-05-05', 'type': 'expense', 'account_id': 1},
+        {'description': 'Loja qualquer', 'amount': '10.00', 'date': '2025-05-05', 'type': 'expense',
+         'account_id': 1}]}).get_json()
+    assert [r['status'] for r in batch['results']] == ['created', 'invalid']
+    assert batch['results'][1]['errors'] == ['category_id é obrigatória para receitas e despesas.']
+
+    conn = sqlite3.connect(app.config['DATABASE'])
+    assert dict(conn.execute("SELECT description, category FROM transactions WHERE date >= '2025-05-02' "
+                             "AND description IN ('POSTO IPIRANGA', 'Posto Shell', 'Cinema')")) == {
+        'POSTO IPIRANGA': ids['Transporte'], 'Posto Shell': ids['Transporte'], 'Cinema': None}
+    assert conn.execute("SELECT category FROM transactions WHERE description = 'POSTO ALE 22'").fetchone()[0] == \
+        ids['Transporte']
+    conn.execute("UPDATE transactions SET category = NULL WHERE id IN (SELECT t.id FROM transactions t "
+                 "JOIN accounts a ON a.id = t.account_id WHERE a.user_id = 1 AND t.transaction_type = 'despesa' "
+                 "ORDER BY t.id LIMIT 5)")
+    conn.execute("UPDATE transactions SET description = 'Posto BR' WHERE id IN (SELECT t.id FROM transactions t "
+                 "JOIN accounts a ON a.id = t.account_id WHERE a.user_id = 1 AND t.transaction_type = 'despesa' "
+                 "ORDER BY t.id LIMIT 3)")
+    conn.commit()
+    conn.close()
+
+    preview = client.post('/api/v1/categorization/preview', json={}).get_json()
+    assert preview['matched'] == 3 and preview['scanned'] == 6  # 5 sem categoria + Cinema, 3 casam
+    assert {item['description'] for item in preview['sample']} == {'Posto BR'}
+    assert client.post('/api/v1/categorization/apply', json={}).get_json()['updated'] == 3
+    assert client.post('/api/v1/categorization/preview', json={}).get_json()['matched'] == 0
+
+    assert client.delete(f"/api/v1/categorization/rules/{other['id']}").status_code == 404
+    assert client.delete(f"/api/v1/categorization/rules/{created.get_json()['id']}").status_code == 200
+    check_route_budget(client, '/api/v1/categorization/rules')
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Testes das sugestões de categoria aprendidas (category_model.py, migração 016)
+"""
+
+import io
+import sqlite3
+
+import pytest
+
+from app_simple_advanced import app, init_category_model
+from category_model import CategoryModel, load_model, save_model, tokenize, train
+from migrations import run_all_migrations
+from query_budget import check_route_budget
+
+def _counts(model):
+    return dict(model.docs), {category: dict(words) for category, words in model.words.items() if words}
+
+def test_incremental_training_and_persistence(tmp_path):
+    """Teste: inserções treinam incrementalmente; alterar lançamento antigo refaz o modelo; JSON ida e volta"""
+    assert tokenize('PAG*IFOOD 1234 São Paulo - x') == ['pag', 'ifood', 'sao', 'paulo']
+
+    db_path = str(tmp_path / 'category_model.db')
+    assert run_all_migrations(db_path)
+    conn = sqlite3.connect(db_path)
+    conn.execute("INSERT INTO users (id, email, password_hash, first_name, last_name) VALUES (1, 'u@t', 'x', 'U', 'U')")
+    conn.execute("INSERT INTO accounts (id, user_id, name, account_type) VALUES (1, 1, 'Conta', 'corrente')")
+
+    def add(description, category, kind='despesa'):
+        return conn.execute('''INSERT INTO transactions (description, amount, date, transaction_type, account_id, category)
+                               VALUES (?, 10, '2025-01-01', ?, 1, ?)''', (description, kind, category)).lastrowid
+
+    for n in range(20):
+        add(f'UBER *TRIP {n}', 7)
+        add(f'PAG*IFOOD {n}', 6)
+        add('Posto Shell', 7)
+    add('SALARIO ACME', '1', 'receita')  # categoria gravada como texto pelo formulário
+    add('Sem categoria', None)
+    conn.commit()
+
+    model = train(conn, 1, 'transaction_type')
+    assert len(model) == 61 and model.docs[1] == 1
+    top = model.suggest('uber trip centro')
+    assert top[0]['category_id'] == 7 and top[0]['probability'] > 0.9 and len(top) == 3
+    assert model.suggest('posto ipiranga', {6: 'despesa', 7: 'despesa', 1: 'receita'}, 'despesa')[0]['category_id'] == 7
+    assert [s['category_id'] for s in model.suggest('ifood', {6: 'despesa', 1: 'receita'}, 'receita')] == [1]
+    assert model.suggest('nada conhecido') == []
+    assert train(conn, 1, 'transaction_type', model) is model  # mesma versão: nada a fazer
+
+    # Só inserções: incremental dá as mesmas contagens que treinar do zero
+    add('iFood pedido', 6)
+    add('UBER EATS', 6)
+    conn.commit()
+    incremental = train(conn, 1, 'transaction_type', model)
+    assert incremental is not model and len(model) == 61  # o modelo servido não muda
+    assert _counts(incremental) == _counts(train(conn, 1, 'transaction_type'))
+    assert incremental.version > model.version
+
+    # Lançamento já contado mudou de categoria: refeito do zero
+    conn.execute("UPDATE transactions SET category = 6 WHERE description = 'Posto Shell'")
+    conn.commit()
+    rebuilt = train(conn, 1, 'transaction_type', incremental)
+    assert rebuilt.docs[7] == 20 and rebuilt.docs[6] == 42
+    assert _counts(rebuilt) == _counts(train(conn, 1, 'transaction_type'))
+
+    save_model(conn, 1, rebuilt)
+    save_model(conn, 1, model)  # versão mais antiga não sobrescreve
+    conn.commit()
+    stored = load_model(conn, 1)
+    assert stored.version == rebuilt.version and _counts(stored) == _counts(rebuilt)
+    assert stored.suggest('Posto BR') == rebuilt.suggest('Posto BR')
+    assert load_model(conn, 2) is None and len(CategoryModel()) == 0
+    conn.close()
+
+@pytest.mark.dataset(users=2, accounts_per_user=2, years=1, tx_per_month=30, seed=49)
+def test_suggestions_api_and_import(dataset_db):
+    """Teste: sugestão nunca treina na requisição; retreino em segundo plano; importação traz sugestões"""
+    conn = sqlite3.connect(app.config['DATABASE'])
+    ids = dict(conn.execute('SELECT name, id FROM categories'))
+    conn.close()
+    trainer = init_category_model(app)
+
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess['user_id'] = 1
+    url = '/api/v1/categorization/suggest?description=UBER%20*TRIP%20999&transaction_type=despesa'
+    first = client.get(url).get_json()
+    assert first == {'ready': False, 'suggestions': []}  # primeiro treino agendado, não feito aqui
+    trainer.wait(30)
+
+    suggestions = client.get(url).get_json()['suggestions']
+    assert suggestions[0]['category_id'] == ids['Transporte'] and suggestions[0]['name'] == 'Transporte'
+    assert len(suggestions) <= 3 and all(s['category_id'] != ids['Salário'] for s in suggestions)
+    assert client.get('/api/v1/categorization/suggest').status_code == 400
+    check_route_budget(client, url)
+
+    # Novo lançamento: a resposta segue com o modelo anterior e o retreino vai para o fundo
+    conn = sqlite3.connect(app.config['DATABASE'])
+    stored_version = conn.execute('SELECT version FROM category_models WHERE user_id = 1').fetchone()[0]
+    conn.close()
+    assert client.post('/transactions/new', json={
+        'description': 'Academia Smart Fit', 'amount': '99.90', 'date': '2025-05-02',
+        'transaction_type': 'despesa', 'account_id': 1, 'category_id': ids['Saúde']}).get_json()['success']
+    assert client.get('/api/v1/categorization/suggest?description=Smart%20Fit').get_json()['suggestions'] == []
+    trainer.wait(30)
+    smart_fit = client.get('/api/v1/categorization/suggest?description=Smart%20Fit').get_json()['suggestions']
+    assert smart_fit[0]['category_id'] == ids['Saúde']
+    conn = sqlite3.connect(app.config['DATABASE'])
+    assert conn.execute('SELECT version FROM category_models WHERE user_id = 1').fetchone()[0] > stored_version
+    conn.close()
+
+    csv_file = 'data;descricao;valor\n03/05/2025;PAG*IFOOD 77;-42,00\n04/05/2025;Xyz;-30,00\n'.encode()
+    imported = client.post('/transactions/import', headers={'Accept': 'application/json'}, data={
+        'csv_file': (io.BytesIO(csv_file), 'extrato.csv'), 'account_id': '1', 'has_header': '1'}).get_json()
+    assert imported['inserted'] == 2
+    assert [item['description'] for item in imported['suggestions']] == ['PAG*IFOOD 77']
+    assert imported['suggestions'][0]['suggestions'][0]['category_id'] == ids['Alimentação']
+    trainer.wait(30)
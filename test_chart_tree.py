@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Testes dos totais hierárquicos do plano de contas (chart_tree.py, migração 013)
+"""
+
+import sqlite3
+
+import pytest
+
+from app_simple_advanced import app
+from migrations import column_exists, run_all_migrations, table_exists
+from migrations.migration_013_chart_closure import migration_013
+from query_budget import check_route_budget
+
+pytestmark = pytest.mark.dataset(users=2, accounts_per_user=2, years=2, tx_per_month=10, seed=46)
+
+def _closure(conn):
+    return set(conn.execute('SELECT ancestor_id, descendant_id, depth FROM chart_account_closure'))
+
+def _expected_closure(conn):
+    """Pares (ancestral, descendente, distância) subindo parent_id de cada nó"""
+    parents = dict(conn.execute('SELECT id, parent_id FROM chart_of_accounts'))
+    pairs = set()
+    for node in parents:
+        ancestor, depth = node, 0
+        while ancestor is not None:
+            pairs.add((ancestor, node, depth))
+            ancestor, depth = parents.get(ancestor), depth + 1
+    return pairs
+
+def test_closure_maintained_by_triggers(tmp_path):
+    """Teste: inserir, mover subárvore e excluir mantêm a tabela de fechamento; migração preenche a existente"""
+    db_path = str(tmp_path / 'closure.db')
+    assert run_all_migrations(db_path)
+    conn = sqlite3.connect(db_path)
+
+    def add(code, parent=None):
+        return conn.execute('''INSERT INTO chart_of_accounts (code, name, parent_id, account_type)
+                               VALUES (?, ?, ?, 'despesa')''', (code, code, parent)).lastrowid
+
+    root = add('4')
+    food = add('4.1', root)
+    market = add('4.1.01', food)
+    bakery = add('4.1.01.01', market)
+    home = add('4.2', root)
+    assert _closure(conn) == _expected_closure(conn)
+    assert (root, bakery, 3) in _closure(conn)
+
+    # Mercado (com a padaria) passa para Moradia
+    conn.execute('UPDATE chart_of_accounts SET parent_id = ? WHERE id = ?', (home, market))
+    assert _closure(conn) == _expected_closure(conn)
+    assert (food, bakery, 2) not in _closure(conn) and (home, bakery, 2) in _closure(conn)
+
+    conn.execute('DELETE FROM chart_of_accounts WHERE id = ?', (bakery,))
+    assert not [pair for pair in _closure(conn) if bakery in pair[:2]]
+
+    # Banco anterior à migração: a árvore existente é preenchida de uma vez
+    conn.execute('DELETE FROM chart_account_closure')
+    migration_013(conn, table_exists=table_exists, column_exists=column_exists)
+    assert _closure(conn) == _expected_closure(conn)
+    conn.close()
+
+def test_chart_tree_api_drill_down(dataset_db, client_for):
+    """Teste: subtotais batem com a soma por plano de contas; drill-down até um nível novo"""
+    conn = sqlite3.connect(app.config['DATABASE'])
+    food, level = conn.execute("SELECT id, level FROM chart_of_accounts WHERE name = 'Alimentação'").fetchone()
+    delivery = conn.execute('''INSERT INTO chart_of_accounts (code, name, parent_id, level, account_type)
+                               VALUES ('4.1.02.01', 'Delivery', ?, ?, 'despesa')''',
+                            (food, level + 1)).lastrowid
+    conn.execute('''INSERT INTO transactions (description, amount, date, transaction_type, chart_account_id,
+                                              account_id, is_confirmed)
+                    VALUES ('IFOOD', 123.45, '2025-03-10', 'despesa', ?, 1, 1)''', (delivery,))
+    conn.commit()
+    leaves = dict(conn.execute('''
+        SELECT t.chart_account_id, ROUND(SUM(t.amount), 2) FROM transactions t
+        JOIN accounts a ON a.id = t.account_id
+        WHERE a.user_id = 1 AND t.is_confirmed = 1 AND t.transaction_type = 'despesa'
+          AND DATE(t.date) BETWEEN '2025-01-01' AND '2025-12-31'
+        GROUP BY t.chart_account_id
+    '''))
+    conn.close()
+
+    client = client_for(1)
+    period = 'start_date=2025-01-01&end_date=2025-12-31&transaction_type=despesa'
+    top = client.get(f'/api/v1/reports/chart-tree?{period}').get_json()
+    assert top['node'] is None and top['path'] == []
+    assert top['total'] == round(sum(leaves.values()), 2)
+    assert [child['name'] for child in top['children']] == ['DESPESAS']
+
+    expenses = client.get(f"/api/v1/reports/chart-tree?{period}&node_id={top['children'][0]['id']}").get_json()
+    assert expenses['node']['share'] == 100.0
+    assert round(sum(child['total'] for child in expenses['children']), 2) == top['total']
+    totals = [child['total'] for child in expenses['children']]
+    assert totals == sorted(totals, reverse=True)
+
+    food_node = next(child for child in expenses['children'] if child['id'] == food)
+    assert food_node['has_children']
+    assert food_node['total'] == round(leaves.get(food, 0) + 123.45, 2)
+    drill = client.get(f'/api/v1/reports/chart-tree?{period}&node_id={food}').get_json()
+    assert [item['name'] for item in drill['path']] == ['DESPESAS', 'Alimentação']
+    assert drill['node']['own_total'] == leaves.get(food, 0)
+    assert drill['children'] == [{'id': delivery, 'code': '4.1.02.01', 'name': 'Delivery', 'level': level + 1,
+                                  'is_summary': False, 'total': 123.45, 'own_total': 123.45, 'quantity': 1,
+                                  'share': round(12345 * 100 / round(food_node['total'] * 100), 2),
+                                  'has_children': False}]
+
+    # Outro usuário não vê os lançamentos do usuário 1
+    other = client_for(2).get(f'/api/v1/reports/chart-tree?{period}&node_id={delivery}').get_json()
+    assert other['node']['total'] == 0
+
+    assert client.get('/api/v1/reports/chart-tree?node_id=999999').status_code == 404
+    assert client.get('/api/v1/reports/chart-tree?start_date=2025-13-01').status_code == 400
+    assert client.get('/api/v1/reports/chart-tree?transaction_type=transferencia').status_code == 400
+    check_route_budget(client, f'/api/v1/reports/chart-tree?{period}&node_id={food}')
+    check_route_budget(client, f'/reports/chart-tree?{period}')
+    assert client.get(f'/reports/chart-tree?node_id={food}').status_code == 200
+    assert client.get('/reports/chart-tree?node_id=999999').status_code == 302
+    assert client.get('/api/v1/reports/chart-tree').get_json()['start_date'].endswith('-01')  # mês atual
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Testes dos widgets do dashboard com ETag (dashboard_widgets.py)
+"""
+
+import sqlite3
+from datetime import date
+
+import pytest
+
+from app_simple_advanced import app
+from query_budget import count_queries
+
+
+
+WIDGETS = ['/api/v1/dashboard/summary', '/api/v1/dashboard/financial-table?period=week',
+           '/api/v1/dashboard/recent', '/api/v1/dashboard/accounts']
+
+pytestmark = pytest.mark.dataset(users=2, accounts_per_user=2, years=0.25, tx_per_month=5, seed=38)
+
+def test_shell_and_widgets(dataset_db, client_for):
+    """Teste: a casca não calcula agregados; cada widget devolve o seu bloco"""
+    client = client_for(1)
+    client.get('/dashboard')  # aquece o cache de categorias
+    with count_queries() as counter:
+        html = client.get('/dashboard').get_data(as_text=True)
+    assert counter.count <= 2
+    assert 'data-widget="financial-table"' in html and "dashboardWidgets.load" in html
+
+    summary, table, recent, accounts = (client.get(url).get_json() for url in WIDGETS)
+    assert set(summary['month']) == {'income', 'expenses', 'balance'}
+    assert table['period'] == 'week' and table['financial_table']['period_label'] == 'Esta Semana'
+    assert 'ranges' not in table['financial_table']
+    assert len(recent['transactions']) == 5
+    dates = [tx['date'] for tx in recent['transactions']]
+    assert dates == sorted(dates, reverse=True)
+    assert {tx['account_name'] for tx in recent['transactions']} <= {acc['name'] for acc in accounts['accounts']}
+    assert {acc['id'] for acc in accounts['accounts']} == {1, 2}
+    # Saldo lido de current_balance_cents (Money.from_row), não do REAL
+    with sqlite3.connect(app.config['DATABASE']) as conn:
+        conn.execute('UPDATE accounts SET current_balance = 0.30000000000000004, current_balance_cents = 30 '
+                     'WHERE id = 1')
+    accounts = client.get('/api/v1/dashboard/accounts').get_json()
+    assert {acc['id']: acc['current_balance'] for acc in accounts['accounts']}[1] == 0.3
+    assert client.get('/api/v1/dashboard/recent?limit=x').status_code == 400
+
+def test_etag_revalidation(dataset_db, client_for):
+    """Teste: If-None-Match devolve 304 sem calcular; escrita ou outro usuário invalidam"""
+    client = client_for(1)
+    etags = {}
+    for url in WIDGETS:
+        response = client.get(url)
+        assert response.headers['Cache-Control'] == 'private, no-cache'
+        assert 'Cookie' in response.headers['Vary']
+        etags[url] = response.headers['ETag']
+
+    with count_queries() as counter:
+        response = client.get(WIDGETS[1], headers={'If-None-Match': etags[WIDGETS[1]]})
+    assert response.status_code == 304 and response.headers['ETag'] == etags[WIDGETS[1]]
+    assert counter.count == 2  # usuário da sessão + seq do change_log
+    # O período faz parte da versão
+    other_period = client.get('/api/v1/dashboard/financial-table?period=year',
+                              headers={'If-None-Match': etags[WIDGETS[1]]})
+    assert other_period.status_code == 200
+    # Mesmo ETag vindo do navegador de outro usuário não vale
+    assert client_for(2).get(WIDGETS[3], headers={'If-None-Match': etags[WIDGETS[3]]}).status_code == 200
+
+    client.post('/transactions/new', json={'description': 'Padaria', 'amount': '9.50',
+                                           'date': date.today().isoformat(), 'transaction_type': 'despesa',
+                                           'account_id': 1, 'category_id': 3})
+    for url in WIDGETS:
+        response = client.get(url, headers={'If-None-Match': etags[url]})
+        assert response.status_code == 200, url
+    assert response.get_json()['accounts']
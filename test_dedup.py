@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Testes de detecção de duplicatas (dedup.py)
+"""
+
+import io
+
+import pytest
+
+from app_simple_advanced import app, update_account_balance
+from dedup import find_duplicate, find_duplicates, fingerprint, main as dedup_main, normalize_description
+from statement_import import StatementImporter
+
+pytestmark = pytest.mark.dataset(users=2, accounts_per_user=2, years=0.5, tx_per_month=10, seed=21)
+
+def test_fingerprint_and_lookup(dataset_db, connect):
+    """Teste: normalização da descrição e busca exata/±N dias"""
+    assert normalize_description('  PIX  Padaria Pão-Quente ') == 'pix padaria pao quente'
+    assert fingerprint(1, '2024-03-05', 'despesa', 1990, 'UBER *Trip') == \
+        fingerprint(1, '2024-03-05 10:00:00', 'despesa', 1990, 'uber trip')
+    assert fingerprint(1, '2024-03-05', 'despesa', 1990, 'uber') != fingerprint(2, '2024-03-05', 'despesa', 1990, 'uber')
+
+    conn = connect()
+    conn.execute("INSERT INTO transactions (description, amount, date, transaction_type, account_id) "
+                 "VALUES ('Farmácia Central', 87.43, '2024-05-10', 'despesa', 1)")
+    assert find_duplicate(conn, 1, '2024-05-10', 'despesa', 8743, 'FARMACIA CENTRAL')['match'] == 'exact'
+    assert find_duplicate(conn, 1, '2024-05-12', 'despesa', 8743, 'Drogaria')['match'] == 'fuzzy'
+    assert find_duplicate(conn, 1, '2024-05-20', 'despesa', 8743, 'Farmácia Central') is None
+    assert find_duplicate(conn, 1, '2024-05-10', 'receita', 8743, 'Farmácia Central') is None
+    conn.close()
+
+def test_reimport_skips_existing_rows(dataset_db, connect):
+    """Teste: extrato sobreposto não duplica; linhas idênticas legítimas são mantidas"""
+    first = 'data;descricao;valor\n01/04/2024;Café;-5,00\n01/04/2024;Café;-5,00\n02/04/2024;Mercado;-120,30\n'
+    second = first + '03/04/2024;Café;-5,00\n01/04/2024;Café;-5,00\n'
+    conn = connect()
+    with app.app_context():
+        summary = StatementImporter(conn, 1, 1, update_account_balance).run(io.BytesIO(first.encode()))
+        assert (summary['inserted'], summary['duplicates']) == (3, 0)
+        summary = StatementImporter(conn, 1, 1, update_account_balance).run(io.BytesIO(second.encode()))
+        # 3 já existentes; o 3º café de 01/04 e o de 03/04 são novos
+        assert (summary['inserted'], summary['duplicates']) == (2, 3)
+        summary = StatementImporter(conn, 1, 1, update_account_balance, skip_duplicates=False).run(
+            io.BytesIO(first.encode()))
+        assert (summary['inserted'], summary['duplicates']) == (3, 0)
+    assert conn.execute("SELECT duplicate_count FROM import_batches ORDER BY id").fetchall()[1][0] == 3
+    conn.close()
+
+def test_new_transaction_retry_is_not_duplicated(dataset_db, connect, client_for):
+    """Teste: POST repetido de /transactions/new devolve a transação existente"""
+    client = client_for(1)
+    payload = {'description': 'Conta de luz', 'amount': '215.37', 'date': '2024-06-03',
+               'transaction_type': 'despesa', 'account_id': 1, 'category_id': 5}
+    first = client.post('/transactions/new', json=payload).get_json()
+    retry = client.post('/transactions/new', json=payload).get_json()
+    assert first['success'] and not first['possible_duplicate']
+    assert retry['success'] and retry['duplicate'] and retry['transaction_id'] == first['transaction_id']
+
+    near = client.post('/transactions/new', json=dict(payload, date='2024-06-04', description='Energia')).get_json()
+    assert near['possible_duplicate']['id'] == first['transaction_id']
+    forced = client.post('/transactions/new', json=dict(payload, allow_duplicate=True)).get_json()
+    assert forced['transaction_id'] != first['transaction_id']
+
+    conn = connect()
+    row = conn.execute('SELECT fingerprint FROM transactions WHERE id = ?', (first['transaction_id'],)).fetchone()
+    assert row['fingerprint'] == fingerprint(1, '2024-06-03', 'despesa', 21537, 'Conta de luz')
+    assert conn.execute("SELECT COUNT(*) FROM transactions WHERE description = 'Conta de luz'").fetchone()[0] == 2
+    conn.close()
+
+    # Edição recalcula a impressão digital (não fica só zerada pelo trigger)
+    edited = client.post(f"/transactions/{first['transaction_id']}/edit", data={
+        'description': 'Energia elétrica', 'amount': '215.37', 'date': '2024-06-05',
+        'transaction_type': 'despesa', 'account_id': '1', 'category': '5'})
+    assert edited.status_code == 302
+    conn = connect()
+    row = conn.execute('SELECT fingerprint, date FROM transactions WHERE id = ?', (first['transaction_id'],)).fetchone()
+    assert row['fingerprint'] == fingerprint(1, '2024-06-05', 'despesa', 21537, 'Energia elétrica')
+    conn.close()
+
+def test_duplicates_report(dataset_db, connect, client_for):
+    """Teste: relatório em uma passada indexada, sem gravar na leitura; invalidação por trigger"""
+    conn = connect()
+    # O gerador já grava a impressão digital
+    assert conn.execute('SELECT COUNT(*) FROM transactions WHERE fingerprint IS NULL').fetchone()[0] == 0
+    baseline = len(find_duplicates(conn, 1))
+    conn.executemany("INSERT INTO transactions (description, amount, date, transaction_type, account_id) "
+                     "VALUES (?, 333.33, ?, 'despesa', 2)",
+                     [('Academia', '2024-02-01'), ('ACADEMIA', '2024-02-01'), ('Academia Fit', '2024-02-03')])
+    conn.commit()
+    groups = find_duplicates(conn, 1)
+    assert len(groups) == baseline + 1
+    planted = next(g for g in groups if g['amount'] == 333.33)
+    assert planted['match'] == 'fuzzy' and len(planted['transactions']) == 3
+    # Linhas de SQL direto: a leitura não preenche; a linha de comando sim
+    assert conn.execute('SELECT COUNT(*) FROM transactions WHERE fingerprint IS NULL').fetchone()[0] == 3
+    assert dedup_main(['--db', app.config['DATABASE'], '--user-id', '1']) == 0
+    assert conn.execute('SELECT COUNT(*) FROM transactions WHERE fingerprint IS NULL').fetchone()[0] == 0
+
+    # Edição legada invalida a impressão digital (trigger da migração 007)
+    conn.execute("UPDATE transactions SET description = 'Academia' WHERE description = 'Academia Fit'")
+    assert conn.execute("SELECT fingerprint FROM transactions WHERE date = '2024-02-03' AND amount = 333.33"
+                        ).fetchone()[0] is None
+    conn.execute("UPDATE transactions SET date = '2024-02-01' WHERE date = '2024-02-03' AND amount = 333.33")
+    conn.commit()
+    planted = next(g for g in find_duplicates(conn, 1) if g['amount'] == 333.33)
+    assert planted['match'] == 'exact'  # impressão digital que faltava calculada em memória
+    assert conn.execute('SELECT COUNT(*) FROM transactions WHERE fingerprint IS NULL').fetchone()[0] == 1
+
+    plan = ' '.join(row[3] for row in conn.execute('''
+        EXPLAIN QUERY PLAN SELECT t.id FROM transactions t JOIN accounts a ON a.id = t.account_id
+        WHERE a.user_id = 1 ORDER BY t.account_id, t.transaction_type, t.amount_cents, t.date
+    '''))
+    assert 'idx_transactions_dedup' in plan and 'TEMP B-TREE' not in plan, plan
+    conn.close()
+
+    response = client_for(1).get('/transactions/duplicates', headers={'Accept': 'application/json'})
+    assert any(g['amount'] == 333.33 for g in response.get_json()['groups'])
+    assert client_for(1).get('/transactions/duplicates?days=0').status_code == 200
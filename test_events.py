@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Testes do stream SSE de eventos (events.py)
+"""
+
+import json
+from datetime import date
+
+import pytest
+
+from change_log import latest_seq
+
+pytestmark = pytest.mark.dataset(users=2, accounts_per_user=2, years=0.25, tx_per_month=5, seed=37)
+
+@pytest.fixture(autouse=True)
+def _fast_stream(app, monkeypatch):
+    """Stream curto: polling/heartbeat rápidos e fecha logo após o replay"""
+    monkeypatch.setitem(app.config, 'EVENTS_POLL_SECONDS', 0.02)
+    monkeypatch.setitem(app.config, 'EVENTS_HEARTBEAT_SECONDS', 0.05)
+    monkeypatch.setitem(app.config, 'EVENTS_MAX_SECONDS', 0)
+
+@pytest.fixture
+def seq(connect):
+    def current(user_id):
+        with connect() as conn:
+            return latest_seq(conn, user_id)
+    return current
+
+def _parse(text):
+    """Blocos SSE -> [(id, evento, dados)] (comentários ': ...' viram ('', 'comment', None))"""
+    events = []
+    for block in text.strip().split('\n\n'):
+        fields = {}
+        for line in block.split('\n'):
+            if line.startswith(':'):
+                fields['event'] = 'comment'
+            else:
+                key, _, value = line.partition(': ')
+                fields[key] = value
+        if 'event' in fields:
+            data = json.loads(fields['data']) if 'data' in fields else None
+            events.append((fields.get('id', ''), fields['event'], data))
+    return events
+
+EXPENSE = {'description': 'Uber', 'amount': '23.90', 'date': '2024-06-11',
+           'transaction_type': 'despesa', 'account_id': 1, 'category_id': 5}
+
+def test_resume_coalesces_changes(dataset_db, seq, client_for):
+    """Teste: Last-Event-ID retoma do seq e agrupa as alterações em eventos leves"""
+    client = client_for(1)
+    since = seq(1)
+    items = [dict(EXPENSE, description=f'Uber {i}') for i in range(5)]
+    assert client.post('/api/v1/transactions/batch', json=items).status_code == 201
+    last = seq(1)
+
+    response = client.get('/api/v1/events', headers={'Last-Event-ID': str(since)})
+    assert response.mimetype == 'text/event-stream'
+    assert response.headers['Cache-Control'] == 'no-cache'
+    events = _parse(response.get_data(as_text=True))
+    assert events[0] == (str(since), 'ready', {'seq': since})
+    by_name = {name: (event_id, data) for event_id, name, data in events}
+    assert by_name['balance'] == (str(last), {'seq': last, 'accounts': [1]})
+    assert by_name['aggregates'][1] == {'seq': last, 'entities': ['transactions'], 'changes': 5}
+
+    # Sem Last-Event-ID começa do seq atual; o usuário 2 não vê as alterações do usuário 1
+    assert [name for _, name, _ in _parse(client.get('/api/v1/events').get_data(as_text=True))] == ['ready']
+    other = _parse(client_for(2).get(f'/api/v1/events?since={since}').get_data(as_text=True))
+    assert 'aggregates' not in {name for _, name, _ in other}
+
+def test_stream_delivers_live_writes(app, dataset_db, monkeypatch, client_for):
+    """Teste: escrita feita com o stream aberto chega como evento; heartbeat quando ocioso"""
+    monkeypatch.setitem(app.config, 'EVENTS_MAX_SECONDS', 5)
+    response = client_for(1).get('/api/v1/events', buffered=False)
+    chunks = iter(response.response)
+    received = ''
+    while 'event: ready' not in received:
+        received += next(chunks).decode()
+    while ': keep-alive' not in received:
+        received += next(chunks).decode()
+
+    client_for(1).post('/transactions/new', json=EXPENSE)
+    while 'event: aggregates' not in received:
+        received += next(chunks).decode()
+    response.close()
+    names = [name for _, name, _ in _parse(received)]
+    assert names.index('aggregates') > names.index('comment') > names.index('ready')
+    assert 'balance' in names
+
+def test_dashboard_widgets_follow_writes(dataset_db, client_for):
+    """Teste: widgets que o dashboard busca de novo após um evento refletem a escrita"""
+    client = client_for(1)
+    summary = client.get('/api/v1/dashboard/summary').get_json()
+    table = client.get('/api/v1/dashboard/financial-table?period=year').get_json()
+    accounts = client.get('/api/v1/dashboard/accounts').get_json()
+
+    client.post('/transactions/new', json=dict(EXPENSE, date=date.today().isoformat()))
+    after = client.get('/api/v1/dashboard/summary').get_json()
+    assert round(after['month']['expenses'] - summary['month']['expenses'], 2) == 23.90
+    after_table = client.get('/api/v1/dashboard/financial-table?period=year').get_json()
+    assert round(after_table['financial_table']['a_pagar']['period']
+                 - table['financial_table']['a_pagar']['period'], 2) == 23.90
+    balance = {acc['id']: acc['current_balance'] for acc in client.get('/api/v1/dashboard/accounts').get_json()['accounts']}
+    assert balance[1] != {acc['id']: acc['current_balance'] for acc in accounts['accounts']}[1]
+
+    html = client.get('/dashboard').get_data(as_text=True)
+    assert 'data-live="month.expenses"' in html and "new EventSource('/api/v1/events')" in html
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Testes da projeção de saldo do /planning (forecast.py)
+"""
+
+import sqlite3
+from datetime import date, timedelta
+
+import numpy as np
+import pytest
+
+from app_simple_advanced import app, add_months
+from analytics_cube import LedgerCube, day_number
+from forecast import forecast_balances, forecast_horizon, next_occurrences
+from query_budget import check_route_budget
+
+pytestmark = pytest.mark.dataset(users=2, accounts_per_user=2, years=2, tx_per_month=10, seed=43)
+
+def _cube(rows):
+    """Cubo de uma lista (dia 'YYYY-MM-DD', centavos, tipo, conta) - tudo confirmado e avulso"""
+    days, cents, kinds, accounts = zip(*rows)
+    account_ids, account_codes = np.unique(accounts, return_inverse=True)
+    return LedgerCube(day=np.array([day_number(d) for d in days], dtype=np.int32),
+                      cents=np.array(cents, dtype=np.int64),
+                      kind=np.array([{'receita': 0, 'despesa': 1}[k] for k in kinds], dtype=np.int8),
+                      confirmed=np.ones(len(rows), dtype=bool),
+                      recurring=np.zeros(len(rows), dtype=bool),
+                      account=account_codes.astype(np.int32),
+                      chart=np.zeros(len(rows), dtype=np.int32),
+                      account_ids=account_ids, chart_ids=np.array([0]), charts={})
+
+def test_occurrences_and_seasonal_baseline():
+    """Teste: datas das séries (fim de mês, passo em dias) e média sazonal só dos meses ativos"""
+    first, last = day_number('2027-01-01'), day_number('2027-06-30')
+    monthly = {'recurrence_type': 'mensal', 'end': None, 'anchor': 31, 'last': day_number('2026-12-31')}
+    assert [str(np.datetime64(int(d), 'D')) for d in next_occurrences(monthly, first, last)] == [
+        '2027-01-31', '2027-02-28', '2027-03-31', '2027-04-30', '2027-05-31', '2027-06-30']
+    monthly['end'] = day_number('2027-03-15')
+    assert len(next_occurrences(monthly, first, last)) == 2
+    weekly = {'recurrence_type': 'semanal', 'end': None, 'anchor': 1, 'last': day_number('2026-12-20')}
+    weeks = next_occurrences(weekly, first, last)
+    assert weeks[0] == day_number('2027-01-03') and np.all(np.diff(weeks) == 7)
+
+    assert forecast_horizon(date(2026, 11, 30), 1) == (day_number('2026-12-01'), day_number('2026-12-30'))
+    # Conta 1: 310,00 todo dezembro há 3 anos; conta 2: só um dezembro desde que foi aberta
+    cube = _cube([('2023-12-15', 31000, 'despesa', 1), ('2024-12-15', 31000, 'despesa', 1),
+                  ('2025-12-15', 31000, 'despesa', 1), ('2025-12-10', 31000, 'despesa', 2),
+                  ('2026-03-01', 50000, 'receita', 2)])
+    result = forecast_balances(cube, [], [1, 2], date(2026, 11, 30), 1)
+    assert result['opening'].tolist() == [-93000, 19000]
+    assert result['components']['baseline'].tolist() == [-30000, -30000]  # -1000/dia em dezembro
+    assert result['balances'][:, 0].tolist() == [-94000, 18000]
+
+def test_forecast_api_combines_sources(dataset_db, client_for):
+    """Teste: API soma agendados confirmados e séries sem materializar; saldo inicial = saldo de hoje"""
+    client = client_for(1)
+    before = client.get('/api/v1/planning/forecast?months=6').get_json()
+    today = date.today()
+    assert before['start'] == (today + timedelta(days=1)).isoformat()
+    assert before['end'] == add_months(today, 6).isoformat() and len(before['dates']) == len(before['total'])
+    as_of = client.get('/api/v1/balances/as-of').get_json()
+    assert [acc['opening_balance'] for acc in before['accounts']] == [acc['balance'] for acc in as_of['accounts']]
+
+    conn = sqlite3.connect(app.config['DATABASE'])
+    parent_date = today - timedelta(days=40)
+    series_end = today + timedelta(days=120)
+    conn.execute('''INSERT INTO transactions (description, amount, date, transaction_type, account_id,
+                                              recurrence_type, recurrence_end_date, is_confirmed)
+                    VALUES ('Academia', 100, ?, 'despesa', 1, 'mensal', ?, 1)''',
+                 (parent_date.isoformat(), series_end.isoformat()))
+    for amount, confirmed in ((500, 1), (300, 0)):
+        conn.execute('''INSERT INTO transactions (description, amount, date, transaction_type, account_id,
+                                                  recurrence_type, is_confirmed)
+                        VALUES ('Avulso futuro', ?, ?, 'receita', 1, 'unica', ?)''',
+                     (amount, (today + timedelta(days=10)).isoformat(), confirmed))
+    conn.commit()
+    conn.close()
+
+    expected_occurrences, current = 0, parent_date
+    while True:
+        current = add_months(current, 1)
+        if current > series_end:
+            break
+        expected_occurrences += current > today
+
+    after = client.get('/api/v1/planning/forecast?months=6').get_json()
+    old, new = before['accounts'][0], after['accounts'][0]
+    assert new['opening_balance'] == round(old['opening_balance'] - 100, 2)
+    assert new['components']['scheduled'] == round(old['components']['scheduled'] + 500, 2)
+    assert new['components']['recurring'] == round(old['components']['recurring'] - 100 * expected_occurrences, 2)
+    assert new['components']['baseline'] == old['components']['baseline']  # série fica fora da média
+    assert new['balances'][-1] == round(new['opening_balance'] + sum(new['components'].values()), 2)
+
+    for bad in ('months=0', 'months=25', 'months=abc'):
+        assert client.get(f'/api/v1/planning/forecast?{bad}').status_code == 400
+    assert client.get('/api/v1/planning/forecast?account_id=3').status_code == 404
+    check_route_budget(client, '/api/v1/planning/forecast?months=24')
+    assert client.get('/planning').status_code == 200
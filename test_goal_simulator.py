@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Testes da simulação de Monte Carlo das metas (goal_simulator.py)
+"""
+
+from datetime import date
+
+import numpy as np
+import pytest
+
+import goal_simulator
+from goal_simulator import BATCH_PATHS, simulate
+from query_budget import check_route_budget, count_queries
+
+TODAY = date(2026, 1, 10)
+
+pytestmark = pytest.mark.dataset(users=2, accounts_per_user=2, years=2, tx_per_month=10, seed=44)
+
+def _goal(goal_id, target, saved=0, target_date='2026-07-31', recent=0, first=None):
+    return {'id': goal_id, 'name': f'Meta {goal_id}', 'target_cents': target, 'target_date': target_date,
+            'saved_cents': saved, 'recent_cents': recent, 'first_contribution': first}
+
+def test_simulation_model():
+    """Teste: fração por meta, probabilidade contra distribuição conhecida, orçamento de tempo e semente"""
+    # R$ 1.000 livres todo mês; meta 1 recebeu metade disso no último ano, meta 2 fica com o resto
+    steady = np.full(12, 100000)
+    result = simulate([_goal(1, 400000, saved=100000, recent=600000, first='2024-05-01'),
+                       _goal(2, 300001), _goal(3, 5000, saved=5000, target_date='2025-12-01')],
+                      steady, TODAY, 1000, 10000, seed=1)
+    first, second, past = result['goals']
+    assert (first['months'], first['saving_rate'], first['probability']) == (6, 0.5, 1.0)
+    assert first['final'] == {'p10': 4000.0, 'p50': 4000.0, 'p90': 4000.0}
+    assert first['bands']['months'][0] == '2026-02' and first['bands']['p50'][0] == 1500.0
+    assert (second['saving_rate'], second['probability']) == (0.5, 0.0)  # chega a 300000, falta 1 centavo
+    assert (past['months'], past['probability']) == (0, 1.0)
+
+    # Meses de R$ 0 ou R$ 2.000 meio a meio: em 2 meses, P(>= R$ 4.000) = 1/4
+    alternating = np.array([0, 200000] * 6)
+    goals = [_goal(1, 400000, target_date='2026-03-01')]
+    result = simulate(goals, alternating, TODAY, 5000, 10000, seed=7)
+    assert result['paths'] == 5000 and not result['truncated']
+    assert abs(result['goals'][0]['probability'] - 0.25) < 0.03
+    assert simulate(goals, alternating, TODAY, 5000, 10000, seed=7)['goals'] == result['goals']
+
+    truncated = simulate(goals, alternating, TODAY, 5000, 0, seed=7)
+    assert truncated['paths'] == BATCH_PATHS and truncated['truncated']
+
+def test_simulation_api_cached_by_data_version(dataset_db, client_for):
+    """Teste: API em cache até a próxima contribuição; página de metas renderiza"""
+    client = client_for(1)
+    first = client.get('/api/v1/goals/simulation').get_json()
+    assert first['paths'] > 0 and first['goals']
+    assert all(0 <= goal['probability'] <= 1 for goal in first['goals'])
+    for goal in first['goals']:
+        bands = goal['bands']
+        assert len(bands['months']) == goal['months'] == len(bands['p50'])
+        assert all(low <= mid <= high for low, mid, high in zip(bands['p10'], bands['p50'], bands['p90']))
+
+    with count_queries() as counter:
+        assert client.get('/api/v1/goals/simulation').get_json() == first
+    assert counter.count == 2  # usuário + versão dos dados
+
+    goal_id = first['goals'][0]['id']
+    client.post(f'/goals/contribute/{goal_id}', data={'amount': '250.00', 'description': 'Extra'})
+    after = client.get('/api/v1/goals/simulation').get_json()
+    assert after['goals'][0]['saved_amount'] == round(first['goals'][0]['saved_amount'] + 250, 2)
+
+    check_route_budget(client, '/api/v1/goals/simulation')
+    assert client.get('/goals').status_code == 200
+
+def test_truncated_simulation_not_cached(dataset_db, monkeypatch, client_for):
+    """Teste: resultado truncado pelo orçamento de tempo não fica em cache; o completo sim"""
+    client = client_for(1)
+    monkeypatch.setitem(goal_simulator._settings, 'budget_ms', 0)
+    truncated = client.get('/api/v1/goals/simulation').get_json()
+    assert truncated['truncated'] and truncated['paths'] == BATCH_PATHS
+
+    monkeypatch.setitem(goal_simulator._settings, 'budget_ms', 60000)
+    with count_queries() as counter:
+        complete = client.get('/api/v1/goals/simulation').get_json()
+    assert counter.count > 2  # simulou de novo em vez de servir o truncado
+    assert not complete['truncated'] and complete['paths'] > BATCH_PATHS
+    with count_queries() as counter:
+        assert client.get('/api/v1/goals/simulation').get_json() == complete
+    assert counter.count == 2
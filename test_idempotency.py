@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Testes de chaves de idempotência (idempotency.py)
+"""
+
+import sqlite3
+
+import pytest
+from flask import session
+
+from app_simple_advanced import app
+from idempotency import REPLAYED_HEADER, idempotent
+from query_budget import count_queries
+
+pytestmark = pytest.mark.dataset(users=2, accounts_per_user=2, years=0.25, tx_per_month=5, seed=31)
+
+def _count(sql, params=()):
+    with sqlite3.connect(app.config['DATABASE']) as conn:
+        return conn.execute(sql, params).fetchone()[0]
+
+def test_json_replay_skips_writes(dataset_db, client_for):
+    """Teste: repetição com a mesma chave devolve a resposta gravada sem gravar de novo"""
+    client = client_for(1)
+    payload = {'description': 'Mercado semanal', 'amount': '310.25', 'date': '2024-06-03',
+               'transaction_type': 'despesa', 'account_id': 1, 'category_id': 6}
+    headers = {'Idempotency-Key': 'retry-123'}
+    first = client.post('/transactions/new', json=payload, headers=headers)
+    with count_queries() as counter:
+        retry = client.post('/transactions/new', json=payload, headers=headers)
+    assert retry.get_json() == first.get_json() and first.get_json()['success']
+    assert retry.headers[REPLAYED_HEADER] == 'true' and REPLAYED_HEADER not in first.headers
+    assert not any(s.lstrip().upper().startswith(('INSERT', 'UPDATE')) for s in counter.statements), counter.statements
+    assert _count("SELECT COUNT(*) FROM transactions WHERE description = 'Mercado semanal'") == 1
+
+    # Mesma chave, outro corpo -> 422; chave é por usuário
+    other = client.post('/transactions/new', json=dict(payload, amount='1.00'), headers=headers)
+    assert other.status_code == 422
+    user2 = client_for(2).post('/transactions/new', json=dict(payload, account_id=3), headers=headers)
+    assert user2.get_json()['success'] and REPLAYED_HEADER not in user2.headers
+
+def test_form_endpoints_replay_redirect(dataset_db, client_for):
+    """Teste: orçamento, conta e contribuição não são recriados em repetições"""
+    client = client_for(1)
+    with sqlite3.connect(app.config['DATABASE']) as conn:
+        conn.execute('DELETE FROM budgets')
+        goal_id = conn.execute("INSERT INTO goals (user_id, name, target_amount) VALUES (1, 'Viagem', 5000)").lastrowid
+
+    budget = {'category_id': '5', 'amount': '800', 'start_date': '2024-06-01', 'end_date': '2024-06-30'}
+    for _ in range(3):
+        response = client.post('/budgets/create', data=budget, headers={'Idempotency-Key': 'b-1'})
+        assert response.status_code == 302 and response.headers['Location'].endswith('/budgets')
+    assert _count('SELECT COUNT(*) FROM budgets') == 1
+
+    for _ in range(2):
+        client.post(f'/goals/contribute/{goal_id}', data={'amount': '150'}, headers={'Idempotency-Key': 'g-1'})
+    client.post(f'/goals/contribute/{goal_id}', data={'amount': '150'}, headers={'Idempotency-Key': 'g-2'})
+    assert _count('SELECT COUNT(*) FROM goal_contributions WHERE goal_id = ?', (goal_id,)) == 2
+
+    account = {'name': 'Conta Digital', 'type': 'conta_corrente', 'balance': 0}
+    first = client.post('/accounts/create', json=account, headers={'Idempotency-Key': 'a-1'}).get_json()
+    retry = client.post('/accounts/create', json=account, headers={'Idempotency-Key': 'a-1'}).get_json()
+    assert first == retry
+    assert _count("SELECT COUNT(*) FROM accounts WHERE name = 'Conta Digital'") == 1
+
+def test_expiry_and_failure_release_key(dataset_db, client_for):
+    """Teste: chave expirada ou reserva abandonada executam de novo; 5xx/exceção liberam a chave"""
+    client = client_for(1)
+    budget = {'category_id': '7', 'amount': '90', 'start_date': '2024-07-01', 'end_date': '2024-07-31'}
+    client.post('/budgets/create', data=budget, headers={'Idempotency-Key': 'exp'})
+    with sqlite3.connect(app.config['DATABASE']) as conn:
+        conn.execute('UPDATE idempotency_keys SET expires_at = 0')
+        conn.execute('DELETE FROM budgets')
+    response = client.post('/budgets/create', data=budget, headers={'Idempotency-Key': 'exp'})
+    assert REPLAYED_HEADER not in response.headers
+    assert _count('SELECT COUNT(*) FROM budgets') == 1
+
+    # Worker morto no meio da requisição: a reserva fica sem resposta
+    with sqlite3.connect(app.config['DATABASE']) as conn:
+        conn.execute('DELETE FROM budgets')
+    assert client.post('/budgets/create', data=budget, headers={'Idempotency-Key': 'crash'}).status_code == 302
+    with sqlite3.connect(app.config['DATABASE']) as conn:
+        conn.execute("UPDATE idempotency_keys SET status_code = NULL, body = NULL, "
+                     "reserved_at = CAST(strftime('%s') AS INTEGER) WHERE idempotency_key = 'crash'")
+        conn.execute('DELETE FROM budgets')
+    assert client.post('/budgets/create', data=budget, headers={'Idempotency-Key': 'crash'}).status_code == 409
+    with sqlite3.connect(app.config['DATABASE']) as conn:
+        conn.execute("UPDATE idempotency_keys SET reserved_at = reserved_at - ? WHERE idempotency_key = 'crash'",
+                     (app.config['IDEMPOTENCY_PROCESSING_TIMEOUT_SECONDS'] + 1,))
+    response = client.post('/budgets/create', data=budget, headers={'Idempotency-Key': 'crash'})
+    assert response.status_code == 302 and REPLAYED_HEADER not in response.headers
+    assert _count('SELECT COUNT(*) FROM budgets') == 1
+    assert _count("SELECT status_code FROM idempotency_keys WHERE idempotency_key = 'crash'") == 302
+
+    calls = []
+
+    def flaky_view():
+        calls.append(1)
+        if len(calls) == 1:
+            raise RuntimeError('banco ocupado')
+        return {'success': True}, 201
+
+    view = idempotent(flaky_view)
+    for expected in ('erro', 201, 201):
+        with app.test_request_context('/x', method='POST', data='{}', headers={'Idempotency-Key': 'f-1'}):
+            session['user_id'] = 1
+            try:
+                response = view()
+            except RuntimeError:
+                assert expected == 'erro'
+                continue
+            assert response.status_code == expected
+    assert len(calls) == 2  # a 3ª chamada foi replay
+
+def test_soft_failures_release_key(dataset_db, client_for):
+    """Teste: falha devolvida como 200/302 não é gravada; a nova tentativa com a mesma chave executa"""
+    client = client_for(1)
+    payload = {'description': 'Farmácia', 'amount': '42.10', 'date': '2024-06-10',
+               'transaction_type': 'despesa', 'account_id': 1, 'category_id': 6}
+    form = {'description': 'Padaria', 'amount': '12.00', 'date': '2024-06-11',
+            'transaction_type': 'despesa', 'account_id': '1', 'category': '6'}
+    with sqlite3.connect(app.config['DATABASE']) as conn:
+        conn.execute("""CREATE TRIGGER trg_test_busy BEFORE INSERT ON transactions
+                        BEGIN SELECT RAISE(ABORT, 'database is locked'); END""")
+    failed = client.post('/transactions/new', json=payload, headers={'Idempotency-Key': 't-1'})
+    assert failed.status_code == 200 and failed.get_json()['success'] is False
+    failed = client.post('/transactions/new', data=form, headers={'Idempotency-Key': 't-2'})
+    assert failed.status_code == 302
+    with client.session_transaction() as sess:
+        assert sess.pop('_flashes')[0][0] == 'danger'
+    assert _count('SELECT COUNT(*) FROM idempotency_keys') == 0
+
+    with sqlite3.connect(app.config['DATABASE']) as conn:
+        conn.execute('DROP TRIGGER trg_test_busy')
+    retry = client.post('/transactions/new', json=payload, headers={'Idempotency-Key': 't-1'})
+    assert retry.get_json()['success'] and REPLAYED_HEADER not in retry.headers
+    assert _count("SELECT COUNT(*) FROM transactions WHERE description = 'Farmácia'") == 1
+
+    # Redirect gravado: o replay repete a mensagem flash da primeira execução
+    for _ in range(2):
+        response = client.post('/transactions/new', data=form, headers={'Idempotency-Key': 't-2'})
+        assert response.status_code == 302
+        with client.session_transaction() as sess:
+            assert [category for category, _ in sess.pop('_flashes')] == ['success']
+    assert response.headers[REPLAYED_HEADER] == 'true'
+    assert _count("SELECT COUNT(*) FROM transactions WHERE description = 'Padaria'") == 1
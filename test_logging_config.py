@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+"""
+Testes do logging estruturado (logging_config.py)
+"""
+
+import json
+import logging
+
+from logging_config import JsonFormatter, DebugSamplingFilter, _parse_levels
+
+def _record(level, msg, args=(), extra=None):
+    record = logging.LogRecord('fynanpro.test', level, __file__, 1, msg, args, None)
+    for key, value in (extra or {}).items():
+        setattr(record, key, value)
+    return record
+
+def test_json_formatter_includes_extra_fields():
+    """Teste: JSON com mensagem formatada de forma preguiçosa + campos extra"""
+    line = JsonFormatter().format(_record(logging.INFO, 'GET %s %s', ('/dashboard', 200),
+                                          {'duration_ms': 12.5, 'user_id': 7}))
+    payload = json.loads(line)
+    assert payload['msg'] == 'GET /dashboard 200'
+    assert payload['level'] == 'INFO'
+    assert payload['logger'] == 'fynanpro.test'
+    assert payload['duration_ms'] == 12.5 and payload['user_id'] == 7
+    assert 'args' not in payload and 'levelno' not in payload
+
+def test_debug_sampling_keeps_warnings():
+    """Teste: amostragem descarta DEBUG mas nunca WARNING/ERROR"""
+    sampler = DebugSamplingFilter(0.0)
+    assert sampler.filter(_record(logging.DEBUG, 'hot path')) is False
+    assert sampler.filter(_record(logging.WARNING, 'importante')) is True
+    assert DebugSamplingFilter(1.0).filter(_record(logging.DEBUG, 'tudo')) is True
+
+def test_parse_levels():
+    """Teste: LOG_LEVELS no formato logger=NIVEL"""
+    assert _parse_levels('migrations=warning, fynanpro.access=INFO') == {
+        'migrations': 'WARNING', 'fynanpro.access': 'INFO'}
+    assert _parse_levels('') == {}
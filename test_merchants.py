@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Testes dos estabelecimentos normalizados (merchants.py, migração 017)
+"""
+
+import io
+import sqlite3
+from collections import defaultdict
+
+import pytest
+
+from app_simple_advanced import app
+from merchants import intern_merchants, main as merchants_main, merchant_key, merchant_name
+from migrations import column_exists, run_all_migrations, table_exists
+from migrations.migration_017_merchants import migration_017
+from query_budget import check_route_budget
+
+PERIOD = 'start_date=2020-01-01&end_date=2030-12-31'
+
+def test_normalization_and_backfill(tmp_path):
+    """Teste: variações do extrato viram uma chave; migração preenche; descrição alterada é remapeada"""
+    assert {merchant_key(d) for d in ('PAG*IFOOD 1234', 'IFOOD *SP', 'iFood', 'ifood 0042')} == {'ifood'}
+    assert merchant_name('COMPRA CARTAO DROGASIL 0423') == 'DROGASIL'
+    assert merchant_name('PAYPAL *NETFLIX') == 'NETFLIX'
+    assert merchant_name('99 POP 1234') == '99 POP' and merchant_name('POSTO SHELL 12') == 'POSTO SHELL'
+    assert merchant_key('Pão de Açúcar') == 'pao de acucar' and merchant_key('') == 'sem descricao'
+
+    db_path = str(tmp_path / 'merchants.db')
+    assert run_all_migrations(db_path)
+    conn = sqlite3.connect(db_path)
+    conn.execute("INSERT INTO users (id, email, password_hash, first_name, last_name) VALUES (1, 'u@t', 'x', 'U', 'U')")
+    conn.execute("INSERT INTO accounts (id, user_id, name, account_type) VALUES (1, 1, 'Conta', 'corrente')")
+    descriptions = ['PAG*IFOOD 1234', 'IFOOD *SP', 'iFood', 'Pão de Açúcar', 'PAO DE ACUCAR 12', 'Uber']
+    for description in descriptions:
+        conn.execute('''INSERT INTO transactions (description, amount, date, transaction_type, account_id)
+                        VALUES (?, 10, '2025-01-01', 'despesa', 1)''', (description,))
+
+    # Banco com lançamentos anteriores à migração: preenchidos de uma vez
+    migration_017(conn, table_exists=table_exists, column_exists=column_exists)
+    mapped = dict(conn.execute('''SELECT t.description, m.key FROM transactions t
+                                  JOIN merchants m ON m.id = t.merchant_id'''))
+    assert mapped == {d: merchant_key(d) for d in descriptions}
+    assert conn.execute('SELECT COUNT(*) FROM merchants').fetchone()[0] == 3
+    ifood = intern_merchants(conn, ['iFood'])['iFood']
+    assert intern_merchants(conn, ['IFOOD *RJ', 'Novo Lugar']) == {
+        'IFOOD *RJ': ifood, 'Novo Lugar': conn.execute("SELECT id FROM merchants WHERE key = 'novo lugar'").fetchone()[0]}
+
+    # Descrição alterada fora da aplicação: merchant_id zerado pelo trigger e recalculado pela linha de comando
+    conn.execute("UPDATE transactions SET description = 'UBER *TRIP 99' WHERE description = 'iFood'")
+    conn.execute("UPDATE transactions SET notes = 'x' WHERE description = 'Uber'")
+    assert conn.execute('SELECT COUNT(*) FROM transactions WHERE merchant_id IS NULL').fetchone()[0] == 1
+    conn.commit()
+    assert merchants_main(['--db', db_path]) == 0
+    assert conn.execute('''SELECT m.key FROM transactions t JOIN merchants m ON m.id = t.merchant_id
+                           WHERE t.description = 'UBER *TRIP 99' ''').fetchone()[0] == 'uber'
+    conn.close()
+
+@pytest.mark.dataset(users=2, accounts_per_user=2, years=1, tx_per_month=30, seed=50)
+def test_merchant_report_and_write_paths(dataset_db, client_for):
+    """Teste: totais por estabelecimento batem com a chave; novo lançamento, importação e extrato usam o id"""
+    conn = sqlite3.connect(app.config['DATABASE'])
+    # O gerador grava merchant_id: o relatório não tem o que preencher na leitura
+    assert conn.execute('SELECT COUNT(*) FROM transactions WHERE merchant_id IS NULL').fetchone()[0] == 0
+    expected = defaultdict(lambda: [0, 0])
+    descriptions = set()
+    for description, kind, amount in conn.execute('''
+        SELECT t.description, t.transaction_type, t.amount FROM transactions t
+        JOIN accounts a ON a.id = t.account_id WHERE a.user_id = 1 AND t.is_confirmed = 1'''):
+        descriptions.add(description)
+        expected[merchant_key(description)][0] += 1
+        if kind == 'despesa':
+            expected[merchant_key(description)][1] += round(amount * 100)
+    conn.close()
+
+    client = client_for(1)
+    report = client.get(f'/api/v1/reports/merchants?{PERIOD}').get_json()['merchants']
+    assert {merchant_key(m['name']): [m['quantity'], round(m['expenses'] * 100)] for m in report} == expected
+    assert len(report) < len(descriptions) and 'ifood' in expected  # variações agrupadas
+    expenses = [m['expenses'] for m in report]
+    assert expenses == sorted(expenses, reverse=True)
+    assert len(client.get(f'/api/v1/reports/merchants?{PERIOD}&limit=3').get_json()['merchants']) == 3
+    ifood = next(m for m in report if merchant_key(m['name']) == 'ifood')
+
+    assert client.post('/transactions/new', json={
+        'description': 'PAG*IFOOD 9981', 'amount': '55.00', 'date': '2025-05-02',
+        'transaction_type': 'despesa', 'account_id': 1, 'category_id': 5}).get_json()['success']
+    csv_file = 'data;descricao;valor\n03/05/2025;IFOOD *RJ;-42,00\n04/05/2025;Padaria Nova 01;-8,00\n'.encode()
+    imported = client.post('/transactions/import', headers={'Accept': 'application/json'}, data={
+        'csv_file': (io.BytesIO(csv_file), 'extrato.csv'), 'account_id': '1', 'has_header': '1'}).get_json()
+    assert imported['inserted'] == 2
+    conn = sqlite3.connect(app.config['DATABASE'])
+    written = dict(conn.execute('''SELECT description, merchant_id FROM transactions
+                                   WHERE description IN ('PAG*IFOOD 9981', 'IFOOD *RJ', 'Padaria Nova 01')'''))
+    assert written['PAG*IFOOD 9981'] == written['IFOOD *RJ'] == ifood['id']
+    assert conn.execute('SELECT name FROM merchants WHERE id = ?', (written['Padaria Nova 01'],)).fetchone()[0] == \
+        'Padaria Nova'
+    edited_id = conn.execute("SELECT id FROM transactions WHERE description = 'IFOOD *RJ'").fetchone()[0]
+    conn.close()
+
+    # Descrição editada: merchant_id recalculado na própria edição
+    assert client.post(f'/transactions/{edited_id}/edit', data={
+        'description': 'Padaria Nova 02', 'amount': '42.00', 'date': '2025-05-03',
+        'transaction_type': 'despesa', 'account_id': '1', 'category': '5'}).status_code == 302
+    conn = sqlite3.connect(app.config['DATABASE'])
+    assert conn.execute('SELECT merchant_id FROM transactions WHERE id = ?', (edited_id,)).fetchone()[0] == \
+        written['Padaria Nova 01']
+    conn.close()
+
+    page = client.get(f"/transactions?merchant_id={ifood['id']}").get_data(as_text=True)
+    assert page.count('class="transaction-card"') == min(expected['ifood'][0] + 1, 50)  # + novo, - editado
+    assert 'Padaria Nova 01' in client.get('/transactions?search=padaria%20nova').get_data(as_text=True)
+    pao = client.get('/transactions?search=pao%20de%20acucar').get_data(as_text=True)
+    assert ('Pão de Açúcar' in pao) == ('pao de acucar' in expected)
+
+    assert client_for(2).get(f'/api/v1/reports/merchants?{PERIOD}').get_json()['merchants'] != report
+    assert client.get('/api/v1/reports/merchants?start_date=ontem').status_code == 400
+    check_route_budget(client, f'/api/v1/reports/merchants?{PERIOD}')
+    check_route_budget(client, f'/reports/merchants?{PERIOD}')
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Testes de valores monetários em centavos (money.py + migração 005)
+"""
+
+import sqlite3
+from decimal import Decimal
+
+import pytest
+
+from money import Money, cents_sql, to_cents
+from migrations import run_all_migrations
+
+def test_parse_and_arithmetic():
+    """Teste: conversão para centavos, somas exatas e formatação brasileira"""
+    assert to_cents(0.1) == 10
+    assert to_cents('1.234,56') == 123456
+    assert to_cents('R$ -12,3') == -1230
+    assert to_cents('1234.565') == 123457
+    assert to_cents(Decimal('10.005')) == 1001
+    assert to_cents(None) == 0
+
+    total = sum((Money.from_value(0.1) for _ in range(10)), Money())
+    assert total == Money(100)
+    assert sum(Money(5) for _ in range(3)) == Money(15)
+    assert Money(150) - Money(200) == Money(-50)
+    assert -Money(5) < Money(0) < Money(1)
+
+    assert Money(123456789).format() == 'R$ 1.234.567,89'
+    assert Money(-5).format() == 'R$ -0,05'
+    assert str(Money(100)) == 'R$ 1,00'
+    assert Money(1999).to_float() == 19.99
+
+    try:
+        to_cents('abc')
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("Texto inválido deveria falhar")
+
+def test_dual_read_sql():
+    """Teste: expressão SQL prefere a coluna em centavos quando existe"""
+    assert cents_sql('amount', 't') == 'CAST(ROUND(t.amount * 100) AS INTEGER)'
+    assert cents_sql('amount', 't', ['amount', 'amount_cents']) == \
+        'COALESCE(t.amount_cents, CAST(ROUND(t.amount * 100) AS INTEGER))'
+    assert Money.from_row({'amount': 1.5, 'amount_cents': 151}, 'amount') == Money(151)
+    assert Money.from_row({'amount': 1.5, 'amount_cents': None}, 'amount') == Money(150)
+    assert Money.from_row({'amount': 1.5}, 'amount') == Money(150)
+
+def test_migration_backfill_and_triggers(tmp_path):
+    """Teste: migração 005 preenche centavos e mantém escrita legada sincronizada"""
+    db_path = str(tmp_path / 'money.db')
+    conn = sqlite3.connect(db_path)
+    conn.executescript('''
+        CREATE TABLE users (id INTEGER PRIMARY KEY, email TEXT, password_hash TEXT);
+        CREATE TABLE accounts (id INTEGER PRIMARY KEY, user_id INTEGER, name TEXT, account_type TEXT,
+                               initial_balance REAL DEFAULT 0, current_balance REAL DEFAULT 0);
+        CREATE TABLE transactions (id INTEGER PRIMARY KEY, description TEXT, amount REAL NOT NULL,
+                                   date DATE NOT NULL, transaction_type TEXT, account_id INTEGER);
+        INSERT INTO users VALUES (1, 'a@b.c', 'x');
+        INSERT INTO accounts (id, user_id, name, account_type, current_balance) VALUES (1, 1, 'CC', 'corrente', 0.3);
+        INSERT INTO transactions (description, amount, date, transaction_type, account_id)
+        VALUES ('a', 0.1, '2024-01-01', 'receita', 1), ('b', 0.2, '2024-01-02', 'receita', 1);
+    ''')
+    conn.commit()
+    conn.close()
+    assert run_all_migrations(db_path)
+
+    conn = sqlite3.connect(db_path)
+    assert conn.execute('SELECT SUM(amount_cents) FROM transactions').fetchone()[0] == 30
+    assert conn.execute('SELECT current_balance_cents FROM accounts').fetchone()[0] == 30
+
+    # Escrita legada (só REAL) -> trigger preenche centavos
+    conn.execute("INSERT INTO transactions (description, amount, date, transaction_type, account_id) "
+                 "VALUES ('c', 19.99, '2024-01-03', 'despesa', 1)")
+    assert conn.execute("SELECT amount_cents FROM transactions WHERE description = 'c'").fetchone()[0] == 1999
+    conn.execute("UPDATE transactions SET amount = 20.01 WHERE description = 'c'")
+    assert conn.execute("SELECT amount_cents FROM transactions WHERE description = 'c'").fetchone()[0] == 2001
+
+    # Escrita nova (REAL + centavos) é respeitada
+    conn.execute("INSERT INTO transactions (description, amount, amount_cents, date, transaction_type, account_id) "
+                 "VALUES ('d', 5.0, 500, '2024-01-04', 'despesa', 1)")
+    assert conn.execute("SELECT amount_cents FROM transactions WHERE description = 'd'").fetchone()[0] == 500
+    conn.close()
+
+@pytest.mark.dataset(users=1, accounts_per_user=2, years=0.25, tx_per_month=10, seed=5)
+def test_account_balance_is_exact(app, dataset_db):
+    """Teste: update_account_balance soma em centavos e grava as duas colunas"""
+    from app_simple_advanced import get_db, update_account_balance
+    with app.app_context():
+        conn = get_db()
+        conn.executemany("INSERT INTO transactions (description, amount, date, transaction_type, account_id) "
+                         "VALUES ('x', 0.1, '2024-01-01', 'receita', 1)", [()] * 10)
+        update_account_balance(conn, 1)
+        conn.commit()
+        row = conn.execute('SELECT current_balance, current_balance_cents FROM accounts WHERE id = 1').fetchone()
+        expected = conn.execute('''
+            SELECT SUM(CASE WHEN transaction_type = 'despesa' THEN -amount_cents ELSE amount_cents END)
+            FROM transactions WHERE account_id = 1
+        ''').fetchone()[0]
+        conn.close()
+    assert row['current_balance_cents'] == expected
+    assert row['current_balance'] == expected / 100
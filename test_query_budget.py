@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Testes de orçamento de queries por rota (query_budget.py)
+"""
+
+import pytest
+
+from query_budget import QueryBudgetExceeded, assert_max_queries, check_query_headers, check_route_budget
+
+pytestmark = pytest.mark.dataset(users=2, accounts_per_user=3, years=0.5, tx_per_month=10, seed=3)
+
+def test_assert_max_queries_lists_statements(dataset_db, client_for):
+    """Teste: estouro do orçamento falha com a lista de statements"""
+    client = client_for(1)
+    try:
+        with assert_max_queries(1, label='dashboard'):
+            client.get('/dashboard')
+    except QueryBudgetExceeded as e:
+        assert e.budget == 1
+        assert len(e.statements) > 1
+        assert 'SELECT * FROM users WHERE id = 1' in str(e)
+    else:
+        raise AssertionError("Orçamento de 1 query deveria estourar")
+
+def test_declared_route_budgets(dataset_db, client_for):
+    """Teste: rotas principais cabem no orçamento declarado com @query_budget"""
+    client = client_for(1)
+    urls = [
+        '/dashboard', '/dashboard?period=year',
+        '/transactions', '/transactions?page=3', '/transactions?search=IFOOD&type=despesa',
+        '/reports', '/reports/cash_flow', '/reports/categories', '/reports/accounts',
+        '/reports/trends', '/reports/export/transactions', '/budgets', '/transactions/duplicates',
+    ]
+    for url in urls:
+        response = check_route_budget(client, url)
+        assert response.status_code == 200, f"{url} -> {response.status_code}"
+
+def test_header_and_raise_modes(app, dataset_db, monkeypatch, client_for):
+    """Teste: QUERY_BUDGET_MODE header expõe contagem; raise falha a requisição"""
+    client = client_for(1)
+    client.get('/transactions')  # aquecer caches de schema/categorias
+    monkeypatch.setitem(app.config, 'QUERY_BUDGET_MODE', 'header')
+    response = client.get('/transactions')
+    assert response.headers['X-Query-Budget'] == '4'
+    assert check_query_headers(response, '/transactions') <= 4
+
+    view = app.view_functions['transactions']
+    monkeypatch.setitem(app.config, 'QUERY_BUDGET_MODE', 'raise')
+    monkeypatch.setattr(view, 'query_budget', 1)
+    try:
+        client.get('/transactions')
+    except QueryBudgetExceeded as e:
+        assert e.label == 'transactions'
+    else:
+        raise AssertionError("Modo raise deveria falhar a requisição")
+
+def test_transactions_scoped_to_user(dataset_db, connect, client_for):
+    """Teste: extrato e estatísticas mostram apenas transações do usuário logado"""
+    with connect() as conn:
+        own = conn.execute('''
+            SELECT COUNT(*) FROM transactions t JOIN accounts a ON t.account_id = a.id
+            WHERE a.user_id = 1
+        ''').fetchone()[0]
+    response = client_for(1).get('/transactions')
+    assert response.status_code == 200
+    assert f'<h4>{own}</h4>'.encode() in response.data
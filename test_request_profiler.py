@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Testes do profiler de requisições (request_profiler.py)
+"""
+
+import os
+import sqlite3
+
+import pytest
+
+import app_simple_advanced
+from app_simple_advanced import init_db
+
+@pytest.fixture
+def profiler_app(app, tmp_path, monkeypatch):
+    """Banco temporário com um usuário admin e um usuário comum"""
+    monkeypatch.setitem(app.config, 'PROFILE_DIR', str(tmp_path / 'profiles'))
+    monkeypatch.setitem(app.config, 'PROFILE_SAMPLE_RATE', 0.0)
+    init_db()
+
+    with sqlite3.connect(app.config['DATABASE']) as conn:
+        conn.execute("""
+            INSERT INTO users (first_name, last_name, email, password_hash)
+            VALUES ('Admin', 'FynanPro', 'admin@fynanpro.com', 'x'),
+                   ('Maria', 'Silva', 'maria@example.com', 'x')
+        """)
+    return app
+
+def test_admin_flag_captures_profile(profiler_app, client_for):
+    """Teste: admin com ?_profile=1 gera pstats + collapsed + metadados"""
+    app = profiler_app
+    client = client_for(1)
+    response = client.get('/api/v1/user/profile?_profile=1')
+    assert response.status_code == 200
+    profile_id = response.headers.get('X-Profile-Id')
+    assert profile_id, "Header X-Profile-Id ausente"
+
+    files = sorted(os.listdir(app.config['PROFILE_DIR']))
+    assert files == [f'{profile_id}.collapsed', f'{profile_id}.json', f'{profile_id}.pstats']
+
+    profiles = app_simple_advanced.list_profiles(app.config['PROFILE_DIR'])
+    assert profiles[0]['endpoint'] == 'api_user_profile'
+    assert profiles[0]['user_id'] == 1
+    assert profiles[0]['trigger'] == 'admin'
+
+    download = client.get(f'/admin/profiles/{profile_id}/pstats')
+    assert download.status_code == 200 and len(download.data) > 0
+
+    listing = client.get('/admin/profiles')
+    assert listing.status_code == 200 and profile_id.encode() in listing.data
+
+def test_non_admin_flag_is_ignored(profiler_app, client_for):
+    """Teste: usuário comum não consegue ativar o profiler nem ver a página admin"""
+    client = client_for(2)
+    response = client.get('/api/v1/user/profile', headers={'X-Profile': '1'})
+    assert response.status_code == 200
+    assert 'X-Profile-Id' not in response.headers
+    assert not os.path.exists(profiler_app.config['PROFILE_DIR'])
+
+    listing = client.get('/admin/profiles')
+    assert listing.status_code == 302
+
+def test_sample_rate_uses_sampler_only(profiler_app, monkeypatch, client_for):
+    """Teste: amostragem automática grava apenas pilhas colapsadas"""
+    app = profiler_app
+    monkeypatch.setitem(app.config, 'PROFILE_SAMPLE_RATE', 1.0)
+    response = client_for(2).get('/api/v1/user/profile')
+    profile_id = response.headers.get('X-Profile-Id')
+    assert profile_id
+    assert not os.path.exists(os.path.join(app.config['PROFILE_DIR'], f'{profile_id}.pstats'))
+    assert os.path.exists(os.path.join(app.config['PROFILE_DIR'], f'{profile_id}.collapsed'))
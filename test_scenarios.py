@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Testes dos cenários "e se" do planejamento (scenarios.py)
+"""
+
+import sqlite3
+from datetime import date
+
+import numpy as np
+import pytest
+
+from app_simple_advanced import app
+from analytics_cube import LedgerCube, day_number
+from forecast import forecast_basis, project
+from money import Money
+from query_budget import check_route_budget, count_queries
+from scenarios import ScenarioError, evaluate, parse_scenario
+
+TODAY = date(2026, 11, 30)
+CHARTS = {10: {'name': 'Alimentação', 'code': '4.1', 'account_type': 'despesa'},
+          11: {'name': 'Supermercado', 'code': '4.1.01', 'account_type': 'despesa'},
+          20: {'name': 'Moradia', 'code': '4.2', 'account_type': 'despesa'}}
+
+pytestmark = pytest.mark.dataset(users=2, accounts_per_user=2, years=2, tx_per_month=10, seed=45)
+
+def _basis():
+    """Dezembro passado: 310,00 de Supermercado e 620,00 de Moradia na conta 1; 3.100,00 de salário"""
+    rows = [('2025-12-10', 31000, 1, 1, 11), ('2025-12-12', 62000, 1, 1, 20), ('2025-12-05', 310000, 0, 1, 0)]
+    days, cents, kinds, accounts, charts = zip(*rows)
+    chart_ids = np.array([0, 10, 11, 20])
+    cube = LedgerCube(day=np.array([day_number(d) for d in days], dtype=np.int32),
+                      cents=np.array(cents, dtype=np.int64), kind=np.array(kinds, dtype=np.int8),
+                      confirmed=np.ones(len(rows), dtype=bool), recurring=np.zeros(len(rows), dtype=bool),
+                      account=np.zeros(len(rows), dtype=np.int32),
+                      chart=np.array([list(chart_ids).index(c) for c in charts], dtype=np.int32),
+                      account_ids=np.array([1]), chart_ids=chart_ids, charts=CHARTS)
+    return forecast_basis(cube, [], [1], TODAY)
+
+def test_scenario_engine():
+    """Teste: corte por plano de contas (com filhos), fluxos mensais/avulsos e contribuição para meta"""
+    basis = _basis()
+    accounts = [{'id': 1, 'name': 'Conta', 'include_in_total': 1}]
+    base = project(basis, 2)
+
+    _, months, adjustments = parse_scenario({'months': 2, 'adjustments': [
+        {'type': 'category', 'category': 'alimentação', 'percent': -50}]})
+    result = evaluate(basis, accounts, adjustments, months)
+    assert result['baseline']['end_balance'] == Money(int(base['balances'][0, -1])).to_float()
+    # Supermercado (4.1.01) é filho de Alimentação (4.1): metade de 310,00; Moradia não muda
+    assert result['difference'][-1] == 155.0
+    assert result['scenario']['components']['baseline'] == round(3100 - 620 - 155, 2)
+
+    _, months, adjustments = parse_scenario({'months': 3, 'adjustments': [
+        {'type': 'monthly', 'amount': '-300,00', 'day': 31},
+        {'type': 'one_time', 'amount': 1000, 'date': '2026-12-20'},
+        {'type': 'goal_contribution', 'goal_id': 7, 'amount': 500, 'day': 5}]})
+    goal = {'id': 7, 'name': 'Viagem', 'target_cents': 500000, 'target_date': '2027-06-30', 'saved_cents': 200000}
+    result = evaluate(basis, accounts, adjustments, months, [goal])
+    # Dezembro a fevereiro (dia 31 -> 28/02): -300 e -500 em cada mês, +1.000 em 20/12
+    assert result['scenario']['components']['adjustments'] == 1000 - 3 * 800
+    assert result['difference'][-1] == -1400.0
+    assert result['difference'][result['dates'].index('2026-12-20')] == 500.0
+    assert result['goals'][0]['projected_amount'] == 2000 + 500 * 7 and result['goals'][0]['reaches_target']
+
+    for bad in ({'adjustments': []}, {'months': 30, 'adjustments': [{'type': 'monthly', 'amount': 1}]},
+                {'adjustments': [{'type': 'bonus'}]}, {'adjustments': [{'type': 'category', 'percent': 10}]},
+                {'adjustments': [{'type': 'monthly', 'amount': 'abc'}]},
+                {'adjustments': [{'type': 'goal_contribution', 'goal_id': 1, 'amount': -5}]}):
+        try:
+            parse_scenario(bad)
+            raise AssertionError(f'{bad} deveria ser recusado')
+        except ScenarioError:
+            pass
+
+def test_scenario_api_recomputes_lazily(dataset_db, client_for):
+    """Teste: preview igual à projeção sem ajustes; cenário salvo só recalcula quando os dados mudam"""
+    client = client_for(1)
+    forecast = client.get('/api/v1/planning/forecast?months=6').get_json()
+    body = {'months': 6, 'adjustments': [{'type': 'category', 'chart_account_id': 999999, 'percent': -20}]}
+    preview = client.post('/api/v1/planning/scenarios/preview', json=body).get_json()
+    assert preview['baseline']['total'] == preview['scenario']['total'] == forecast['total']
+
+    body = {'name': 'Apertar o cinto', 'months': 6,
+            'adjustments': [{'type': 'monthly', 'amount': 250, 'account_id': 2}]}
+    response = client.post('/api/v1/planning/scenarios', json=body)
+    assert response.status_code == 201
+    created = response.get_json()
+    scenario_id = created['id']
+    assert created['result']['accounts'][1]['scenario_end'] == round(
+        created['result']['accounts'][1]['baseline_end'] + 250 * 6, 2)
+
+    with count_queries() as counter:
+        assert client.get(f'/api/v1/planning/scenarios/{scenario_id}').get_json() == created
+    assert counter.count == 3  # usuário + cenário + versão dos dados
+
+    conn = sqlite3.connect(app.config['DATABASE'])
+    conn.execute('''INSERT INTO transactions (description, amount, date, transaction_type, account_id, is_confirmed)
+                    VALUES ('Bônus', 1000, ?, 'receita', 2, 1)''', (date.today().isoformat(),))
+    conn.commit()
+    conn.close()
+    after = client.get(f'/api/v1/planning/scenarios/{scenario_id}').get_json()
+    assert after['result_version'] != created['result_version']
+    assert after['result']['accounts'][1]['baseline_end'] == round(
+        created['result']['accounts'][1]['baseline_end'] + 1000, 2)
+    check_route_budget(client, f'/api/v1/planning/scenarios/{scenario_id}')
+
+    assert [s['id'] for s in client.get('/api/v1/planning/scenarios').get_json()['scenarios']] == [scenario_id]
+    assert client_for(2).get(f'/api/v1/planning/scenarios/{scenario_id}').status_code == 404
+    assert client.post('/api/v1/planning/scenarios', json={'adjustments': 'x'}).status_code == 400
+    foreign = {'adjustments': [{'type': 'monthly', 'amount': 10, 'account_id': 3}]}
+    assert client.post('/api/v1/planning/scenarios/preview', json=foreign).status_code == 400
+    assert client.delete(f'/api/v1/planning/scenarios/{scenario_id}').status_code == 200
+    assert client.delete(f'/api/v1/planning/scenarios/{scenario_id}').status_code == 404
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Testes da importação de extratos CSV/OFX (statement_import.py)
+"""
+
+import io
+import sqlite3
+import time
+
+import pytest
+
+from app_simple_advanced import app, update_account_balance
+from statement_import import (LineSource, StatementImporter, StatementImportError,
+                              iter_csv, iter_ofx, parse_amount)
+
+OFX_SAMPLE = b"""OFXHEADER:100
+DATA:OFXSGML
+CHARSET:1252
+
+<OFX><BANKMSGSRSV1><STMTTRNRS><STMTRS><BANKTRANLIST>
+<STMTTRN>
+<TRNTYPE>DEBIT
+<DTPOSTED>20240105120000[-3:BRT]
+<TRNAMT>-35,90
+<FITID>A1
+<MEMO>Padaria P\xe3o Quente
+</STMTTRN>
+<STMTTRN><TRNTYPE>CREDIT<DTPOSTED>20240110<TRNAMT>1500.00<FITID>A2<NAME>PIX RECEBIDO</STMTTRN>
+</BANKTRANLIST></STMTRS></STMTTRNRS></BANKMSGSRSV1></OFX>
+"""
+
+pytestmark = pytest.mark.dataset(users=2, accounts_per_user=2, years=0.25, tx_per_month=5, seed=11)
+
+def _balance_cents(conn, account_id):
+    return conn.execute('''
+        SELECT SUM(CASE WHEN transaction_type = 'despesa' THEN -amount_cents ELSE amount_cents END)
+        FROM transactions WHERE account_id = ?
+    ''', (account_id,)).fetchone()[0]
+
+def test_csv_and_ofx_parsing():
+    """Teste: normalização de datas/valores, detecção de separador e linhas inválidas"""
+    assert parse_amount('R$ -1.234,56') == -123456
+    assert parse_amount('(12,50)') == -1250
+    assert parse_amount('1,234.56', '.') == 123456
+
+    csv_data = 'Data;Histórico;Valor (R$);Tipo\n05/01/2024;Mercado;"-1.234,56";\n' \
+               '06/01/2024;Salário;5.000,00;C\n31/02/2024;Data ruim;10,00;\n07/01/2024;Estorno;-20,00;Crédito\n'
+    records = list(iter_csv(LineSource(io.BytesIO(csv_data.encode('utf-8')))))
+    assert [r.error is None for r in records] == [True, True, False, True]
+    assert records[0][1:5] == ('2024-01-05', 'Mercado', 123456, 'despesa')
+    assert records[1].transaction_type == 'receita'
+    assert records[2].line == 4
+    assert records[3][3:5] == (2000, 'receita')
+
+    no_header = list(iter_csv(['2024-01-05,Café,-4.50\n'], '%Y-%m-%d', '.', has_header=False))
+    assert no_header[0][1:5] == ('2024-01-05', 'Café', 450, 'despesa')
+
+    try:
+        list(iter_csv(['Quando;Quanto\n', '01/01/2024;1\n']))
+    except StatementImportError as e:
+        assert 'date' in str(e)
+    else:
+        raise AssertionError("Cabeçalho sem colunas obrigatórias deveria falhar")
+
+    ofx = list(iter_ofx(LineSource(io.BytesIO(OFX_SAMPLE))))
+    assert len(ofx) == 2
+    assert ofx[0][1:6] == ('2024-01-05', 'Padaria Pão Quente', 3590, 'despesa', 'A1')
+    assert ofx[1][1:6] == ('2024-01-10', 'PIX RECEBIDO', 150000, 'receita', 'A2')
+
+def test_large_csv_batched_import(dataset_db):
+    """Teste: 120k linhas em lotes, progresso periódico e saldo recalculado uma vez"""
+    lines = ['data;descricao;valor\n']
+    lines += [f'{(i % 28) + 1:02d}/03/2024;Compra {i};{"-" if i % 3 else ""}{i % 500},{i % 100:02d}\n'
+              for i in range(120000)]
+    payload = ''.join(lines).encode('utf-8')
+
+    balance_calls = []
+    progress = []
+
+    def tracked_update(conn, account_id):
+        balance_calls.append(account_id)
+        update_account_balance(conn, account_id)
+
+    conn = sqlite3.connect(app.config['DATABASE'])
+    conn.row_factory = sqlite3.Row
+    with app.app_context():
+        started = time.perf_counter()
+        summary = StatementImporter(conn, 1, 1, tracked_update,
+                                    on_progress=lambda s, pct: progress.append(pct)).run(
+            io.BytesIO(payload), 'csv', filename='grande.csv', total_bytes=len(payload))
+        elapsed = time.perf_counter() - started
+
+    assert summary['inserted'] == 120000 and summary['error_count'] == 0
+    assert balance_calls == [1]
+    assert len(progress) == 12 and progress[-1] == 100.0
+    batch = conn.execute('SELECT * FROM import_batches WHERE id = ?', (summary['import_id'],)).fetchone()
+    assert batch['status'] == 'completed' and batch['inserted_count'] == 120000
+    imported = conn.execute('SELECT COUNT(*) FROM transactions WHERE import_batch_id = ? AND created_by_import = 1',
+                            (summary['import_id'],)).fetchone()[0]
+    assert imported == 120000
+    account = conn.execute('SELECT current_balance_cents FROM accounts WHERE id = 1').fetchone()
+    assert account['current_balance_cents'] == _balance_cents(conn, 1)
+    conn.close()
+    print(f"   ⏱️ {elapsed:.2f}s para 120k linhas")
+
+def test_failed_import_is_rolled_back(dataset_db):
+    """Teste: falha no meio da importação remove os lotes já gravados"""
+    conn = sqlite3.connect(app.config['DATABASE'])
+    conn.row_factory = sqlite3.Row
+    before = conn.execute('SELECT COUNT(*) FROM transactions').fetchone()[0]
+
+    def exploding_lines():
+        yield b'data;descricao;valor\n'
+        for i in range(30):
+            yield f'01/03/2024;Linha {i};-1,00\n'.encode()
+        raise IOError('upload interrompido')
+
+    with app.app_context():
+        try:
+            StatementImporter(conn, 1, 1, update_account_balance, batch_size=10).run(exploding_lines())
+        except IOError:
+            pass
+        else:
+            raise AssertionError("Falha de leitura deveria propagar")
+
+    assert conn.execute('SELECT COUNT(*) FROM transactions').fetchone()[0] == before
+    assert conn.execute('SELECT status FROM import_batches').fetchone()[0] == 'failed'
+
+    try:
+        StatementImporter(conn, 1, 3, update_account_balance).run(io.BytesIO(b'data;descricao;valor\n'))
+    except StatementImportError:
+        pass
+    else:
+        raise AssertionError("Conta de outro usuário deveria ser recusada")
+    conn.close()
+
+def test_import_route_and_status(dataset_db):
+    """Teste: upload pela rota /transactions/import e consulta de progresso"""
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess['user_id'] = 1
+
+    assert client.get('/transactions/import').status_code == 200
+    assert client.get('/transactions/import/status').get_json() == {'status': 'none'}
+
+    response = client.post('/transactions/import', headers={'Accept': 'application/json'}, data={
+        'csv_file': (io.BytesIO(OFX_SAMPLE), 'extrato.ofx'),
+        'account_id': '1',
+    })
+    result = response.get_json()
+    assert result['success'] and result['inserted'] == 2
+
+    status = client.get('/transactions/import/status').get_json()
+    assert status['status'] == 'completed' and status['percent'] == 100.0
+
+    response = client.post('/transactions/import', data={
+        'csv_file': (io.BytesIO(b'data;descricao;valor\n'), 'x.csv'), 'account_id': '3'})
+    assert response.status_code == 302
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Testes da sincronização incremental (change_log.py, migração 009)
+"""
+
+
+import pytest
+
+from app_simple_advanced import app, update_account_balance
+from change_log import IN_CHUNK_SIZE, MAX_PAGE_SIZE, in_chunks, latest_seq
+
+pytestmark = pytest.mark.dataset(users=2, accounts_per_user=2, years=0.25, tx_per_month=5, seed=36)
+
+def _sync(client, since, limit=500):
+    response = client.get(f'/api/v1/sync?since={since}&limit={limit}')
+    assert response.status_code == 200, response.get_data(as_text=True)
+    return response.get_json()
+
+def test_in_chunks_respects_parameter_limit():
+    """Teste: IN (...) fatiado em até IN_CHUNK_SIZE parâmetros, placeholders de cada fatia"""
+    chunks = list(in_chunks(iter(range(IN_CHUNK_SIZE * 2 + 3))))
+    assert [len(chunk) for _, chunk in chunks] == [IN_CHUNK_SIZE, IN_CHUNK_SIZE, 3]
+    assert chunks[-1] == ('?, ?, ?', [IN_CHUNK_SIZE * 2, IN_CHUNK_SIZE * 2 + 1, IN_CHUNK_SIZE * 2 + 2])
+    assert list(in_chunks([])) == []
+
+def test_full_sync_pages_by_sequence(dataset_db, connect, client_for):
+    """Teste: since=0 percorre todo o histórico do usuário em páginas, sem dados de outro usuário"""
+    client = client_for(1)
+    seen = {'transactions': set(), 'accounts': set(), 'budgets': set(), 'goals': set()}
+    since, pages = 0, 0
+    while True:
+        page = _sync(client, since, limit=40)
+        for entity, change in page['changes'].items():
+            # o gerador grava os saldos depois de criar as contas: 'updated' em página posterior
+            assert not change['deleted']
+            seen[entity].update(row['id'] for row in change['inserted'] + change['updated'])
+        assert page['next_since'] > since
+        since, pages = page['next_since'], pages + 1
+        if not page['has_more']:
+            break
+    assert pages > 1 and since == page['latest_seq']
+
+    with connect() as conn:
+        expected = {row[0] for row in conn.execute(
+            'SELECT t.id FROM transactions t JOIN accounts a ON a.id = t.account_id WHERE a.user_id = 1')}
+        assert seen['transactions'] == expected
+        assert seen['accounts'] == {1, 2}
+        assert seen['goals'] == {row[0] for row in conn.execute('SELECT id FROM goals WHERE user_id = 1')}
+    assert _sync(client, since)['changes'] == {}
+
+def test_delta_has_inserts_updates_and_tombstones(dataset_db, connect, client_for):
+    """Teste: delta compacto com inserções, alterações e tombstones; recálculo sem mudança não gera log"""
+    client = client_for(1)
+    with connect() as conn:
+        old_id = conn.execute('SELECT id FROM transactions WHERE account_id = 1 ORDER BY id LIMIT 1').fetchone()[0]
+        edited_id = conn.execute('SELECT id FROM transactions WHERE account_id = 2 ORDER BY id LIMIT 1').fetchone()[0]
+        with app.app_context():
+            update_account_balance(conn, 2)  # 1ª normalização do saldo do gerador
+        conn.commit()
+        since = latest_seq(conn, 1)
+        with app.app_context():
+            update_account_balance(conn, 2)  # mesmo saldo: nenhuma alteração
+        conn.commit()
+        assert latest_seq(conn, 1) == since
+
+    items = [{'description': 'Cinema', 'amount': '42.00', 'date': '2024-06-10',
+              'transaction_type': 'despesa', 'account_id': 1, 'category_id': 6},
+             {'description': 'Temporária', 'amount': '1.00', 'date': '2024-06-10',
+              'transaction_type': 'despesa', 'account_id': 1, 'category_id': 6}]
+    created = client.post('/api/v1/transactions/batch', json=items).get_json()['results']
+    new_id, temp_id = created[0]['transaction_id'], created[1]['transaction_id']
+    with connect() as conn:
+        conn.execute('DELETE FROM transactions WHERE id IN (?, ?)', (old_id, temp_id))
+        conn.execute("UPDATE transactions SET description = 'Editada' WHERE id = ?", (edited_id,))
+        conn.execute("UPDATE transactions SET description = 'Editada 2' WHERE id = ?", (edited_id,))
+
+    changes = _sync(client, since)['changes']
+    tx = changes['transactions']
+    assert [row['id'] for row in tx['inserted']] == [new_id]
+    assert tx['inserted'][0]['amount_cents'] == 4200
+    assert [(row['id'], row['description']) for row in tx['updated']] == [(edited_id, 'Editada 2')]
+    assert tx['deleted'] == [old_id]  # a temporária nasceu e morreu no intervalo
+    assert [row['id'] for row in changes['accounts']['updated']] == [1]  # saldo mudou
+    assert 'budgets' not in changes
+
+    other = _sync(client_for(2), 0)['changes']
+    assert new_id not in {row['id'] for row in other['transactions']['inserted']}
+    assert {row['id'] for row in other['accounts']['inserted']} == {3, 4}
+    for query in ('since=-1', 'limit=0', 'since=x'):
+        response = client.get(f'/api/v1/sync?{query}')
+        assert response.status_code == 400 and 'limit ≥ 1' in response.get_json()['message']
+    assert client.get('/api/v1/sync?since=0&limit=999999').get_json()['limit'] == MAX_PAGE_SIZE
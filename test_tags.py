@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Testes do índice normalizado de tags (tags.py, migração 014)
+"""
+
+import sqlite3
+from collections import defaultdict
+
+import pytest
+
+from app_simple_advanced import app
+from migrations import column_exists, run_all_migrations, table_exists
+from migrations.migration_014_transaction_tags import migration_014
+from query_budget import check_route_budget
+from tags import normalize_tags
+
+PERIOD = 'start_date=2020-01-01&end_date=2030-12-31'
+
+pytestmark = pytest.mark.dataset(users=2, accounts_per_user=2, years=2, tx_per_month=20, seed=47)
+
+def _links(conn):
+    return set(conn.execute('''
+        SELECT tt.transaction_id, tg.user_id, tg.name FROM transaction_tags tt JOIN tags tg ON tg.id = tt.tag_id
+    '''))
+
+def test_tag_index_maintained_by_triggers(tmp_path):
+    """Teste: texto livre vira tags exatas por usuário; update/delete mantêm o índice; migração preenche"""
+    assert normalize_tags(' Viagem, trabalho,,VIAGEM\nfamília ') == 'Viagem,trabalho,família'
+    assert normalize_tags(' , ') is None and normalize_tags(None) is None
+
+    db_path = str(tmp_path / 'tags.db')
+    assert run_all_migrations(db_path)
+    conn = sqlite3.connect(db_path)
+    for user_id in (1, 2):
+        conn.execute("INSERT INTO users (id, email, password_hash, first_name, last_name) VALUES (?, ?, 'x', 'U', 'U')",
+                     (user_id, f'u{user_id}@test'))
+        conn.execute("INSERT INTO accounts (id, user_id, name, account_type) VALUES (?, ?, 'Conta', 'corrente')",
+                     (user_id, user_id))
+
+    def add(tags, account_id=1):
+        return conn.execute('''INSERT INTO transactions (description, amount, date, transaction_type, account_id, tags)
+                               VALUES ('x', 10, '2025-01-01', 'despesa', ?, ?)''', (account_id, tags)).lastrowid
+
+    trip = add('Viagem, trabalho')
+    extra = add('trabalho-extra')
+    upper = add('VIAGEM,"aspas"')
+    add(None)
+    assert _links(conn) == {(trip, 1, 'Viagem'), (trip, 1, 'trabalho'), (extra, 1, 'trabalho-extra'),
+                            (upper, 1, 'Viagem'), (upper, 1, '"aspas"')}
+    # Mesma tag sem diferença de maiúsculas; 'trabalho' não casa com 'trabalho-extra'
+    assert conn.execute("SELECT COUNT(*) FROM tags WHERE user_id = 1 AND name = 'viagem'").fetchone()[0] == 1
+    tagged = conn.execute('''SELECT tt.transaction_id FROM tags tg JOIN transaction_tags tt ON tt.tag_id = tg.id
+                             WHERE tg.user_id = 1 AND tg.name = 'TRABALHO' ''').fetchall()
+    assert tagged == [(trip,)]
+
+    conn.execute("UPDATE transactions SET tags = 'família' WHERE id = ?", (trip,))
+    conn.execute('UPDATE transactions SET account_id = 2 WHERE id = ?', (extra,))
+    conn.execute('DELETE FROM transactions WHERE id = ?', (upper,))
+    expected = {(trip, 1, 'família'), (extra, 2, 'trabalho-extra')}
+    assert _links(conn) == expected
+
+    # Banco anterior à migração: as strings existentes são indexadas de uma vez
+    conn.execute('DELETE FROM transaction_tags')
+    conn.execute('DELETE FROM tags')
+    migration_014(conn, table_exists=table_exists, column_exists=column_exists)
+    assert _links(conn) == expected
+    conn.close()
+
+def test_tag_filters_and_totals(dataset_db, client_for):
+    """Teste: totais por tag batem com as strings; extrato e plano de contas filtram pela tag exata"""
+    conn = sqlite3.connect(app.config['DATABASE'])
+    expected = defaultdict(lambda: [0, 0, 0])
+    for tags, kind, amount in conn.execute('''
+        SELECT t.tags, t.transaction_type, t.amount FROM transactions t JOIN accounts a ON a.id = t.account_id
+        WHERE a.user_id = 1 AND t.is_confirmed = 1 AND t.tags IS NOT NULL'''):
+        for tag in tags.split(','):
+            expected[tag][0] += 1
+            if kind in ('receita', 'despesa'):
+                expected[tag][1 if kind == 'receita' else 2] += round(amount * 100)
+    conn.close()
+
+    client = client_for(1)
+    report = client.get(f'/api/v1/reports/tags?{PERIOD}').get_json()
+    assert {tag['name']: [tag['quantity'], round(tag['income'] * 100), round(tag['expenses'] * 100)]
+            for tag in report['tags']} == {name: values for name, values in expected.items()}
+    expenses = [tag['expenses'] for tag in report['tags']]
+    assert expenses == sorted(expenses, reverse=True)
+
+    created = client.post('/transactions/new', json={
+        'description': 'Hotel', 'amount': '480.00', 'date': '2025-05-02', 'transaction_type': 'despesa',
+        'account_id': 1, 'category_id': 5, 'tags': 'congresso, Viagem '}).get_json()
+    assert created['success']
+    conn = sqlite3.connect(app.config['DATABASE'])
+    conn.execute('UPDATE transactions SET is_confirmed = 1 WHERE id = ?', (created['transaction_id'],))
+    conn.commit()
+    conn.close()
+    after = {tag['name']: tag for tag in client.get(f'/api/v1/reports/tags?{PERIOD}').get_json()['tags']}
+    assert after['congresso']['quantity'] == 1 and after['congresso']['expenses'] == 480.0
+    assert after['viagem']['quantity'] == expected['viagem'][0] + 1  # 'Viagem ' é a mesma tag
+
+    page = client.get('/transactions?tag=CONGRESSO').get_data(as_text=True)
+    assert page.count('class="transaction-card"') == 1 and 'Hotel' in page and '#congresso' in page
+    assert client.get('/transactions?tag=congres').get_data(as_text=True).count('class="transaction-card"') == 0
+
+    tree = client.get(f'/api/v1/reports/chart-tree?{PERIOD}&tag=viagem').get_json()
+    assert tree['tag'] == 'viagem'
+    # O lançamento de /transactions/new grava a categoria fora de chart_account_id
+    assert tree['total'] == round(expected['viagem'][2] / 100, 2)
+    assert client_for(2).get(f'/api/v1/reports/tags?{PERIOD}').get_json()['tags'][0]['name'] != 'congresso'
+
+    assert client.get('/api/v1/reports/tags?start_date=ontem').status_code == 400
+    check_route_budget(client, f'/api/v1/reports/tags?{PERIOD}')
+    check_route_budget(client, f'/reports/tags?{PERIOD}')
+    check_route_budget(client, '/transactions?tag=viagem')
+    assert client.get(f'/reports/chart-tree?{PERIOD}&tag=viagem').status_code == 200
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Testes da API de transações em lote (transaction_batch.py)
+"""
+
+
+import pytest
+
+from app_simple_advanced import app, update_account_balance
+from query_budget import count_queries
+
+URL = '/api/v1/transactions/batch'
+
+pytestmark = pytest.mark.dataset(users=2, accounts_per_user=2, years=0.25, tx_per_month=5, seed=35)
+
+def _balances(connect):
+    """Saldos em centavos recalculados pela regra do app (o gerador só soma as confirmadas)"""
+    with app.app_context(), connect() as conn:
+        for account_id in (1, 2):
+            update_account_balance(conn, account_id)
+        return {row['id']: row['current_balance_cents'] for row in conn.execute('SELECT id, current_balance_cents FROM accounts')}
+
+def test_batch_creates_items_in_one_commit(dataset_db, connect, client_for):
+    """Teste: lote válido grava tudo, recalcula cada saldo uma vez e devolve o resultado por item"""
+    before = _balances(connect)
+    items = [{'description': f'Feira {i}', 'amount': '10.50', 'date': '2024-06-0%d' % (i % 9 + 1),
+              'type': 'expense', 'account_id': 1, 'category_id': 3} for i in range(40)]
+    items.append({'description': 'Salário extra', 'amount': 1000, 'date': '2024-06-05',
+                  'transaction_type': 'receita', 'account_id': 2, 'category_id': 1})
+    items.append({'description': 'Reserva', 'amount': '250.00', 'date': '2024-06-06',
+                  'transaction_type': 'transferencia', 'account_id': 1, 'transfer_account_id': 2})
+
+    with count_queries() as counter:
+        response = client_for(1).post(URL, json=items)
+    body = response.get_json()
+    assert response.status_code == 201, body
+    assert (body['created'], body['duplicates'], body['invalid']) == (42, 0, 0)
+    assert [r['index'] for r in body['results']] == list(range(42))
+    assert all(r['status'] == 'created' and r['transaction_id'] for r in body['results'])
+    assert body['results'][-1]['counterpart_id']
+    # Uma vez por conta tocada (o trace repete o statement quando os triggers de centavos disparam)
+    updates = {s.strip() for s in counter.statements if s.lstrip().upper().startswith('UPDATE ACCOUNTS')}
+    assert len(updates) == 2, updates
+
+    after = _balances(connect)
+    assert after[1] - before[1] == -40 * 1050 - 25000
+    assert after[2] - before[2] == 100000 + 25000
+    with connect() as conn:
+        row = conn.execute('SELECT amount_cents, category, fingerprint FROM transactions WHERE description = ?',
+                           ('Feira 0',)).fetchone()
+        assert (row['amount_cents'], row['category']) == (1050, 3) and row['fingerprint']
+
+    # /transactions/new grava as pernas da transferência com a mesma convenção do lote
+    single = client_for(1).post('/transactions/new', json={
+        'description': 'Reserva avulsa', 'amount': '250.00', 'date': '2024-06-06',
+        'transaction_type': 'transferencia', 'account_id': 1, 'transfer_account_id': 2}).get_json()
+    assert single['success'], single
+    legs = 'SELECT account_id, amount_cents, transfer_account_id FROM transactions WHERE description = ? ORDER BY id'
+    with connect() as conn:
+        assert [tuple(r) for r in conn.execute(legs, ('Reserva avulsa',))] == \
+            [tuple(r) for r in conn.execute(legs, ('Reserva',))] == [(1, -25000, 2), (2, 25000, 1)]
+        assert conn.execute("SELECT COUNT(*) FROM transactions WHERE description = 'Reserva avulsa' "
+                            "AND (fingerprint IS NULL OR merchant_id IS NULL)").fetchone()[0] == 0
+    assert _balances(connect)[1] - after[1] == -25000
+    rejected = client_for(1).post('/transactions/new', json={
+        'description': 'Para outro usuário', 'amount': '5.00', 'date': '2024-06-06',
+        'transaction_type': 'transferencia', 'account_id': 1, 'transfer_account_id': 3}).get_json()
+    assert not rejected['success']
+
+def test_invalid_item_rejects_atomic_batch(dataset_db, connect, monkeypatch, client_for):
+    """Teste: um item inválido recusa o lote atômico; atomic=false grava só os válidos"""
+    client = client_for(1)
+    good = {'description': 'Padaria', 'amount': '7.00', 'date': '2024-06-01',
+            'transaction_type': 'despesa', 'account_id': 1, 'category_id': 3}
+    bad = [dict(good, amount='-1'), dict(good, account_id=3), dict(good, date='01/06/2024'),
+           dict(good, category_id=1), dict(good, category_id=None), 'texto']
+
+    response = client.post(URL, json=[good] + bad)
+    body = response.get_json()
+    assert response.status_code == 422 and body['created'] == 0 and not body['committed']
+    assert body['results'][0]['status'] == 'skipped'
+    assert all(r['status'] == 'invalid' and r['errors'] for r in body['results'][1:])
+    with connect() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM transactions WHERE description = 'Padaria'").fetchone()[0] == 0
+
+    response = client.post(URL, json={'transactions': [good] + bad, 'atomic': False})
+    assert response.status_code == 201 and response.get_json()['created'] == 1
+
+    assert client.post(URL, json={'foo': 1}).status_code == 400
+    monkeypatch.setitem(app.config, 'API_BATCH_MAX_ITEMS', 3)
+    assert client.post(URL, json=[good] * 4).status_code == 400
+
+def test_resent_batch_skips_duplicates(dataset_db, connect, client_for):
+    """Teste: reenviar o mesmo lote não duplica; linhas idênticas no lote são mantidas"""
+    client = client_for(1)
+    coffee = {'description': 'Café', 'amount': '5.00', 'date': '2024-06-02',
+              'transaction_type': 'despesa', 'account_id': 1, 'category_id': 3}
+    first = client.post(URL, json=[coffee, coffee]).get_json()
+    assert first['created'] == 2
+    retry = client.post(URL, json=[coffee, coffee, coffee]).get_json()
+    assert (retry['created'], retry['duplicates']) == (1, 2)
+    assert [r['status'] for r in retry['results']] == ['duplicate', 'duplicate', 'created']
+    forced = client.post(URL, json={'transactions': [coffee], 'skip_duplicates': False})
+    assert forced.status_code == 201
+    with connect() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM transactions WHERE description = 'Café'").fetchone()[0] == 4
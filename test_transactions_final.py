@@ -1,6 +1,8 @@
 import requests
 import time
 
+from query_budget import check_query_headers
+
 # Testar a nova aba de transações
 print("🧪 TESTANDO NOVA ABA DE TRANSAÇÕES")
 print("=" * 50)
@@ -21,6 +23,11 @@ print("\n2️⃣ Testando /transactions...")
 trans = s.get('http://127.0.0.1:5000/transactions')
 print(f"   Status: {trans.status_code}")
 
+# Orçamento de queries (servidor com QUERY_BUDGET_MODE=header)
+query_count = check_query_headers(trans, '/transactions')
+if query_count is not None:
+    print(f"   Queries: {query_count} (orçamento {trans.headers['X-Query-Budget']})")
+
 if trans.status_code == 200:
     print("   ✅ ABA DE TRANSAÇÕES FUNCIONANDO!")
     print(f"   Tamanho da resposta: {len(trans.text)} bytes")
@@ -2,6 +2,8 @@
 import requests
 import time
 
+from query_budget import check_query_headers
+
 def test_transactions_tab():
     print("🏦 TESTANDO ABA DE TRANSAÇÕES COMPLETA")
     print("=" * 60)
@@ -31,6 +33,15 @@ def test_transactions_tab():
     print(f"   Status: {transactions_response.status_code}")
     print(f"   URL final: {transactions_response.url}")
     
+    # Orçamento de queries (servidor com QUERY_BUDGET_MODE=header)
+    try:
+        query_count = check_query_headers(transactions_response, '/transactions')
+        if query_count is not None:
+            print(f"   ✅ Queries: {query_count} (orçamento {transactions_response.headers['X-Query-Budget']})")
+    except AssertionError as e:
+        print(f"   ❌ Orçamento de queries excedido: {e}")
+        return False
+    
     if transactions_response.status_code == 200:
         content = transactions_response.text
         
@@ -0,0 +1,261 @@
+# Criação de transações em lote (POST /api/v1/transactions/batch) - FynanPro
+"""
+Clientes que sincronizam vários lançamentos de uma vez (app offline,
+integrações) mandam até API_BATCH_MAX_ITEMS transações em uma requisição.
+
+- todos os itens são validados antes de qualquer escrita;
+- as linhas entram em uma única transação do SQLite (um commit);
+- o saldo e os checkpoints de saldo de cada conta tocada são recalculados
+  uma única vez, no final (balance_checkpoints.DeferredSnapshots);
+- duplicatas exatas (dedup.py) são puladas, como na importação de extratos;
+- receitas/despesas sem category_id recebem a categoria da primeira regra
+  do usuário que casar (categorization.py), como em new_transaction;
+- a resposta traz o resultado de cada item, na ordem enviada.
+
+Com atomic=True (padrão) um item inválido recusa o lote inteiro; com
+atomic=False os itens válidos são gravados e os inválidos reportados.
+"""
+
+import logging
+from datetime import date
+
+from balance_checkpoints import DeferredSnapshots
+from dedup import DuplicateCounter, fingerprint
+from merchants import intern_merchants
+from money import to_cents
+
+logger = logging.getLogger(__name__)
+
+MAX_BATCH_ITEMS = 500
+
+# Tipos aceitos na API (inglês do app mobile) -> tipos gravados
+TYPE_ALIASES = {
+    'receita': 'receita', 'income': 'receita',
+    'despesa': 'despesa', 'expense': 'despesa',
+    'transferencia': 'transferencia', 'transfer': 'transferencia',
+}
+
+# Colunas opcionais gravadas quando existem no schema
+_OPTIONAL_COLUMNS = ('amount_cents', 'category', 'notes', 'reference', 'user_id',
+                     'transfer_account_id', 'fingerprint', 'merchant_id')
+
+
+class BatchError(ValueError):
+    """Corpo da requisição inválido como um todo (não é lista, excede o limite...)"""
+
+
+def parse_batch_body(body, max_items=MAX_BATCH_ITEMS):
+    """
+    Aceita uma lista de transações ou {'transactions': [...], 'atomic': bool,
+    'skip_duplicates': bool}; devolve (itens, atomic, skip_duplicates).
+    """
+    atomic, skip_duplicates = True, True
+    if isinstance(body, dict):
+        atomic = bool(body.get('atomic', True))
+        skip_duplicates = bool(body.get('skip_duplicates', True))
+        body = body.get('transactions')
+    if not isinstance(body, list):
+        raise BatchError('Envie uma lista de transações (ou {"transactions": [...]}).')
+    if not body:
+        raise BatchError('Lote vazio.')
+    if len(body) > max_items:
+        raise BatchError(f'Lote com {len(body)} transações; o máximo é {max_items}.')
+    return body, atomic, skip_duplicates
+
+
+def validate_item(item, account_ids, categories, rules=None):
+    """
+    Normalizar um item; devolve (transação, erros).
+    account_ids: contas ativas do usuário; categories: {id: category_type};
+    rules: RuleSet do usuário (categorization.rule_set), consultado quando falta category_id.
+    """
+    if not isinstance(item, dict):
+        return None, ['Item deve ser um objeto JSON.']
+
+    errors = []
+    description = str(item.get('description') or '').strip()
+    if not description:
+        errors.append('description é obrigatória.')
+
+    cents = None
+    try:
+        cents = to_cents(item.get('amount'))
+        if cents <= 0:
+            errors.append('amount deve ser maior que zero.')
+    except (TypeError, ValueError, ArithmeticError):
+        errors.append('amount inválido.')
+
+    tx_date = None
+    try:
+        tx_date = date.fromisoformat(str(item.get('date') or '')[:10]).isoformat()
+    except ValueError:
+        errors.append('date deve estar no formato AAAA-MM-DD.')
+
+    transaction_type = TYPE_ALIASES.get(str(item.get('transaction_type', item.get('type', ''))).lower())
+    if not transaction_type:
+        errors.append('transaction_type deve ser receita, despesa ou transferencia.')
+
+    account_id = _int_or_none(item.get('account_id'))
+    if account_id not in account_ids:
+        errors.append('account_id não encontrada entre as contas do usuário.')
+
+    category_id = _int_or_none(item.get('category_id', item.get('category')))
+    transfer_account_id = _int_or_none(item.get('transfer_account_id'))
+    if transaction_type == 'transferencia':
+        category_id = None
+        if transfer_account_id not in account_ids or transfer_account_id == account_id:
+            errors.append('transfer_account_id deve ser outra conta do usuário.')
+    elif transaction_type:
+        transfer_account_id = None
+        if category_id is None and rules is not None and not errors:
+            rule = rules.match(description, cents, account_id, transaction_type)
+            if rule:
+                category_id = rule.category_id
+        if category_id is None:
+            errors.append('category_id é obrigatória para receitas e despesas.')
+        elif category_id not in categories:
+            errors.append('category_id não encontrada.')
+        elif categories[category_id] not in (transaction_type, None):
+            errors.append(f'category_id não é uma categoria de {transaction_type}.')
+
+    if errors:
+        return None, errors
+    return {
+        'description': description,
+        'cents': cents,
+        'date': tx_date,
+        'transaction_type': transaction_type,
+        'account_id': account_id,
+        'category': category_id,
+        'notes': str(item.get('notes') or ''),
+        'reference': item.get('reference'),
+        'transfer_account_id': transfer_account_id,
+    }, []
+
+
+def _int_or_none(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class TransactionBatch:
+    """Grava um lote já parseado para um usuário (uma transação SQL, saldos no final)"""
+
+    def __init__(self, conn, user_id, accounts, categories, update_balance, skip_duplicates=True, rules=None):
+        self.conn = conn
+        self.user_id = user_id
+        self.rules = rules
+        self.account_ids = {account['id'] for account in accounts}
+        self.categories = {category['id']: category.get('category_type') for category in categories}
+        self.update_balance = update_balance  # (conn, account_id) -> None, ex.: update_account_balance
+
+        columns = {row[1] for row in conn.execute('PRAGMA table_info(transactions)').fetchall()}
+        type_column = 'type' if 'type' in columns else 'transaction_type'
+        self.skip_duplicates = skip_duplicates and 'fingerprint' in columns
+        self._extras = [name for name in _OPTIONAL_COLUMNS if name in columns]
+        self._merchant_ids = {}
+        names = ['description', 'amount', 'date', type_column, 'account_id'] + self._extras
+        self.insert_sql = (f"INSERT INTO transactions ({', '.join(names)}) "
+                           f"VALUES ({', '.join('?' * len(names))})")
+        self.snapshots = DeferredSnapshots(conn, type_column, columns)
+
+    def _row(self, tx, account_id, cents, transfer_account_id, description):
+        values = [description, cents / 100, tx['date'], tx['transaction_type'], account_id]
+        extras = {
+            'amount_cents': cents,
+            'category': tx['category'],
+            'notes': tx['notes'],
+            'reference': tx['reference'],
+            'user_id': self.user_id,
+            'transfer_account_id': transfer_account_id,
+            'fingerprint': fingerprint(account_id, tx['date'], tx['transaction_type'], cents, description),
+            'merchant_id': self._merchant_ids.get(description),
+        }
+        return values + [extras[name] for name in self._extras]
+
+    @staticmethod
+    def _signed(tx):
+        """Transferência sai da conta de origem com valor negativo (como no gerador de dataset)"""
+        return -tx['cents'] if tx['transaction_type'] == 'transferencia' else tx['cents']
+
+    def _rows(self, tx):
+        """Linhas de um item: transferência vira saída na origem + entrada no destino"""
+        if tx['transaction_type'] != 'transferencia':
+            return [self._row(tx, tx['account_id'], tx['cents'], None, tx['description'])]
+        return [self._row(tx, tx['account_id'], self._signed(tx), tx['transfer_account_id'], tx['description']),
+                self._row(tx, tx['transfer_account_id'], tx['cents'], tx['account_id'], tx['description'])]
+
+    def run(self, items, atomic=True):
+        """Valida e grava; devolve o resumo com o resultado de cada item"""
+        results = []
+        valid = []
+        for index, item in enumerate(items):
+            tx, errors = validate_item(item, self.account_ids, self.categories, self.rules)
+            if errors:
+                results.append({'index': index, 'status': 'invalid', 'errors': errors})
+            else:
+                results.append({'index': index, 'status': None})
+                valid.append((index, tx))
+
+        invalid = len(items) - len(valid)
+        if invalid and atomic:
+            for result in results:
+                if result['status'] is None:
+                    result['status'] = 'skipped'
+            return self._summary(results, created=0, duplicates=0, invalid=invalid, committed=False)
+
+        if 'merchant_id' in self._extras and valid:
+            self._merchant_ids = intern_merchants(self.conn, (tx['description'] for _, tx in valid))
+        plans = [(index, fingerprint(tx['account_id'], tx['date'], tx['transaction_type'],
+                                     self._signed(tx), tx['description']), self._rows(tx))
+                 for index, tx in valid]
+        duplicates = None
+        if self.skip_duplicates:
+            duplicates = DuplicateCounter(self.conn)
+            duplicates.prefetch(fp for _, fp, _ in plans)
+
+        created = skipped = 0
+        touched = set()
+        try:
+            self.snapshots.suspend()
+            for index, fp, rows in plans:
+                if duplicates and duplicates.is_duplicate(fp):
+                    results[index]['status'] = 'duplicate'
+                    skipped += 1
+                    continue
+                ids = [self.conn.execute(self.insert_sql, row).lastrowid for row in rows]
+                for row in rows:
+                    touched.add(row[4])
+                    self.snapshots.touch(row[4], row[2])
+                results[index].update(status='created', transaction_id=ids[0])
+                if len(ids) > 1:
+                    results[index]['counterpart_id'] = ids[1]
+                created += 1
+            self.snapshots.resume()
+            self.snapshots.rebuild()
+
+            for account_id in sorted(touched):
+                self.update_balance(self.conn, account_id)
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+
+        logger.info("📦 Lote de transações: %s criadas, %s duplicadas, %s inválidas (usuário %s, %s contas)",
+                    created, skipped, invalid, self.user_id, len(touched))
+        return self._summary(results, created, skipped, invalid, committed=True)
+
+    @staticmethod
+    def _summary(results, created, duplicates, invalid, committed):
+        for result in results:
+            result.setdefault('errors', [])
+        return {
+            'success': committed and (created > 0 or invalid == 0),
+            'committed': committed,
+            'created': created,
+            'duplicates': duplicates,
+            'invalid': invalid,
+            'results': results,
+        }